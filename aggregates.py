@@ -0,0 +1,264 @@
+"""
+Pride in Place Data Explorer - Benchmark Aggregates
+Population-weighted LA, regional and England benchmarks for every indicator.
+
+The dashboard compares an area with its LA, region and England. Instead of
+hardcoding those figures or recomputing them in JavaScript, this stage
+computes, for every indicator and every area at each level:
+
+    mean    population-weighted mean
+    median  population-weighted median
+    p10 .. p90  population-weighted percentile bands (10th, 25th, 75th, 90th)
+
+LSOA indicators (IMD domain scores) roll up to MSOA, LA, region and England,
+and MSOA indicators (census rates, HLNM scores) roll up to LA, region and
+England. Each indicator is sorted once, with the areas of every level
+stacked into a single grouped array, so one pass yields all levels.
+
+The LA, region and England rows are written to aggregates.bin, a data
+bundle with one table per level keyed by area code; the MSOA rows built
+from LSOAs go to data/build/aggregates_msoa.arrow.
+
+Usage:
+    python aggregates.py [--out aggregates.bin]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import bundle
+import columnar_store
+import data_gatherer
+
+LOCAL_DIR = Path(__file__).parent
+BUILD_DIR = LOCAL_DIR / "data" / "build"
+AGGREGATES_FILE = LOCAL_DIR / "aggregates.bin"
+MSOA_AGGREGATES_FILE = BUILD_DIR / "aggregates_msoa.arrow"
+
+ENGLAND_CODE = "E92000001"
+
+# Output level -> (lookup code column, lookup name column)
+LEVELS = {
+    "msoa": ("MSOA21CD", "MSOA21NM"),
+    "la": ("LAD22CD", "LAD22NM"),
+    "region": ("RGN22CD", "RGN22NM"),
+    "england": (None, None),
+}
+
+QUANTILES = {"p10": 0.10, "p25": 0.25, "median": 0.50, "p75": 0.75, "p90": 0.90}
+STATS = ["mean"] + list(QUANTILES)
+
+# MSOA measures averaged as rates; counts and ranks are not meaningful means
+MSOA_INDICATORS = [
+    'bad_health_pct', 'no_qualifications_pct', 'level4_plus_pct',
+    'deprived_pct', 'owned_pct', 'social_rented_pct',
+    'hlnm_growth', 'hlnm_energy', 'hlnm_opportunity', 'hlnm_health',
+]
+MSOA_WEIGHT = 'total_population'
+
+# Stored values are rounded so the bundle can keep them as scaled integers
+DECIMALS = 4
+
+
+def weighted_group_stats(values, weights, groups, n_groups):
+    """Weighted mean and quantiles of values within each group.
+
+    groups holds an integer group id (0 .. n_groups - 1) per value; a value
+    may be repeated under several ids to aggregate several levels at once.
+    Missing or infinite values and zero weights are skipped. Returns a dict of stat name
+    -> float array of length n_groups (NaN for empty groups).
+    """
+    valid = np.isfinite(values) & (weights > 0)
+    values, weights, groups = values[valid], weights[valid], groups[valid]
+    if len(values) == 0:
+        return {name: np.full(n_groups, np.nan) for name in STATS}
+
+    order = np.lexsort((values, groups))
+    values, weights, groups = values[order], weights[order], groups[order]
+    cumulative = np.cumsum(weights)
+
+    ids = np.arange(n_groups)
+    starts = np.searchsorted(groups, ids, side='left')
+    ends = np.searchsorted(groups, ids, side='right')
+    present = ends > starts
+    before = np.where(starts > 0, cumulative[np.maximum(starts - 1, 0)], 0.0)
+    total = np.where(present, cumulative[np.maximum(ends - 1, 0)] - before, np.nan)
+
+    stats = {"mean": np.bincount(groups, weights=values * weights, minlength=n_groups) / total}
+    for name, q in QUANTILES.items():
+        # First value whose cumulative weight reaches q of its group's total
+        target = before + q * np.nan_to_num(total)
+        index = np.searchsorted(cumulative, target, side='left')
+        index = np.clip(index, starts, np.maximum(ends - 1, starts))
+        stats[name] = np.where(present, values[np.minimum(index, len(values) - 1)], np.nan)
+    return stats
+
+
+def stack_levels(frame, code_columns):
+    """Group ids for every row at every level, as one stacked array.
+
+    Returns (row positions, group ids, groups) where groups is a list of
+    (level, code) per id; the England level is a single group.
+    """
+    positions, ids, groups = [], [], []
+    row_index = np.arange(len(frame))
+    for level, column in code_columns.items():
+        if column is None:
+            codes = np.zeros(len(frame), dtype=np.int64)
+            names = [ENGLAND_CODE]
+        else:
+            codes, names = pd.factorize(frame[column].astype(str))
+        positions.append(row_index)
+        ids.append(codes + len(groups))
+        groups.extend((level, name) for name in names)
+    return np.concatenate(positions), np.concatenate(ids), groups
+
+
+def aggregate(frame, indicators, weight, code_columns):
+    """Population-weighted stats of indicators at every level in code_columns.
+
+    Returns a dict of level -> DataFrame indexed by area code with one
+    "<indicator>:<stat>" column per indicator and stat, plus "n" (areas with
+    any weight) and "weight" (the summed weight).
+    """
+    positions, ids, groups = stack_levels(frame, code_columns)
+    weights = frame[weight].to_numpy(dtype=np.float64, na_value=np.nan)[positions]
+    weights = np.nan_to_num(weights)
+
+    columns = {
+        "n": np.bincount(ids, weights=(weights > 0).astype(np.float64), minlength=len(groups)),
+        "weight": np.bincount(ids, weights=weights, minlength=len(groups)),
+    }
+    for indicator in indicators:
+        values = frame[indicator].to_numpy(dtype=np.float64, na_value=np.nan)[positions]
+        for stat, result in weighted_group_stats(values, weights, ids, len(groups)).items():
+            columns[f"{indicator}:{stat}"] = result
+
+    table = pd.DataFrame(columns)
+    table['level'] = [level for level, _ in groups]
+    table['code'] = [code for _, code in groups]
+    return {
+        level: rows.drop(columns='level').set_index('code')
+        for level, rows in table.groupby('level', sort=False)
+    }
+
+
+def load_lsoa_frame(lookup):
+    """IMD domain scores per LSOA with their MSOA/LA/region and population.
+
+    Returns (frame, score columns, population column or None).
+    """
+    imd, lsoa_col = data_gatherer.load_imd_data(lookup)
+    population_col = data_gatherer.find_population_column(imd)
+    score_cols = [c for c in imd.columns if 'score' in c.lower()]
+
+    frame = imd[[lsoa_col] + score_cols].merge(
+        lookup[['LSOA21CD', 'MSOA21CD', 'LAD22CD', 'RGN22CD']],
+        left_on=lsoa_col, right_on='LSOA21CD', how='inner',
+    )
+    if population_col is None:
+        print("  No LSOA population in the IMD extract, weighting LSOAs equally")
+        frame['population'] = 1.0
+    else:
+        frame['population'] = imd.set_index(lsoa_col)[population_col].reindex(frame[lsoa_col]).to_numpy()
+    return frame, score_cols, population_col
+
+
+def load_msoa_frame(lookup, build_dir=BUILD_DIR):
+    """Census rates and HLNM scores per MSOA with LA/region and population."""
+    census = columnar_store.read_table(Path(build_dir) / "census_msoa.arrow")
+    need = columnar_store.read_table(Path(build_dir) / "need_msoa.arrow")
+    geography = lookup[['MSOA21CD', 'LAD22CD', 'RGN22CD']].drop_duplicates('MSOA21CD')
+
+    frame = geography.rename(columns={'MSOA21CD': 'msoa_code'})
+    for df in (census, need):
+        frame = frame.merge(df.astype({'msoa_code': str}), on='msoa_code', how='left')
+    return frame, [c for c in MSOA_INDICATORS if c in frame.columns]
+
+
+def level_names(lookup):
+    """Area code -> (name, parent code) for the LA and region levels."""
+    names = {ENGLAND_CODE: ("England", None)}
+    for _, row in lookup[['LAD22CD', 'LAD22NM', 'RGN22CD', 'RGN22NM']].drop_duplicates('LAD22CD').iterrows():
+        names[str(row['LAD22CD'])] = (str(row['LAD22NM']), str(row['RGN22CD']))
+        names[str(row['RGN22CD'])] = (str(row['RGN22NM']), ENGLAND_CODE)
+    return names
+
+
+def build_aggregates(out_path=AGGREGATES_FILE, build_dir=BUILD_DIR):
+    """Compute every level's benchmarks and write aggregates.bin."""
+    start = time.perf_counter()
+    lookup = columnar_store.read_table(Path(build_dir) / "lookup.arrow")
+    lookup = lookup[lookup['LSOA21CD'].str.startswith('E')]
+
+    print("\n1. Aggregating LSOA indicators (IMD)...")
+    lsoa_frame, lsoa_indicators, population_col = load_lsoa_frame(lookup)
+    lsoa_levels = aggregate(
+        lsoa_frame, lsoa_indicators, 'population',
+        {level: column for level, (column, _) in LEVELS.items()},
+    )
+
+    print("\n2. Aggregating MSOA indicators (census, HLNM)...")
+    msoa_frame, msoa_indicators = load_msoa_frame(lookup, build_dir)
+    msoa_levels = aggregate(
+        msoa_frame, msoa_indicators, MSOA_WEIGHT,
+        {"la": "LAD22CD", "region": "RGN22CD", "england": None},
+    )
+
+    msoa_table = lsoa_levels.pop("msoa").round(DECIMALS)
+    msoa_table.index.name = 'msoa_code'
+    columnar_store.write_table(msoa_table.reset_index(), MSOA_AGGREGATES_FILE)
+
+    names = level_names(lookup)
+    tables = {}
+    for level in ("la", "region", "england"):
+        lsoa_part = lsoa_levels[level].drop(columns=['n', 'weight'])
+        combined = msoa_levels[level].join(lsoa_part, how='outer').round(DECIMALS)
+        combined.insert(0, 'name', [names.get(code, (code, None))[0] for code in combined.index])
+        combined.insert(1, 'parent', [names.get(code, (code, None))[1] for code in combined.index])
+        combined.index.name = 'code'
+        rows = [
+            {k: v for k, v in row.items() if v is not None and not (isinstance(v, float) and np.isnan(v))}
+            for row in combined.reset_index().to_dict(orient='records')
+        ]
+        tables[level] = (rows, {"key": "code"})
+
+    metadata = {
+        "generated": pd.Timestamp.now().isoformat(timespec='seconds'),
+        "stats": STATS,
+        "indicators": msoa_indicators + lsoa_indicators,
+        "weights": {
+            "msoa": MSOA_WEIGHT,
+            "lsoa": population_col,
+        },
+    }
+    payload = bundle.encode_bundle(tables, metadata)
+    # Renamed into place, so an interrupted build never leaves a truncated
+    # aggregates.bin for the dashboard to decode
+    tmp_path = Path(out_path).with_suffix('.tmp')
+    tmp_path.write_bytes(payload)
+    tmp_path.replace(out_path)
+    print(f"\n  Wrote {Path(out_path).name}: {len(payload):,} bytes "
+          f"({', '.join(f'{len(t[0])} {level}' for level, t in tables.items())}) "
+          f"in {time.perf_counter() - start:.1f}s")
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark aggregates for the PiP Data Explorer")
+    parser.add_argument('--out', default=str(AGGREGATES_FILE))
+    parser.add_argument('--build-dir', default=str(BUILD_DIR), help="pipeline intermediate tables")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Pride in Place Data Explorer - Benchmark Aggregates")
+    print("=" * 60)
+    build_aggregates(args.out, args.build_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,629 @@
+// Pride in Place Data Explorer - area analysis worker
+// The data work behind displayArea, the deep-dive modal and comparison mode:
+// boundary tile decoding, percentile and benchmark comparisons, story insight
+// ranking, and the comparison matrix.
+// Started as a Web Worker (new Worker('./area_worker.js')) it runs off the
+// main thread with its own ShardStore, whose shards and aggregates.bin come
+// from the page's copies (transferred, not fetched again) when AreaAnalysis
+// is given bytes(), and posts results back as transferable typed arrays. Loaded as a plain script it
+// provides AreaAnalysis, which sends tasks to the worker, or runs the same
+// functions in-thread where no worker can start (e.g. under node).
+
+(function (root) {
+    const inWorker = typeof importScripts === 'function' && typeof document === 'undefined';
+    if (inWorker) importScripts('./asset_manifest.js', './bundle_reader.js', './shard_reader.js');
+    const { readBundle, loadBundle } = root.PipBundle || require('./bundle_reader.js');
+    const { openShards } = root.PipShards || require('./shard_reader.js');
+    // The content-hashed name when publish.py's manifest is loaded (asset_manifest.js)
+    const assetUrl = url => (root.PipAssets ? root.PipAssets.assetUrl(url) : url);
+
+    const ENGLAND_CODE = 'E92000001';
+
+    // Deep-dive indicators: inverse means a higher value is worse; england
+    // is used where aggregates.bin has no England figure for the indicator
+    const INDICATORS = {
+        jsa: { inverse: true, england: 1.2 },
+        uc_search: { inverse: true, england: 2.5 },
+        uc_total: { inverse: true, england: 4.0 },
+        jobs_density: { inverse: false, england: 0.8 },
+        jobs_access: { inverse: false, england: 750000 },
+        gva: { inverse: false, england: 35000 },
+        gva_change: { inverse: false, england: 25 },
+        highgrowth: { inverse: false, england: 10.0 },
+        no_quals: { inverse: true, england: 7.0 },
+        level3plus: { inverse: false, england: 61.0 },
+        higher_mgr: { inverse: false, england: 11.0 },
+        income: { inverse: false, england: 31400 },
+        digital: { inverse: false, england: 95.0 },
+        broadband: { inverse: false, england: 80.0 }
+    };
+    const INDICATOR_KEYS = Object.keys(INDICATORS);
+
+    // Same order as bundle.py's IMD_SCORE_COLUMNS and the IMD cards
+    const IMD_COLUMNS = [
+        'Index of Multiple Deprivation (IMD) Score',
+        'Income Score (rate)',
+        'Employment Score (rate)',
+        'Education, Skills and Training Score',
+        'Health Deprivation and Disability Score',
+        'Crime Score',
+        'Barriers to Housing and Services Score',
+        'Living Environment Score'
+    ];
+
+    const STORY_FIELDS = [
+        'lsoas', 'avg_growth', 'growth_range', 'least_growth', 'most_growth',
+        'avg_income', 'lowest_income', 'highest_no_quals'
+    ];
+
+    const WORSE = 1, BETTER = 0, NO_COMPARISON = -1;
+
+    // Comparison mode indicators for each kind of area. inverse means a
+    // higher value is worse; percentile names the column holding the
+    // area's national percentile, if there is one
+    const COMPARISON_INDICATORS = {
+        msoa: [
+            ...IMD_COLUMNS.map(key => ({ key, inverse: true, percentile: `${key}_percentile` })),
+            ...['hlnm_growth', 'hlnm_energy', 'hlnm_opportunity', 'hlnm_health', 'bad_health_pct',
+                'no_qualifications_pct', 'deprived_pct'
+            ].map(key => ({ key, inverse: true, percentile: `${key}_percentile` })),
+            { key: 'level4_plus_pct', inverse: false, percentile: 'level4_plus_pct_percentile' }
+        ],
+        // lsoa_hlnm percentiles run from most need (0) up; the economic
+        // indicators have no percentile of their own
+        lsoa: [
+            ...['gp', 'ep', 'cp', 'opp', 'hp'].map(key => ({ key, inverse: false, percentile: key })),
+            ...INDICATOR_KEYS.map(key => ({ key, inverse: INDICATORS[key].inverse, percentile: null }))
+        ]
+    };
+
+    // Benchmark levels from nearest to furthest
+    const BENCHMARK_LEVELS = ['la', 'region', 'england'];
+    const NO_BENCHMARK = -1;
+
+    function number(value) {
+        return value === null || value === undefined ? NaN : value;
+    }
+
+    // {name: value} for a typed array laid out as fields
+    function fields(names, values) {
+        const out = {};
+        names.forEach((name, i) => { out[name] = values[i]; });
+        return out;
+    }
+
+    // ------------------------------------------------------------------
+    // Boundary tiles (written by `python boundaries.py tile`)
+    // ------------------------------------------------------------------
+
+    // Rings are delta-coded integers in units of the tile quantum, offset
+    // from the tile origin. Every point goes into one Float64Array of x, y
+    // pairs (rings closed); features, polygons and rings are offset arrays
+    // into the next level down, so a ring r is points rings[r]..rings[r + 1].
+    function decodeTile(tile) {
+        const [originX, originY] = tile.origin;
+        const quantum = tile.quantum;
+
+        let ringCount = 0, polygonCount = 0, pointCount = 0;
+        for (const f of tile.features) {
+            polygonCount += f.g.length;
+            for (const polygon of f.g) {
+                ringCount += polygon.length;
+                for (const ring of polygon) pointCount += ring.length / 2 + 1;
+            }
+        }
+
+        const features = new Uint32Array(tile.features.length + 1);
+        const polygons = new Uint32Array(polygonCount + 1);
+        const rings = new Uint32Array(ringCount + 1);
+        const coords = new Float64Array(pointCount * 2);
+        const bounds = new Float64Array([Infinity, Infinity, -Infinity, -Infinity]);
+        let p = 0, r = 0, point = 0;
+        tile.features.forEach((f, i) => {
+            features[i] = p;
+            for (const polygon of f.g) {
+                polygons[p++] = r;
+                for (const ring of polygon) {
+                    rings[r++] = point;
+                    const start = point;
+                    let x = originX, y = originY;
+                    for (let j = 0; j < ring.length; j += 2) {
+                        x += ring[j];
+                        y += ring[j + 1];
+                        coords[point * 2] = x * quantum;
+                        coords[point * 2 + 1] = y * quantum;
+                        point++;
+                    }
+                    coords[point * 2] = coords[start * 2];
+                    coords[point * 2 + 1] = coords[start * 2 + 1];
+                    point++;
+                }
+            }
+        });
+        features[tile.features.length] = p;
+        polygons[polygonCount] = r;
+        rings[ringCount] = point;
+        for (let i = 0; i < point; i++) {
+            bounds[0] = Math.min(bounds[0], coords[i * 2]);
+            bounds[1] = Math.min(bounds[1], coords[i * 2 + 1]);
+            bounds[2] = Math.max(bounds[2], coords[i * 2]);
+            bounds[3] = Math.max(bounds[3], coords[i * 2 + 1]);
+        }
+
+        return {
+            codes: tile.features.map(f => f.c),
+            names: tile.features.map(f => f.n),
+            features, polygons, rings, coords, bounds
+        };
+    }
+
+    // GeoJSON features for L.geoJSON from a decoded tile
+    function tileFeatures(tile) {
+        const { features, polygons, rings, coords } = tile;
+        return tile.codes.map((code, i) => {
+            const shapes = [];
+            for (let p = features[i]; p < features[i + 1]; p++) {
+                const shape = [];
+                for (let r = polygons[p]; r < polygons[p + 1]; r++) {
+                    const ring = [];
+                    for (let point = rings[r]; point < rings[r + 1]; point++) {
+                        ring.push([coords[point * 2], coords[point * 2 + 1]]);
+                    }
+                    shape.push(ring);
+                }
+                shapes.push(shape);
+            }
+            return {
+                type: 'Feature',
+                properties: { LSOA21CD: code, LSOA21NM: tile.names[i] },
+                geometry: shapes.length === 1
+                    ? { type: 'Polygon', coordinates: shapes[0] }
+                    : { type: 'MultiPolygon', coordinates: shapes }
+            };
+        });
+    }
+
+    // ------------------------------------------------------------------
+    // Benchmarks (aggregates.bin, written by aggregates.py)
+    // ------------------------------------------------------------------
+
+    // Precomputed benchmark for an indicator: level is 'la', 'region' or
+    // 'england'; stat is mean, median, p10, p25, p75 or p90
+    function benchmarkValue(benchmarks, level, code, indicator, stat = 'mean') {
+        if (!benchmarks || !code) return null;
+        const table = benchmarks.tables[level];
+        const row = table.find(code);
+        return row === undefined ? null : table.value(row, `${indicator}:${stat}`) ?? null;
+    }
+
+    // Benchmark codes for an area: its LA (matched by name), region and England
+    function benchmarkAreas(benchmarks, localAuthority) {
+        if (!benchmarks) return null;
+        const las = benchmarks.tables.la;
+        if (!las.byName) {
+            las.byName = new Map(las.column('name').map((name, i) => [name, i]));
+        }
+        const row = las.byName.get(localAuthority);
+        const la = row === undefined ? null : las.record(row);
+        const regions = benchmarks.tables.region;
+        return {
+            la: la ? la.code : null,
+            laName: la ? la.name : null,
+            region: la ? la.parent : null,
+            regionName: la ? regions.record(regions.find(la.parent)).name : null,
+            england: ENGLAND_CODE
+        };
+    }
+
+    // ------------------------------------------------------------------
+    // Comparisons and insights
+    // ------------------------------------------------------------------
+
+    // Areas side by side: values, national percentiles (<column>_percentile)
+    // and LA / region / England means, each an areas x
+    // columns Float64Array with NaN where there is nothing to show
+    function compareAreas(areas, columns, benchmarks) {
+        const size = areas.length * columns.length;
+        const result = {
+            codes: areas.map(a => a.msoa_code),
+            columns,
+            values: new Float64Array(size),
+            percentiles: new Float64Array(size),
+            la: new Float64Array(size),
+            region: new Float64Array(size),
+            england: new Float64Array(size),
+            names: []
+        };
+        areas.forEach((area, i) => {
+            const codes = benchmarkAreas(benchmarks, area.local_authority) || {};
+            result.names.push({ laName: codes.laName || null, regionName: codes.regionName || null });
+            columns.forEach((column, j) => {
+                const k = i * columns.length + j;
+                result.values[k] = number(area[column]);
+                result.percentiles[k] = number(area[`${column}_percentile`]);
+                result.la[k] = number(benchmarkValue(benchmarks, 'la', codes.la, column));
+                result.region[k] = number(benchmarkValue(benchmarks, 'region', codes.region, column));
+                result.england[k] = number(benchmarkValue(benchmarks, 'england', codes.england, column));
+            });
+        });
+        return result;
+    }
+
+    // The comparison matrix for rows of {code, name, record, localAuthority}
+    // on the given indicators (COMPARISON_INDICATORS). Every grid is a rows x
+    // indicators Float64Array, NaN where there is nothing to show:
+    //   values            the indicator values
+    //   zScores           standard scores against the other rows
+    //   percentiles       national percentiles
+    //   percentileDeltas  percentile points above or below the first row
+    //   benchmarks        the nearest benchmark (LA, else region, else England;
+    //                     benchmarkLevels holds its BENCHMARK_LEVELS index)
+    //   benchmarkDiffs    value minus that benchmark
+    // and means / deviations hold each indicator's mean and standard
+    // deviation across the rows
+    function comparisonMatrix(rows, indicators, benchmarks) {
+        const n = rows.length, m = indicators.length, size = n * m;
+        const values = new Float64Array(size);
+        const percentiles = new Float64Array(size);
+        const nearest = new Float64Array(size).fill(NaN);
+        const benchmarkLevels = new Int8Array(size).fill(NO_BENCHMARK);
+
+        // Benchmark figures per level and area code, looked up once per LA
+        // however many rows it has
+        const benchmarkRows = new Map();
+        function benchmarkRow(level, code) {
+            const id = `${level}:${code}`;
+            if (!benchmarkRows.has(id)) {
+                benchmarkRows.set(id, Float64Array.from(indicators, ({ key }) => {
+                    const value = number(benchmarkValue(benchmarks, level, code, key));
+                    return Number.isNaN(value) && level === 'england' && INDICATORS[key]
+                        ? INDICATORS[key].england
+                        : value;
+                }));
+            }
+            return benchmarkRows.get(id);
+        }
+
+        rows.forEach(({ record, localAuthority }, i) => {
+            const codes = benchmarkAreas(benchmarks, localAuthority) || { england: ENGLAND_CODE };
+            const levels = BENCHMARK_LEVELS.map(level => codes[level] ? benchmarkRow(level, codes[level]) : null);
+            indicators.forEach(({ key, percentile }, j) => {
+                const k = i * m + j;
+                values[k] = number(record[key]);
+                percentiles[k] = percentile ? number(record[percentile]) : NaN;
+                for (let level = 0; level < levels.length; level++) {
+                    if (levels[level] && !Number.isNaN(levels[level][j])) {
+                        nearest[k] = levels[level][j];
+                        benchmarkLevels[k] = level;
+                        break;
+                    }
+                }
+            });
+        });
+
+        // Column means and (population) standard deviations over the
+        // values present
+        const means = new Float64Array(m);
+        const deviations = new Float64Array(m);
+        const counts = new Uint32Array(m);
+        for (let k = 0; k < size; k++) {
+            if (!Number.isNaN(values[k])) {
+                means[k % m] += values[k];
+                counts[k % m]++;
+            }
+        }
+        for (let j = 0; j < m; j++) means[j] = counts[j] ? means[j] / counts[j] : NaN;
+        for (let k = 0; k < size; k++) {
+            if (!Number.isNaN(values[k])) deviations[k % m] += (values[k] - means[k % m]) ** 2;
+        }
+        for (let j = 0; j < m; j++) deviations[j] = counts[j] ? Math.sqrt(deviations[j] / counts[j]) : NaN;
+
+        // One pass for every derived grid; NaN propagates from missing values
+        const zScores = new Float64Array(size);
+        const percentileDeltas = new Float64Array(size);
+        const benchmarkDiffs = new Float64Array(size);
+        for (let k = 0; k < size; k++) {
+            const j = k % m;
+            zScores[k] = deviations[j] > 0 ? (values[k] - means[j]) / deviations[j] : NaN;
+            percentileDeltas[k] = percentiles[k] - percentiles[j];
+            benchmarkDiffs[k] = values[k] - nearest[k];
+        }
+
+        return {
+            codes: rows.map(r => r.code),
+            names: rows.map(r => r.name),
+            indicators: indicators.map(i => i.key),
+            values, zScores, percentiles, percentileDeltas,
+            benchmarks: nearest, benchmarkLevels, benchmarkDiffs,
+            means, deviations
+        };
+    }
+
+    // WORSE, BETTER, or NO_COMPARISON for a missing (or zero) value
+    function compareValue(value, benchmark, inverse) {
+        if (value === 0 || value === null || value === undefined) return NO_COMPARISON;
+        const deviation = inverse ? (value - benchmark) : (benchmark - value);
+        return deviation > 0 ? WORSE : BETTER;
+    }
+
+    // Each LSOA's economic indicators against England: the England figure
+    // per indicator, and an LSOAs x indicators Int8Array of comparisons
+    function compareIndicators(lsoas, benchmarks) {
+        const count = INDICATOR_KEYS.length;
+        const england = new Float64Array(INDICATOR_KEYS.map(key =>
+            benchmarkValue(benchmarks, 'england', ENGLAND_CODE, key) ?? INDICATORS[key].england));
+        const worse = new Int8Array(lsoas.length * count);
+        lsoas.forEach((lsoa, i) => {
+            INDICATOR_KEYS.forEach((key, j) => {
+                worse[i * count + j] = compareValue(lsoa.econ[key], england[j], INDICATORS[key].inverse);
+            });
+        });
+        return { codes: lsoas.map(l => l.code), england, worse };
+    }
+
+    // Figures the story narrative ranks the area's LSOAs by (STORY_FIELDS),
+    // or null when no LSOA has both HLNM and economic data
+    function storyInsights(lsoaCount, lsoas) {
+        const data = lsoas.filter(d => d.hlnm && d.econ);
+        if (data.length === 0) return null;
+
+        const growth = data.map(d => d.hlnm.gp);
+        const mostChallenged = data.reduce((prev, curr) => (curr.hlnm.gp > prev.hlnm.gp) ? curr : prev);
+        const leastChallenged = data.reduce((prev, curr) => (curr.hlnm.gp < prev.hlnm.gp) ? curr : prev);
+
+        const incomes = data.map(d => d.econ.income).filter(i => i > 0);
+        const lowestIncome = data.reduce((prev, curr) =>
+            ((curr.econ.income || 999999) < (prev.econ.income || 999999)) ? curr : prev);
+
+        const noQuals = data.map(d => d.econ.no_quals).filter(v => v > 0);
+        const highestNoQuals = noQuals.length ? Math.max(...noQuals) : 0;
+
+        return new Float64Array([
+            lsoaCount,
+            growth.reduce((a, b) => a + b, 0) / growth.length,
+            Math.max(...growth) - Math.min(...growth),
+            leastChallenged.hlnm.gp,
+            mostChallenged.hlnm.gp,
+            incomes.reduce((a, b) => a + b, 0) / incomes.length,
+            number(lowestIncome.econ.income),
+            highestNoQuals
+        ]);
+    }
+
+    // ------------------------------------------------------------------
+    // Tasks: run in the worker, or in-thread by AreaAnalysis as a fallback
+    // ------------------------------------------------------------------
+
+    const TASKS = {
+        async tile(context, kind, code, level = 2) {
+            const response = await fetch(assetUrl(`./boundaries/${level}/${kind}/${code}.json`));
+            if (!response.ok) throw new Error(`No boundary tile for ${code}`);
+            return decodeTile(await response.json());
+        },
+
+        // Everything displayArea and the deep dive need beyond the area record
+        async analyse(context, msoa) {
+            const found = await context.shards.area(msoa);
+            if (!found) return null;
+            const { area, shard } = found;
+            const lsoas = (shard.lsoaMap[msoa] || []).map(l => ({
+                code: l.c,
+                hlnm: shard.lsoaHlnm[l.c],
+                econ: shard.lsoaEconomic[l.c]
+            }));
+            return {
+                imd: compareAreas([area], IMD_COLUMNS, context.benchmarks),
+                story: storyInsights(lsoas.length, lsoas),
+                deepDive: compareIndicators(lsoas.filter(l => l.econ), context.benchmarks)
+            };
+        },
+
+        // Any number of areas side by side on the given columns
+        async compare(context, msoas, columns = IMD_COLUMNS) {
+            const found = await Promise.all(msoas.map(msoa => context.shards.area(msoa)));
+            return compareAreas(found.filter(f => f).map(f => f.area), columns, context.benchmarks);
+        },
+
+        // The comparison matrix for MSOAs (kind 'msoa') or LSOAs ('lsoa',
+        // with the MSOA each is in); codes that cannot be found are left out
+        async matrix(context, kind, codes, msoas = codes) {
+            // Each LA shard is fetched once, however many areas are in it
+            const shards = new Map();
+            for (const msoa of msoas) {
+                const laCode = context.shards.laCode(msoa);
+                if (laCode !== null && !shards.has(laCode)) shards.set(laCode, context.shards.shard(laCode));
+            }
+            await Promise.all(shards.values());
+
+            const rows = [];
+            for (let i = 0; i < codes.length; i++) {
+                const laCode = context.shards.laCode(msoas[i]);
+                if (laCode === null) continue;
+                const shard = await shards.get(laCode);
+                const row = shard.areas.find(msoas[i]);
+                if (row === undefined) continue;
+                const area = shard.areas.record(row);
+                if (kind === 'msoa') {
+                    rows.push({
+                        code: area.msoa_code,
+                        name: area.neighbourhood_name || area.msoa_code,
+                        record: area,
+                        localAuthority: area.local_authority
+                    });
+                    continue;
+                }
+                const hlnm = shard.lsoaHlnm[codes[i]];
+                const econ = shard.lsoaEconomic[codes[i]];
+                if (!hlnm && !econ) continue;
+                rows.push({
+                    code: codes[i],
+                    name: (hlnm && hlnm.n) || codes[i],
+                    record: Object.assign({}, hlnm, econ),
+                    localAuthority: area.local_authority
+                });
+            }
+            return comparisonMatrix(rows, COMPARISON_INDICATORS[kind], context.benchmarks);
+        }
+    };
+
+    // Every typed array buffer in a result, to transfer rather than copy
+    function transferables(value, found = new Set()) {
+        if (ArrayBuffer.isView(value)) {
+            found.add(value.buffer);
+        } else if (value && typeof value === 'object') {
+            Object.values(value).forEach(v => transferables(v, found));
+        }
+        return [...found];
+    }
+
+    if (inWorker) {
+        let context = null;
+        // Bundles asked of the main thread: request id -> {resolve, reject}
+        const loads = new Map();
+        let nextLoad = 0;
+        const loadShared = url => new Promise((resolve, reject) => {
+            const request = nextLoad++;
+            loads.set(request, { resolve, reject });
+            root.postMessage({ request, url });
+        }).then(readBundle);
+
+        root.onmessage = async ({ data }) => {
+            if (data.loaded !== undefined) {
+                const { resolve, reject } = loads.get(data.loaded);
+                loads.delete(data.loaded);
+                if (data.error === undefined) resolve(data.buffer);
+                else reject(new Error(data.error));
+                return;
+            }
+            const { id, type, args } = data;
+            try {
+                if (type === 'init') {
+                    const [{ shards, aggregates, manifest, shared }] = args;
+                    if (root.PipAssets) root.PipAssets.useManifest(manifest);
+                    const load = shared ? loadShared : loadBundle;
+                    context = Promise.all([
+                        openShards(shards, { load }),
+                        load(aggregates).catch(() => null)
+                    ]).then(([store, benchmarks]) => ({ shards: store, benchmarks }));
+                    await context;
+                    root.postMessage({ id, result: true });
+                    return;
+                }
+                const result = await TASKS[type](await context, ...args);
+                root.postMessage({ id, result }, transferables(result));
+            } catch (e) {
+                root.postMessage({ id, error: e.message || String(e) });
+            }
+        };
+        return;
+    }
+
+    // ------------------------------------------------------------------
+    // Main thread client
+    // ------------------------------------------------------------------
+
+    class AreaAnalysis {
+        // local() returns {shards, benchmarks} for running tasks in-thread,
+        // used when the worker cannot start or fails to initialise;
+        // bytes(url) returns (a promise of) the page's own ArrayBuffer of a
+        // bundle the worker needs, or null, so the worker does not fetch and
+        // decode what the page already has; without it the worker fetches
+        constructor({ local, bytes = null, shards = './shards/', aggregates = './aggregates.bin', worker = './area_worker.js' }) {
+            this.local = local;
+            this.bytes = bytes;
+            this.pending = new Map();
+            this.nextId = 0;
+            this.worker = null;
+            if (typeof Worker === 'undefined') return;
+            try {
+                this.worker = new Worker(assetUrl(worker));
+            } catch (e) {
+                console.warn('Area worker unavailable, analysing on the main thread:', e);
+                return;
+            }
+            this.worker.onmessage = e => (e.data.url !== undefined ? this.provide(e.data) : this.settle(e.data));
+            this.worker.onerror = e => this.abandon(e);
+            const manifest = root.PipAssets ? root.PipAssets.current() : null;
+            const shared = Boolean(bytes);
+            this.send('init', [{ shards, aggregates, manifest, shared }]).catch(e => this.abandon(e));
+        }
+
+        // Answers the worker's request for a bundle with a transferred copy
+        // of the page's bytes; the page's tables still view the original
+        async provide({ request, url }) {
+            let message;
+            try {
+                const buffer = await this.bytes(url);
+                if (!buffer) throw new Error(`${url} is not loaded`);
+                message = { loaded: request, buffer: buffer.slice(0) };
+            } catch (e) {
+                message = { loaded: request, error: e.message || String(e) };
+            }
+            if (this.worker) this.worker.postMessage(message, message.buffer ? [message.buffer] : []);
+        }
+
+        send(type, args) {
+            return new Promise((resolve, reject) => {
+                const id = this.nextId++;
+                this.pending.set(id, { type, args, resolve, reject });
+                this.worker.postMessage({ id, type, args });
+            });
+        }
+
+        settle({ id, result, error }) {
+            const request = this.pending.get(id);
+            if (!request) return;
+            this.pending.delete(id);
+            if (error === undefined) request.resolve(result);
+            else request.reject(new Error(error));
+        }
+
+        // Stop using the worker; anything still waiting runs in-thread
+        abandon(reason) {
+            if (!this.worker) return;
+            console.warn('Area worker failed, analysing on the main thread:', reason);
+            this.worker.terminate();
+            this.worker = null;
+            for (const { type, args, resolve, reject } of this.pending.values()) {
+                if (type !== 'init') this.runLocal(type, args).then(resolve, reject);
+            }
+            this.pending.clear();
+        }
+
+        runLocal(type, args) {
+            return TASKS[type](this.local(), ...args);
+        }
+
+        run(type, ...args) {
+            return this.worker ? this.send(type, args) : this.runLocal(type, args);
+        }
+
+        tile(kind, code, level = 2) {
+            return this.run('tile', kind, code, level);
+        }
+
+        analyse(msoa) {
+            return this.run('analyse', msoa);
+        }
+
+        compare(msoas, columns = IMD_COLUMNS) {
+            return this.run('compare', msoas, columns);
+        }
+
+        matrix(kind, codes, msoas = codes) {
+            return this.run('matrix', kind, codes, msoas);
+        }
+    }
+
+    const api = {
+        AreaAnalysis, ENGLAND_CODE, INDICATORS, INDICATOR_KEYS, IMD_COLUMNS, STORY_FIELDS,
+        COMPARISON_INDICATORS, BENCHMARK_LEVELS, WORSE, BETTER, NO_COMPARISON, NO_BENCHMARK,
+        fields, decodeTile, tileFeatures, benchmarkValue, benchmarkAreas,
+        compareAreas, comparisonMatrix, compareValue, compareIndicators, storyInsights
+    };
+    if (typeof module !== 'undefined' && module.exports) {
+        module.exports = api;
+    } else {
+        root.PipAnalysis = api;
+    }
+})(typeof self !== 'undefined' ? self : this);
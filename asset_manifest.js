@@ -0,0 +1,43 @@
+// Pride in Place Data Explorer - asset manifest
+// Maps the file names the dashboard asks for to the content-hashed names
+// publish.py gives them (manifest.json, written alongside). Hashed files never
+// change, so they are cached for good; a new build is picked up by fetching
+// the manifest again. Without a manifest (the repository served as it is)
+// every name resolves to itself.
+
+(function (root) {
+    let manifest = null;
+
+    function useManifest(value) {
+        manifest = value && value.files ? value : null;
+        return manifest;
+    }
+
+    async function loadManifest(url = './manifest.json') {
+        try {
+            // Revalidated on every load: it is the one file that names a build
+            const response = await fetch(url, { cache: 'no-cache' });
+            return useManifest(response.ok ? await response.json() : null);
+        } catch (e) {
+            return useManifest(null);
+        }
+    }
+
+    // './shards/la/E08000025.bin' -> './shards/la/E08000025.3f09a1c2b4.bin'
+    function assetUrl(url) {
+        if (!manifest) return url;
+        const hashed = manifest.files[url.replace(/^\.\//, '')];
+        return hashed ? `./${hashed}` : url;
+    }
+
+    function current() {
+        return manifest;
+    }
+
+    const api = { loadManifest, useManifest, assetUrl, current };
+    if (typeof module !== 'undefined' && module.exports) {
+        module.exports = api;
+    } else {
+        root.PipAssets = api;
+    }
+})(typeof self !== 'undefined' ? self : this);
@@ -0,0 +1,111 @@
+// Benchmark: dashboard data load, JSON + JS globals vs. the binary bundle.
+//
+// Compares the bytes shipped (raw and gzipped) and the time to get from the
+// downloaded text/buffer to data the dashboard can use:
+//
+// - before: JSON.parse the area dataset and evaluate the three LSOA data
+//           scripts (what the browser did on every page load)
+// - after:  readBundle on the same tables packed as one bundle (encoded by
+//           bundle.py for this run), then decode one area the way the
+//           dashboard does when it is selected (and, for reference, all rows)
+//
+// Run from the repository root:
+//     node benchmarks/bench_bundle.js
+
+const { execFileSync } = require('child_process');
+const fs = require('fs');
+const path = require('path');
+const zlib = require('zlib');
+const { performance } = require('perf_hooks');
+
+const ROOT = path.resolve(__dirname, '..');
+const PYTHON = process.env.PYTHON || 'python';
+const { readBundle } = require(path.join(ROOT, 'bundle_reader.js'));
+
+const REPEATS = 200;
+const SCRIPTS = {
+    LSOA_MAP_DATA: 'lsoa_embedded_data_temp.js',
+    LSOA_HLNM_DATA: 'lsoa_hlnm_data.js',
+    LSOA_ECONOMIC_DATA: 'lsoa_economic_underlying.js'
+};
+
+function read(name) {
+    return fs.readFileSync(path.join(ROOT, name));
+}
+
+function median(fn) {
+    const times = [];
+    for (let i = 0; i < REPEATS; i++) {
+        const start = performance.now();
+        fn();
+        times.push(performance.now() - start);
+    }
+    times.sort((a, b) => a - b);
+    return times[Math.floor(times.length / 2)];
+}
+
+function kb(bytes) {
+    return `${(bytes / 1024).toFixed(1)} KB`;
+}
+
+const areasText = read('data.json').toString('utf8').replace(/^﻿/, '');
+const scriptTexts = Object.entries(SCRIPTS).map(([name, file]) =>
+    [name, read(file).toString('utf8').replace(/^﻿/, '')]);
+const bundleBytes = execFileSync(PYTHON, ['-c',
+    'import sys; sys.path.insert(0, sys.argv[1]); import bundle; '
+    + 'sys.stdout.buffer.write(bundle.encode_bundle(*bundle.load_dashboard_tables()))', ROOT],
+    { maxBuffer: 64 * 1024 * 1024 });
+const buffer = bundleBytes.buffer.slice(bundleBytes.byteOffset, bundleBytes.byteOffset + bundleBytes.length);
+
+const beforeFiles = [Buffer.from(areasText), ...scriptTexts.map(([, text]) => Buffer.from(text))];
+const beforeRaw = beforeFiles.reduce((n, b) => n + b.length, 0);
+const beforeGzip = beforeFiles.reduce((n, b) => n + zlib.gzipSync(b, { level: 9 }).length, 0);
+const afterGzip = zlib.gzipSync(bundleBytes, { level: 9 }).length;
+
+function loadBefore() {
+    const data = JSON.parse(areasText);
+    const globals = {};
+    for (const [name, text] of scriptTexts) {
+        globals[name] = new Function(`${text}\nreturn ${name};`)();
+    }
+    return [data, globals];
+}
+
+const msoa = JSON.parse(areasText).areas[0].msoa_code;
+
+function loadAfterOneArea() {
+    const bundle = readBundle(buffer);
+    const { areas, lsoa_map, lsoa_hlnm, lsoa_economic } = bundle.tables;
+    const area = areas.record(areas.find(msoa));
+    const lsoas = lsoa_map.grouped()[msoa];
+    const hlnm = lsoa_hlnm.keyed();
+    const econ = lsoa_economic.keyed();
+    return [area, lsoas.map(l => [hlnm[l.c], econ[l.c]])];
+}
+
+function loadAfterEverything() {
+    const bundle = readBundle(buffer);
+    return Object.values(bundle.tables).map(t => {
+        const rows = [];
+        for (let i = 0; i < t.rows; i++) rows.push(t.record(i));
+        return rows;
+    });
+}
+
+// Warm the JIT before timing
+for (let i = 0; i < 20; i++) {
+    loadBefore();
+    loadAfterOneArea();
+    loadAfterEverything();
+}
+
+const before = median(loadBefore);
+const afterOne = median(loadAfterOneArea);
+const afterAll = median(loadAfterEverything);
+
+console.log('Dashboard data: JSON + JS globals vs. binary bundle');
+console.log(`  size (raw)      ${kb(beforeRaw).padStart(10)} -> ${kb(bundleBytes.length).padStart(10)}`);
+console.log(`  size (gzip -9)  ${kb(beforeGzip).padStart(10)} -> ${kb(afterGzip).padStart(10)}`);
+console.log(`  parse           ${before.toFixed(3).padStart(7)} ms -> ${afterOne.toFixed(3).padStart(7)} ms (open + one area)`);
+console.log(`                  ${''.padStart(10)}    ${afterAll.toFixed(3).padStart(7)} ms (open + every row)`);
+console.log(`  (median of ${REPEATS} runs)`);
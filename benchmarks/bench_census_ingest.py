@@ -0,0 +1,97 @@
+"""
+Benchmark: Census 2021 ingestion, extract-then-parse vs. streamed typed parse.
+
+Builds NOMIS-shaped ZIPs for the eight TS tables (one MSOA CSV per archive,
+7,264 rows) in a temporary directory, then times and memory-profiles:
+
+- before: extract the MSOA member to disk, then a plain pd.read_csv
+- after:  data_gatherer.read_census_msoa straight from the archive
+
+Run from the repository root:
+    python benchmarks/bench_census_ingest.py
+"""
+
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import data_gatherer  # noqa: E402
+import fixtures  # noqa: E402
+
+MSOA_COUNT = 7264
+
+
+def build_fixtures(directory, rows=MSOA_COUNT, seed=0):
+    """Write one NOMIS-shaped ZIP per table and return their paths."""
+    codes = [f"E02{i:06d}" for i in range(1, rows + 1)]
+    names = [f"Synthetic MSOA {i:03d}" for i in range(1, rows + 1)]
+    return fixtures.write_census_zips(directory, codes, names, np.random.default_rng(seed))
+
+
+def legacy_ingest(zip_path, workdir):
+    """Pre-change path: extract the member to disk, then parse every column."""
+    csv_path = Path(workdir) / f"{zip_path.stem}_msoa.csv"
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        member = data_gatherer.find_msoa_member(zf, zip_path.stem)
+        with zf.open(member) as source:
+            content = source.read()
+        with open(csv_path, 'wb') as target:
+            target.write(content)
+    return pd.read_csv(csv_path)
+
+
+def streamed_ingest(zip_path, keywords):
+    """Current path: typed, column-pruned parse straight from the archive."""
+    return data_gatherer.read_census_msoa(zip_path, keywords)
+
+
+def measure(label, load, repeats=5):
+    """Best-of-n wall clock, peak traced allocation and resident frame size."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        frames = load()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    frames = load()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    frame_bytes = sum(f.memory_usage(deep=True).sum() for f in frames)
+    print(f"  {label:<8} {min(timings) * 1000:8.1f} ms   "
+          f"peak {peak / 1e6:7.1f} MB   frames {frame_bytes / 1e6:6.1f} MB")
+    return min(timings), peak, frame_bytes
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = build_fixtures(tmp)
+        tables = {
+            dataset: paths[table]
+            for dataset, (_, table) in data_gatherer.CENSUS_TABLES.items()
+        }
+
+        print(f"Census ingestion, {len(tables)} tables x {MSOA_COUNT:,} MSOAs")
+        before = measure("before", lambda: [
+            legacy_ingest(path, tmp) for path in tables.values()
+        ])
+        after = measure("after", lambda: [
+            streamed_ingest(path, data_gatherer.CENSUS_COLUMN_KEYWORDS[dataset])
+            for dataset, path in tables.items()
+        ])
+
+        print(f"  speed-up {before[0] / after[0]:.1f}x, "
+              f"peak memory {before[1] / after[1]:.1f}x lower, "
+              f"frames {before[2] / after[2]:.1f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+// Benchmark: comparison mode, one area at a time vs. one matrix.
+//
+// Times how long the dashboard takes to get N areas ready to compare on the
+// comparison indicators (PipAnalysis.COMPARISON_INDICATORS.msoa):
+//
+// - before: compareAreas on each area in turn, as the per-area analysis
+//           (displayArea) does, which gives values and benchmarks only
+// - after:  the area worker's matrix task, one comparisonMatrix over all N
+//           with z-scores, percentile deltas and nearest-benchmark
+//           differences as well
+//
+// Areas are the dashboard's own, repeated to reach N, with the shards and
+// aggregates already fetched. Comparing 50 areas should take under 100 ms.
+//
+// Run from the repository root after `python bundle.py` and
+// `python aggregates.py`:
+//     node benchmarks/bench_compare.js [aggregates.bin]
+
+const fs = require('fs');
+const path = require('path');
+const { performance } = require('perf_hooks');
+
+const ROOT = path.resolve(__dirname, '..');
+const { readBundle } = require(path.join(ROOT, 'bundle_reader.js'));
+const { openShards } = require(path.join(ROOT, 'shard_reader.js'));
+const PipAnalysis = require(path.join(ROOT, 'area_worker.js'));
+
+const SIZES = [10, 50, 200, 1000];
+const REPEATS = 20;
+const BUDGET_MS = 100;
+
+function read(file) {
+    const bytes = fs.readFileSync(file);
+    return readBundle(bytes.buffer.slice(bytes.byteOffset, bytes.byteOffset + bytes.length));
+}
+
+async function timed(fn) {
+    const times = [];
+    for (let i = 0; i < REPEATS; i++) {
+        const start = performance.now();
+        await fn();
+        times.push(performance.now() - start);
+    }
+    times.sort((a, b) => a - b);
+    return times[Math.floor(times.length / 2)];
+}
+
+(async () => {
+    const aggregates = process.argv[2] || path.join(ROOT, 'aggregates.bin');
+    const benchmarks = fs.existsSync(aggregates) ? read(aggregates) : null;
+    if (!benchmarks) console.log(`No ${aggregates}; comparing without benchmarks`);
+
+    const shards = await openShards('shards/', { load: async url => read(path.join(ROOT, url)), capacity: 64 });
+    const analysis = new PipAnalysis.AreaAnalysis({ local: () => ({ shards, benchmarks }) });
+    const columns = PipAnalysis.COMPARISON_INDICATORS.msoa.map(i => i.key);
+    const codes = shards.msoas.column('msoa_code');
+
+    console.log(`${'areas'.padStart(6)} ${'before'.padStart(10)} ${'after'.padStart(10)}`);
+    for (const size of SIZES) {
+        const msoas = Array.from({ length: size }, (_, i) => codes[i % codes.length]);
+        await analysis.matrix('msoa', msoas);  // warm the shard cache
+        const before = await timed(async () => {
+            for (const msoa of msoas) {
+                const { area } = await shards.area(msoa);
+                PipAnalysis.compareAreas([area], columns, benchmarks);
+            }
+        });
+        const after = await timed(() => analysis.matrix('msoa', msoas));
+        const flag = size >= 50 && after > BUDGET_MS ? `  over the ${BUDGET_MS} ms budget` : '';
+        console.log(`${String(size).padStart(6)} ${before.toFixed(2).padStart(7)} ms ${after.toFixed(2).padStart(7)} ms${flag}`);
+    }
+})();
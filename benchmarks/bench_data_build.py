@@ -0,0 +1,245 @@
+"""
+Benchmark: every stage of the data build, offline, at three sizes.
+
+fixtures.write_fixtures lays out synthetic copies of every source the build
+reads (the NOMIS Census ZIPs, the IMD LSOA file, the lookup CSV, the Pride in
+Place list and the HLNM and CNI files) for an England of 40 MSOAs, 400 and
+6,856 (all of England), every MSOA in the Pride in Place list. data_gatherer
+is pointed at them and run the way main() runs it, timing each stage:
+
+    load_*            from a cold columnar store (a fresh store per run), and
+                      again warm, from the store the cold run left
+    process_*         each Census table's measures
+    build_census_measures, aggregate_imd_to_msoa, build_final_dataset,
+    add_england_percentiles (the final areas against all of England),
+    export_to_json
+
+Times are the best of --repeats cold runs; peak memory is the largest
+allocation traced within the stage, from one more run under tracemalloc.
+The results go to data/benchmarks/data_build.json (or --out) with the
+environment they were measured in. If that file already holds a run, or
+--baseline names one, every stage is compared with it and one more than
+--tolerance slower (and by more than MIN_REGRESSION_MS) is reported as a
+regression; the script then exits with status 1.
+
+Run from the repository root:
+    python benchmarks/bench_data_build.py [--sizes 1x 10x england]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import columnar_store  # noqa: E402
+import data_gatherer  # noqa: E402
+import fixtures  # noqa: E402
+
+SIZES = {"1x": 40, "10x": 400, "england": fixtures.ENGLAND_MSOAS}
+RESULTS_FILE = ROOT / "data" / "benchmarks" / "data_build.json"
+REPEATS = 3
+TOLERANCE = 0.25
+# Differences below this are timer noise at the 1x size
+MIN_REGRESSION_MS = 5.0
+PROCESS_STAGES = {
+    "process_economic_activity": "economic_activity",
+    "process_health": "health",
+    "process_qualifications": "qualifications",
+    "process_deprivation": "deprivation",
+    "process_tenure": "tenure",
+}
+
+
+@contextlib.contextmanager
+def pointed_at(paths, store_dir):
+    """data_gatherer reading the fixtures in paths, caching in store_dir."""
+    saved = (data_gatherer.DATA_DIR, data_gatherer.HLNM_FILE, data_gatherer.CNI_FILES,
+             columnar_store.STORE_DIR)
+    data_gatherer.DATA_DIR = paths["data_dir"]
+    data_gatherer.HLNM_FILE = paths["hlnm_file"]
+    data_gatherer.CNI_FILES = paths["cni_files"]
+    columnar_store.STORE_DIR = Path(store_dir)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        (data_gatherer.DATA_DIR, data_gatherer.HLNM_FILE, data_gatherer.CNI_FILES,
+         columnar_store.STORE_DIR) = saved
+
+
+class Stages:
+    """Runs stages one after another, recording each one's time and rows."""
+
+    def __init__(self, traced=False):
+        self.traced = traced
+        self.seconds, self.peaks, self.rows = {}, {}, {}
+
+    def run(self, name, func, *args):
+        if self.traced:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = func(*args)
+        self.seconds[name] = time.perf_counter() - start
+        if self.traced:
+            self.peaks[name] = tracemalloc.get_traced_memory()[1] - base
+        # Rows out; export_to_json returns nothing, so it counts rows in
+        frame = args[0] if result is None else result
+        frame = frame[0] if isinstance(frame, tuple) else frame
+        if isinstance(frame, dict):
+            frame = next(iter(frame.values()))
+        self.rows[name] = len(frame)
+        return result
+
+
+def build(stages, output_path):
+    """The data build, stage by stage, as data_gatherer.main() runs it."""
+    pip = stages.run("load_pip_msoas", data_gatherer.load_pip_msoas)
+    lookup = stages.run("load_lsoa_msoa_lookup", data_gatherer.load_lsoa_msoa_lookup)
+    all_msoa_codes = lookup['MSOA21CD'].unique().tolist()
+    census = stages.run("load_census_data", data_gatherer.load_census_data)
+    imd, lsoa_col = stages.run("load_imd_data", data_gatherer.load_imd_data, lookup)
+    stages.run("load_hlnm_data", data_gatherer.load_hlnm_data)
+    stages.run("load_cni_data", data_gatherer.load_cni_data)
+    need = stages.run("load_need_data", data_gatherer.load_need_data)
+
+    for name, dataset in PROCESS_STAGES.items():
+        stages.run(name, getattr(data_gatherer, name), census[dataset], all_msoa_codes)
+    census_msoa = stages.run("build_census_measures", data_gatherer.build_census_measures,
+                             census, all_msoa_codes)
+    imd_msoa = stages.run("aggregate_imd_to_msoa", data_gatherer.aggregate_imd_to_msoa,
+                          imd, lsoa_col, lookup)
+    final = stages.run("build_final_dataset", data_gatherer.build_final_dataset,
+                       pip, census_msoa, imd_msoa, [need])
+    final = stages.run("add_england_percentiles", data_gatherer.add_england_percentiles,
+                       final, census_msoa, imd_msoa)
+    stages.run("export_to_json", data_gatherer.export_to_json, final, output_path)
+
+
+def measure(paths, workdir, repeats):
+    """{stage: {ms, warm_ms, peak_mb, rows}} for one set of fixtures."""
+    output_path = Path(workdir) / "data.json"
+    cold = []
+    for run in range(repeats):
+        stages = Stages()
+        with pointed_at(paths, Path(workdir) / f"store-{run}"):
+            build(stages, output_path)
+        cold.append(stages)
+
+    warm = Stages()
+    with pointed_at(paths, Path(workdir) / "store-0"):
+        build(warm, output_path)
+
+    traced = Stages(traced=True)
+    tracemalloc.start()
+    try:
+        with pointed_at(paths, Path(workdir) / "store-traced"):
+            build(traced, output_path)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        name: {
+            "ms": round(min(s.seconds[name] for s in cold) * 1000, 2),
+            "warm_ms": round(warm.seconds[name] * 1000, 2),
+            "peak_mb": round(traced.peaks[name] / 1e6, 2),
+            "rows": warm.rows[name],
+        }
+        for name in warm.seconds
+    }
+
+
+def environment():
+    """Where the numbers were measured, so runs on different machines are told apart."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "generated": pd.Timestamp.now().isoformat(timespec='seconds'),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "pyarrow": pa.__version__,
+    }
+
+
+def regressions(results, baseline, tolerance):
+    """[(size, stage, before ms, after ms)] for stages slower than the baseline."""
+    slower = []
+    for size, stages in results.items():
+        for name, now in stages.items():
+            before = baseline.get(size, {}).get(name)
+            if before is None:
+                continue
+            if now["ms"] > before["ms"] * (1 + tolerance) and now["ms"] - before["ms"] > MIN_REGRESSION_MS:
+                slower.append((size, name, before["ms"], now["ms"]))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the data build on synthetic fixtures")
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES))
+    parser.add_argument('--repeats', type=int, default=REPEATS, help="cold runs per size, best kept")
+    parser.add_argument('--out', default=str(RESULTS_FILE))
+    parser.add_argument('--baseline', help="results file to compare with (default: the previous --out)")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="slowdown reported as a regression, as a fraction")
+    args = parser.parse_args()
+
+    out_path = Path(args.out)
+    baseline_path = Path(args.baseline) if args.baseline else out_path
+    baseline = json.loads(baseline_path.read_text())["results"] if baseline_path.exists() else {}
+
+    results = {}
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            paths = fixtures.write_fixtures(Path(tmp) / "fixtures", SIZES[size])
+            print(f"\n{size}: {paths['msoas']:,} MSOAs, {paths['lsoas']:,} LSOAs "
+                  f"(fixtures in {time.perf_counter() - start:.1f}s)")
+            results[size] = measure(paths, tmp, args.repeats)
+
+        print(f"  {'stage':<28} {'cold':>10} {'warm':>10} {'peak':>10} {'rows':>8}")
+        for name, stage in results[size].items():
+            print(f"  {name:<28} {stage['ms']:>7.1f} ms {stage['warm_ms']:>7.1f} ms "
+                  f"{stage['peak_mb']:>7.1f} MB {stage['rows']:>8,}")
+        print(f"  {'total':<28} {sum(s['ms'] for s in results[size].values()):>7.1f} ms "
+              f"{sum(s['warm_ms'] for s in results[size].values()):>7.1f} ms")
+
+    slower = regressions(results, baseline, args.tolerance)
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps({
+        "environment": environment(),
+        "repeats": args.repeats,
+        "results": results,
+    }, indent=2))
+    print(f"\nWrote {out_path}")
+
+    if baseline and not slower:
+        print(f"No regressions against {baseline_path.name}")
+    for size, name, before, after in slower:
+        print(f"  REGRESSION {size} {name}: {before:.1f} ms -> {after:.1f} ms")
+    if slower:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: exporting areas, one JSON document vs. streamed chunks.
+
+Exports every MSOA and every LSOA in England (the national tables the query
+service serves) and reports time to first byte, total time and peak Python
+memory (tracemalloc, in a second run so tracing does not skew the times)
+for:
+
+- before: export_to_json's approach, to_dict(orient='records'), a loop
+          replacing NaN in every value, then json.dump with indent=2
+- after:  export.stream as csv, xlsx and geojson, CHUNK_ROWS rows at a time
+
+Output goes to a counting sink, so disk speed is not measured.
+
+Run from the repository root after the pipeline's census, imd and need
+stages:
+    python benchmarks/bench_export.py
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import export  # noqa: E402
+
+
+class Counter:
+    """A text/binary sink that only counts what it is given."""
+
+    def __init__(self):
+        self.size = 0
+        self.first = None
+
+    def write(self, data):
+        if self.first is None and data:
+            self.first = time.perf_counter()
+        self.size += len(data)
+
+
+def before(rows, sink):
+    records = rows.to_dict(orient='records')
+    for record in records:
+        for key, value in record.items():
+            if pd.isna(value):
+                record[key] = None
+    json.dump({"areas": records}, sink, indent=2, ensure_ascii=False, default=str)
+
+
+def after(rows, fmt, level, sink):
+    for data in export.stream(rows, fmt, level):
+        sink.write(data)
+
+
+def measure(fn, *args):
+    """(first byte s, total s, size) untraced, then peak bytes traced."""
+    sink = Counter()
+    start = time.perf_counter()
+    fn(*args, sink)
+    total = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(*args, Counter())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return sink.first - start, total, peak, sink.size
+
+
+def main():
+    areas, lsoas = export.load_tables()
+    print(f"\n{'':24} {'first byte':>11} {'total':>10} {'peak memory':>12} {'size':>10}")
+    for level in export.LEVELS:
+        rows = export.select(areas, lsoas, None, level)
+        runs = [(f"{level} json (before)", before, (rows,))]
+        runs += [(f"{level} {fmt}", after, (rows, fmt, level)) for fmt in export.FORMATS]
+        for label, fn, args in runs:
+            first, total, peak, size = measure(fn, *args)
+            print(f"{label:24} {first * 1000:>8.1f} ms {total * 1000:>7.0f} ms "
+                  f"{peak / 1024 / 1024:>9.1f} MB {size / 1024 / 1024:>7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
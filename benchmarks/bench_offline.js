@@ -0,0 +1,308 @@
+// Benchmark: network bytes per visit and offline rendering with the Service Worker.
+//
+// Publishes the site to a temporary directory, serves it with
+// `python publish.py serve`, and runs service_worker.js against it in a vm
+// (an in-memory Cache Storage stands in for the browser's). A visit is what
+// the dashboard fetches: index.html and its scripts, manifest.json, the shard
+// index, benchmarks and search index, then for each area opened its LA shard,
+// boundary tile and the CARTO basemap tiles around it (basemap and unpkg
+// requests get synthetic responses of BASEMAP_TILE_BYTES). Bytes are as sent
+// (gzip); manifest.json is counted in full, where a browser would get a 304
+// for an unchanged build, and the first visit's precache downloads the shell
+// again, where a browser would take it from the HTTP cache. Measured:
+//
+// - before: no Service Worker; every visit downloads everything again
+// - after:  the first three visits, a visit offline, the visits after a
+//           new build is published, and the runtime caches' entry counts
+//           after browsing more areas than they hold
+//
+// Run from the repository root:
+//     node benchmarks/bench_offline.js
+
+const { execFileSync, spawn } = require('child_process');
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const vm = require('vm');
+
+const ROOT = path.resolve(__dirname, '..');
+const PYTHON = process.env.PYTHON || 'python';
+const BASEMAP_TILE_BYTES = 20000;
+const BASEMAP_TILES_PER_AREA = 20;
+const AREAS_PER_VISIT = 5;
+const BROWSED_AREAS = 60;
+
+// ----------------------------------------------------------------------
+// Network and Cache Storage as the worker sees them
+// ----------------------------------------------------------------------
+
+const network = { offline: false, bytes: 0, requests: 0 };
+
+async function networkFetch(input, init) {
+    const request = new Request(input, init);
+    if (network.offline) throw new TypeError('Failed to fetch (offline)');
+    network.requests++;
+    const url = new URL(request.url);
+    if (url.hostname !== 'localhost') {
+        network.bytes += BASEMAP_TILE_BYTES;
+        return new Response(new Uint8Array(BASEMAP_TILE_BYTES), { status: 200 });
+    }
+    const response = await fetch(request, { headers: { 'Accept-Encoding': 'gzip' } });
+    network.bytes += Number(response.headers.get('Content-Length') || 0);
+    return response;
+}
+
+class MemoryCache {
+    constructor() {
+        this.entries = new Map();
+    }
+
+    async match(request) {
+        const entry = this.entries.get(new Request(request).url);
+        return entry ? new Response(entry.body, entry.init) : undefined;
+    }
+
+    async put(request, response) {
+        const url = new Request(request).url;
+        const body = await response.arrayBuffer();
+        this.entries.delete(url);
+        this.entries.set(url, { body, init: { status: response.status, headers: response.headers } });
+    }
+
+    async addAll(urls) {
+        const responses = await Promise.all(urls.map(url => networkFetch(url)));
+        if (responses.some(r => !r.ok)) throw new TypeError('addAll: a request failed');
+        for (let i = 0; i < urls.length; i++) await this.put(urls[i], responses[i]);
+    }
+
+    async keys() {
+        return [...this.entries.keys()].map(url => new Request(url));
+    }
+
+    async delete(request) {
+        return this.entries.delete(new Request(request).url);
+    }
+}
+
+class MemoryCacheStorage {
+    constructor() {
+        this.caches = new Map();
+    }
+
+    async open(name) {
+        if (!this.caches.has(name)) this.caches.set(name, new MemoryCache());
+        return this.caches.get(name);
+    }
+
+    async keys() {
+        return [...this.caches.keys()];
+    }
+
+    async delete(name) {
+        return this.caches.delete(name);
+    }
+
+    async match(request) {
+        for (const cache of this.caches.values()) {
+            const response = await cache.match(request);
+            if (response) return response;
+        }
+        return undefined;
+    }
+}
+
+// ----------------------------------------------------------------------
+// The worker and the page
+// ----------------------------------------------------------------------
+
+function startWorker(base) {
+    const listeners = {};
+    const scope = {
+        registration: { scope: `${base}/` },
+        caches: new MemoryCacheStorage(),
+        clients: { claim: async () => {} },
+        skipWaiting: async () => {},
+        addEventListener: (type, listener) => { listeners[type] = listener; },
+        fetch: networkFetch,
+        Request, Response, URL, console, setTimeout, clearTimeout
+    };
+    scope.self = scope;
+    vm.createContext(scope);
+    vm.runInContext(fs.readFileSync(path.join(ROOT, 'service_worker.js'), 'utf8'), scope);
+
+    // Runs a lifecycle or fetch event and everything it waits on
+    async function dispatch(type, event) {
+        const extensions = [];
+        event.waitUntil = promise => extensions.push(promise);
+        listeners[type](event);
+        while (extensions.length) await extensions.shift();
+    }
+
+    return {
+        caches: scope.caches,
+        install: () => dispatch('install', {}),
+        async fetch(url, { mode = 'cors' } = {}) {
+            const request = new Request(url);
+            Object.defineProperty(request, 'mode', { value: mode });
+            let responded = null;
+            const event = { request, respondWith: promise => { responded = promise; } };
+            const done = dispatch('fetch', event);
+            const response = await (responded || networkFetch(request));
+            const body = await response.arrayBuffer();
+            await done;
+            return { ok: response.ok, body };
+        }
+    };
+}
+
+// The page without a Service Worker
+async function direct(url) {
+    const response = await networkFetch(url);
+    return { ok: response.ok, body: await response.arrayBuffer() };
+}
+
+// One visit opening the given LA shards; fetch is the worker's or the
+// network's. Areas are numbered from firstArea to place their basemap tiles
+async function visit(base, fetchUrl, las, firstArea = 0) {
+    let failed = 0;
+    const get = async (url, options) => {
+        try {
+            const response = await fetchUrl(url, options);
+            if (!response.ok) failed++;
+            return response;
+        } catch (e) {
+            failed++;
+            return null;
+        }
+    };
+
+    const page = await get(`${base}/`, { mode: 'navigate' });
+    const html = page ? Buffer.from(page.body).toString() : '';
+    const scripts = [...html.matchAll(/<(?:script src|link rel="stylesheet" href)="([^"]+)"/g)].map(m => m[1]);
+    await Promise.all(scripts.map(src => get(new URL(src, `${base}/`).href, { mode: 'no-cors' })));
+
+    const manifestResponse = await get(`${base}/manifest.json`);
+    const files = manifestResponse ? JSON.parse(Buffer.from(manifestResponse.body)).files : {};
+    const asset = name => `${base}/${files[name] || name}`;
+    await Promise.all(['shards/index.bin', 'aggregates.bin', 'search_index.bin']
+        .filter(name => files[name])
+        .map(name => get(asset(name))));
+
+    for (const [i, la] of las.entries()) {
+        const requests = [get(asset(`shards/la/${la}.bin`))];
+        if (files[`boundaries/2/la/${la}.json`]) requests.push(get(asset(`boundaries/2/la/${la}.json`)));
+        for (let t = 0; t < BASEMAP_TILES_PER_AREA; t++) {
+            requests.push(get(`https://a.basemaps.cartocdn.com/light_all/14/${8000 + firstArea + i}/${5000 + t}.png`, { mode: 'no-cors' }));
+        }
+        await Promise.all(requests);
+    }
+    return { failed, build: manifestResponse ? JSON.parse(Buffer.from(manifestResponse.body)).build : null };
+}
+
+async function measured(label, run) {
+    network.bytes = 0;
+    network.requests = 0;
+    const result = await run();
+    console.log(`  ${label.padEnd(34)} ${(network.bytes / 1024).toFixed(1).padStart(9)} KB ` +
+                `${String(network.requests).padStart(6)} requests` +
+                `${result.failed ? `  ${result.failed} failed` : ''}${result.note ? `  ${result.note}` : ''}`);
+    return result;
+}
+
+// ----------------------------------------------------------------------
+// Publishing and serving
+// ----------------------------------------------------------------------
+
+function publish(root, out) {
+    const script = 'import sys; sys.path.insert(0, sys.argv[1]); import publish; publish.publish(sys.argv[2], sys.argv[3])';
+    execFileSync(PYTHON, ['-c', script, ROOT, out, root], { stdio: 'ignore' });
+}
+
+function serve(dir) {
+    return new Promise((resolve, reject) => {
+        const server = spawn(PYTHON, ['-u', path.join(ROOT, 'publish.py'), 'serve', '--dir', dir, '--port', '0']);
+        server.stdout.on('data', data => {
+            const found = /http:\/\/localhost:(\d+)/.exec(String(data));
+            if (found) resolve({ base: `http://localhost:${found[1]}`, stop: () => server.kill() });
+        });
+        server.on('exit', code => reject(new Error(`server exited with ${code}`)));
+    });
+}
+
+// A copy of the sources with area_worker.js changed, as a new build would be
+function changedSources(dir) {
+    for (const name of fs.readdirSync(ROOT)) {
+        if (/\.(js|html|bin|json|png)$/.test(name)) fs.copyFileSync(path.join(ROOT, name), path.join(dir, name));
+    }
+    for (const name of ['shards', 'boundaries']) {
+        if (fs.existsSync(path.join(ROOT, name))) fs.cpSync(path.join(ROOT, name), path.join(dir, name), { recursive: true });
+    }
+    fs.appendFileSync(path.join(dir, 'area_worker.js'), '\n// next build\n');
+}
+
+async function main() {
+    const tmp = fs.mkdtempSync(path.join(os.tmpdir(), 'pip-offline-'));
+    const site = path.join(tmp, 'site');
+    publish(ROOT, site);
+    const server = await serve(site);
+    const { base } = server;
+    try {
+        const las = fs.readdirSync(path.join(ROOT, 'shards', 'la')).map(f => f.replace('.bin', ''));
+        const opened = las.slice(0, AREAS_PER_VISIT);
+
+        console.log(`${AREAS_PER_VISIT} areas per visit, ${BASEMAP_TILES_PER_AREA} basemap tiles each\n`);
+        console.log('before (no Service Worker)');
+        await measured('any visit', () => visit(base, direct, opened));
+
+        console.log('\nafter');
+        const worker = startWorker(base);
+        // The page is not controlled until the worker installs, so areas are
+        // only cached from the second visit on
+        await measured('first visit (+ precache)', async () => {
+            const result = await visit(base, direct, opened);
+            await worker.install();
+            return result;
+        });
+        await measured('second visit', () => visit(base, worker.fetch, opened));
+        await measured('third visit', () => visit(base, worker.fetch, opened));
+
+        network.offline = true;
+        await measured('offline, areas seen before', () => visit(base, worker.fetch, opened));
+        await measured('offline, an area not seen', () => visit(base, worker.fetch, las.slice(AREAS_PER_VISIT, AREAS_PER_VISIT + 1)));
+        network.offline = false;
+
+        const sources = path.join(tmp, 'next');
+        fs.mkdirSync(sources);
+        changedSources(sources);
+        publish(sources, site);
+        const seen = await measured('visit after a new build', async () => {
+            const result = await visit(base, worker.fetch, opened);
+            return { ...result, note: `manifest names build ${result.build}` };
+        });
+        await measured('next visit', async () => {
+            const page = await worker.fetch(`${base}/`, { mode: 'navigate' });
+            const workerScript = /area_worker\.[0-9a-f]+\.js/.exec(Buffer.from(page.body).toString())[0];
+            const manifest = JSON.parse(fs.readFileSync(path.join(site, 'manifest.json')));
+            const result = await visit(base, worker.fetch, opened);
+            const current = manifest.files['area_worker.js'] === workerScript;
+            return { ...result, note: `index.html is build ${current ? seen.build : 'previous'}` };
+        });
+
+        for (let i = 0; i < BROWSED_AREAS; i++) {
+            await visit(base, worker.fetch, [las[i % las.length]], AREAS_PER_VISIT + i);
+        }
+        const counts = [];
+        for (const name of await worker.caches.keys()) {
+            counts.push(`${name} ${(await (await worker.caches.open(name)).keys()).length}`);
+        }
+        console.log(`\nCache entries after ${BROWSED_AREAS} more visits: ${counts.join(', ')}`);
+    } finally {
+        server.stop();
+        fs.rmSync(tmp, { recursive: true, force: true });
+    }
+}
+
+main().catch(e => {
+    console.error(e);
+    process.exit(1);
+});
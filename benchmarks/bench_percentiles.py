@@ -0,0 +1,107 @@
+"""
+Benchmark: England percentile ranking, per-area scan vs. sorted lookup.
+
+Times calculate_all_percentiles against the loop it replaced (for each area,
+count the England values strictly below it), on ENGLAND_MSOAS synthetic
+MSOAs and an increasing number of areas, and checks the two agree exactly,
+value for value. The data is built to hit the edge cases:
+
+- ties: values are rounded to 1 dp, so many areas share a value with each
+  other and with England MSOAs
+- NaN: some England values and some area values are missing
+- an area value below every England value and one above every one
+- a column that is missing for every England MSOA (percentiles all NaN)
+- the lower-is-worse columns, which are inverted
+
+tests/test_percentiles.py runs the same comparison under pytest.
+
+Run from the repository root:
+    python benchmarks/bench_percentiles.py
+"""
+
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import data_gatherer  # noqa: E402
+
+ENGLAND_MSOAS = 6856
+AREAS = [40, 400, 6856]
+NAN_SHARE = 0.05
+COLUMNS = data_gatherer.HIGHER_IS_WORSE + data_gatherer.LOWER_IS_WORSE + ['social_rented_pct']
+
+
+def baseline_percentiles(df, all_england_df):
+    """calculate_all_percentiles as it was before the sorted lookup."""
+    numeric_cols = df.select_dtypes(include=[np.number]).columns
+
+    for col in numeric_cols:
+        if col in ['msoa_code']:
+            continue
+
+        if col in all_england_df.columns:
+            all_values = all_england_df[col].dropna()
+
+            percentile_col = f"{col}_percentile"
+            df[percentile_col] = df[col].apply(
+                lambda x: (all_values < x).sum() / len(all_values) * 100 if pd.notna(x) else np.nan
+            )
+
+            if col in data_gatherer.LOWER_IS_WORSE:
+                df[percentile_col] = 100 - df[percentile_col]
+
+    return df
+
+
+def synthetic(rng, rows, codes):
+    """A frame of COLUMNS with ties (1 dp) and NaNs."""
+    df = pd.DataFrame({'msoa_code': codes})
+    for col in COLUMNS:
+        values = np.round(rng.gamma(2.0, 8.0, rows), 1)
+        values[rng.random(rows) < NAN_SHARE] = np.nan
+        df[col] = values
+    return df
+
+
+def main():
+    rng = np.random.default_rng(0)
+    england = synthetic(rng, ENGLAND_MSOAS, [f"E02{i:06d}" for i in range(ENGLAND_MSOAS)])
+    # Every England value of one column missing
+    england['social_rented_pct'] = np.nan
+
+    print(f"{ENGLAND_MSOAS:,} England MSOAs, {len(COLUMNS)} columns\n")
+    print(f"{'areas':>8} {'before':>12} {'after':>12}")
+    for size in AREAS:
+        areas = synthetic(rng, size, [f"E02{i:06d}" for i in range(size)])
+        # Outside the England range, and exactly on its extremes
+        areas.loc[0, COLUMNS[0]] = -1.0
+        areas.loc[1, COLUMNS[0]] = 1e6
+        areas.loc[2, COLUMNS[0]] = england[COLUMNS[0]].min()
+        areas.loc[3, COLUMNS[0]] = england[COLUMNS[0]].max()
+
+        start = time.perf_counter()
+        # The all-missing column divides by zero in the old loop
+        with np.errstate(invalid='ignore'):
+            expected = baseline_percentiles(areas.copy(), england)
+        before = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            found = data_gatherer.calculate_all_percentiles(areas.copy(), england)
+        after = time.perf_counter() - start
+
+        pd.testing.assert_frame_equal(found, expected, check_exact=True)
+        print(f"{size:>8,} {before * 1000:>9.1f} ms {after * 1000:>9.1f} ms")
+
+    print("\nIdentical to the per-area scan, ties and NaNs included")
+
+
+if __name__ == "__main__":
+    main()
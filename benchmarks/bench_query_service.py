@@ -0,0 +1,148 @@
+"""
+Benchmark: query service latency under concurrent load.
+
+Starts query_service.py in a subprocess over whatever national tables the
+pipeline has built (data/build/), then opens CONNECTIONS keep-alive
+connections and has each issue REQUESTS requests drawn from a mix of area
+lookups, children, indicator slices and ranked lists. Reports throughput and
+latency percentiles for a cold pass (LRU empty) and a warm pass, plus the
+cost of a conditional request answered with 304.
+
+Run from the repository root:
+    python benchmarks/bench_query_service.py [--connections 200] [--workers N]
+"""
+
+import argparse
+import http.client
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import national  # noqa: E402
+
+PORT = 8765
+
+
+def request_mix(lookup, count, seed=0):
+    """A reproducible list of request paths over real codes."""
+    rng = random.Random(seed)
+    lsoas = lookup.index.tolist()
+    msoas = lookup['MSOA21CD'].unique().tolist()
+    las = [str(c) for c in lookup['LAD22CD'].unique()]
+    regions = [str(c) for c in lookup['RGN22CD'].unique()]
+    indicators = ['bad_health_pct', 'deprived_pct', 'hlnm_growth', 'hlnm_health',
+                  'Index of Multiple Deprivation (IMD) Score']
+
+    makers = [
+        lambda: f"/areas/{rng.choice(msoas)}",
+        lambda: f"/areas/{rng.choice(lsoas)}",
+        lambda: f"/areas/{rng.choice(las)}",
+        lambda: f"/areas/{rng.choice(las)}/children",
+        lambda: f"/areas/{rng.choice(msoas)}/similar",
+        lambda: f"/indicators/{rng.choice(indicators)}?within={rng.choice(las)}",
+        lambda: f"/rank/{rng.choice(indicators)}?within={rng.choice(regions)}&limit=10",
+    ]
+    return [rng.choice(makers)().replace(' ', '%20') for _ in range(count)]
+
+
+def wait_for_server(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/indicators')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("query service did not start")
+
+
+def run_load(port, paths, connections, per_connection):
+    """Closed-loop load: each connection sends its requests back to back."""
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(connections + 1)
+
+    def client(offset):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.connect()
+        local = []
+        barrier.wait()
+        for i in range(per_connection):
+            path = paths[(offset + i * connections) % len(paths)]
+            start = time.perf_counter()
+            conn.request('GET', path)
+            conn.getresponse().read()
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(connections)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return np.array(latencies) * 1000, elapsed
+
+
+def report(label, latencies, elapsed):
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    print(f"  {label:<6} {len(latencies) / elapsed:8.0f} req/s   "
+          f"p50 {p50:6.2f} ms   p90 {p90:6.2f} ms   p99 {p99:6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--connections', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=25, help="requests per connection")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    lookup = national.load_lookup()
+    paths = request_mix(lookup, args.connections * args.requests)
+
+    server = subprocess.Popen(
+        [sys.executable, str(ROOT / "query_service.py"), '--port', str(PORT), '--workers', str(args.workers)],
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_server(PORT)
+        print(f"Query service: {args.connections} connections x {args.requests} requests, "
+              f"{args.workers} worker(s), {os.cpu_count()} CPU(s)")
+        report("cold", *run_load(PORT, paths, args.connections, args.requests))
+        report("warm", *run_load(PORT, paths, args.connections, args.requests))
+
+        # Revalidation: a client holding the ETag gets an empty 304
+        conn = http.client.HTTPConnection('127.0.0.1', PORT)
+        conn.request('GET', paths[0])
+        response = conn.getresponse()
+        response.read()
+        etag = response.getheader('ETag')
+        times = []
+        for _ in range(1000):
+            start = time.perf_counter()
+            conn.request('GET', paths[0], headers={'If-None-Match': etag})
+            response = conn.getresponse()
+            response.read()
+            times.append(time.perf_counter() - start)
+        print(f"  304    p50 {np.percentile(times, 50) * 1000:6.2f} ms (status {response.status}, one connection)")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+// Benchmark: search-box keystrokes at national scale.
+//
+// Types a sample of area names one character at a time (from the second
+// character on, as the dashboard does) and times each keystroke:
+//
+// - scan:  the old handleSearch filter - lowercase and substring-test every
+//          area's name, LA and code - run over all ~41k areas
+// - index: SearchIndex.search on search_index.bin, top 8
+// - page:  what the dashboard runs: the index keeping only entries in its
+//          own shards (canDisplay), against the scan over those areas
+//
+// Run from the repository root after `python search_index.py`:
+//     node benchmarks/bench_search.js
+
+const fs = require('fs');
+const path = require('path');
+const { performance } = require('perf_hooks');
+
+const ROOT = path.resolve(__dirname, '..');
+const { readBundle } = require(path.join(ROOT, 'bundle_reader.js'));
+const { SearchIndex } = require(path.join(ROOT, 'search_reader.js'));
+
+const SAMPLE = 300;
+
+// The MSOAs the dashboard can open, from its shard index
+const shardIndex = fs.readFileSync(path.join(ROOT, 'shards', 'index.bin'));
+const shardMsoas = readBundle(shardIndex.buffer.slice(shardIndex.byteOffset, shardIndex.byteOffset + shardIndex.length))
+    .tables.msoas.column('msoa_code');
+const displayable = new Set(shardMsoas);
+const canDisplay = entry => entry.msoa !== null && displayable.has(entry.msoa);
+
+const bytes = fs.readFileSync(path.join(ROOT, 'search_index.bin'));
+const buffer = bytes.buffer.slice(bytes.byteOffset, bytes.byteOffset + bytes.length);
+
+let start = performance.now();
+const index = new SearchIndex(readBundle(buffer));
+const openTime = performance.now() - start;
+
+// Every area as the old search saw it: name, LA and code
+const areas = [];
+for (let e = 0; e < index.table.rows; e++) {
+    const entry = index.entry(e);
+    areas.push({ neighbourhood_name: entry.name, local_authority: entry.context, msoa_code: entry.code });
+}
+
+function scan(query) {
+    const term = query.toLowerCase();
+    return areas.filter(a => {
+        return (a.neighbourhood_name || '').toLowerCase().includes(term) ||
+               (a.local_authority || '').toLowerCase().includes(term) ||
+               a.msoa_code.toLowerCase().includes(term);
+    }).slice(0, 8);
+}
+
+// Deterministic sample of names (every n-th area), typed keystroke by keystroke
+const keystrokes = [];
+const step = Math.floor(areas.length / SAMPLE);
+for (let i = 0; i < areas.length && keystrokes.length < SAMPLE * 40; i += step) {
+    const name = areas[i].neighbourhood_name;
+    for (let n = 2; n <= name.length; n++) keystrokes.push(name.slice(0, n));
+}
+keystrokes.push('e02', 'e0200', 'e01000', 'st', 'man', 'north east');
+
+function time(fn) {
+    for (const q of keystrokes.slice(0, 200)) fn(q);   // warm up the JIT
+    const times = [];
+    for (const q of keystrokes) {
+        const t = performance.now();
+        fn(q);
+        times.push(performance.now() - t);
+    }
+    times.sort((a, b) => a - b);
+    const at = p => times[Math.min(times.length - 1, Math.floor(times.length * p))];
+    return { p50: at(0.5), p99: at(0.99), max: times[times.length - 1] };
+}
+
+const before = time(scan);
+const after = time(q => index.search(q));
+const pageAreas = areas.filter(a => displayable.has(a.msoa_code));
+const pageBefore = time(q => {
+    const term = q.toLowerCase();
+    return pageAreas.filter(a => (a.neighbourhood_name || '').toLowerCase().includes(term) ||
+                                 a.msoa_code.toLowerCase().includes(term)).slice(0, 8);
+});
+const pageAfter = time(q => index.search(q, 8, canDisplay));
+
+const fmt = s => `p50 ${s.p50.toFixed(3)} ms   p99 ${s.p99.toFixed(3)} ms   max ${s.max.toFixed(3)} ms`;
+console.log(`Search: ${keystrokes.length} keystrokes over ${areas.length.toLocaleString()} areas`);
+console.log(`  scan   ${fmt(before)}`);
+console.log(`  index  ${fmt(after)}`);
+console.log(`Dashboard: ${displayable.size} displayable MSOAs`);
+console.log(`  scan   ${fmt(pageBefore)}`);
+console.log(`  index  ${fmt(pageAfter)}`);
+console.log(`  index size ${(bytes.length / 1024).toFixed(0)} KB, open ${openTime.toFixed(1)} ms`);
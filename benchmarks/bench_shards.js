@@ -0,0 +1,173 @@
+// Benchmark: dashboard first paint and memory, one bundle vs. per-LA shards.
+//
+// For each directory holding data_bundle.bin (every table in one bundle) and
+// shards/, as benchmarks/bench_shards.py builds them, measures
+// what the page fetches and decodes before it can show the first area:
+//
+// - before: data_bundle.bin, the lookup views index.html built on load,
+//           then the area, its LSOAs and the IMD percentile scan over every
+//           area that the overview ran
+// - after:  shards/index.bin, then the area's LA shard via ShardStore
+//
+// and the memory (JS heap + array buffers) still held after first paint and
+// after opening one area in every LA in turn, each measured in a fresh node
+// process.
+//
+// Run from the repository root through benchmarks/bench_shards.py, or:
+//     node benchmarks/bench_shards.js dir [dir ...]
+
+const { execFileSync } = require('child_process');
+const fs = require('fs');
+const path = require('path');
+const zlib = require('zlib');
+const { performance } = require('perf_hooks');
+
+const ROOT = path.resolve(__dirname, '..');
+const { readBundle } = require(path.join(ROOT, 'bundle_reader.js'));
+const { openShards } = require(path.join(ROOT, 'shard_reader.js'));
+
+const REPEATS = 20;
+const IMD_SCORE = 'Index of Multiple Deprivation (IMD) Score';
+
+function kb(bytes) {
+    return `${(bytes / 1024).toFixed(1)} KB`;
+}
+
+// A fresh copy each time, as a fetch would hand over
+function fetched(bytes) {
+    return bytes.buffer.slice(bytes.byteOffset, bytes.byteOffset + bytes.length);
+}
+
+function held() {
+    for (let i = 0; i < 3; i++) gc();
+    const usage = process.memoryUsage();
+    return usage.heapUsed + usage.arrayBuffers;
+}
+
+// What displayArea read for one area
+function touch(area, lsoaMap, lsoaHlnm, lsoaEconomic) {
+    let n = Object.keys(area).length;
+    for (const lsoa of lsoaMap[area.msoa_code] || []) {
+        n += lsoaHlnm[lsoa.c] ? 1 : 0;
+        n += lsoaEconomic[lsoa.c] ? 1 : 0;
+    }
+    return n;
+}
+
+function paintBefore(bytes, msoa) {
+    const bundle = readBundle(fetched(bytes));
+    const allAreas = bundle.tables.areas.lazyRows();
+    const views = [
+        bundle.tables.lsoa_map.grouped(),
+        bundle.tables.lsoa_hlnm.keyed(),
+        bundle.tables.lsoa_economic.keyed()
+    ];
+    const area = bundle.tables.areas.record(bundle.tables.areas.find(msoa));
+    const scores = allAreas.map(a => a[IMD_SCORE]).filter(s => s !== null && s !== undefined).sort((a, b) => a - b);
+    area.imdPercentile = Math.round(scores.filter(s => s < area[IMD_SCORE]).length / scores.length * 100);
+    touch(area, ...views);
+    return { bundle, allAreas, views, area };
+}
+
+async function paintAfter(files, msoa, capacity) {
+    const load = async url => readBundle(fetched(files.get(url)));
+    const store = await openShards('shards/', { load, capacity });
+    const { area, shard } = await store.area(msoa);
+    touch(area, shard.lsoaMap, shard.lsoaHlnm, shard.lsoaEconomic);
+    return { store, shard, area };
+}
+
+async function timed(fn) {
+    const times = [];
+    for (let i = 0; i < REPEATS; i++) {
+        const start = performance.now();
+        await fn();
+        times.push(performance.now() - start);
+    }
+    times.sort((a, b) => a - b);
+    return times[Math.floor(times.length / 2)];
+}
+
+function readFixture(dir) {
+    const bundleBytes = fs.readFileSync(path.join(dir, 'data_bundle.bin'));
+    const files = new Map([['shards/index.bin', fs.readFileSync(path.join(dir, 'shards', 'index.bin'))]]);
+    for (const name of fs.readdirSync(path.join(dir, 'shards', 'la'))) {
+        files.set(`shards/la/${name}`, fs.readFileSync(path.join(dir, 'shards', 'la', name)));
+    }
+    const index = readBundle(fetched(files.get('shards/index.bin'))).tables;
+    // One area per LA, spread across the index, is what "browsing" opens
+    const browse = [];
+    for (let la = 0; la < index.las.rows; la++) {
+        browse.push(index.msoas.value(Math.floor(la * index.msoas.rows / index.las.rows), 'msoa_code'));
+    }
+    return { bundleBytes, files, index, msoa: browse[0], browse };
+}
+
+// Run in a child process: bytes held after first paint and after browsing
+async function measureMemory(mode, dir) {
+    const { bundleBytes, files, msoa, browse } = readFixture(dir);
+    const base = held();
+    let first, keep;
+    if (mode === 'before') {
+        keep = paintBefore(bundleBytes, msoa);
+        first = held() - base;
+        // Every area's data stays decoded behind the views, so browsing
+        // adds no fetches, only the rows and strings it touches
+        const areas = keep.bundle.tables.areas;
+        for (const code of browse) touch(areas.record(areas.find(code)), ...keep.views);
+    } else {
+        keep = await paintAfter(files, msoa, 8);
+        first = held() - base;
+        for (const code of browse) {
+            const { area, shard } = await keep.store.area(code);
+            touch(area, shard.lsoaMap, shard.lsoaHlnm, shard.lsoaEconomic);
+        }
+    }
+    const browsed = held() - base;
+    console.log(JSON.stringify({ first, browsed, kept: !!keep }));
+}
+
+function memory(mode, dir) {
+    const output = execFileSync(process.execPath, ['--expose-gc', __filename, '--memory', mode, dir]);
+    return JSON.parse(output.toString());
+}
+
+async function measure(dir) {
+    const { bundleBytes, files, index, msoa, browse } = readFixture(dir);
+    const firstShard = files.get(`shards/la/${index.msoas.value(index.msoas.find(msoa), 'la_code')}.bin`);
+    const gzip = bytes => zlib.gzipSync(bytes, { level: 9 }).length;
+
+    const beforeBytes = bundleBytes.length;
+    const afterBytes = files.get('shards/index.bin').length + firstShard.length;
+    const beforeGzip = gzip(bundleBytes);
+    const afterGzip = gzip(files.get('shards/index.bin')) + gzip(firstShard);
+
+    const beforeTime = await timed(() => paintBefore(bundleBytes, msoa));
+    const afterTime = await timed(() => paintAfter(files, msoa, 8));
+    const before = memory('before', dir);
+    const after = memory('after', dir);
+
+    console.log(`\n${index.msoas.rows.toLocaleString()} areas in ${index.las.rows} LAs (${path.basename(dir)})`);
+    console.log(`  ${''.padEnd(30)} ${'before'.padStart(12)} ${'after'.padStart(12)}`);
+    const row = (label, a, b) => console.log(`  ${label.padEnd(30)} ${a.padStart(12)} ${b.padStart(12)}`);
+    row('first paint fetch', kb(beforeBytes), kb(afterBytes));
+    row('first paint fetch (gzip)', kb(beforeGzip), kb(afterGzip));
+    row('first paint decode', `${beforeTime.toFixed(2)} ms`, `${afterTime.toFixed(2)} ms`);
+    row('memory after first paint', kb(before.first), kb(after.first));
+    row(`memory after ${browse.length} LAs opened`, kb(before.browsed), kb(after.browsed));
+}
+
+(async () => {
+    const args = process.argv.slice(2);
+    if (args[0] === '--memory') {
+        await measureMemory(args[1], args[2]);
+        return;
+    }
+    if (!args.length) {
+        console.error('Usage: node benchmarks/bench_shards.js dir [dir ...] (see bench_shards.py)');
+        process.exit(1);
+    }
+    for (const dir of args) {
+        await measure(dir);
+    }
+})();
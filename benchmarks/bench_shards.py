@@ -0,0 +1,87 @@
+"""
+Benchmark: dashboard first paint and memory, one bundle vs. per-LA shards.
+
+Builds the dashboard data at three sizes of coverage in a temporary
+directory by repeating the 40 real areas (and their LSOAs) under fresh MSOA,
+LSOA and LA codes: 40 areas, 400, and 6,800 (about every MSOA in England,
+in LAs of about the real size).
+Each size is written both ways:
+
+- before: data_bundle.bin, everything in one file (bundle.write_bundle)
+- after:  shards/index.bin plus shards/la/<LA>.bin (bundle.write_la_shards)
+
+then benchmarks/bench_shards.js times the first paint and measures the
+memory held in node, where the dashboard decodes them.
+
+Run from the repository root (needs node):
+    python benchmarks/bench_shards.py
+"""
+
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import bundle  # noqa: E402
+
+COPIES = [1, 10, 170]
+# Copies sharing an LA code; 7 x ~3 real areas per LA is close to the
+# ~22 MSOAs of an average English LA
+COPIES_PER_LA = 7
+
+
+def replicate(tables, copies):
+    """The dashboard tables repeated with fresh MSOA and LSOA codes."""
+    repeated = {name: ([], options) for name, (_, options) in tables.items()}
+    for copy in range(copies):
+        def recode(code):
+            return f"{code[:3]}{copy:03d}{code[3:]}"
+
+        for name, (rows, _) in tables.items():
+            for row in rows:
+                row = dict(row)
+                for column in ("msoa_code", "msoa", "c"):
+                    if column in row:
+                        row[column] = recode(row[column])
+                repeated[name][0].append(row)
+    return repeated
+
+
+def build_fixture(out_dir, copies):
+    """Write data_bundle.bin and shards/ for copies x the real areas."""
+    tables, metadata = bundle.load_dashboard_tables()
+    local_authorities = bundle.load_local_authorities()
+    real_las = {
+        a['msoa_code']: dict(local_authorities[bundle._la_name(a['local_authority'])],
+                             local_authority=a['local_authority'])
+        for a in tables["areas"][0]
+    }
+
+    tables = replicate(tables, copies)
+    (out_dir / "data_bundle.bin").write_bytes(bundle.encode_bundle(tables, metadata))
+
+    area_las = {}
+    for area in tables["areas"][0]:
+        copy, real_code = area['msoa_code'][3:6], area['msoa_code'][:3] + area['msoa_code'][6:]
+        la = real_las[real_code]
+        area_las[area['msoa_code']] = dict(la, la_code=f"{la['la_code']}-{int(copy) // COPIES_PER_LA}")
+    tables["areas"] = (bundle.dataset_percentiles(tables["areas"][0]), tables["areas"][1])
+    bundle.write_la_shards(out_dir / "shards", tables, metadata, area_las)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = []
+        for copies in COPIES:
+            out_dir = Path(tmp) / f"x{copies}"
+            out_dir.mkdir()
+            build_fixture(out_dir, copies)
+            fixtures.append(str(out_dir))
+        subprocess.run(["node", str(ROOT / "benchmarks" / "bench_shards.js"), *fixtures],
+                       check=True)
+
+
+if __name__ == "__main__":
+    main()
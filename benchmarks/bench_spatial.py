@@ -0,0 +1,129 @@
+"""
+Benchmark: geocoding points to LSOAs, scan vs. spatial index.
+
+Builds a synthetic England of about 35k LSOA-like polygons (a grid of cells
+over England's bounding box, VERTICES_PER_SIDE vertices along each side so a
+polygon has about as many vertices as a BSC boundary) and their centroids,
+then times:
+
+- locate: which LSOA each of N random points is in
+    before: per point, a bounding-box filter over every polygon and a ray
+            cast against the few left
+    after:  SpatialIndex.locate over the whole batch (grid candidates, one
+            vectorised ray cast)
+- near:   the centroids within 2 km of each of 1,000 points
+    before: haversine distance to every centroid
+    after:  SpatialIndex.near (grid cells around the circle, then haversine)
+
+The scan is only timed on the first SCAN_POINTS points and scaled up.
+
+Run from the repository root:
+    python benchmarks/bench_spatial.py
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import columnar_store  # noqa: E402
+import spatial_index  # noqa: E402
+
+# England's bounding box in degrees
+WEST, SOUTH, EAST, NORTH = -5.8, 49.9, 1.8, 55.9
+COLUMNS, ROWS = 190, 185
+VERTICES_PER_SIDE = 15
+POINTS = [1_000, 10_000, 100_000]
+SCAN_POINTS = 500
+NEAR_QUERIES = 1_000
+NEAR_KM = 2.0
+
+
+def synthetic_geometry():
+    """(features, rings, parents) shaped like boundaries.load_geometry output."""
+    width, height = (EAST - WEST) / COLUMNS, (NORTH - SOUTH) / ROWS
+    steps = np.arange(VERTICES_PER_SIDE) / VERTICES_PER_SIDE
+    features, rings, parents = [], [], {}
+    for row in range(ROWS):
+        for column in range(COLUMNS):
+            x0, y0 = WEST + column * width, SOUTH + row * height
+            x1, y1 = x0 + width, y0 + height
+            xs = np.concatenate([x0 + steps * width, np.full_like(steps, x1), x1 - steps * width, np.full_like(steps, x0)])
+            ys = np.concatenate([np.full_like(steps, y0), y0 + steps * height, np.full_like(steps, y1), y1 - steps * height])
+            code = f"E01{row * COLUMNS + column:06d}"
+            rings.append(np.rint(np.c_[xs, ys] / spatial_index.QUANTUM).astype(np.int64))
+            features.append((code, code, [[len(rings) - 1]]))
+            parents[code] = (f"E02{(row * COLUMNS + column) // 5:06d}", f"E06{row:06d}")
+    return features, rings, parents
+
+
+def scan_locate(features, rings, x, y):
+    """Per point: bounding-box filter over every polygon, then a ray cast."""
+    boxes = np.array([[r[:, 0].min(), r[:, 1].min(), r[:, 0].max(), r[:, 1].max()] for r in rings])
+    found = []
+    for px, py in zip(x, y):
+        code = None
+        for i in np.flatnonzero((boxes[:, 0] <= px) & (px <= boxes[:, 2]) & (boxes[:, 1] <= py) & (py <= boxes[:, 3])):
+            ring = rings[i]
+            x0, y0 = ring[:, 0], ring[:, 1]
+            x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+            straddle = (y0 > py) != (y1 > py)
+            crossing = x0[straddle] + (py - y0[straddle]) * (x1 - x0)[straddle] / (y1 - y0)[straddle]
+            if (crossing > px).sum() % 2:
+                code = features[i][0]
+                break
+        found.append(code)
+    return found
+
+
+def main():
+    rng = np.random.default_rng(0)
+    features, rings, parents = synthetic_geometry()
+    print(f"{len(features):,} polygons, {sum(len(r) for r in rings):,} vertices")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "spatial_index.arrow"
+        columnar_store.write_table(spatial_index.polygon_table(features, rings, parents), path)
+        start = time.perf_counter()
+        polygons = spatial_index.Polygons(columnar_store.read_arrow(path))
+        print(f"Index load: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    centres = np.array([r.mean(axis=0) for r in rings]) * spatial_index.QUANTUM
+    centroids = spatial_index.Centroids([code for code, _, _ in features], centres[:, 1], centres[:, 0])
+    index = spatial_index.SpatialIndex(polygons, {"lsoa": centroids})
+
+    print(f"\n{'points':>8} {'before':>12} {'after':>12}")
+    for size in POINTS:
+        lat, lng = rng.uniform(SOUTH, NORTH, size), rng.uniform(WEST, EAST, size)
+        x, y = spatial_index.to_units(lat, lng)
+
+        start = time.perf_counter()
+        expected = scan_locate(features, rings, x[:SCAN_POINTS], y[:SCAN_POINTS])
+        before = (time.perf_counter() - start) * size / min(size, SCAN_POINTS)
+
+        start = time.perf_counter()
+        found = index.locate(lat, lng)
+        after = time.perf_counter() - start
+
+        assert [a["lsoa"] if a else None for a in found[:SCAN_POINTS]] == expected
+        print(f"{size:>8,} {before * 1000:>9.0f} ms {after * 1000:>9.0f} ms")
+
+    lat, lng = rng.uniform(SOUTH, NORTH, NEAR_QUERIES), rng.uniform(WEST, EAST, NEAR_QUERIES)
+    start = time.perf_counter()
+    scanned = [np.count_nonzero(spatial_index.haversine_km(a, b, centroids.lat, centroids.lng) <= NEAR_KM)
+               for a, b in zip(lat, lng)]
+    before = time.perf_counter() - start
+    start = time.perf_counter()
+    indexed = [len(index.near(a, b, NEAR_KM, "lsoa")) for a, b in zip(lat, lng)]
+    after = time.perf_counter() - start
+    assert scanned == indexed
+    print(f"\n{NEAR_QUERIES:,} radius queries ({NEAR_KM} km): "
+          f"before {before * 1000:.0f} ms, after {after * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
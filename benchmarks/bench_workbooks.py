@@ -0,0 +1,60 @@
+"""
+Benchmark: reading the OCSI/ONS workbooks, openpyxl vs. workbooks.py.
+
+For each workbook in the repository root that the PowerShell extractors used
+to open through Excel COM, times:
+
+- before: pd.read_excel (openpyxl) of the sheet
+- after:  workbooks.read_table with the columns the pipeline selects
+
+and checks that both return the same values for those columns.
+
+Run from the repository root:
+    python benchmarks/bench_workbooks.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import workbooks  # noqa: E402
+
+CNI_COLUMNS = ['Area Code', 'Value']
+
+# Workbook -> (sheet, columns the pipeline reads)
+WORKBOOKS = {
+    "HLNM_MSOA.xlsx": ("master", ['Area Code', 'Growth', 'Energy', 'Crime', 'Opportunity', 'Health']),
+    "MSOA_Community Needs Index 2023_ Community Needs rank_2023-01-01.xlsx": (None, CNI_COLUMNS),
+    "MSOA_Community Needs Index 2023_ Civic Assets rank_2023-01-01.xlsx": (None, CNI_COLUMNS),
+    "MSOA_Community Needs Index 2023_ Connectedness rank_2023-01-01.xlsx": (None, CNI_COLUMNS),
+    "MSOA_Community Needs Index 2023_ Active and Engaged Community rank_2023-01-01.xlsx": (None, CNI_COLUMNS),
+    "lsoa_msoa_la_region_lookup.xlsx": (None, ['LSOA21CD', 'LSOA21NM', 'MSOA21CD', 'MSOA21NM',
+                                               'LAD22CD', 'LAD22NM', 'RGN22CD', 'RGN22NM']),
+}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    print(f"{'workbook':<58} {'rows':>7} {'openpyxl':>9} {'workbooks':>10}")
+    for name, (sheet, columns) in WORKBOOKS.items():
+        path = ROOT / name
+        if not path.exists():
+            print(f"{name[:58]:<58} missing")
+            continue
+        before, before_time = timed(lambda: pd.read_excel(path, sheet_name=sheet or 0, usecols=columns))
+        after, after_time = timed(lambda: workbooks.read_table(path, sheet=sheet, usecols=columns))
+        pd.testing.assert_frame_equal(after, before, check_dtype=False)
+        print(f"{name[:58]:<58} {len(after):>7,} {before_time:>8.2f}s {after_time:>9.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Synthetic, offline copies of the data build's inputs at any number of MSOAs.
+
+write_fixtures lays out a directory shaped like the real sources, so
+data_gatherer can run end to end without NOMIS, GOV.UK or ONS:
+
+    data/ts066.zip ... ts063.zip     NOMIS bulk Census tables, one CSV per
+                                     geography level, the MSOA one full size
+    data/imd_2025.csv                IoD2025 File 7: score, rank and decile
+                                     per domain plus the population columns
+    data/lsoa_msoa_lookup.csv        the ONS LSOA -> MSOA -> LA -> region lookup
+    data/pride_in_place_msoas.xlsx   the OCSI list of selected MSOAs
+    data/cache_manifest.json         every file above, as downloaded
+    HLNM_MSOA_csv.csv, MSOA_Community Needs Index ... (four files)
+                                     HLNM scores and CNI ranks per MSOA
+
+Areas nest like England: LSOAS_PER_MSOA LSOAs on average per MSOA, MSOAS_PER_LA
+MSOAs per LA, nine regions. Counts are drawn so each part is a share of its
+table's total, scores and ranks from the real ranges. The same seed and size
+always give the same files.
+"""
+
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import data_gatherer
+import downloader
+import export
+
+# England has 33,755 LSOAs in 6,856 MSOAs in 296 LAs
+ENGLAND_MSOAS = 6856
+LSOAS_PER_MSOA = 33755 / 6856
+MSOAS_PER_LA = 23
+REGIONS = 9
+
+# Column stems shaped like the real NOMIS bulk tables
+TABLE_COLUMNS = {
+    "ts066": ("Economic activity status", [
+        "Total: All usual residents aged 16 years and over",
+        "Economically active (excluding full-time students)",
+        "Economically active (excluding full-time students):In employment",
+        "Economically active (excluding full-time students):In employment:Employee",
+        "Economically active (excluding full-time students):In employment:Employee: Part-time",
+        "Economically active (excluding full-time students):In employment:Employee: Full-time",
+        "Economically active (excluding full-time students):In employment:Self-employed with employees",
+        "Economically active (excluding full-time students):In employment:Self-employed without employees",
+        "Economically active (excluding full-time students): Unemployed",
+        "Economically active and a full-time student",
+        "Economically active and a full-time student:In employment",
+        "Economically active and a full-time student: Unemployed",
+        "Economically inactive",
+        "Economically inactive: Retired",
+        "Economically inactive: Student",
+        "Economically inactive: Looking after home or family",
+        "Economically inactive: Long-term sick or disabled",
+        "Economically inactive: Other",
+    ]),
+    "ts037": ("General health", [
+        "Total: All usual residents", "Very good health", "Good health",
+        "Fair health", "Bad health", "Very bad health",
+    ]),
+    "ts038": ("Disability", [
+        "Total: All usual residents", "Disabled under the Equality Act",
+        "Disabled under the Equality Act: Day-to-day activities limited a lot",
+        "Disabled under the Equality Act: Day-to-day activities limited a little",
+        "Not disabled under the Equality Act",
+        "Not disabled under the Equality Act: Has long term physical or mental health condition but day-to-day activities are not limited",
+        "Not disabled under the Equality Act: No long term physical or mental health conditions",
+    ]),
+    "ts067": ("Highest level of qualification", [
+        "Total: All usual residents aged 16 years and over", "No qualifications",
+        "Level 1 and entry level qualifications", "Level 2 qualifications",
+        "Apprenticeship", "Level 3 qualifications",
+        "Level 4 qualifications and above", "Other qualifications",
+    ]),
+    "ts011": ("Household deprivation", [
+        "Total: All households", "Household is not deprived in any dimension",
+        "Household is deprived in one dimension", "Household is deprived in two dimensions",
+        "Household is deprived in three dimensions", "Household is deprived in four dimensions",
+    ]),
+    "ts054": ("Tenure of household", [
+        "Total: All households", "Owned", "Owned: Owns outright",
+        "Owned: Owns with a mortgage or loan", "Shared ownership",
+        "Shared ownership: Shared ownership", "Social rented",
+        "Social rented: Rents from council or Local Authority",
+        "Social rented: Other social rented", "Private rented",
+        "Private rented: Private landlord or letting agency",
+        "Private rented: Other private rented", "Lives rent free",
+    ]),
+    "ts039": ("Provision of unpaid care", [
+        "Total: All usual residents aged 5 and over", "Provides no unpaid care",
+        "Provides 19 or less hours unpaid care a week",
+        "Provides 9 hours or less unpaid care a week",
+        "Provides 10 to 19 hours unpaid care a week",
+        "Provides 20 to 49 hours unpaid care a week",
+        "Provides 20 to 34 hours unpaid care a week",
+        "Provides 35 to 49 hours unpaid care a week",
+        "Provides 50 or more hours unpaid care a week",
+    ]),
+    "ts063": ("Occupation (current)", [
+        "Total: All usual residents aged 16 years and over in employment the week before the census",
+        "1. Managers, directors and senior officials", "2. Professional occupations",
+        "3. Associate professional and technical occupations",
+        "4. Administrative and secretarial occupations", "5. Skilled trades occupations",
+        "6. Caring, leisure and other service occupations",
+        "7. Sales and customer service occupations",
+        "8. Process, plant and machine operatives", "9. Elementary occupations",
+    ]),
+}
+
+IMD_DOMAINS = [
+    ("Index of Multiple Deprivation (IMD)", "Index of Multiple Deprivation (IMD) Score", 0.5, 90),
+    ("Income", "Income Score (rate)", 0.0, 0.6),
+    ("Employment", "Employment Score (rate)", 0.0, 0.5),
+    ("Education, Skills and Training", "Education, Skills and Training Score", 0.0, 100),
+    ("Health Deprivation and Disability", "Health Deprivation and Disability Score", -3.5, 3.5),
+    ("Crime", "Crime Score", -3.0, 3.5),
+    ("Barriers to Housing and Services", "Barriers to Housing and Services Score", 5, 70),
+    ("Living Environment", "Living Environment Score", 0.5, 90),
+    ("Income Deprivation Affecting Children Index (IDACI)",
+     "Income Deprivation Affecting Children Index (IDACI) Score (rate)", 0.0, 0.7),
+    ("Income Deprivation Affecting Older People (IDAOPI)",
+     "Income Deprivation Affecting Older People (IDAOPI) Score (rate)", 0.0, 0.8),
+]
+IMD_POPULATION = [
+    ("Total population: mid 2022", 1.0),
+    ("Dependent Children aged 0-15: mid 2022", 0.18),
+    ("Population aged 16-59: mid 2022", 0.58),
+    ("Older population aged 60 and over: mid 2022", 0.24),
+    ("Working age population 18-66 (for use with Employment Deprivation Domain): mid 2022", 0.62),
+]
+HLNM_DOMAINS = ["Growth", "Energy", "Crime", "Opportunity", "Health"]
+
+
+def geography(msoas, seed=0):
+    """The lookup for an England of msoas MSOAs, one row per LSOA."""
+    rng = np.random.default_rng(seed)
+    per_msoa = rng.integers(4, 7, msoas)
+    per_msoa[rng.random(msoas) < LSOAS_PER_MSOA - 5] = 4
+    msoa = np.repeat(np.arange(msoas), per_msoa)
+    la = msoa // MSOAS_PER_LA
+    region = la % REGIONS
+    lsoa_codes = [f"E01{i + 1:06d}" for i in range(len(msoa))]
+    within = np.arange(len(msoa)) - np.repeat(np.cumsum(per_msoa) - per_msoa, per_msoa)
+
+    return pd.DataFrame({
+        "LSOA21CD": lsoa_codes,
+        "LSOA21NM": [f"Synthetic LA {a + 1:03d} {m + 1:03d}{chr(65 + w)}" for a, m, w in zip(la, msoa, within)],
+        "LSOA21NMW": "",
+        "MSOA21CD": [f"E02{m + 1:06d}" for m in msoa],
+        "MSOA21NM": [f"Synthetic LA {a + 1:03d} {m + 1:03d}" for a, m in zip(la, msoa)],
+        "MSOA21NMW": "",
+        "LAD22CD": [f"E06{a + 1:06d}" for a in la],
+        "LAD22NM": [f"Synthetic LA {a + 1:03d}" for a in la],
+        "RGN22CD": [f"E12{r + 1:06d}" for r in region],
+        "RGN22NM": [f"Synthetic Region {r + 1}" for r in region],
+    })
+
+
+def write_census_zips(directory, codes, names, rng):
+    """One NOMIS-shaped ZIP per table in TABLE_COLUMNS; returns {table: path}."""
+    paths = {}
+    for table, (topic, stems) in TABLE_COLUMNS.items():
+        frame = pd.DataFrame({"date": 2021, "geography": names, "geography code": codes})
+        total = rng.integers(4000, 12000, len(codes))
+        for stem in stems:
+            share = 1.0 if stem.startswith("Total") else rng.uniform(0.0, 0.6, len(codes))
+            frame[f"{topic}: {stem}; measures: Value"] = (total * share).astype(np.int64)
+
+        zip_path = Path(directory) / f"{table}.zip"
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for level in ("ctry", "rgn", "ltla", "msoa", "oa"):
+                level_frame = frame if level == "msoa" else frame.head(50)
+                zf.writestr(f"census2021-{table}-{level}.csv", level_frame.to_csv(index=False))
+        paths[table] = zip_path
+    return paths
+
+
+def imd_table(lookup, rng):
+    """IoD2025 File 7 columns for every LSOA in lookup."""
+    n = len(lookup)
+    imd = pd.DataFrame({
+        "LSOA code (2021)": lookup["LSOA21CD"],
+        "LSOA name (2021)": lookup["LSOA21NM"],
+        "Local Authority District code (2024)": lookup["LAD22CD"],
+        "Local Authority District name (2024)": lookup["LAD22NM"],
+    })
+    for name, score_column, low, high in IMD_DOMAINS:
+        scores = rng.uniform(low, high, n)
+        ranks = scores.argsort()[::-1].argsort() + 1
+        imd[score_column] = scores.round(3)
+        imd[f"{name} Rank (where 1 is most deprived)"] = ranks
+        imd[f"{name} Decile (where 1 is most deprived 10% of LSOAs)"] = (ranks - 1) * 10 // n + 1
+    population = rng.integers(1000, 3000, n)
+    for column, share in IMD_POPULATION:
+        imd[column] = (population * share).astype(np.int64)
+    return imd
+
+
+def need_tables(msoas, rng):
+    """(hlnm, {rank column: cni}) frames in the OCSI column layout."""
+    area = {
+        "Area Code": msoas["MSOA21CD"].to_numpy(),
+        "Area Name": msoas["MSOA21NM"].to_numpy(),
+        "Parent Area Code": msoas["LAD22CD"].to_numpy(),
+        "Parent Area Name": msoas["LAD22NM"].to_numpy(),
+    }
+    n = len(msoas)
+    hlnm = pd.DataFrame(area)
+    for domain in HLNM_DOMAINS:
+        hlnm[domain] = rng.permutation(n) + 1 if domain == "Crime" else rng.uniform(0, 100, n).round(8)
+    hlnm = hlnm[["Area Code", "Area Name", "Parent Area Code", "Parent Area Name", *HLNM_DOMAINS]]
+
+    cni = {}
+    for rank_column in data_gatherer.CNI_FILES:
+        frame = pd.DataFrame(area)
+        frame.insert(2, "Value", rng.permutation(n) + 1)
+        cni[rank_column] = frame
+    return hlnm, cni
+
+
+def write_table(frame, path):
+    """A CSV, or an .xlsx through export.stream_xlsx, by path suffix."""
+    path = Path(path)
+    if path.suffix == ".xlsx":
+        with open(path, 'wb') as f:
+            for data in export.stream_xlsx(frame, sheet="Sheet1"):
+                f.write(data)
+    else:
+        frame.to_csv(path, index=False, encoding='utf-8-sig')
+    return path
+
+
+def write_fixtures(directory, msoas=ENGLAND_MSOAS, selected=None, seed=0):
+    """Write every build input for an England of msoas MSOAs under directory.
+
+    selected is how many MSOAs go in the Pride in Place list (default: all).
+    Returns {"data_dir", "hlnm_file", "cni_files", "msoas", "lsoas"}.
+    """
+    directory = Path(directory)
+    data_dir = directory / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    lookup = geography(msoas, seed)
+    lookup.to_csv(data_dir / data_gatherer.CACHE_FILES["lsoa_msoa_lookup"], index=False, encoding='utf-8-sig')
+    write_table(imd_table(lookup, rng), data_dir / data_gatherer.CACHE_FILES["imd_2025"])
+
+    first = lookup.drop_duplicates("MSOA21CD")
+    write_census_zips(data_dir, first["MSOA21CD"].tolist(), first["MSOA21NM"].tolist(), rng)
+
+    pip = first.head(selected or msoas)
+    write_table(pd.DataFrame({
+        "MSOA Code": pip["MSOA21CD"].to_numpy(),
+        "Neighbourhood Name": [f"Neighbourhood {i + 1}" for i in range(len(pip))],
+        "Local Authority": pip["LAD22NM"].to_numpy(),
+    }), data_dir / data_gatherer.CACHE_FILES["pip_msoas"])
+
+    hlnm, cni = need_tables(first, rng)
+    hlnm_file = write_table(hlnm, directory / data_gatherer.HLNM_FILE.name)
+    cni_files = {
+        rank_column: write_table(cni[rank_column], directory / path.name)
+        for rank_column, path in data_gatherer.CNI_FILES.items()
+    }
+    # Recorded as a finished download is, so the build trusts them without
+    # asking the (unreachable) sources whether they are complete
+    for key, name in data_gatherer.CACHE_FILES.items():
+        downloader._record(data_dir, data_dir / name, data_gatherer.URLS[key], None, None)
+    return {"data_dir": data_dir, "hlnm_file": hlnm_file, "cni_files": cni_files,
+            "msoas": len(first), "lsoas": len(lookup)}
@@ -0,0 +1,540 @@
+"""
+Pride in Place Data Explorer - Boundary Tools
+Streaming extraction of boundary features from large GeoJSON files.
+
+The national LSOA boundary file holds ~35k polygons and hundreds of MB, but
+each build only needs a few hundred of them. iter_features parses a
+FeatureCollection one feature at a time, so peak memory is bounded by the
+largest single feature rather than the whole file, and extract_features
+writes the matches out as it goes.
+
+Wanted areas can be given as LSOA, MSOA, LA or region codes; anything that
+is not an LSOA code is expanded to its LSOAs through the lookup CSV.
+
+build_tiles pre-splits the national file into small per-MSOA and per-LA
+tiles, so the dashboard fetches a few KB per area
+instead of the whole national file. Simplification is topology-preserving:
+vertices where the set of neighbouring areas changes are pinned, and each
+shared edge between them is simplified identically for both neighbours, so
+adjacent polygons never open gaps or overlap.
+
+Usage:
+    python boundaries.py extract SOURCE.geojson OUT.geojson --codes E02001954 E08000025
+    python boundaries.py extract SOURCE.geojson OUT.geojson --codes-file lsoa_codes.txt
+    python boundaries.py tile SOURCE.geojson [--out boundaries] [--levels 0 1 2]
+"""
+
+import argparse
+import csv
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+LOCAL_DIR = Path(__file__).parent
+LOOKUP_FILE = LOCAL_DIR / "lsoa_msoa_la_region_lookup_csv.csv"
+LSOA_BOUNDARIES_FILE = LOCAL_DIR / "Lower_layer_Super_Output_Areas_December_2021_Boundaries_EW_BSC_V4_-4299016806856585929.geojson"
+
+# Lookup columns a wanted code may belong to, finest first
+LOOKUP_LEVELS = ['LSOA21CD', 'MSOA21CD', 'LAD22CD', 'RGN22CD']
+
+TILES_DIR = LOCAL_DIR / "boundaries"
+
+# Zoom levels for the tile pyramid: Douglas-Peucker tolerance and output
+# coordinate quantum, both in degrees (0.00001 degrees is roughly 1 m)
+ZOOM_LEVELS = [
+    {"level": 0, "tolerance": 0.0005, "quantum": 0.0001},
+    {"level": 1, "tolerance": 0.0001, "quantum": 0.00001},
+    {"level": 2, "tolerance": 0.00002, "quantum": 0.000001},
+]
+
+# Levels the build writes by default: the dashboard map fetches the
+# coarsest one that is still under a pixel at the zoom it draws an area at
+DASHBOARD_LEVELS = [0, 1, 2]
+
+# Quantum used to match shared vertices between neighbouring polygons
+BASE_QUANTUM = 0.000001
+
+CHUNK_SIZE = 1024 * 1024
+WHITESPACE = ' \t\n\r'
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Minimal buffered text reader for incremental JSON decoding."""
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Append the next chunk; returns False at end of file."""
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop consumed text so the buffer only ever holds the current value
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character (without consuming it), or ''."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        """Consume char (after any whitespace) or raise ValueError."""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in GeoJSON, found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value, reading more text as needed."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number can be cut off at the chunk boundary; make sure it is not
+            if end == len(self.buffer) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_features(fp, header=None):
+    """Yield the features of a GeoJSON FeatureCollection one at a time.
+
+    If header is a dict, the collection's other top-level members (type, name,
+    crs, ...) are stored in it as they are read.
+    """
+    reader = _Reader(fp)
+    reader.expect('{')
+
+    while reader.peek() != '}':
+        key = reader.value()
+        reader.expect(':')
+
+        if key != 'features':
+            value = reader.value()
+            if header is not None:
+                header[key] = value
+        else:
+            reader.expect('[')
+            while reader.peek() != ']':
+                yield reader.value()
+                if reader.peek() == ',':
+                    reader.pos += 1
+            reader.expect(']')
+
+        if reader.peek() == ',':
+            reader.pos += 1
+
+    reader.expect('}')
+
+
+def expand_codes(codes, lookup_path=LOOKUP_FILE):
+    """Expand LSOA/MSOA/LA/region codes to the set of LSOA codes they cover."""
+    codes = {c.strip() for c in codes if c and c.strip()}
+    lsoas = set()
+    with open(lookup_path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            if any(row.get(level) in codes for level in LOOKUP_LEVELS):
+                lsoas.add(row['LSOA21CD'])
+
+    # LSOA codes are kept even when missing from the (England-only) lookup
+    return lsoas | {c for c in codes if c.startswith(('E01', 'W01'))}
+
+
+def extract_features(source, destination, wanted, code_property='LSOA21CD'):
+    """Stream features whose code_property is in wanted from source to destination.
+
+    Returns the number of features written.
+    """
+    written = 0
+    with open(source, 'r', encoding='utf-8-sig') as src, \
+            open(destination, 'w', encoding='utf-8') as dst:
+        dst.write('{"type":"FeatureCollection","features":[\n')
+        for feature in iter_features(src):
+            if feature.get('properties', {}).get(code_property) in wanted:
+                if written:
+                    dst.write(',\n')
+                json.dump(feature, dst, separators=(',', ':'), ensure_ascii=False)
+                written += 1
+        dst.write('\n]}\n')
+
+    return written
+
+
+def load_lookup(lookup_path=LOOKUP_FILE):
+    """Map each LSOA code to its (MSOA, LA) codes."""
+    parents = {}
+    with open(lookup_path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            parents[row['LSOA21CD']] = (row['MSOA21CD'], row['LAD22CD'])
+    return parents
+
+
+def load_geometry(source, wanted=None, code_property='LSOA21CD', name_property='LSOA21NM'):
+    """Stream polygons out of a GeoJSON file into compact integer arrays.
+
+    Returns (features, rings): features is a list of (code, name, polygons)
+    where polygons is a list of lists of ring indices, and rings is a list of
+    (n, 2) int64 arrays of coordinates in BASE_QUANTUM units, without the
+    repeated closing vertex.
+    """
+    features = []
+    rings = []
+    with open(source, 'r', encoding='utf-8-sig') as f:
+        for feature in iter_features(f):
+            properties = feature.get('properties') or {}
+            code = properties.get(code_property)
+            if wanted is not None and code not in wanted:
+                continue
+
+            geometry = feature.get('geometry') or {}
+            if geometry.get('type') == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                continue
+
+            polygon_rings = []
+            for polygon in polygons:
+                indices = []
+                for ring in polygon:
+                    coords = np.rint(np.asarray(ring, dtype=np.float64)[:, :2] / BASE_QUANTUM).astype(np.int64)
+                    if len(coords) > 1 and (coords[0] == coords[-1]).all():
+                        coords = coords[:-1]
+                    if len(coords) >= 3:
+                        indices.append(len(rings))
+                        rings.append(coords)
+                if indices:
+                    polygon_rings.append(indices)
+
+            if polygon_rings:
+                features.append((code, properties.get(name_property, ''), polygon_rings))
+
+    return features, rings
+
+
+def _vertex_keys(coords):
+    """One int64 key per vertex, equal for identical quantised coordinates."""
+    return (coords[:, 0] << 32) ^ (coords[:, 1] & 0xFFFFFFFF)
+
+
+def vertex_signatures(features, rings):
+    """Per-ring arrays identifying which features share each vertex.
+
+    Two vertices get the same signature when the same set of features passes
+    through them, so a change of signature along a ring marks a junction.
+    Each distinct set gets its own id.
+    """
+    owners = np.empty(len(rings), dtype=np.int64)
+    for feature_index, (_, _, polygons) in enumerate(features):
+        for polygon in polygons:
+            owners[polygon] = feature_index
+
+    lengths = np.array([len(r) for r in rings])
+    keys = np.concatenate([_vertex_keys(r) for r in rings])
+    vertex_owner = np.repeat(owners, lengths)
+
+    # Distinct (key, feature) pairs, then per-key aggregates of the features
+    order = np.lexsort((vertex_owner, keys))
+    pair_keys, pair_owner = keys[order], vertex_owner[order]
+    distinct = np.ones(len(order), dtype=bool)
+    distinct[1:] = (pair_keys[1:] != pair_keys[:-1]) | (pair_owner[1:] != pair_owner[:-1])
+    pair_keys, pair_owner = pair_keys[distinct], pair_owner[distinct]
+
+    # Each key's owners are sorted, so keys with the same number of owners
+    # are rows of one (keys, count) array and equal rows are equal sets
+    unique_keys, starts, counts = np.unique(pair_keys, return_index=True, return_counts=True)
+    key_signature = np.empty(len(unique_keys), dtype=np.int64)
+    next_id = 0
+    for count in np.unique(counts):
+        groups = np.flatnonzero(counts == count)
+        owner_sets = pair_owner[starts[groups, None] + np.arange(count)]
+        distinct_sets, set_ids = np.unique(owner_sets, axis=0, return_inverse=True)
+        key_signature[groups] = next_id + set_ids.ravel()
+        next_id += len(distinct_sets)
+
+    signatures = key_signature[np.searchsorted(unique_keys, keys)]
+    return np.split(signatures, np.cumsum(lengths)[:-1])
+
+
+def douglas_peucker(points, tolerance):
+    """Boolean mask of points kept by Douglas-Peucker (end points always kept)."""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    xs = points[:, 0].astype(np.float64)
+    ys = points[:, 1].astype(np.float64)
+    stack = [(0, len(points) - 1)]
+
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        x0, y0 = xs[first], ys[first]
+        dx, dy = xs[last] - x0, ys[last] - y0
+        inner_x, inner_y = xs[first + 1:last] - x0, ys[first + 1:last] - y0
+        length = (dx * dx + dy * dy) ** 0.5
+        if length == 0:
+            distances = np.sqrt(inner_x * inner_x + inner_y * inner_y)
+        else:
+            distances = np.abs(dx * inner_y - dy * inner_x) / length
+        index = distances.argmax()
+        if distances[index] > tolerance:
+            split = first + 1 + int(index)
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return keep
+
+
+def _canonical_edge(points):
+    """(edge in its canonical direction, whether that is the given one)."""
+    forward = tuple(points[0]) < tuple(points[-1]) or (
+        (points[0] == points[-1]).all() and tuple(points[1]) <= tuple(points[-2])
+    )
+    return (points if forward else points[::-1]), forward
+
+
+def _simplify_edge(points, tolerance, cache, pinned=frozenset()):
+    """Simplify one edge between junctions in a direction-independent way.
+
+    The edge is simplified in a canonical direction so both neighbours that
+    share it get the same vertices; cache holds results by edge so each
+    shared edge is only simplified once. Edges in pinned keep every vertex.
+    """
+    canonical, forward = _canonical_edge(points)
+    key = canonical.tobytes()
+    simplified = cache.pop(key, None)
+    if simplified is None:
+        simplified = canonical if key in pinned else canonical[douglas_peucker(canonical, tolerance)]
+        cache[key] = simplified
+    return simplified if forward else simplified[::-1]
+
+
+def _ring_edges(ring, signature):
+    """The edges of a closed ring between its junction vertices, in order.
+
+    Each edge includes the junctions at both ends; the first starts on the
+    ring's first junction, and the last ends there.
+    """
+    n = len(ring)
+    fixed = (signature != np.roll(signature, 1)) | (signature != np.roll(signature, -1))
+    fixed_indices = np.flatnonzero(fixed)
+    if len(fixed_indices) == 0:
+        # No junctions (island, or wholly enclosed): pin the smallest vertex
+        keys = _vertex_keys(ring)
+        fixed_indices = np.array([int(np.argmin(keys))])
+
+    # Rotate so the ring starts on a junction, then close it
+    rotated = np.roll(ring, -fixed_indices[0], axis=0)
+    closed = np.vstack([rotated, rotated[:1]])
+    cuts = np.append((fixed_indices - fixed_indices[0]) % n, n)
+    return [closed[first:last + 1] for first, last in zip(cuts[:-1], cuts[1:])]
+
+
+def simplify_ring(ring, signature, tolerance, cache=None, pinned=frozenset()):
+    """Simplify a closed ring, keeping junction vertices fixed."""
+    if cache is None:
+        cache = {}
+    edges = _ring_edges(ring, signature)
+    parts = [edges[0][:1]]
+    for edge in edges:
+        parts.append(_simplify_edge(edge, tolerance, cache, pinned)[1:])
+    return np.vstack(parts)[:-1]
+
+
+def _quantise_ring(ring, quantum):
+    """Snap a ring to the output grid and drop repeated vertices."""
+    snapped = np.rint(ring * (BASE_QUANTUM / quantum)).astype(np.int64)
+    distinct = np.any(snapped != np.roll(snapped, 1, axis=0), axis=1)
+    return snapped[distinct] if distinct.any() else snapped[:1]
+
+
+def simplify_rings(features, rings, level):
+    """Simplified, quantised rings for one zoom level.
+
+    A ring simplified below three vertices keeps all of its own instead,
+    and so does every neighbour along the edges they share, so those edges
+    still match.
+    """
+    tolerance = level["tolerance"] / BASE_QUANTUM
+    quantum = level["quantum"]
+    signatures = vertex_signatures(features, rings)
+    # Shared edges are looked up (and dropped) when the second neighbour
+    # reaches them, so the cache only holds edges still waiting for a match
+    cache = {}
+    result = [
+        _quantise_ring(simplify_ring(ring, signature, tolerance, cache), quantum)
+        for ring, signature in zip(rings, signatures)
+    ]
+
+    collapsed = [i for i, ring in enumerate(result) if len(ring) < 3]
+    if not collapsed:
+        return result
+
+    # Pin the collapsed rings' edges, then simplify again every ring that
+    # touches one of their vertices; the rest simplify as before
+    pinned = {
+        _canonical_edge(edge)[0].tobytes()
+        for i in collapsed for edge in _ring_edges(rings[i], signatures[i])
+    }
+    lengths = np.array([len(r) for r in rings])
+    touching = np.isin(np.concatenate([_vertex_keys(r) for r in rings]),
+                       np.concatenate([_vertex_keys(rings[i]) for i in collapsed]))
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    cache = {}
+    for i in np.flatnonzero(np.logical_or.reduceat(touching, starts)):
+        result[i] = _quantise_ring(simplify_ring(rings[i], signatures[i], tolerance, cache, pinned), quantum)
+    return result
+
+
+def encode_tile(members, features, level_rings, level):
+    """Encode features as a compact tile: delta-coded integer rings.
+
+    Each feature is {"c": code, "n": name, "g": polygons}, where a polygon is a
+    list of rings and a ring is a flat [x0, y0, dx1, dy1, ...] list; x0/y0 are
+    relative to the tile origin and everything is in units of the quantum.
+    """
+    all_points = np.vstack([
+        level_rings[r] for i in members for polygon in features[i][2] for r in polygon
+    ])
+    origin = all_points.min(axis=0)
+
+    encoded = []
+    for i in members:
+        code, name, polygons = features[i]
+        geometry = []
+        for polygon in polygons:
+            polygon_rings = []
+            for r in polygon:
+                ring = level_rings[r] - origin
+                deltas = np.vstack([ring[:1], np.diff(ring, axis=0)])
+                polygon_rings.append(deltas.ravel().tolist())
+            geometry.append(polygon_rings)
+        encoded.append({"c": code, "n": name, "g": geometry})
+
+    return {
+        "level": level["level"],
+        "quantum": level["quantum"],
+        "origin": origin.tolist(),
+        "features": encoded,
+    }
+
+
+def _write_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'), ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def build_tiles(source, out_dir=TILES_DIR, lookup_path=LOOKUP_FILE, levels=DASHBOARD_LEVELS):
+    """Write per-MSOA and per-LA boundary tiles for the given zoom levels.
+
+    Layout: {out_dir}/{level}/msoa/{MSOA21CD}.json and
+    {out_dir}/{level}/la/{LAD22CD}.json, plus {out_dir}/index.json.
+    """
+    out_dir = Path(out_dir)
+    parents = load_lookup(lookup_path)
+
+    print(f"Loading boundaries from {Path(source).name}...")
+    features, rings = load_geometry(source, wanted=set(parents))
+    print(f"  {len(features):,} areas, {sum(len(r) for r in rings):,} vertices")
+
+    groups = {"msoa": defaultdict(list), "la": defaultdict(list)}
+    for index, (code, _, _) in enumerate(features):
+        msoa, la = parents[code]
+        groups["msoa"][msoa].append(index)
+        groups["la"][la].append(index)
+
+    index = {"levels": [], "msoa": sorted(groups["msoa"]), "la": sorted(groups["la"])}
+    for level in (spec for spec in ZOOM_LEVELS if spec["level"] in levels):
+        level_rings = simplify_rings(features, rings, level)
+        total_bytes = 0
+        for kind, members_by_code in groups.items():
+            for code, members in members_by_code.items():
+                path = out_dir / str(level["level"]) / kind / f"{code}.json"
+                _write_json(path, encode_tile(members, features, level_rings, level))
+                total_bytes += path.stat().st_size
+
+        vertices = sum(len(r) for r in level_rings)
+        index["levels"].append(dict(level, vertices=vertices, bytes=total_bytes))
+        print(f"  Level {level['level']}: {vertices:,} vertices, {total_bytes / 1024 / 1024:.1f}MB of tiles")
+
+    _write_json(out_dir / "index.json", index)
+    print(f"Wrote {len(groups['msoa']):,} MSOA and {len(groups['la']):,} LA tiles per level to {out_dir}")
+    return index
+
+
+def read_codes_file(path):
+    """Codes from a text file, one per line (blank lines ignored)."""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Boundary tools for the PiP Data Explorer")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    extract = commands.add_parser('extract', help="stream a subset of features out of a GeoJSON file")
+    extract.add_argument('source')
+    extract.add_argument('destination')
+    extract.add_argument('--codes', nargs='*', default=[], help="LSOA, MSOA, LA or region codes")
+    extract.add_argument('--codes-file', help="file of codes, one per line")
+    extract.add_argument('--lookup', default=str(LOOKUP_FILE))
+    extract.add_argument('--property', default='LSOA21CD', help="feature property holding the code")
+
+    tile = commands.add_parser('tile', help="build simplified per-MSOA/per-LA boundary tiles")
+    tile.add_argument('source', nargs='?', default=str(LSOA_BOUNDARIES_FILE))
+    tile.add_argument('--out', default=str(TILES_DIR))
+    tile.add_argument('--lookup', default=str(LOOKUP_FILE))
+    tile.add_argument('--levels', nargs='*', type=int, default=DASHBOARD_LEVELS,
+                      choices=[spec["level"] for spec in ZOOM_LEVELS])
+
+    args = parser.parse_args()
+
+    if args.command == 'extract':
+        codes = list(args.codes)
+        if args.codes_file:
+            codes += read_codes_file(args.codes_file)
+        if args.property == 'LSOA21CD':
+            wanted = expand_codes(codes, args.lookup)
+        else:
+            wanted = set(codes)
+
+        print(f"Extracting {len(wanted)} areas from {Path(args.source).name}...")
+        count = extract_features(args.source, args.destination, wanted, args.property)
+        size_mb = Path(args.destination).stat().st_size / (1024 * 1024)
+        print(f"Created {args.destination} ({count} features, {size_mb:.1f}MB)")
+
+    elif args.command == 'tile':
+        build_tiles(args.source, args.out, args.lookup, args.levels)
+
+
+if __name__ == "__main__":
+    main()
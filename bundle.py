@@ -0,0 +1,477 @@
+"""
+Pride in Place Data Explorer - Data Bundle
+Packs the dashboard data into compact columnar binary files.
+
+The dashboard used to load its data as an inline JSON blob plus three
+JavaScript globals (LSOA_MAP_DATA, LSOA_HLNM_DATA, LSOA_ECONOMIC_DATA), all
+parsed up front on page load. This module writes the same data in the data
+bundle format: one typed array per column plus a shared string dictionary
+for codes, names and labels. bundle_reader.js maps the arrays straight onto
+the fetched buffer and only decodes the rows a view actually touches.
+
+The dashboard loads the tables split by local authority:
+
+    shards/index.bin          every MSOA (code, name, LA) and every LA
+    shards/la/<LAD22CD>.bin   the areas, lsoa_map, lsoa_hlnm and lsoa_economic
+                              tables for one LA, and its areas' most similar
+                              MSOAs when similar.bin exists (similarity.py)
+
+so the first page load only fetches the index, and shard_reader.js fetches
+one LA's data when an area in it is opened.
+
+Layout (little-endian, every section 8-byte aligned):
+
+    0   "PIPB"
+    4   uint32 format version
+    8   uint32 directory length
+    12  directory (UTF-8 JSON: tables, columns, offsets)
+    ..  string dictionary: uint32 offsets[count + 1], then UTF-8 bytes
+    ..  column arrays
+
+Column types: i8/i16/i32 integers (optionally divided by a power-of-ten
+"scale" on read, so 54.71 is stored as 5471 and decodes to exactly 54.71),
+f64 for everything else, and s16/s32 indexes into the string dictionary.
+Missing (and non-finite) values use the type's minimum (NaN for f64) as a
+null sentinel.
+
+Usage:
+    python bundle.py                        # write shards/
+    python bundle.py --single bundle.bin    # also every table in one file
+    python bundle.py --benchmark            # compare size and parse time (needs node)
+"""
+
+import argparse
+import bisect
+import json
+import math
+import re
+import struct
+from pathlib import Path
+
+import numpy as np
+
+import workbooks
+
+LOCAL_DIR = Path(__file__).parent
+AREAS_FILE = LOCAL_DIR / "data.json"
+LSOA_MAP_FILE = LOCAL_DIR / "lsoa_embedded_data_temp.js"
+LSOA_HLNM_FILE = LOCAL_DIR / "lsoa_hlnm_data.js"
+LSOA_ECONOMIC_FILE = LOCAL_DIR / "lsoa_economic_underlying.js"
+SHARD_DIR = LOCAL_DIR / "shards"
+LOOKUP_FILE = LOCAL_DIR / "lsoa_msoa_la_region_lookup_csv.csv"
+SIMILAR_FILE = LOCAL_DIR / "similar.bin"
+
+# Scores the dashboard ranks against every area in the dataset
+IMD_SCORE_COLUMNS = [
+    'Index of Multiple Deprivation (IMD) Score',
+    'Income Score (rate)',
+    'Employment Score (rate)',
+    'Education, Skills and Training Score',
+    'Health Deprivation and Disability Score',
+    'Crime Score',
+    'Barriers to Housing and Services Score',
+    'Living Environment Score',
+]
+
+MAGIC = b"PIPB"
+FORMAT_VERSION = 1
+ALIGN = 8
+MAX_SCALE_DECIMALS = 6
+
+INT_TYPES = [
+    ("i8", np.int8),
+    ("i16", np.int16),
+    ("i32", np.int32),
+]
+
+
+# ---------------------------------------------------------------------------
+# Reading the current dashboard data files
+# ---------------------------------------------------------------------------
+
+def read_js_global(path):
+    """Parse a ``const NAME = {...};`` data file written by the extract scripts."""
+    text = Path(path).read_text(encoding='utf-8-sig')
+    body = text[text.index('=') + 1:].strip().rstrip(';')
+    try:
+        return json.loads(body)
+    except ValueError:
+        # lsoa_embedded_data_temp.js uses bare object keys ({c:"E01...",n:...})
+        # and trailing commas, both fine in JavaScript but not in JSON
+        body = re.sub(r'([{,]\s*)([A-Za-z_]\w*)\s*:', r'\1"\2":', body)
+        return json.loads(re.sub(r',(\s*[\]}])', r'\1', body))
+
+
+def load_dashboard_tables(areas_file=AREAS_FILE):
+    """Collect the dashboard data as {table name: (rows, options)}.
+
+    rows is a list of dicts; options name the key column ("key") used for
+    lookups, or the column rows are grouped by ("group").
+    """
+    with open(areas_file, 'r', encoding='utf-8-sig') as f:
+        data = json.load(f)
+
+    lsoa_map = [
+        dict(lsoa, msoa=msoa)
+        for msoa, lsoas in read_js_global(LSOA_MAP_FILE).items()
+        for lsoa in lsoas
+    ]
+    hlnm = [dict(values, c=code) for code, values in read_js_global(LSOA_HLNM_FILE).items()]
+    economic = [dict(values, c=code) for code, values in read_js_global(LSOA_ECONOMIC_FILE).items()]
+
+    tables = {
+        "areas": (data["areas"], {"key": "msoa_code"}),
+        "lsoa_map": (lsoa_map, {"group": "msoa"}),
+        "lsoa_hlnm": (hlnm, {"key": "c"}),
+        "lsoa_economic": (economic, {"key": "c"}),
+    }
+    return tables, data.get("metadata", {})
+
+
+# ---------------------------------------------------------------------------
+# Encoding
+# ---------------------------------------------------------------------------
+
+class StringDictionary:
+    """Shared, insertion-ordered table of every string in the bundle."""
+
+    def __init__(self):
+        self.index = {}
+
+    def add(self, value):
+        if value not in self.index:
+            self.index[value] = len(self.index)
+        return self.index[value]
+
+    def encode(self):
+        """Return (offsets, utf-8 bytes) for the dictionary."""
+        encoded = [s.encode('utf-8') for s in self.index]
+        offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        return offsets, b"".join(encoded)
+
+
+def _scale_for(values):
+    """Smallest power-of-ten scale that makes every value an integer, or None."""
+    for decimals in range(MAX_SCALE_DECIMALS + 1):
+        scale = 10 ** decimals
+        scaled = [v * scale for v in values]
+        # Round-trip through the shortest repr so 0.1 * 10 counts as exact
+        if all(abs(s - round(s)) < 1e-6 and round(s) / scale == v for s, v in zip(scaled, values)):
+            return scale
+    return None
+
+
+def encode_column(values, strings):
+    """Encode one column as (spec, numpy array) using the narrowest fitting type."""
+    values = [None if isinstance(v, float) and not math.isfinite(v) else v for v in values]
+    present = [v for v in values if v is not None]
+
+    if any(isinstance(v, str) for v in present):
+        codes = [strings.add(str(v)) if v is not None else None for v in values]
+        kind, dtype = ("s16", np.uint16) if len(strings.index) < 0xFFFF else ("s32", np.uint32)
+        null = int(np.iinfo(dtype).max)
+        array = np.array([null if c is None else c for c in codes], dtype=dtype)
+        return {"type": kind, "null": null}, array
+
+    scale = _scale_for(present) if present else 1
+    if scale is not None:
+        ints = [round(v * scale) for v in present]
+        low, high = (min(ints), max(ints)) if ints else (0, 0)
+        for kind, dtype in INT_TYPES:
+            info = np.iinfo(dtype)
+            # The type's minimum is reserved as the null sentinel
+            if info.min < low and high <= info.max:
+                null = int(info.min)
+                array = np.array(
+                    [null if v is None else round(v * scale) for v in values], dtype=dtype
+                )
+                spec = {"type": kind, "null": null}
+                if scale != 1:
+                    spec["scale"] = scale
+                return spec, array
+
+    array = np.array([np.nan if v is None else float(v) for v in values], dtype='<f8')
+    return {"type": "f64"}, array
+
+
+def encode_bundle(tables, metadata=None):
+    """Serialise {name: (rows, options)} into the bundle format; returns bytes."""
+    strings = StringDictionary()
+    directory = {"metadata": metadata or {}, "tables": {}}
+    sections = []
+
+    for name, (rows, options) in tables.items():
+        if options.get("group"):
+            rows = sorted(rows, key=lambda r: r[options["group"]])
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        table = dict(options, rows=len(rows), columns={})
+        for column in columns:
+            spec, array = encode_column([row.get(column) for row in rows], strings)
+            table["columns"][column] = spec
+            sections.append((spec, array))
+        directory["tables"][name] = table
+
+    offsets, string_bytes = strings.encode()
+    directory["strings"] = {"count": len(strings.index), "length": len(string_bytes)}
+
+    # Offsets depend on the directory length, which depends on the offsets:
+    # settle it by padding the directory to a fixed-point size
+    size = 0
+    while True:
+        position = _align(12 + size)
+        directory["strings"]["offsets"] = position
+        position = _align(position + offsets.nbytes)
+        directory["strings"]["bytes"] = position
+        position = _align(position + len(string_bytes))
+        for spec, array in sections:
+            spec["offset"] = position
+            position = _align(position + array.nbytes)
+        encoded = json.dumps(directory, separators=(',', ':')).encode('utf-8')
+        if len(encoded) <= size:
+            break
+        size = len(encoded)
+
+    out = bytearray(position)
+    out[0:12] = MAGIC + struct.pack('<II', FORMAT_VERSION, size)
+    out[12:12 + size] = encoded.ljust(size)
+    _place(out, directory["strings"]["offsets"], offsets.tobytes())
+    _place(out, directory["strings"]["bytes"], string_bytes)
+    for spec, array in sections:
+        _place(out, spec["offset"], array.astype(array.dtype.newbyteorder('<')).tobytes())
+    return bytes(out)
+
+
+def _align(position):
+    return (position + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _place(buffer, offset, data):
+    buffer[offset:offset + len(data)] = data
+
+
+def decode_bundle(payload):
+    """Decode a bundle back into {table name: list of dicts} (used for checks)."""
+    magic, (version, size) = payload[:4], struct.unpack('<II', payload[4:12])
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("Not a data bundle (or an unsupported version)")
+    directory = json.loads(payload[12:12 + size])
+
+    spec = directory["strings"]
+    offsets = np.frombuffer(payload, dtype='<u4', count=spec["count"] + 1, offset=spec["offsets"])
+    raw = payload[spec["bytes"]:spec["bytes"] + spec["length"]]
+    strings = [raw[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(spec["count"])]
+
+    tables = {}
+    for name, table in directory["tables"].items():
+        decoded = {}
+        for column, col in table["columns"].items():
+            dtype = {"i8": '<i1', "i16": '<i2', "i32": '<i4', "f64": '<f8',
+                     "s16": '<u2', "s32": '<u4'}[col["type"]]
+            values = np.frombuffer(payload, dtype=dtype, count=table["rows"], offset=col["offset"])
+            if col["type"] == "f64":
+                decoded[column] = [None if math.isnan(v) else float(v) for v in values]
+            elif col["type"].startswith("s"):
+                decoded[column] = [None if v == col["null"] else strings[v] for v in values]
+            else:
+                scale = col.get("scale", 1)
+                decoded[column] = [
+                    None if v == col["null"] else (int(v) if scale == 1 else int(v) / scale)
+                    for v in values
+                ]
+        tables[name] = [
+            {column: decoded[column][i] for column in decoded if decoded[column][i] is not None}
+            for i in range(table["rows"])
+        ]
+    return tables
+
+
+def _check_round_trip(tables, payload):
+    """Every value must survive the round trip."""
+    decoded = decode_bundle(payload)
+    for name, (rows, options) in tables.items():
+        expected = [{k: v for k, v in row.items() if v is not None} for row in rows]
+        group = options.get("group")
+        if group:
+            expected.sort(key=lambda r: r[group])
+        if decoded[name] != expected:
+            raise ValueError(f"Bundle round trip changed table {name}")
+
+
+def _write(path, payload):
+    tmp_path = Path(path).with_suffix('.tmp')
+    tmp_path.write_bytes(payload)
+    tmp_path.replace(path)
+
+
+def write_bundle(path, areas_file=AREAS_FILE):
+    """Build one bundle of every table from the current data files and write it to path.
+
+    The dashboard loads shards instead; a single bundle is what
+    benchmarks/bench_bundle.js and bench_shards.js compare them against.
+    """
+    tables, metadata = load_dashboard_tables(areas_file)
+    payload = encode_bundle(tables, metadata)
+    _check_round_trip(tables, payload)
+    _write(path, payload)
+    print(f"Wrote {Path(path).name}: {len(payload):,} bytes, "
+          + ", ".join(f"{name} {len(rows)} rows" for name, (rows, _) in tables.items()))
+    return payload
+
+
+# ---------------------------------------------------------------------------
+# Shards
+# ---------------------------------------------------------------------------
+
+def dataset_percentiles(areas, columns=IMD_SCORE_COLUMNS):
+    """Copies of the area rows with <column>_dataset_percentile added: the
+    share of areas in the dataset scoring lower, which the dashboard used to
+    work out by scanning every area on each render. It is kept apart from
+    <column>_percentile, the rank against every MSOA in England that
+    data_gatherer.py and national.py write.
+    """
+    ranked = [dict(area) for area in areas]
+    for column in columns:
+        scores = sorted(a[column] for a in areas if a.get(column) is not None)
+        for area in ranked:
+            if area.get(column) is not None:
+                area[f"{column}_dataset_percentile"] = bisect.bisect_left(scores, area[column]) / len(scores) * 100
+    return ranked
+
+
+def _la_name(name):
+    # data.json has "Bristol, City of" where the 2022 lookup has "Bristol"
+    return name.removesuffix(", City of")
+
+
+def load_local_authorities(lookup_path=LOOKUP_FILE):
+    """LA name -> {la_code, region_code, region} from the ONS lookup."""
+    lookup = workbooks.read_table(lookup_path, usecols=['LAD22CD', 'LAD22NM', 'RGN22CD', 'RGN22NM'])
+    lookup = lookup.drop_duplicates('LAD22CD')
+    return {
+        _la_name(row.LAD22NM): {"la_code": row.LAD22CD, "region_code": row.RGN22CD, "region": row.RGN22NM}
+        for row in lookup.itertuples(index=False)
+    }
+
+
+def load_similar_areas(msoa_codes, path=SIMILAR_FILE, lookup_path=LOOKUP_FILE):
+    """Rows of a "similar" shard table for the given MSOAs: the neighbour's
+    code (c), name (n), LA (la) and distance (d), nearest first. Empty when
+    similar.bin has not been built.
+    """
+    if not Path(path).exists():
+        return []
+    wanted = set(msoa_codes)
+    neighbours = [row for row in decode_bundle(Path(path).read_bytes()).get("msoa", []) if row['code'] in wanted]
+    lookup = workbooks.read_table(lookup_path, usecols=['MSOA21CD', 'MSOA21NM', 'LAD22NM'])
+    names = {row.MSOA21CD: (row.MSOA21NM, row.LAD22NM)
+             for row in lookup.drop_duplicates('MSOA21CD').itertuples(index=False)}
+    return [
+        {"msoa": row['code'], "c": row['n'], "n": names.get(row['n'], (row['n'], None))[0],
+         "la": names.get(row['n'], (None, None))[1], "d": row['d']}
+        for row in neighbours
+    ]
+
+
+def write_la_shards(out_dir, tables, metadata, area_las):
+    """Write one bundle per LA plus the index; returns the index payload.
+
+    area_las maps each MSOA code to its LA ({la_code, local_authority,
+    region_code, region}); LSOAs follow the MSOA they are grouped under in
+    lsoa_map, and tables keyed by LSOA code ("c") follow the LSOA.
+    """
+    out_dir = Path(out_dir)
+    (out_dir / "la").mkdir(parents=True, exist_ok=True)
+    msoa_la = {msoa: la['la_code'] for msoa, la in area_las.items()}
+    lsoa_la = {row['c']: msoa_la.get(row['msoa']) for row in tables["lsoa_map"][0]}
+
+    shard_rows = {la_code: {name: [] for name in tables} for la_code in set(msoa_la.values())}
+    for name, (rows, options) in tables.items():
+        for row in rows:
+            if name == "areas":
+                la_code = msoa_la[row['msoa_code']]
+            elif options.get("group") == "msoa":
+                la_code = msoa_la.get(row['msoa'])
+            else:
+                la_code = lsoa_la.get(row['c'])
+            if la_code:
+                shard_rows[la_code][name].append(row)
+
+    las = []
+    for la_code in sorted(shard_rows):
+        shard = {name: (rows, tables[name][1]) for name, rows in shard_rows[la_code].items()}
+        payload = encode_bundle(shard, dict(metadata, la_code=la_code))
+        _check_round_trip(shard, payload)
+        _write(out_dir / "la" / f"{la_code}.bin", payload)
+        first = area_las[shard_rows[la_code]["areas"][0]['msoa_code']]
+        las.append(dict(first, msoas=len(shard_rows[la_code]["areas"]), bytes=len(payload)))
+
+    # Shards of LAs no longer in the dataset would be served stale
+    for stale in (out_dir / "la").glob("*.bin"):
+        if stale.stem not in shard_rows:
+            stale.unlink()
+
+    areas = tables["areas"][0]
+    index_tables = {
+        "msoas": ([{"msoa_code": a['msoa_code'], "neighbourhood_name": a['neighbourhood_name'],
+                    "la_code": msoa_la[a['msoa_code']]} for a in areas], {"key": "msoa_code"}),
+        "las": (las, {"key": "la_code"}),
+    }
+    index = encode_bundle(index_tables, metadata)
+    _check_round_trip(index_tables, index)
+    _write(out_dir / "index.bin", index)
+    largest = max(la['bytes'] for la in las)
+    print(f"Wrote {out_dir.name}/: index.bin {len(index):,} bytes, {len(las)} LA shards "
+          f"(largest {largest:,} bytes, {sum(la['bytes'] for la in las):,} in all)")
+    return index
+
+
+def write_shards(out_dir=SHARD_DIR, areas_file=AREAS_FILE, lookup_path=LOOKUP_FILE,
+                 similar_path=SIMILAR_FILE):
+    """Split the dashboard tables by local authority, as national.py does.
+
+    The data.json MSOA codes do not all match the 2021 lookup, so areas are
+    placed by their local_authority name.
+    """
+    tables, metadata = load_dashboard_tables(areas_file)
+    areas = dataset_percentiles(tables["areas"][0])
+    tables["areas"] = (areas, tables["areas"][1])
+    local_authorities = load_local_authorities(lookup_path)
+    similar = load_similar_areas([a['msoa_code'] for a in areas], similar_path, lookup_path)
+    if similar:
+        tables["similar"] = (similar, {"group": "msoa"})
+
+    unknown = sorted({
+        a['local_authority'] for a in areas if _la_name(a['local_authority']) not in local_authorities
+    })
+    if unknown:
+        raise ValueError(f"Local authorities not in {Path(lookup_path).name}: {unknown}")
+    area_las = {
+        a['msoa_code']: dict(local_authorities[_la_name(a['local_authority'])],
+                             local_authority=a['local_authority'])
+        for a in areas
+    }
+    return write_la_shards(out_dir, tables, metadata, area_las)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the dashboard data bundle")
+    parser.add_argument('--areas', default=str(AREAS_FILE), help="MSOA dataset (default: data.json)")
+    parser.add_argument('--single', help="also write every table to this one file")
+    parser.add_argument('--shards', default=str(SHARD_DIR), help="per-LA shard directory (default: shards)")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="compare size and parse time against the JSON/JS files")
+    args = parser.parse_args()
+
+    if args.single:
+        write_bundle(args.single, args.areas)
+    write_shards(args.shards, args.areas)
+
+    if args.benchmark:
+        # The dashboard decodes the bundle in JavaScript, so time it there
+        import subprocess
+        subprocess.run(["node", str(LOCAL_DIR / "benchmarks" / "bench_bundle.js")], check=True)
+
+
+if __name__ == "__main__":
+    main()
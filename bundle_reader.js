@@ -0,0 +1,210 @@
+// Pride in Place Data Explorer - data bundle reader
+// Decodes the data bundles bundle.py writes (shards/). Column arrays are typed
+// views onto the fetched buffer, so loading costs one small JSON parse for
+// the directory; rows and strings are only decoded when a view asks for them.
+
+(function (root) {
+    const MAGIC = 'PIPB';
+    const FORMAT_VERSION = 1;
+    const ARRAY_TYPES = {
+        i8: Int8Array,
+        i16: Int16Array,
+        i32: Int32Array,
+        f64: Float64Array,
+        s16: Uint16Array,
+        s32: Uint32Array
+    };
+
+    function readBundle(buffer) {
+        const view = new DataView(buffer);
+        const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+        if (magic !== MAGIC || view.getUint32(4, true) !== FORMAT_VERSION) {
+            throw new Error('Not a data bundle (or an unsupported version)');
+        }
+        const directoryLength = view.getUint32(8, true);
+        const decoder = new TextDecoder();
+        const directory = JSON.parse(decoder.decode(new Uint8Array(buffer, 12, directoryLength)));
+
+        const strings = stringTable(buffer, directory.strings, decoder);
+        const tables = {};
+        for (const [name, spec] of Object.entries(directory.tables)) {
+            tables[name] = new BundleTable(buffer, spec, strings);
+        }
+        // buffer: the bytes the tables view, for handing on to a worker
+        return { metadata: directory.metadata, tables, buffer };
+    }
+
+    function stringTable(buffer, spec, decoder) {
+        const offsets = new Uint32Array(buffer, spec.offsets, spec.count + 1);
+        const bytes = new Uint8Array(buffer, spec.bytes, spec.length);
+        const cache = new Array(spec.count);
+        return function (index) {
+            let value = cache[index];
+            if (value === undefined) {
+                value = decoder.decode(bytes.subarray(offsets[index], offsets[index + 1]));
+                cache[index] = value;
+            }
+            return value;
+        };
+    }
+
+    class BundleTable {
+        constructor(buffer, spec, strings) {
+            this.rows = spec.rows;
+            this.key = spec.key;
+            this.group = spec.group;
+            this.strings = strings;
+            this.columns = {};
+            for (const [name, col] of Object.entries(spec.columns)) {
+                this.columns[name] = Object.assign({
+                    values: new ARRAY_TYPES[col.type](buffer, col.offset, spec.rows)
+                }, col);
+            }
+            this.names = Object.keys(this.columns);
+            this.records = new Array(spec.rows);
+            this.keyIndex = null;
+        }
+
+        // One cell, or null if missing
+        value(row, name) {
+            const col = this.columns[name];
+            if (!col) return undefined;
+            const raw = col.values[row];
+            if (col.type === 'f64') return Number.isNaN(raw) ? null : raw;
+            if (raw === col.null) return null;
+            if (col.type[0] === 's') return this.strings(raw);
+            return col.scale ? raw / col.scale : raw;
+        }
+
+        // Every value in a column, decoded (typed array views stay untouched)
+        column(name) {
+            const out = new Array(this.rows);
+            for (let i = 0; i < this.rows; i++) out[i] = this.value(i, name);
+            return out;
+        }
+
+        // A plain object for one row, decoded once and then reused
+        record(row) {
+            let rec = this.records[row];
+            if (!rec) {
+                rec = {};
+                for (const name of this.names) {
+                    const v = this.value(row, name);
+                    if (v !== null) rec[name] = v;
+                }
+                this.records[row] = rec;
+            }
+            return rec;
+        }
+
+        // Row number for a key value (the index is built on first use)
+        find(key) {
+            if (!this.keyIndex) {
+                const col = this.columns[this.key];
+                this.keyIndex = new Map();
+                for (let i = 0; i < this.rows; i++) {
+                    this.keyIndex.set(this.strings(col.values[i]), i);
+                }
+            }
+            return this.keyIndex.get(key);
+        }
+
+        // Lazy row objects: each field is decoded when it is read
+        lazyRows() {
+            const rows = new Array(this.rows);
+            for (let i = 0; i < this.rows; i++) rows[i] = this.lazyRow(i);
+            return rows;
+        }
+
+        lazyRow(row) {
+            const table = this;
+            return new Proxy({}, {
+                get(_, name) {
+                    return typeof name === 'string' ? table.value(row, name) ?? undefined : undefined;
+                },
+                has(_, name) {
+                    return name in table.columns && table.value(row, name) !== null;
+                },
+                ownKeys() {
+                    return table.names.filter(name => table.value(row, name) !== null);
+                },
+                getOwnPropertyDescriptor(_, name) {
+                    const v = table.value(row, name);
+                    return v === null || v === undefined
+                        ? undefined
+                        : { value: v, enumerable: true, configurable: true };
+                }
+            });
+        }
+
+        // Object-like view keyed by the key column: view[code] -> record
+        keyed() {
+            const table = this;
+            return new Proxy({}, {
+                get(_, key) {
+                    const row = typeof key === 'string' ? table.find(key) : undefined;
+                    return row === undefined ? undefined : table.record(row);
+                },
+                has(_, key) {
+                    return table.find(key) !== undefined;
+                }
+            });
+        }
+
+        // Object-like view of row groups: view[msoa] -> [records], rows are
+        // stored sorted by the group column so each group is one run
+        grouped() {
+            const table = this;
+            const col = this.columns[this.group];
+            let ranges = null;
+            const cache = new Map();
+            function groupRange(key) {
+                if (!ranges) {
+                    ranges = new Map();
+                    for (let i = 0; i < table.rows; i++) {
+                        const k = table.strings(col.values[i]);
+                        const range = ranges.get(k);
+                        if (range) range[1] = i + 1;
+                        else ranges.set(k, [i, i + 1]);
+                    }
+                }
+                return ranges.get(key);
+            }
+            return new Proxy({}, {
+                get(_, key) {
+                    if (typeof key !== 'string') return undefined;
+                    if (cache.has(key)) return cache.get(key);
+                    const range = groupRange(key);
+                    if (!range) return undefined;
+                    const records = [];
+                    for (let i = range[0]; i < range[1]; i++) {
+                        const rec = Object.assign({}, table.record(i));
+                        delete rec[table.group];
+                        records.push(rec);
+                    }
+                    cache.set(key, records);
+                    return records;
+                },
+                has(_, key) {
+                    return groupRange(key) !== undefined;
+                }
+            });
+        }
+    }
+
+    // The content-hashed name when publish.py's manifest is loaded (asset_manifest.js)
+    const assetUrl = url => (root.PipAssets ? root.PipAssets.assetUrl(url) : url);
+
+    async function loadBundle(url) {
+        const response = await fetch(assetUrl(url));
+        if (!response.ok) throw new Error(`Failed to load ${url}: ${response.status}`);
+        return readBundle(await response.arrayBuffer());
+    }
+
+    const api = { readBundle, loadBundle, BundleTable };
+    if (typeof module !== 'undefined' && module.exports) {
+        module.exports = api;
+    } else {
+        root.PipBundle = api;
+    }
+})(typeof self !== 'undefined' ? self : this);
@@ -0,0 +1,166 @@
+"""
+Pride in Place Data Explorer - Columnar Store
+Typed, memory-mapped intermediate tables for the data build.
+
+Each raw source (CSV, ZIP or workbook) is parsed once and written as an
+uncompressed Arrow IPC (Feather v2) file under data/store/, named by a hash
+of the source file contents plus the build parameters. Later runs memory-map
+that file instead of re-parsing text, and only rebuild a table when one of
+its sources or parameters has changed.
+
+The manifest is shared by every process that builds tables (the pipeline
+runs its stages in parallel workers), so each read-modify-write of it holds
+an exclusive lock on manifest.lock in the store directory.
+
+Requires pyarrow.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.ipc
+
+import instrument
+from downloader import FILE_MODE, file_lock, sha256_file, temp_path
+
+STORE_DIR = Path(__file__).parent / "data" / "store"
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "manifest.lock"
+
+def manifest_lock(store_dir=STORE_DIR):
+    """Hold the store manifest exclusively, across threads and processes.
+
+    Load the manifest inside the block, change it and save it before leaving,
+    so no other writer's entries are lost in between.
+    """
+    return file_lock(Path(store_dir) / LOCK_NAME)
+
+
+def load_manifest(store_dir=STORE_DIR):
+    """Load the store manifest, or an empty one if missing or unreadable."""
+    try:
+        with open(Path(store_dir) / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    manifest.setdefault("files", {})
+    manifest.setdefault("tables", {})
+    return manifest
+
+
+def save_manifest(manifest, store_dir=STORE_DIR):
+    """Write the store manifest atomically (call under manifest_lock)."""
+    path = Path(store_dir) / MANIFEST_NAME
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=store_dir,
+                                     suffix='.tmp', delete=False) as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.chmod(f.name, FILE_MODE)
+    os.replace(f.name, path)
+
+
+def file_digest(path, manifest):
+    """SHA-256 of a source file, memoised in the manifest by size and mtime."""
+    path = Path(path).resolve()
+    stat = path.stat()
+    known = manifest["files"].get(str(path))
+    if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+        return known["sha256"]
+
+    digest = sha256_file(path)
+    manifest["files"][str(path)] = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": digest,
+    }
+    return digest
+
+
+def source_key(sources, params, manifest):
+    """Content hash identifying one build of a table."""
+    digest = hashlib.sha256()
+    for path in sources:
+        digest.update(file_digest(path, manifest).encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def write_table(df, path):
+    """Write a DataFrame as an uncompressed Arrow IPC file (mmap-friendly)."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = temp_path(Path(path).parent, '.tmp')
+    with pa.OSFile(str(tmp_path), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def read_arrow(path):
+    """Memory-map an Arrow IPC file and return it as a pyarrow Table."""
+    with pa.memory_map(str(path), 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def read_table(path):
+    """Memory-map an Arrow IPC file and return it as a DataFrame.
+
+    Numeric columns without nulls stay read-only views of the mapped file;
+    string, categorical and nullable columns are copied into pandas.
+    """
+    return read_arrow(path).to_pandas(split_blocks=True)
+
+
+def cached_table(name, sources, build, params=None, store_dir=None):
+    """Return table name from the store, building it only when stale.
+
+    sources is the list of raw files the table is derived from and params any
+    settings that change its contents (column selections, dtypes, version).
+    build is called with no arguments to produce the DataFrame on a miss.
+    store_dir defaults to STORE_DIR as it is at call time.
+    """
+    store_dir = Path(store_dir or STORE_DIR)
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    with instrument.span(f"store {name}") as step:
+        # Hash outside the lock, then merge just these sources' digests
+        manifest = load_manifest(store_dir)
+        key = source_key(sources, params, manifest)
+        with manifest_lock(store_dir):
+            latest = load_manifest(store_dir)
+            for p in sources:
+                resolved = str(Path(p).resolve())
+                latest["files"][resolved] = manifest["files"][resolved]
+            save_manifest(latest, store_dir)
+
+        path = store_dir / f"{name}-{key[:16]}.arrow"
+        entry = latest["tables"].get(name)
+        if entry and entry["key"] == key and path.exists():
+            print(f"  Using store: {path.name}")
+            step.set(hit=True)
+            df = read_table(path)
+            step.rows(rows_out=len(df))
+            return df
+
+        step.set(hit=False)
+        df = build()
+        write_table(df, path)
+
+        with manifest_lock(store_dir):
+            manifest = load_manifest(store_dir)
+            previous = manifest["tables"].get(name)
+            if previous and previous["file"] != path.name:
+                (store_dir / previous["file"]).unlink(missing_ok=True)
+            manifest["tables"][name] = {
+                "key": key,
+                "file": path.name,
+                "rows": len(df),
+                "sources": [str(Path(p).resolve()) for p in sources],
+            }
+            save_manifest(manifest, store_dir)
+
+        print(f"  Stored: {path.name} ({len(df):,} rows)")
+        step.rows(rows_out=len(df))
+        return read_table(path)
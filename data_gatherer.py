@@ -11,18 +11,33 @@ Data Sources:
 Run this script to generate the data.json file used by the dashboard.
 """
 
-import requests
 import pandas as pd
 import numpy as np
+import argparse
+import csv
+import functools
 import json
 import zipfile
 import io
 import os
 from pathlib import Path
 
+import columnar_store
+import downloader
+import instrument
+import workbooks
+
 # Configuration
-DATA_DIR = Path(__file__).parent / "data"
-OUTPUT_FILE = Path(__file__).parent / "data.json"
+LOCAL_DIR = Path(__file__).parent
+DATA_DIR = LOCAL_DIR / "data"
+OUTPUT_FILE = LOCAL_DIR / "data.json"
+# Per-stage timings, memory and I/O of the last run (see instrument.py)
+TRACE_FILE = LOCAL_DIR / "data_trace.json"
+CHROME_TRACE_FILE = LOCAL_DIR / "data_trace.chrome.json"
+PROFILE_DIR = DATA_DIR / "profile"
+
+# Bump to invalidate every table in the columnar store after a parsing change
+STORE_VERSION = 1
 
 # URLs for data sources
 URLS = {
@@ -46,61 +61,193 @@ URLS = {
     "imd_2025": "https://assets.publishing.service.gov.uk/media/6721a39246532eb85b519981/File_7_-_All_IoD2025_Scores__Ranks_and_Deciles.csv",
 }
 
+# Cache filename for each source in DATA_DIR
+CACHE_FILES = {
+    "pip_msoas": "pride_in_place_msoas.xlsx",
+    "lsoa_msoa_lookup": "lsoa_msoa_lookup.csv",
+    "census_economic_activity": "ts066.zip",
+    "census_health": "ts037.zip",
+    "census_disability": "ts038.zip",
+    "census_qualifications": "ts067.zip",
+    "census_deprivation": "ts011.zip",
+    "census_tenure": "ts054.zip",
+    "census_unpaid_care": "ts039.zip",
+    "census_occupation": "ts063.zip",
+    "imd_2025": "imd_2025.csv",
+}
+
+# Keywords for the Census columns each process_* function looks for. Only the
+# geography code plus columns containing one of these are parsed; the rest of
+# each table is skipped. Tables without a process_* step keep just the totals.
+CENSUS_COLUMN_KEYWORDS = {
+    "economic_activity": ['total', 'unemployed', 'inactive', 'employed', 'employee'],
+    "health": ['total', 'bad', 'poor', 'good'],
+    "disability": ['total'],
+    "qualifications": ['total', 'no qual', 'level 4'],
+    "deprivation": ['total', 'deprived'],
+    "tenure": ['total', 'social', 'council', 'owned', 'owns', 'private'],
+    "unpaid_care": ['total'],
+    "occupation": ['total'],
+}
+
+# Census dataset -> canonical field -> how its columns are recognised. A
+# column belongs to a field when its lower-cased name contains any of "any",
+# all of "all" and none of "none"; a "one" field takes the first such column.
+# Resolved once per table header by census_plan.
+CENSUS_FIELDS = {
+    "economic_activity": {
+        "total": {"any": ['total'], "one": True},
+        "unemployed": {"any": ['unemployed']},
+        "inactive": {"any": ['inactive'], "all": ['economically']},
+        "employed": {"any": ['employed', 'employee']},
+    },
+    "health": {
+        "total": {"any": ['total'], "one": True},
+        "bad_health": {"any": ['bad', 'poor']},
+    },
+    "qualifications": {
+        "total": {"any": ['total'], "one": True},
+        "no_qualifications": {"any": ['no qual']},
+        "level4_plus": {"any": ['level 4']},
+    },
+    "deprivation": {
+        "total": {"any": ['total'], "one": True},
+        "deprived": {"any": ['deprived'], "none": ['not']},
+    },
+    "tenure": {
+        "total": {"any": ['total'], "one": True},
+        "social_rented": {"any": ['social', 'council']},
+        "owned": {"any": ['owned', 'owns']},
+    },
+}
+
+# Census dataset -> (output column, field), in output order. A field's
+# columns are summed; a *_pct column is that sum as a share of the table's
+# total. Measures whose field matched no column are left out.
+CENSUS_MEASURES = {
+    "economic_activity": [
+        ("unemployed_count", "unemployed"), ("inactive_count", "inactive"),
+        ("employed_count", "employed"), ("total_population", "total"),
+    ],
+    "health": [("total", "total"), ("bad_health_count", "bad_health"), ("bad_health_pct", "bad_health")],
+    "qualifications": [
+        ("total", "total"),
+        ("no_qualifications_count", "no_qualifications"), ("no_qualifications_pct", "no_qualifications"),
+        ("level4_plus_count", "level4_plus"), ("level4_plus_pct", "level4_plus"),
+    ],
+    "deprivation": [
+        ("total_households", "total"),
+        ("deprived_households", "deprived"), ("deprived_pct", "deprived"),
+    ],
+    "tenure": [
+        ("total_households", "total"),
+        ("social_rented", "social_rented"), ("social_rented_pct", "social_rented"),
+        ("owned", "owned"), ("owned_pct", "owned"),
+    ],
+}
+
+# Local OCSI extracts (HLNM and Community Needs Index), keyed by output column
+HLNM_FILE = LOCAL_DIR / "HLNM_MSOA_csv.csv"
+HLNM_COLUMNS = {
+    "Growth": "hlnm_growth",
+    "Energy": "hlnm_energy",
+    "Crime": "hlnm_crime",
+    "Opportunity": "hlnm_opportunity",
+    "Health": "hlnm_health",
+}
+# HLNM Crime is a rank (1 = most crime) rather than a need score, so its
+# percentile is inverted to keep higher = more need
+HLNM_RANK_COLUMNS = ["hlnm_crime"]
+
+CNI_FILES = {
+    "community_needs_rank": LOCAL_DIR / "MSOA_Community Needs Index 2023_ Community Needs rank_2023-01-01_csv.xlsx",
+    "civic_assets_rank": LOCAL_DIR / "MSOA_Community Needs Index 2023_ Civic Assets rank_2023-01-01_csv.csv",
+    "connectedness_rank": LOCAL_DIR / "MSOA_Community Needs Index 2023_ Connectedness rank_2023-01-01_csv.csv",
+    "active_engaged_rank": LOCAL_DIR / "MSOA_Community Needs Index 2023_ Active and Engaged Community rank_2023-01-01_csv.csv",
+}
+# CNI ranks run from 1 (highest need) on OCSI's 33,755-area scale
+CNI_RANK_SCALE = 33755
+
+# Compact dtypes for the lookup; codes with few distinct values are categorical
+LOOKUP_DTYPES = {
+    "LSOA21CD": str, "LSOA21NM": str, "LSOA21NMW": str,
+    "MSOA21CD": str, "MSOA21NM": str, "MSOA21NMW": str,
+    "LAD22CD": "category", "LAD22NM": "category",
+    "RGN22CD": "category", "RGN22NM": "category",
+}
+
+# Census dataset name -> (URLS key, NOMIS table id)
+CENSUS_TABLES = {
+    "economic_activity": ("census_economic_activity", "ts066"),
+    "health": ("census_health", "ts037"),
+    "disability": ("census_disability", "ts038"),
+    "qualifications": ("census_qualifications", "ts067"),
+    "deprivation": ("census_deprivation", "ts011"),
+    "tenure": ("census_tenure", "ts054"),
+    "unpaid_care": ("census_unpaid_care", "ts039"),
+    "occupation": ("census_occupation", "ts063"),
+}
+
 def ensure_data_dir():
     """Create data directory if it doesn't exist."""
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 def download_file(url, filename, force=False):
-    """Download a file if it doesn't exist or force is True."""
-    filepath = DATA_DIR / filename
-    if filepath.exists() and not force:
-        print(f"  Using cached: {filename}")
-        return filepath
-
-    print(f"  Downloading: {filename}...")
-    response = requests.get(url, timeout=120)
-    response.raise_for_status()
+    """Download a file into the cache unless a verified copy is already there."""
+    with instrument.span(f"download {filename}") as step:
+        path = downloader.download(url, DATA_DIR / filename, force=force)
+        step.set(bytes=Path(path).stat().st_size)
+    return path
+
+def prefetch_sources(force=False, max_workers=downloader.DEFAULT_WORKERS):
+    """Download every source in URLS in parallel before processing starts."""
+    print("\n0. Fetching data sources...")
+    jobs = [(URLS[key], DATA_DIR / CACHE_FILES[key]) for key in URLS]
+    return downloader.download_all(jobs, force=force, max_workers=max_workers)
+
+def find_msoa_member(zf, name):
+    """Name of the MSOA-level CSV inside a NOMIS bulk ZIP."""
+    for filename in zf.namelist():
+        if 'msoa' in filename.lower() and filename.endswith('.csv'):
+            return filename
 
-    with open(filepath, 'wb') as f:
-        f.write(response.content)
+    raise ValueError(f"No MSOA CSV found in {name}.zip")
 
-    return filepath
+@instrument.traced
+def read_census_msoa(zip_path, keywords):
+    """Parse the MSOA CSV of a NOMIS ZIP directly from the archive.
 
-def download_and_extract_zip(url, name, force=False):
-    """Download a ZIP file and extract the MSOA CSV."""
-    zip_path = DATA_DIR / f"{name}.zip"
-    csv_path = DATA_DIR / f"{name}_msoa.csv"
+    Only the geography code and the columns matching keywords are read.
+    Codes are parsed as categoricals and counts as int32, and the member is
+    streamed from the ZIP so no extracted copy is written to disk.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        member = find_msoa_member(zf, Path(zip_path).stem)
 
-    if csv_path.exists() and not force:
-        print(f"  Using cached: {name}_msoa.csv")
-        return csv_path
+        with zf.open(member) as source:
+            header = next(csv.reader(io.TextIOWrapper(source, encoding='utf-8-sig')))
 
-    print(f"  Downloading: {name}.zip...")
-    response = requests.get(url, timeout=120)
-    response.raise_for_status()
+        geo_col = [c for c in header if 'geography' in c.lower() and 'code' in c.lower()][0]
+        value_cols = [
+            c for c in header
+            if c != geo_col and any(k in c.lower() for k in keywords)
+        ]
 
-    # Save ZIP
-    with open(zip_path, 'wb') as f:
-        f.write(response.content)
+        dtypes = {c: np.int32 for c in value_cols}
+        dtypes[geo_col] = 'category'
 
-    # Extract MSOA file
-    with zipfile.ZipFile(zip_path, 'r') as zf:
-        for filename in zf.namelist():
-            if 'msoa' in filename.lower() and filename.endswith('.csv'):
-                print(f"  Extracting: {filename}")
-                with zf.open(filename) as source:
-                    content = source.read()
-                with open(csv_path, 'wb') as target:
-                    target.write(content)
-                return csv_path
-
-    raise ValueError(f"No MSOA CSV found in {name}.zip")
+        with zf.open(member) as source:
+            return pd.read_csv(
+                source, usecols=[geo_col] + value_cols, dtype=dtypes,
+                encoding='utf-8-sig', engine='c'
+            )
 
+@instrument.traced
 def load_pip_msoas():
     """Load the Pride in Place MSOA list."""
     print("\n1. Loading Pride in Place MSOA list...")
     filepath = download_file(URLS["pip_msoas"], "pride_in_place_msoas.xlsx")
-    df = pd.read_excel(filepath)
+    df = workbooks.read_table(filepath)
 
     # Standardise column names
     df.columns = [c.strip().lower().replace(' ', '_') for c in df.columns]
@@ -127,60 +274,48 @@ def load_pip_msoas():
 
     return df
 
+@instrument.traced
 def load_lsoa_msoa_lookup():
     """Load LSOA to MSOA lookup table."""
     print("\n2. Loading LSOA to MSOA lookup...")
     filepath = download_file(URLS["lsoa_msoa_lookup"], "lsoa_msoa_lookup.csv")
-    df = pd.read_csv(filepath)
+    df = columnar_store.cached_table(
+        "lsoa_msoa_lookup", [filepath],
+        lambda: pd.read_csv(filepath, dtype=LOOKUP_DTYPES, encoding='utf-8-sig'),
+        params={"version": STORE_VERSION, "dtypes": LOOKUP_DTYPES},
+    )
     print(f"  Loaded {len(df)} LSOA-MSOA mappings")
     return df
 
+@instrument.traced
 def load_census_data():
     """Load all Census 2021 datasets."""
     print("\n3. Loading Census 2021 data...")
 
     datasets = {}
 
-    # Economic activity (TS066)
-    path = download_and_extract_zip(URLS["census_economic_activity"], "ts066")
-    datasets["economic_activity"] = pd.read_csv(path)
-
-    # General health (TS037)
-    path = download_and_extract_zip(URLS["census_health"], "ts037")
-    datasets["health"] = pd.read_csv(path)
-
-    # Disability (TS038)
-    path = download_and_extract_zip(URLS["census_disability"], "ts038")
-    datasets["disability"] = pd.read_csv(path)
-
-    # Qualifications (TS067)
-    path = download_and_extract_zip(URLS["census_qualifications"], "ts067")
-    datasets["qualifications"] = pd.read_csv(path)
-
-    # Deprivation dimensions (TS011)
-    path = download_and_extract_zip(URLS["census_deprivation"], "ts011")
-    datasets["deprivation"] = pd.read_csv(path)
-
-    # Tenure (TS054)
-    path = download_and_extract_zip(URLS["census_tenure"], "ts054")
-    datasets["tenure"] = pd.read_csv(path)
-
-    # Unpaid care (TS039)
-    path = download_and_extract_zip(URLS["census_unpaid_care"], "ts039")
-    datasets["unpaid_care"] = pd.read_csv(path)
-
-    # Occupation (TS063)
-    path = download_and_extract_zip(URLS["census_occupation"], "ts063")
-    datasets["occupation"] = pd.read_csv(path)
+    for dataset, (url_key, table) in CENSUS_TABLES.items():
+        zip_path = download_file(URLS[url_key], f"{table}.zip")
+        keywords = CENSUS_COLUMN_KEYWORDS[dataset]
+        datasets[dataset] = columnar_store.cached_table(
+            f"census_{table}", [zip_path],
+            lambda: read_census_msoa(zip_path, keywords),
+            params={"version": STORE_VERSION, "keywords": keywords},
+        )
 
     return datasets
 
+@instrument.traced
 def load_imd_data(lsoa_msoa_lookup):
     """Load IMD 2025 data and aggregate to MSOA level."""
     print("\n4. Loading IMD 2025 data...")
     filepath = download_file(URLS["imd_2025"], "imd_2025.csv")
 
-    imd = pd.read_csv(filepath)
+    imd = columnar_store.cached_table(
+        "imd_2025", [filepath],
+        lambda: pd.read_csv(filepath, encoding='utf-8-sig'),
+        params={"version": STORE_VERSION},
+    )
     print(f"  Loaded {len(imd)} LSOA records")
 
     # Find the LSOA code column
@@ -198,159 +333,318 @@ def load_imd_data(lsoa_msoa_lookup):
 
     return imd, lsoa_col
 
+@instrument.traced
+def load_hlnm_data():
+    """Load the Hyper-Local Need Measure scores for every MSOA."""
+    def build():
+        df = workbooks.read_table(HLNM_FILE, usecols=['Area Code'] + list(HLNM_COLUMNS))
+        df = df.rename(columns={'Area Code': 'msoa_code', **HLNM_COLUMNS})
+        return df.astype({'hlnm_crime': np.int32})
+
+    df = columnar_store.cached_table(
+        "hlnm_msoa", [HLNM_FILE], build,
+        params={"version": STORE_VERSION, "columns": HLNM_COLUMNS},
+    )
+    print(f"  Loaded HLNM scores for {len(df)} MSOAs")
+    return df
+
+@instrument.traced
+def load_cni_data():
+    """Load the Community Needs Index ranks into one MSOA-keyed frame."""
+    ranks = []
+    for rank_col, path in CNI_FILES.items():
+        def build(path=path, rank_col=rank_col):
+            df = workbooks.read_table(path, usecols=['Area Code', 'Value'])
+            df = df.rename(columns={'Area Code': 'msoa_code', 'Value': rank_col})
+            return df.astype({rank_col: np.int32})
+
+        df = columnar_store.cached_table(
+            f"cni_{rank_col}", [path], build,
+            params={"version": STORE_VERSION},
+        )
+        ranks.append(df.set_index('msoa_code')[rank_col])
+
+    # Every file shares the Area Code key, so one index-aligned concat joins them
+    result = pd.concat(ranks, axis=1, join='outer').rename_axis('msoa_code').reset_index()
+    print(f"  Loaded CNI ranks for {len(result)} MSOAs")
+    return result
+
+def need_percentiles(need):
+    """Add every HLNM percentile and CNI rank percentile to an MSOA frame.
+
+    HLNM percentiles follow process_hlnm.ps1: the share of MSOAs scoring at
+    or below the area, to one decimal place, inverted for the rank columns.
+    CNI ranks become 100 - rank / CNI_RANK_SCALE * 100, the formula the
+    dashboard applied on every render. Higher always means more need.
+    """
+    for col in HLNM_COLUMNS.values():
+        percentiles = need[col].rank(method='max', pct=True).to_numpy(dtype=np.float64, na_value=np.nan) * 100
+        if col in HLNM_RANK_COLUMNS:
+            percentiles = 100 - percentiles
+        need[f"{col}_percentile"] = percentiles.round(1)
+
+    for col in CNI_FILES:
+        ranks = need[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        need[f"{col}_percentile"] = 100 - ranks / CNI_RANK_SCALE * 100
+    return need
+
+@instrument.traced
+def load_need_data():
+    """HLNM scores and CNI ranks for every MSOA, joined once with percentiles.
+
+    The joined table is cached in the columnar store under the hashes of all
+    five source files, so the join and percentiles only rerun when one of
+    them (or the percentile settings) changes.
+    """
+    def build():
+        hlnm = load_hlnm_data().set_index('msoa_code')
+        cni = load_cni_data().set_index('msoa_code')
+        need = hlnm.join(cni, how='outer').rename_axis('msoa_code')
+        # Keep ranks integral where the outer join leaves gaps
+        need = need.astype({col: 'Int32' for col in HLNM_RANK_COLUMNS + list(CNI_FILES)})
+        return need_percentiles(need).reset_index()
+
+    df = columnar_store.cached_table(
+        "need_msoa", [HLNM_FILE] + list(CNI_FILES.values()), build,
+        params={
+            "version": STORE_VERSION, "columns": HLNM_COLUMNS, "ranks": list(CNI_FILES),
+            "inverted": HLNM_RANK_COLUMNS, "rank_scale": CNI_RANK_SCALE,
+        },
+    )
+    print(f"  Joined HLNM and CNI for {len(df)} MSOAs")
+    return df
+
 def calculate_percentiles(series):
     """Calculate percentile rank for a series (0-100, higher = worse deprivation)."""
     return series.rank(pct=True) * 100
 
+def _matches(column, rule):
+    """Whether a lower-cased column name satisfies one CENSUS_FIELDS rule."""
+    return (any(k in column for k in rule.get("any", ()))
+            and all(k in column for k in rule.get("all", ()))
+            and not any(k in column for k in rule.get("none", ())))
+
+@functools.lru_cache(maxsize=None)
+def _census_plan(dataset, columns):
+    geo_cols = [c for c in columns if 'geography' in c.lower() and 'code' in c.lower()]
+    if not geo_cols:
+        raise ValueError(f"Census {dataset}: no geography code column in {list(columns)}")
+
+    fields = {}
+    for field, rule in CENSUS_FIELDS[dataset].items():
+        matched = [c for c in columns if c != geo_cols[0] and _matches(c.lower(), rule)]
+        fields[field] = matched[:1] if rule.get("one") else matched
+
+    if not fields["total"]:
+        raise ValueError(f"Census {dataset}: no total column in {list(columns)}")
+    return geo_cols[0], fields
+
+def census_plan(dataset, df):
+    """(geography code column, {field: [columns]}) for one Census table.
+
+    The CENSUS_FIELDS rules are matched against the header once and cached,
+    so every later table with the same columns (the PiP build, the national
+    build, repeated benchmark runs) reuses the mapping. Raises ValueError if
+    the table has no geography code or total column.
+    """
+    return _census_plan(dataset, tuple(df.columns))
+
+def code_index(codes):
+    """The area codes to keep, as one unique index shared by every table."""
+    if isinstance(codes, pd.Index) and codes.is_unique:
+        return codes.rename('msoa_code')
+    return pd.Index(pd.unique(pd.Series(codes, dtype=str)), name='msoa_code')
+
+def census_measures(dataset, df, codes):
+    """CENSUS_MEASURES of one Census table for the areas in codes.
+
+    codes comes from code_index; rows are looked up in it by hash, only the
+    planned columns are read, and the result is indexed by code in the
+    order of codes.
+    """
+    geo_col, fields = census_plan(dataset, df)
+
+    geography = df[geo_col]
+    if isinstance(geography.dtype, pd.CategoricalDtype):
+        # Resolve each distinct code once; -1 (missing) maps to -1
+        positions = np.append(codes.get_indexer(geography.cat.categories), -1)[geography.cat.codes]
+    else:
+        positions = codes.get_indexer(geography.astype(str))
+    rows = np.flatnonzero(positions >= 0)
+    rows = rows[np.argsort(positions[rows], kind='stable')]
+    index = codes[positions[rows]]
+    if not index.is_unique:
+        raise ValueError(f"Census {dataset}: repeated area codes")
+
+    sums = {}
+    for field, cols in fields.items():
+        if not cols:
+            continue
+        if field == "total":
+            sums[field] = df[cols[0]].to_numpy()[rows]
+        elif all(isinstance(df[col].dtype, np.dtype) and df[col].dtype.kind in 'iu' for col in cols):
+            # Plain integer counts have no missing values
+            sums[field] = np.sum([df[col].to_numpy()[rows] for col in cols], axis=0, dtype=np.int64)
+        else:
+            # Missing counts are skipped, as DataFrame.sum(axis=1) skipped them
+            sums[field] = np.nansum([df[col].to_numpy(dtype=np.float64, na_value=np.nan)[rows]
+                                     for col in cols], axis=0)
+
+    total = sums["total"]
+    # An area with a zero total gets an infinite or NaN share, as before
+    with np.errstate(divide='ignore', invalid='ignore'):
+        columns = {
+            name: sums[field] / total * 100 if name.endswith('_pct') else sums[field]
+            for name, field in CENSUS_MEASURES[dataset] if field in sums
+        }
+    return pd.DataFrame(columns, index=index)
+
+@instrument.traced
 def process_economic_activity(df, msoa_codes):
     """Process economic activity data to get key metrics."""
-    # Find geography code column
-    geo_col = [c for c in df.columns if 'geography' in c.lower() and 'code' in c.lower()][0]
-
-    # Filter to our MSOAs
-    df = df[df[geo_col].isin(msoa_codes)].copy()
-
-    # Find relevant columns
-    total_col = [c for c in df.columns if 'total' in c.lower()][0]
-
-    # Look for unemployment and economic inactivity columns
-    unemployed_cols = [c for c in df.columns if 'unemployed' in c.lower()]
-    inactive_cols = [c for c in df.columns if 'inactive' in c.lower() and 'economically' in c.lower()]
-    employed_cols = [c for c in df.columns if 'employed' in c.lower() or 'employee' in c.lower()]
-
-    result = df[[geo_col]].copy()
-    result = result.rename(columns={geo_col: 'msoa_code'})
-
-    # Calculate rates
-    if unemployed_cols:
-        result['unemployed_count'] = df[unemployed_cols].sum(axis=1)
-    if inactive_cols:
-        result['inactive_count'] = df[inactive_cols].sum(axis=1)
-    if employed_cols:
-        result['employed_count'] = df[employed_cols].sum(axis=1)
-
-    result['total_population'] = df[total_col]
-
-    return result
+    return census_measures("economic_activity", df, code_index(msoa_codes)).reset_index()
 
+@instrument.traced
 def process_health(df, msoa_codes):
     """Process health data."""
-    geo_col = [c for c in df.columns if 'geography' in c.lower() and 'code' in c.lower()][0]
-    df = df[df[geo_col].isin(msoa_codes)].copy()
-
-    total_col = [c for c in df.columns if 'total' in c.lower()][0]
-    bad_health_cols = [c for c in df.columns if 'bad' in c.lower() or 'poor' in c.lower()]
-    good_health_cols = [c for c in df.columns if 'good' in c.lower() or 'very good' in c.lower()]
-
-    result = df[[geo_col]].copy()
-    result = result.rename(columns={geo_col: 'msoa_code'})
-    result['total'] = df[total_col]
-
-    if bad_health_cols:
-        result['bad_health_count'] = df[bad_health_cols].sum(axis=1)
-        result['bad_health_pct'] = (result['bad_health_count'] / result['total']) * 100
-
-    return result
+    return census_measures("health", df, code_index(msoa_codes)).reset_index()
 
+@instrument.traced
 def process_qualifications(df, msoa_codes):
     """Process qualifications data."""
-    geo_col = [c for c in df.columns if 'geography' in c.lower() and 'code' in c.lower()][0]
-    df = df[df[geo_col].isin(msoa_codes)].copy()
-
-    total_col = [c for c in df.columns if 'total' in c.lower()][0]
-    no_qual_cols = [c for c in df.columns if 'no qual' in c.lower()]
-    level4_cols = [c for c in df.columns if 'level 4' in c.lower()]
-
-    result = df[[geo_col]].copy()
-    result = result.rename(columns={geo_col: 'msoa_code'})
-    result['total'] = df[total_col]
-
-    if no_qual_cols:
-        result['no_qualifications_count'] = df[no_qual_cols].sum(axis=1)
-        result['no_qualifications_pct'] = (result['no_qualifications_count'] / result['total']) * 100
-
-    if level4_cols:
-        result['level4_plus_count'] = df[level4_cols].sum(axis=1)
-        result['level4_plus_pct'] = (result['level4_plus_count'] / result['total']) * 100
-
-    return result
+    return census_measures("qualifications", df, code_index(msoa_codes)).reset_index()
 
+@instrument.traced
 def process_deprivation(df, msoa_codes):
     """Process household deprivation data."""
-    geo_col = [c for c in df.columns if 'geography' in c.lower() and 'code' in c.lower()][0]
-    df = df[df[geo_col].isin(msoa_codes)].copy()
-
-    total_col = [c for c in df.columns if 'total' in c.lower()][0]
-
-    # Look for columns indicating deprivation dimensions
-    deprived_cols = [c for c in df.columns if 'deprived' in c.lower()]
-
-    result = df[[geo_col]].copy()
-    result = result.rename(columns={geo_col: 'msoa_code'})
-    result['total_households'] = df[total_col]
-
-    # Count households deprived in 1+ dimensions
-    if deprived_cols:
-        # Exclude "not deprived" column
-        deprived_cols = [c for c in deprived_cols if 'not' not in c.lower()]
-        if deprived_cols:
-            result['deprived_households'] = df[deprived_cols].sum(axis=1)
-            result['deprived_pct'] = (result['deprived_households'] / result['total_households']) * 100
-
-    return result
+    return census_measures("deprivation", df, code_index(msoa_codes)).reset_index()
 
+@instrument.traced
 def process_tenure(df, msoa_codes):
     """Process tenure data."""
-    geo_col = [c for c in df.columns if 'geography' in c.lower() and 'code' in c.lower()][0]
-    df = df[df[geo_col].isin(msoa_codes)].copy()
-
-    total_col = [c for c in df.columns if 'total' in c.lower()][0]
-    social_cols = [c for c in df.columns if 'social' in c.lower() or 'council' in c.lower()]
-    owned_cols = [c for c in df.columns if 'owned' in c.lower() or 'owns' in c.lower()]
-    private_rent_cols = [c for c in df.columns if 'private' in c.lower() and 'rent' in c.lower()]
+    return census_measures("tenure", df, code_index(msoa_codes)).reset_index()
 
-    result = df[[geo_col]].copy()
-    result = result.rename(columns={geo_col: 'msoa_code'})
-    result['total_households'] = df[total_col]
-
-    if social_cols:
-        result['social_rented'] = df[social_cols].sum(axis=1)
-        result['social_rented_pct'] = (result['social_rented'] / result['total_households']) * 100
-
-    if owned_cols:
-        result['owned'] = df[owned_cols].sum(axis=1)
-        result['owned_pct'] = (result['owned'] / result['total_households']) * 100
-
-    return result
+def find_population_column(df):
+    """The total population column of an IMD extract, or None if it has none."""
+    for col in df.columns:
+        if 'total population' in col.lower():
+            return col
+    return None
 
+@instrument.traced
 def aggregate_imd_to_msoa(imd_df, lsoa_col, lsoa_msoa_lookup):
-    """Aggregate IMD LSOA data to MSOA level using population-weighted averages."""
+    """Aggregate IMD LSOA data to MSOA level using population-weighted averages.
+
+    Weights come from the extract's total population column; an extract
+    without one falls back to an unweighted mean of its LSOAs.
+    """
     print("  Aggregating IMD to MSOA level...")
 
     # Get LSOA to MSOA mapping
     lookup = lsoa_msoa_lookup[['LSOA21CD', 'MSOA21CD']].drop_duplicates()
 
     # Merge IMD with lookup
-    merged = imd_df.merge(lookup, left_on=lsoa_col, right_on='LSOA21CD', how='left')
+    with instrument.span("merge imd lookup") as step:
+        merged = imd_df.merge(lookup, left_on=lsoa_col, right_on='LSOA21CD', how='left')
+        step.rows(len(imd_df), len(merged))
 
     # Find score columns to aggregate
-    score_cols = [c for c in imd_df.columns if 'score' in c.lower()]
-    rank_cols = [c for c in imd_df.columns if 'rank' in c.lower() and 'decile' not in c.lower()]
+    # Ranks are recalculated after aggregation
+    score_cols = [c for c in imd_df.columns if 'score' in c.lower() and c in merged.columns]
+    if not score_cols:
+        return None
+
+    population_col = find_population_column(imd_df)
+    if population_col is None:
+        print("  No population column found, using unweighted means")
+        weights = pd.Series(1.0, index=merged.index)
+    else:
+        weights = merged[population_col].astype(np.float64)
+
+    # Sum of score * weight over the weight of the LSOAs that have a score
+    scores = merged[score_cols].astype(np.float64)
+    weighted = scores.mul(weights, axis=0)
+    present = scores.notna().mul(weights, axis=0)
+    weighted['MSOA21CD'] = present['MSOA21CD'] = merged['MSOA21CD']
+
+    with instrument.span("group imd by msoa") as step:
+        grouped_sum = weighted.groupby('MSOA21CD').sum(min_count=1)
+        grouped_weight = present.groupby('MSOA21CD').sum()
+        step.rows(len(weighted), len(grouped_sum))
+    msoa_imd = (grouped_sum / grouped_weight.replace(0, np.nan)).reset_index()
+    return msoa_imd.rename(columns={'MSOA21CD': 'msoa_code'})
+
+def assemble(index, frames):
+    """Frames indexed by area code, aligned to index and set side by side.
+
+    Each frame is reindexed to index (a left join) and the columns are
+    concatenated once, instead of merging into a growing frame. Column names
+    repeated across frames get _x and _y suffixes, as a chain of merges gives
+    them, so the output columns are the same as before.
+    """
+    names, seen = [], {}
+    for i, frame in enumerate(frames):
+        if not frame.index.is_unique:
+            raise ValueError(f"Frame {i} has repeated area codes")
+        columns = list(frame.columns)
+        for j, name in enumerate(columns):
+            if name in seen:
+                first, position = seen.pop(name)
+                names[first][position] = f"{name}_x"
+                columns[j] = f"{name}_y"
+            else:
+                seen[name] = (i, j)
+        names.append(columns)
+
+    parts = []
+    for frame, columns in zip(frames, names):
+        frame = frame.set_axis(columns, axis=1)
+        parts.append(frame if frame.index.equals(index) else frame.reindex(index))
+    return pd.concat(parts, axis=1)
+
+def _by_code(df):
+    """An MSOA-keyed frame indexed by its msoa_code column."""
+    return df.set_index(df['msoa_code'].astype(str).rename('msoa_code')).drop(columns='msoa_code')
+
+@instrument.traced
+def build_census_measures(census_datasets, all_msoa_codes):
+    """Process each Census table into one frame of measures for every MSOA.
+
+    Every table is filtered against one shared code index and the measures
+    are assembled side by side on it.
+    """
+    print("\n5. Processing Census measures for all MSOAs...")
+    codes = code_index(all_msoa_codes)
+
+    tables = []
+    for dataset in CENSUS_MEASURES:
+        print(f"  Processing {dataset.replace('_', ' ')}...")
+        with instrument.span(f"process_{dataset}") as step:
+            table = census_measures(dataset, census_datasets[dataset], codes)
+            step.rows(len(census_datasets[dataset]), len(table))
+        if len(table) > 0:
+            tables.append(table)
+    if not tables:
+        return None
+
+    with instrument.span("assemble census measures") as step:
+        # Areas in at least one table, in the shared index's order
+        covered = np.zeros(len(codes), dtype=bool)
+        for table in tables:
+            covered[codes.get_indexer(table.index)] = True
+        result = assemble(codes[covered], tables).reset_index()
+        step.rows(rows_out=len(result))
 
-    # For scores, take mean within MSOA
-    # For ranks, we'll recalculate after aggregation
-    agg_dict = {col: 'mean' for col in score_cols if col in merged.columns}
-
-    if agg_dict:
-        msoa_imd = merged.groupby('MSOA21CD').agg(agg_dict).reset_index()
-        msoa_imd = msoa_imd.rename(columns={'MSOA21CD': 'msoa_code'})
-        return msoa_imd
+    return result
 
-    return None
+@instrument.traced
+def build_final_dataset(pip_df, census_msoa, imd_msoa, extra_msoa=()):
+    """Combine all data sources into the final dataset for the PiP MSOAs.
 
-def build_final_dataset(pip_df, census_datasets, imd_msoa, all_msoa_codes):
-    """Combine all data sources into final dataset with percentiles."""
-    print("\n5. Building final dataset with percentiles...")
+    census_msoa comes from build_census_measures; extra_msoa is any further
+    MSOA-keyed frames (HLNM, CNI) to join on.
+    """
+    print("\n6. Building final dataset...")
 
     # Get list of PiP MSOA codes
     msoa_col = None
@@ -380,147 +674,262 @@ def build_final_dataset(pip_df, census_datasets, imd_msoa, all_msoa_codes):
             la_col = col
             break
 
-    # Start building the result
-    result = pip_df[[msoa_col]].copy()
-    result = result.rename(columns={msoa_col: 'msoa_code'})
+    # Start building the result, one row per PiP MSOA in list order
+    index = pd.Index(pip_df[msoa_col], name='msoa_code')
+    result = pd.DataFrame(index=index)
 
     if name_col:
         result['neighbourhood_name'] = pip_df[name_col].values
     if la_col:
         result['local_authority'] = pip_df[la_col].values
 
-    # Process each Census dataset and calculate national percentiles
-    print("  Processing economic activity...")
-    econ = process_economic_activity(census_datasets["economic_activity"], all_msoa_codes)
-
-    print("  Processing health...")
-    health = process_health(census_datasets["health"], all_msoa_codes)
-
-    print("  Processing qualifications...")
-    quals = process_qualifications(census_datasets["qualifications"], all_msoa_codes)
-
-    print("  Processing household deprivation...")
-    deprivation = process_deprivation(census_datasets["deprivation"], all_msoa_codes)
+    sources = [_by_code(df) for df in (census_msoa, imd_msoa, *extra_msoa) if df is not None]
+    with instrument.span("assemble sources") as step:
+        if sources:
+            # Aligned on the distinct PiP codes, then repeated for any code
+            # listed twice
+            joined = assemble(index.unique(), sources)
+            result = pd.concat([result, joined.reindex(index)], axis=1)
+        result = result.reset_index()
+        step.rows(rows_out=len(result))
 
-    print("  Processing tenure...")
-    tenure = process_tenure(census_datasets["tenure"], all_msoa_codes)
-
-    # Merge all data
-    for df in [econ, health, quals, deprivation, tenure]:
-        if df is not None and len(df) > 0:
-            result = result.merge(df, on='msoa_code', how='left')
-
-    if imd_msoa is not None:
-        result = result.merge(imd_msoa, on='msoa_code', how='left')
+    return result
 
+# Columns where higher = worse (so higher percentile = more deprived)
+HIGHER_IS_WORSE = [
+    'bad_health_pct', 'no_qualifications_pct', 'deprived_pct',
+    'unemployed_count', 'inactive_count'
+]
+
+# Columns where lower = worse
+LOWER_IS_WORSE = [
+    'level4_plus_pct', 'owned_pct', 'employed_count'
+]
+
+def build_percentile_reference(all_england_df, columns):
+    """Sort each England reference column once, dropping missing values.
+
+    Returns a dict of column name -> sorted float64 array, which can be reused
+    to score any number of areas without touching the national table again.
+    """
+    reference = {}
+    for col in columns:
+        values = all_england_df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        values = values[~np.isnan(values)]
+        values.sort(kind='stable')
+        reference[col] = values
+    return reference
+
+def percentiles_from_reference(values, sorted_reference):
+    """Percentage of reference values strictly below each value (NaN stays NaN)."""
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(values.shape, np.nan)
+    present = ~np.isnan(values)
+    if len(sorted_reference) > 0:
+        below = np.searchsorted(sorted_reference, values[present], side='left')
+        result[present] = below / len(sorted_reference) * 100
     return result
 
-def calculate_all_percentiles(df, all_england_df):
-    """Calculate percentile rankings compared to all England MSOAs."""
-    print("\n6. Calculating percentile rankings...")
+@instrument.traced
+def calculate_all_percentiles(df, all_england_df, reference=None):
+    """Calculate percentile rankings compared to all England MSOAs.
 
-    # Columns where higher = worse (so higher percentile = more deprived)
-    higher_is_worse = [
-        'bad_health_pct', 'no_qualifications_pct', 'deprived_pct',
-        'unemployed_count', 'inactive_count'
-    ]
+    Each England column is sorted once and every area is placed with a single
+    searchsorted call, so the cost is O((areas + MSOAs) log MSOAs) per column
+    instead of a full national scan per area. Pass a prebuilt ``reference``
+    from build_percentile_reference to skip the sort on repeated calls.
+    """
+    print("\n7. Calculating percentile rankings...")
 
-    # Columns where lower = worse
-    lower_is_worse = [
-        'level4_plus_pct', 'owned_pct', 'employed_count'
+    numeric_cols = [
+        col for col in df.select_dtypes(include=[np.number]).columns
+        if col != 'msoa_code' and col in all_england_df.columns
     ]
 
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
+    if reference is None:
+        reference = build_percentile_reference(all_england_df, numeric_cols)
 
     for col in numeric_cols:
-        if col in ['msoa_code']:
-            continue
-
-        # Get all England values for this column
-        if col in all_england_df.columns:
-            all_values = all_england_df[col].dropna()
+        values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        percentiles = percentiles_from_reference(values, reference[col])
 
-            # Calculate percentile for each PiP MSOA
-            percentile_col = f"{col}_percentile"
-            df[percentile_col] = df[col].apply(
-                lambda x: (all_values < x).sum() / len(all_values) * 100 if pd.notna(x) else np.nan
-            )
+        # Invert if lower is worse (so higher percentile always = more deprived)
+        if col in LOWER_IS_WORSE:
+            percentiles = 100 - percentiles
 
-            # Invert if lower is worse (so higher percentile always = more deprived)
-            if col in lower_is_worse:
-                df[percentile_col] = 100 - df[percentile_col]
+        df[f"{col}_percentile"] = percentiles
 
     return df
 
-def export_to_json(df, output_path):
-    """Export dataframe to JSON for the dashboard."""
-    print(f"\n7. Exporting to {output_path}...")
+def add_england_percentiles(final_df, census_msoa, imd_msoa):
+    """The dashboard's <measure>_percentile fields: each Census and IMD measure
+    of the PiP areas placed among every England MSOA, to 1 dp.
+
+    Either source may be None (no Census measures, or an IMD extract without
+    score columns), as build_final_dataset allows; only the present ones are
+    ranked.
+    """
+    sources = [_by_code(df) for df in (census_msoa, imd_msoa) if df is not None]
+    if not sources:
+        return final_df
+    codes = functools.reduce(pd.Index.union, (df.index for df in sources))
+    england = assemble(codes, sources)
+    before = set(final_df.columns)
+    final_df = calculate_all_percentiles(final_df, england)
+    for col in final_df.columns:
+        if col not in before:
+            final_df[col] = final_df[col].round(1)
+    return final_df
+
+@instrument.traced
+def export_to_json(df, output_path, metadata=None):
+    """Export dataframe to JSON for the dashboard.
+
+    metadata replaces the description of a full build written by default.
+    """
+    print(f"\n8. Exporting to {output_path}...")
 
     # Convert to list of dictionaries
-    records = df.to_dict(orient='records')
+    with instrument.span("to records"):
+        records = df.to_dict(orient='records')
 
-    # Clean up NaN values
-    for record in records:
-        for key, value in record.items():
-            if pd.isna(value):
-                record[key] = None
+        # Clean up NaN values
+        for record in records:
+            for key, value in record.items():
+                if pd.isna(value):
+                    record[key] = None
 
     # Build metadata
-    metadata = {
-        "generated": pd.Timestamp.now().isoformat(),
-        "total_areas": len(records),
-        "data_sources": {
-            "pride_in_place": "OCSI - Pride in Place Programme neighbourhoods",
-            "census_2021": "ONS Census 2021 via NOMIS",
-            "imd_2025": "MHCLG English Indices of Deprivation 2025"
+    if metadata is None:
+        metadata = {
+            "generated": pd.Timestamp.now().isoformat(),
+            "total_areas": len(records),
+            "data_sources": {
+                "pride_in_place": "OCSI - Pride in Place Programme neighbourhoods",
+                "census_2021": "ONS Census 2021 via NOMIS",
+                "imd_2025": "MHCLG English Indices of Deprivation 2025"
+            }
         }
-    }
 
     output = {
         "metadata": metadata,
         "areas": records
     }
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    with instrument.span("write json") as step:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+        step.set(bytes=Path(output_path).stat().st_size)
 
     print(f"  Exported {len(records)} areas")
 
-def main():
-    """Main function to run the data gathering pipeline."""
-    print("=" * 60)
-    print("Pride in Place Data Explorer - Data Gathering")
-    print("=" * 60)
-
+def refresh_need_fields(path=OUTPUT_FILE, need_msoa=None):
+    """Rewrite the HLNM and CNI fields of an existing data.json from the need table.
+
+    These come from the local OCSI extracts alone, so they can be rebuilt
+    without the Census, IMD and PiP downloads. Every other field, the area
+    order and the metadata are kept; the need columns and their percentiles
+    are exactly what the dataset stage would write.
+    """
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        data = json.load(f)
+    areas = pd.DataFrame(data["areas"])
+    need = _by_code(need_msoa if need_msoa is not None else load_need_data())
+    areas = areas.drop(columns=[c for c in need.columns if c in areas.columns])
+    areas = areas.join(need, on='msoa_code')
+    export_to_json(areas, path, data.get("metadata", {}))
+
+def run(args):
+    """Run every stage of the build inside the open trace."""
     ensure_data_dir()
 
+    # Fetch all sources up front, in parallel
+    with instrument.stage("prefetch"):
+        prefetch_sources()
+
     # Load Pride in Place MSOA list
-    pip_df = load_pip_msoas()
+    with instrument.stage("pip_msoas") as stage:
+        pip_df = load_pip_msoas()
+        stage.rows(rows_out=len(pip_df))
 
     # Load lookup table
-    lsoa_msoa_lookup = load_lsoa_msoa_lookup()
+    with instrument.stage("lookup") as stage:
+        lsoa_msoa_lookup = load_lsoa_msoa_lookup()
 
-    # Get all England MSOA codes
-    all_msoa_codes = lsoa_msoa_lookup['MSOA21CD'].unique().tolist()
-    print(f"  Total MSOAs in England: {len(all_msoa_codes)}")
+        # Get all England MSOA codes
+        all_msoa_codes = lsoa_msoa_lookup['MSOA21CD'].unique().tolist()
+        print(f"  Total MSOAs in England: {len(all_msoa_codes)}")
+        stage.rows(rows_out=len(lsoa_msoa_lookup))
 
     # Load Census data
-    census_data = load_census_data()
+    with instrument.stage("census") as stage:
+        census_data = load_census_data()
+        stage.rows(rows_out=instrument.count_rows(census_data))
 
     # Load and aggregate IMD data
-    imd_df, lsoa_col = load_imd_data(lsoa_msoa_lookup)
-    imd_msoa = aggregate_imd_to_msoa(imd_df, lsoa_col, lsoa_msoa_lookup)
+    with instrument.stage("imd") as stage:
+        imd_df, lsoa_col = load_imd_data(lsoa_msoa_lookup)
+        imd_msoa = aggregate_imd_to_msoa(imd_df, lsoa_col, lsoa_msoa_lookup)
+        stage.rows(len(imd_df), instrument.count_rows(imd_msoa))
+
+    # Load HLNM and Community Needs Index
+    print("\n4b. Loading HLNM and Community Needs Index data...")
+    with instrument.stage("need") as stage:
+        need_msoa = load_need_data()
+        stage.rows(rows_out=len(need_msoa))
 
     # Build final dataset
-    final_df = build_final_dataset(pip_df, census_data, imd_msoa, all_msoa_codes)
+    with instrument.stage("dataset") as stage:
+        census_msoa = build_census_measures(census_data, all_msoa_codes)
+        final_df = build_final_dataset(pip_df, census_msoa, imd_msoa, [need_msoa])
+        final_df = add_england_percentiles(final_df, census_msoa, imd_msoa)
+        stage.rows(rows_out=len(final_df))
 
     # Export to JSON
-    export_to_json(final_df, OUTPUT_FILE)
+    with instrument.stage("export") as stage:
+        export_to_json(final_df, args.output)
+        stage.rows(rows_in=len(final_df))
+
+# Top-level stages of run(), for --profile-stage
+STAGES = ["prefetch", "pip_msoas", "lookup", "census", "imd", "need", "dataset", "export"]
+
+def main():
+    """Main function to run the data gathering pipeline."""
+    parser = argparse.ArgumentParser(description="Build data.json for the PiP Data Explorer")
+    parser.add_argument('--output', type=Path, default=OUTPUT_FILE)
+    parser.add_argument('--refresh-need', action='store_true',
+                        help="only rewrite the HLNM and CNI fields of an existing --output")
+    parser.add_argument('--profile', choices=instrument.PROFILERS,
+                        help="profile each stage: cprofile (.prof) or sample (.folded)")
+    parser.add_argument('--profile-stage', action='append', choices=STAGES, metavar='STAGE',
+                        help=f"only profile this stage (repeatable): {', '.join(STAGES)}")
+    parser.add_argument('--sample-interval', type=float, default=instrument.SAMPLE_INTERVAL,
+                        help="seconds between samples with --profile sample")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Pride in Place Data Explorer - Data Gathering")
+    print("=" * 60)
+
+    if args.refresh_need:
+        refresh_need_fields(args.output)
+        return
+
+    with instrument.tracing(profile=args.profile, profile_stages=args.profile_stage,
+                            profile_dir=PROFILE_DIR, sample_interval=args.sample_interval) as trace:
+        run(args)
+    trace_file = args.output.with_name(TRACE_FILE.name)
+    chrome_trace_file = args.output.with_name(CHROME_TRACE_FILE.name)
+    trace.write(trace_file, chrome_trace_file, {"output": str(args.output)})
 
     print("\n" + "=" * 60)
     print("Data gathering complete!")
-    print(f"Output file: {OUTPUT_FILE}")
+    print(f"Output file: {args.output}")
+    print(f"Trace: {trace_file.name} (Chrome trace: {chrome_trace_file.name})")
+    if args.profile:
+        print(f"Profiles: {PROFILE_DIR}")
     print("=" * 60)
+    print(trace.summary())
 
 if __name__ == "__main__":
     main()
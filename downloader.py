@@ -0,0 +1,350 @@
+"""
+Pride in Place Data Explorer - Download Cache
+Fetches source files into the local data cache.
+
+Downloads are streamed to disk in chunks, resumed from a partial ``.part``
+file when the server supports ranged requests, and recorded in a manifest
+(size, SHA-256, ETag, Last-Modified) so a rerun can trust a cached file
+without touching the network and a truncated or corrupt file is refetched.
+
+Used by data_gatherer.py; any URL works, including a local
+``python -m http.server`` standing in for the real sources.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import requests
+
+MANIFEST_NAME = "cache_manifest.json"
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_WORKERS = 4
+TIMEOUT = 120
+
+MANIFEST_LOCK_NAME = "cache_manifest.lock"
+
+# File locks are per process; these keep threads of one process in line too
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+# mkstemp creates files readable by the owner only; files renamed into place
+# get the mode open() would give them
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold the lock file at path exclusively, across threads and processes.
+
+    The pipeline runs stages in parallel processes, and they share the
+    download cache and the columnar store.
+    """
+    path = Path(path).resolve()
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(path, threading.Lock())
+    with thread_lock, open(path, 'a+b') as lock:
+        if fcntl:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        else:
+            lock.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after ten seconds
+                    time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def temp_path(directory, suffix):
+    """A new, uniquely named file in directory, to be renamed over the real one."""
+    fd, name = tempfile.mkstemp(dir=directory, suffix=suffix)
+    os.close(fd)
+    os.chmod(name, FILE_MODE)
+    return Path(name)
+
+
+def manifest_path(cache_dir):
+    """Path of the cache manifest inside a cache directory."""
+    return Path(cache_dir) / MANIFEST_NAME
+
+
+def load_manifest(cache_dir):
+    """Load the cache manifest, or an empty one if missing or unreadable."""
+    path = manifest_path(cache_dir)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _update_manifest(cache_dir, filename, entry):
+    """Write (or with entry=None, drop) one manifest entry atomically.
+
+    The read-modify-write holds the cache's lock file, so parallel build
+    processes downloading into the same cache keep each other's entries.
+    """
+    with file_lock(Path(cache_dir) / MANIFEST_LOCK_NAME):
+        manifest = load_manifest(cache_dir)
+        if entry is None:
+            manifest.pop(filename, None)
+        else:
+            manifest[filename] = entry
+
+        tmp_path = temp_path(cache_dir, '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_path(cache_dir))
+
+
+def sha256_file(path):
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_cached(filepath, entry, verify=False):
+    """Check a cached file against its manifest entry.
+
+    Size and mtime are compared first so a warm rerun needs no hashing; the
+    SHA-256 is recomputed when those differ or when verify is True.
+    """
+    if not entry or not filepath.exists():
+        return False
+
+    stat = filepath.stat()
+    if stat.st_size != entry.get("size"):
+        return False
+    if not verify and stat.st_mtime_ns == entry.get("mtime_ns"):
+        return True
+
+    return sha256_file(filepath) == entry.get("sha256")
+
+
+def download(url, filepath, force=False, verify=False, session=None):
+    """Download url to filepath through the cache manifest.
+
+    Returns the path. A valid cached copy is reused unless force is True, in
+    which case the server is asked to revalidate with the stored ETag /
+    Last-Modified and a 304 keeps the cached copy.
+    """
+    filepath = Path(filepath)
+    cache_dir = filepath.parent
+    filename = filepath.name
+    entry = load_manifest(cache_dir).get(filename)
+    cached = is_cached(filepath, entry, verify=verify)
+
+    http = session or requests
+
+    if entry is None and filepath.exists() and not force:
+        # Cached before the manifest existed (or placed by hand): adopt it
+        # only if the server says it is complete, else fetch it again
+        remote = _remote_match(http, url, filepath)
+        if remote is not None:
+            entry = _record(cache_dir, filepath, url, *remote)
+            print(f"  Adopted cached: {filename}")
+            cached = True
+
+    if cached and not force:
+        print(f"  Using cached: {filename}")
+        return filepath
+
+    if filepath.exists() and not cached:
+        print(f"  Cached copy of {filename} failed verification, refetching")
+        filepath.unlink()
+
+    part_path = filepath.with_name(filename + '.part')
+
+    # Ask for the raw bytes so the length check and resume offsets line up
+    headers = {'Accept-Encoding': 'identity'}
+    if cached and entry:
+        if entry.get("etag"):
+            headers['If-None-Match'] = entry["etag"]
+        if entry.get("last_modified"):
+            headers['If-Modified-Since'] = entry["last_modified"]
+
+    # Resume a previous partial download, but only if the server still has
+    # the same version (If-Range falls back to a full 200 response otherwise)
+    resume_from = part_path.stat().st_size if part_path.exists() else 0
+    partial = (entry or {}).get("partial", {})
+    validator = partial.get("etag") or partial.get("last_modified")
+    if resume_from and validator and not cached:
+        headers['Range'] = f"bytes={resume_from}-"
+        headers['If-Range'] = validator
+    else:
+        resume_from = 0
+
+    if cached:
+        print(f"  Revalidating: {filename}...")
+    elif resume_from:
+        print(f"  Resuming: {filename} from {resume_from:,} bytes...")
+    else:
+        print(f"  Downloading: {filename}...")
+
+    with http.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code == 304:
+            print(f"  Not modified: {filename}")
+            os.utime(filepath)
+            entry["mtime_ns"] = filepath.stat().st_mtime_ns
+            _update_manifest(cache_dir, filename, entry)
+            return filepath
+
+        response.raise_for_status()
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        expected = response.headers.get('Content-Length')
+
+        if response.status_code == 206:
+            start, total = _content_range(response.headers.get('Content-Range'))
+            if start != resume_from:
+                # The server ignored or misread the Range; appending would
+                # corrupt the file, so start again from nothing
+                print(f"  Server sent {filename} from byte {start}, not {resume_from:,}; restarting")
+                part_path.unlink()
+                _update_manifest(cache_dir, filename, entry)
+                response.close()
+                return download(url, filepath, force=force, verify=verify, session=session)
+            mode = 'ab'
+        else:
+            mode = 'wb'
+            resume_from = 0
+
+        # Remember the validators now so an interrupted transfer can resume
+        _update_manifest(cache_dir, filename, dict(
+            entry or {}, url=url,
+            partial={"etag": etag, "last_modified": last_modified},
+        ))
+
+        written = 0
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                written += len(chunk)
+
+    if expected is not None and written != int(expected):
+        raise IOError(
+            f"Incomplete download of {filename}: got {written:,} of {int(expected):,} bytes "
+            f"(partial file kept for resume)"
+        )
+    if mode == 'ab' and total is not None and part_path.stat().st_size != total:
+        part_path.unlink()
+        raise IOError(f"Resumed download of {filename} does not add up to {total:,} bytes (discarded)")
+
+    os.replace(part_path, filepath)
+    _record(cache_dir, filepath, url, etag, last_modified)
+
+    return filepath
+
+
+def _remote_match(http, url, filepath):
+    """(etag, last_modified) if the server's copy is the local file's size.
+
+    None when it is not, when the server gives no length, or when it cannot
+    be reached: a file with no manifest entry is only trusted on the server's
+    word, since a download interrupted before the manifest existed leaves a
+    plausible-looking truncated file.
+    """
+    size = filepath.stat().st_size
+    if size == 0:
+        return None
+    if filepath.suffix.lower() in ('.zip', '.xlsx') and not zipfile.is_zipfile(filepath):
+        # A truncated archive loses its central directory
+        return None
+    try:
+        response = http.head(url, headers={'Accept-Encoding': 'identity'},
+                             allow_redirects=True, timeout=TIMEOUT)
+    except requests.RequestException:
+        return None
+    length = response.headers.get('Content-Length')
+    if not response.ok or length is None or int(length) != size:
+        return None
+    return response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+
+def _content_range(header):
+    """(first byte, total or None) from a 'bytes first-last/total' Content-Range."""
+    try:
+        unit, _, spec = header.partition(' ')
+        span, _, total = spec.partition('/')
+        if unit != 'bytes':
+            return None, None
+        return int(span.split('-')[0]), (None if total in ('', '*') else int(total))
+    except (AttributeError, ValueError):
+        return None, None
+
+
+def _record(cache_dir, filepath, url, etag, last_modified):
+    """Record a complete file in the manifest and return its entry."""
+    stat = filepath.stat()
+    entry = {
+        "url": url,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256_file(filepath),
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+    _update_manifest(cache_dir, filepath.name, entry)
+    return entry
+
+
+def download_all(jobs, force=False, verify=False, max_workers=DEFAULT_WORKERS):
+    """Download several (url, filepath) pairs with a bounded worker pool.
+
+    Returns a dict of filepath -> Path in the order given. All downloads are
+    attempted; the first failure is re-raised once the others have finished.
+    """
+    results = {}
+    errors = []
+
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(download, url, filepath, force, verify, session): filepath
+                for url, filepath in jobs
+            }
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as exc:
+                    print(f"  Failed: {Path(futures[future]).name} ({exc})")
+                    errors.append(exc)
+
+    if errors:
+        raise errors[0]
+
+    return {filepath: results[filepath] for _, filepath in jobs}
@@ -0,0 +1,299 @@
+"""
+Pride in Place Data Explorer - Export
+Streams the national tables for any selection of areas as CSV, XLSX or
+GeoJSON, from one LSOA up to every MSOA or LSOA in England.
+
+A selection is a list of LSOA, MSOA, LA and region codes (none means all of
+England) and a level: every MSOA or LSOA inside any of the codes, or holding
+an LSOA that was asked for. Rows come from the tables national.py joins
+(build_msoa_table / build_lsoa_table) and are encoded CHUNK_ROWS at a time,
+so an export holds one chunk of encoded text at once whatever its size, and
+the first bytes are ready as soon as the first chunk is:
+
+    csv      header row, then each chunk through DataFrame.to_csv
+    xlsx     one worksheet of inline strings and numbers, written through a
+             zipfile that never seeks (data descriptors after each part), so
+             the zip itself streams
+    geojson  a FeatureCollection, one Feature per row with the row as its
+             properties. LSOAs carry their boundary from spatial_index.arrow
+             and MSOAs the polygons of their LSOAs (not dissolved); without
+             the index, geometry is null
+
+Every exporter is a generator of bytes; the query service writes them
+straight to the socket (/export) and the CLI to a file.
+
+Usage:
+    python export.py OUT.csv [--codes E08000025 E02001954] [--level lsoa]
+    python export.py OUT.xlsx --codes E12000002
+    python export.py OUT.geojson --codes E01005065 --level lsoa
+"""
+
+import argparse
+import json
+import time
+import zipfile
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+import columnar_store
+import national
+import spatial_index
+import workbooks
+
+CHUNK_ROWS = 2000
+LEVELS = ["msoa", "lsoa"]
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "geojson": "application/geo+json",
+}
+
+# Workbook parts other than the worksheet, which is streamed
+XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<Relationships xmlns="{workbooks.PACKAGE_REL_NS}">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<workbook xmlns="{workbooks.MAIN_NS}" xmlns:r="{workbooks.REL_NS}">'
+        '<sheets><sheet name="{sheet}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<Relationships xmlns="{workbooks.PACKAGE_REL_NS}">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+
+# ---------------------------------------------------------------------------
+# Selecting
+# ---------------------------------------------------------------------------
+
+def load_tables(build_dir=national.BUILD_DIR, lookup_path=national.LOOKUP_FILE):
+    """(areas, lsoas): the national MSOA and LSOA tables, as the query service joins them."""
+    return national.load_tables(national.load_lookup(lookup_path), build_dir)
+
+
+def select(areas, lsoas, codes=None, level="msoa"):
+    """The rows of one level inside any of codes, as a DataFrame.
+
+    MSOA rows keep the areas columns; LSOA rows get LSOA21CD as their first
+    column. Raises ValueError for an unknown level or codes matching nothing.
+    """
+    if level not in LEVELS:
+        raise ValueError(f"level must be one of {', '.join(LEVELS)}")
+    codes = {c.strip() for c in codes or [] if c and c.strip()}
+
+    if level == "msoa":
+        if not codes:
+            return areas
+        msoas = set(lsoas.loc[lsoas.index.intersection(list(codes)), 'MSOA21CD'])
+        mask = (areas['msoa_code'].isin(codes | msoas) | areas['la_code'].isin(codes)
+                | areas['region_code'].isin(codes))
+        rows = areas[mask.to_numpy()]
+    else:
+        rows = lsoas
+        if codes:
+            las = set(areas.loc[areas['region_code'].isin(codes), 'la_code'])
+            mask = (lsoas.index.isin(list(codes)) | lsoas['MSOA21CD'].isin(codes)
+                    | lsoas['LAD22CD'].isin(codes | las))
+            rows = lsoas[np.asarray(mask)]
+        rows = rows.reset_index()
+
+    if codes and rows.empty:
+        raise ValueError(f"No {level.upper()}s in {', '.join(sorted(codes))}")
+    return rows
+
+
+def _chunks(rows, chunk_rows):
+    for start in range(0, len(rows), chunk_rows):
+        yield start, rows.iloc[start:start + chunk_rows]
+
+
+def _cells(chunk):
+    """Chunk values as Python objects, with missing and infinite values as None."""
+    present = chunk.notna()
+    floats = chunk.select_dtypes('floating')
+    # JSON has no Infinity; like missing values they become null
+    present[floats.columns] &= np.isfinite(floats).fillna(False).astype(bool)
+    return chunk.astype(object).where(present, None)
+
+
+# ---------------------------------------------------------------------------
+# Formats
+# ---------------------------------------------------------------------------
+
+def stream_csv(rows, chunk_rows=CHUNK_ROWS):
+    yield rows.iloc[:0].to_csv(index=False).encode('utf-8')
+    for _, chunk in _chunks(rows, chunk_rows):
+        yield chunk.to_csv(header=False, index=False).encode('utf-8')
+
+
+class _Sink:
+    """A write-only file for zipfile that hands back what it was given.
+
+    It has no seek, so zipfile writes data descriptors after each entry
+    instead of going back to patch the local headers.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _xlsx_column(letter, numbers, column):
+    """One column of a chunk as worksheet cells, formatted by its dtype."""
+    values = column.astype(object).where(column.notna(), None).tolist()
+    if pd.api.types.is_bool_dtype(column):
+        return ['' if v is None else f'<c r="{letter}{n}" t="b"><v>{int(v)}</v></c>'
+                for n, v in zip(numbers, values)]
+    if pd.api.types.is_numeric_dtype(column):
+        # Infinities have no cell value; they are left empty like missing values
+        return ['' if v is None or not np.isfinite(v) else f'<c r="{letter}{n}"><v>{v!r}</v></c>'
+                for n, v in zip(numbers, values)]
+    return ['' if v is None else f'<c r="{letter}{n}" t="inlineStr"><is><t>{escape(str(v))}</t></is></c>'
+            for n, v in zip(numbers, values)]
+
+
+def _xlsx_rows(first, letters, chunk):
+    numbers = range(first, first + len(chunk))
+    columns = [_xlsx_column(letter, numbers, chunk[c]) for letter, c in zip(letters, chunk.columns)]
+    return ''.join(f'<row r="{n}">{"".join(cells)}</row>' for n, cells in zip(numbers, zip(*columns)))
+
+
+def stream_xlsx(rows, chunk_rows=CHUNK_ROWS, sheet="areas"):
+    sink = _Sink()
+    letters = [workbooks.column_letters(i) for i in range(len(rows.columns))]
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, text in XLSX_PARTS.items():
+            archive.writestr(name, text.replace('{sheet}', escape(sheet)))
+        yield sink.drain()
+
+        with archive.open("xl/worksheets/sheet1.xml", 'w', force_zip64=True) as part:
+            part.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        f'<worksheet xmlns="{workbooks.MAIN_NS}"><sheetData>').encode('utf-8'))
+            header = pd.DataFrame([[str(c) for c in rows.columns]], columns=rows.columns, dtype=object)
+            part.write(_xlsx_rows(1, letters, header).encode('utf-8'))
+            for start, chunk in _chunks(rows, chunk_rows):
+                part.write(_xlsx_rows(start + 2, letters, chunk).encode('utf-8'))
+                yield sink.drain()
+            part.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+def _geometry(code, level, polygons, members):
+    """GeoJSON MultiPolygon for an LSOA or the LSOAs of an MSOA, or None."""
+    if polygons is None:
+        return None
+    codes = members.get(code, []) if level == "msoa" else [code]
+    coordinates = [p for c in codes if c in polygons.rows for p in polygons.polygons(polygons.rows[c])]
+    return {"type": "MultiPolygon", "coordinates": coordinates} if coordinates else None
+
+
+def stream_geojson(rows, level="msoa", polygons=None, chunk_rows=CHUNK_ROWS):
+    code_column = 'msoa_code' if level == "msoa" else 'LSOA21CD'
+    members = {}
+    if polygons is not None and level == "msoa":
+        wanted = set(rows['msoa_code'])
+        for lsoa, msoa in zip(polygons.codes, polygons.msoas):
+            if msoa in wanted:
+                members.setdefault(msoa, []).append(lsoa)
+
+    yield b'{"type":"FeatureCollection","features":[\n'
+    for start, chunk in _chunks(rows, chunk_rows):
+        features = []
+        for record in _cells(chunk).to_dict(orient='records'):
+            properties = {k: v.item() if isinstance(v, np.generic) else v for k, v in record.items()}
+            feature = {"type": "Feature", "properties": properties,
+                       "geometry": _geometry(record[code_column], level, polygons, members)}
+            features.append(json.dumps(feature, separators=(',', ':'), ensure_ascii=False,
+                                       allow_nan=False))
+        yield (('' if start == 0 else ',\n') + ',\n'.join(features)).encode('utf-8')
+    yield b'\n]}\n'
+
+
+def stream(rows, fmt, level="msoa", polygons=None, chunk_rows=CHUNK_ROWS):
+    """Generator of bytes: rows encoded as fmt."""
+    if fmt == "csv":
+        return stream_csv(rows, chunk_rows)
+    if fmt == "xlsx":
+        return stream_xlsx(rows, chunk_rows, sheet=f"{level}s")
+    if fmt == "geojson":
+        return stream_geojson(rows, level, polygons, chunk_rows)
+    raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+
+def load_polygons(path=spatial_index.SPATIAL_INDEX_FILE):
+    """The LSOA boundaries from spatial_index.arrow, or None if it is missing."""
+    if not Path(path).exists():
+        print(f"  {Path(path).name} not found, exporting GeoJSON without boundaries")
+        return None
+    return spatial_index.Polygons(columnar_store.read_arrow(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export areas from the PiP Data Explorer")
+    parser.add_argument('out', help="output file; the format follows its extension")
+    parser.add_argument('--codes', nargs='*', default=[], help="LSOA, MSOA, LA or region codes (default: England)")
+    parser.add_argument('--level', choices=LEVELS, default='msoa')
+    parser.add_argument('--format', choices=list(FORMATS), help="override the extension")
+    parser.add_argument('--build-dir', default=str(national.BUILD_DIR), help="pipeline intermediate tables")
+    args = parser.parse_args()
+
+    fmt = args.format or Path(args.out).suffix.lstrip('.').lower()
+    if fmt not in FORMATS:
+        parser.error(f"format must be one of {', '.join(FORMATS)}")
+
+    start = time.perf_counter()
+    areas, lsoas = load_tables(args.build_dir)
+    rows = select(areas, lsoas, args.codes, args.level)
+    polygons = load_polygons() if fmt == "geojson" else None
+
+    written = 0
+    with open(args.out, 'wb') as f:
+        for data in stream(rows, fmt, args.level, polygons):
+            f.write(data)
+            written += len(data)
+    print(f"  Exported {len(rows):,} {args.level.upper()}s to {args.out} "
+          f"({written / 1024:.0f} KB) in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import json
+from boundaries import LSOA_BOUNDARIES_FILE, extract_features
 
 # Load LSOA mappings
 with open('lsoa_embedded_data_temp.js', 'r', encoding='utf-8') as f:
@@ -15,29 +15,9 @@ for line in content.split('\n'):
 
 print(f"Found {len(needed_lsoas)} unique LSOAs to extract")
 
-# Load full GeoJSON
-print("Loading full GeoJSON...")
-with open('Lower_layer_Super_Output_Areas_December_2021_Boundaries_EW_BSC_V4_-4299016806856585929.geojson', 'r', encoding='utf-8') as f:
-    full_geojson = json.load(f)
-
-# Filter to only our LSOAs
+# Stream the national GeoJSON, keeping only our LSOAs
 print("Filtering features...")
-filtered_features = [
-    feature for feature in full_geojson['features']
-    if feature['properties']['LSOA21CD'] in needed_lsoas
-]
-
-print(f"Extracted {len(filtered_features)} features")
-
-# Create new GeoJSON
-pip_geojson = {
-    "type": "FeatureCollection",
-    "features": filtered_features
-}
-
-# Save
-print("Saving...")
-with open('pip_lsoa_boundaries.geojson', 'w', encoding='utf-8') as f:
-    json.dump(pip_geojson, f)
+count = extract_features(LSOA_BOUNDARIES_FILE, 'pip_lsoa_boundaries.geojson', needed_lsoas)
 
+print(f"Extracted {count} features")
 print("Done! Created pip_lsoa_boundaries.geojson")
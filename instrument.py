@@ -0,0 +1,426 @@
+"""
+Pride in Place Data Explorer - Build Instrumentation
+Per-stage timings, memory, I/O and row counts for the data build.
+
+data_gatherer.main opens a trace and every stage and sub-step it runs (each
+download, store lookup, archive parse, merge and the JSON export) becomes a
+span. A span records:
+
+    wall_s, cpu_s        elapsed and process CPU seconds
+    rss_peak_mb          the largest resident set while it ran; on Linux the
+                         kernel's high-water mark is reset at each span, so
+                         this is the span's own peak, elsewhere the process's
+    read_mb, written_mb  bytes through read()/write() calls (Linux only), so
+                         downloads and CSV parses count, memory-mapped Arrow
+                         tables do not
+    rows_in, rows_out    rows of the DataFrames passed in and returned
+
+Spans nest, per thread. Outside a trace span() and traced() cost one
+attribute check, so the loaders used by the query service and the national
+build are unaffected.
+
+A stage can also be profiled, opt in:
+
+    cprofile   deterministic; writes <stage>.prof for pstats or snakeviz
+    sample     a thread samples the stage's stack every few milliseconds;
+               writes <stage>.folded, collapsed stacks for flamegraph.pl or
+               speedscope, with far less overhead on pandas-heavy code
+
+write() saves the spans as JSON and as a Chrome trace (chrome://tracing,
+Perfetto or speedscope), where each span is a complete event on its thread.
+"""
+
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILERS = ["cprofile", "sample"]
+SAMPLE_INTERVAL = 0.005
+
+_PROC_STATUS = Path("/proc/self/status")
+_PROC_IO = Path("/proc/self/io")
+_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+
+# ---------------------------------------------------------------------------
+# Process counters
+# ---------------------------------------------------------------------------
+
+def _status_kb(field):
+    """A /proc/self/status value in kB, or None off Linux."""
+    try:
+        match = re.search(rf'^{field}:\s+(\d+)', _PROC_STATUS.read_text(), re.MULTILINE)
+    except OSError:
+        return None
+    return int(match.group(1)) if match else None
+
+
+def rss_bytes():
+    """Current resident set size, or None if the platform does not say."""
+    kb = _status_kb('VmRSS')
+    return kb * 1024 if kb is not None else None
+
+
+def peak_rss_bytes():
+    """High-water resident set size since the last reset_peak_rss()."""
+    kb = _status_kb('VmHWM')
+    if kb is not None:
+        return kb * 1024
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_rss():
+    """Reset the kernel's high-water mark (Linux 4.0+); False if not possible."""
+    try:
+        _CLEAR_REFS.write_text('5')
+        return True
+    except OSError:
+        return False
+
+
+def io_bytes():
+    """(read, written) bytes through read()/write() calls so far, or (None, None)."""
+    try:
+        fields = dict(line.split(': ') for line in _PROC_IO.read_text().splitlines())
+    except (OSError, ValueError):
+        return None, None
+    return int(fields['rchar']), int(fields['wchar'])
+
+
+def count_rows(value):
+    """Rows in a DataFrame, a tuple or dict of them, or None for anything else."""
+    if isinstance(value, dict):
+        counts = [count_rows(v) for v in value.values()]
+    elif isinstance(value, (tuple, list)):
+        counts = [count_rows(v) for v in value]
+    else:
+        return len(value) if hasattr(value, 'columns') else None
+    counts = [c for c in counts if c is not None]
+    return sum(counts) if counts else None
+
+
+# ---------------------------------------------------------------------------
+# Profilers
+# ---------------------------------------------------------------------------
+
+class Sampler:
+    """Samples one thread's Python stack on a timer into collapsed stacks."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def enable(self):
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump_stats(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# ---------------------------------------------------------------------------
+# Tracing
+# ---------------------------------------------------------------------------
+
+class Span:
+    """One timed stage or sub-step."""
+
+    def __init__(self, tracer, span_id, name, parent, attrs):
+        self.tracer = tracer
+        self.id = span_id
+        self.name = name
+        self.parent = parent
+        self.attrs = dict(attrs)
+        self.thread = threading.current_thread().name
+        self.thread_id = threading.get_ident()
+        self.rows_in = self.rows_out = None
+        self.peak_rss = None
+        self.profile = None
+
+    def set(self, **attrs):
+        """Attach extra fields (a file name, a cache hit) to the span."""
+        self.attrs.update(attrs)
+
+    def rows(self, rows_in=None, rows_out=None):
+        """Record rows in and out where they are not DataFrame arguments."""
+        if rows_in is not None:
+            self.rows_in = rows_in
+        if rows_out is not None:
+            self.rows_out = rows_out
+
+    def _start(self):
+        self.rss_start = rss_bytes()
+        self.read_start, self.written_start = io_bytes()
+        self.cpu_start = time.process_time()
+        self.start = time.perf_counter()
+
+    def _finish(self):
+        self.wall = time.perf_counter() - self.start
+        self.cpu = time.process_time() - self.cpu_start
+        read, written = io_bytes()
+        self.read = read - self.read_start if read is not None else None
+        self.written = written - self.written_start if written is not None else None
+        self.rss_end = rss_bytes()
+
+    def record(self):
+        def mb(value):
+            return round(value / 1e6, 2) if value is not None else None
+
+        return {
+            "id": self.id,
+            "name": self.name,
+            "parent": self.parent.id if self.parent else None,
+            "thread": self.thread,
+            "start_s": round(self.start - self.tracer.start, 6),
+            "wall_s": round(self.wall, 6),
+            "cpu_s": round(self.cpu, 6),
+            "rss_start_mb": mb(self.rss_start),
+            "rss_end_mb": mb(self.rss_end),
+            "rss_peak_mb": mb(self.peak_rss),
+            "read_mb": mb(self.read),
+            "written_mb": mb(self.written),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            **({"profile": self.profile} if self.profile else {}),
+            **({"attrs": self.attrs} if self.attrs else {}),
+        }
+
+
+class _NullSpan:
+    """Stands in for a Span outside a trace."""
+
+    def set(self, **attrs):
+        pass
+
+    def rows(self, rows_in=None, rows_out=None):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Collects the spans of one run.
+
+    profile is None, 'cprofile' or 'sample'; profile_stages limits it to the
+    named stages (default: every stage). Profiles go to profile_dir.
+    """
+
+    def __init__(self, profile=None, profile_stages=None, profile_dir=None,
+                 sample_interval=SAMPLE_INTERVAL):
+        if profile not in (None, *PROFILERS):
+            raise ValueError(f"Unknown profiler {profile!r}; use one of {', '.join(PROFILERS)}")
+        self.profile = profile
+        self.profile_stages = set(profile_stages or ())
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.sample_interval = sample_interval
+        self.spans = []
+        self.start = time.perf_counter()
+        self.started = time.time()
+        self.scoped_peaks = reset_peak_rss()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = []
+        self._next_id = 1
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _note_peak(self):
+        """Fold the high-water mark so far into every open span."""
+        peak = peak_rss_bytes()
+        if peak is not None:
+            for span in self._open:
+                span.peak_rss = max(span.peak_rss or 0, peak)
+
+    @contextlib.contextmanager
+    def span(self, name, stage=False, **attrs):
+        stack = self._stack()
+        with self._lock:
+            span = Span(self, self._next_id, name, stack[-1] if stack else None, attrs)
+            self._next_id += 1
+            self._note_peak()
+            reset_peak_rss()
+            self._open.append(span)
+        stack.append(span)
+
+        profiler = self._profiler(name) if stage else None
+        span._start()
+        if profiler:
+            profiler.enable()
+        try:
+            yield span
+        finally:
+            if profiler:
+                profiler.disable()
+            span._finish()
+            stack.pop()
+            with self._lock:
+                self._note_peak()
+                self._open.remove(span)
+                self.spans.append(span)
+            if profiler:
+                span.profile = self._save_profile(name, profiler)
+
+    def _profiler(self, name):
+        if self.profile is None or (self.profile_stages and name not in self.profile_stages):
+            return None
+        if self.profile == 'cprofile':
+            return cProfile.Profile()
+        return Sampler(threading.get_ident(), self.sample_interval)
+
+    def _save_profile(self, name, profiler):
+        directory = self.profile_dir or Path.cwd()
+        directory.mkdir(parents=True, exist_ok=True)
+        suffix = '.prof' if self.profile == 'cprofile' else '.folded'
+        path = directory / f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', name)}{suffix}"
+        profiler.dump_stats(path)
+        return str(path)
+
+    # -- Output ------------------------------------------------------------
+
+    def records(self):
+        """Every span as a dict, in the order they started."""
+        return [span.record() for span in sorted(self.spans, key=lambda s: s.start)]
+
+    def chrome_trace(self):
+        """The spans as Chrome trace complete events, in microseconds."""
+        pid = os.getpid()
+        threads, names = {}, {}
+        events = []
+        for span in sorted(self.spans, key=lambda s: s.start):
+            tid = threads.setdefault(span.thread_id, len(threads) + 1)
+            names[tid] = span.thread
+            record = span.record()
+            args = {k: v for k, v in record.items()
+                    if k not in ("id", "name", "parent", "thread", "start_s", "wall_s") and v is not None}
+            events.append({
+                "name": span.name, "cat": "stage" if span.parent is None else "step",
+                "ph": "X", "pid": pid, "tid": tid,
+                "ts": round((span.start - self.start) * 1e6, 1), "dur": round(span.wall * 1e6, 1),
+                "args": args,
+            })
+        events.extend(
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in names.items()
+        )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, json_path, chrome_path, metadata=None):
+        """Save the spans as JSON and as a Chrome trace."""
+        payload = {
+            "generated": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            "wall_s": round(time.perf_counter() - self.start, 3),
+            "rss_peak_scope": "span" if self.scoped_peaks else "process",
+            "profile": self.profile,
+            **(metadata or {}),
+            "spans": self.records(),
+        }
+        for path, content in ((json_path, payload), (chrome_path, self.chrome_trace())):
+            tmp_path = Path(path).with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(content, f, indent=2)
+            os.replace(tmp_path, path)
+
+    def summary(self):
+        """One line per top-level stage, for the end of a run."""
+        lines = [f"  {'stage':<28} {'wall':>8} {'cpu':>8} {'peak RSS':>10} {'read':>9} {'rows out':>9}"]
+        for span in sorted(self.spans, key=lambda s: s.start):
+            if span.parent is not None:
+                continue
+            peak = f"{span.peak_rss / 1e6:.0f} MB" if span.peak_rss else "-"
+            read = f"{span.read / 1e6:.1f} MB" if span.read is not None else "-"
+            rows = f"{span.rows_out:,}" if span.rows_out is not None else "-"
+            lines.append(f"  {span.name:<28} {span.wall:>7.2f}s {span.cpu:>7.2f}s "
+                         f"{peak:>10} {read:>9} {rows:>9}")
+        return "\n".join(lines)
+
+
+_tracer = None
+
+
+@contextlib.contextmanager
+def tracing(**options):
+    """Trace every span() and traced() call until the block exits."""
+    global _tracer
+    previous, _tracer = _tracer, Tracer(**options)
+    try:
+        yield _tracer
+    finally:
+        _tracer = previous
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Time a sub-step; a no-op outside tracing()."""
+    if _tracer is None:
+        yield NULL_SPAN
+        return
+    with _tracer.span(name, **attrs) as current:
+        yield current
+
+
+@contextlib.contextmanager
+def stage(name, **attrs):
+    """Time a top-level stage, profiling it if the trace asks for that."""
+    if _tracer is None:
+        yield NULL_SPAN
+        return
+    with _tracer.span(name, stage=True, **attrs) as current:
+        yield current
+
+
+def traced(func=None, *, name=None):
+    """Decorator: run func as a span with rows in from its DataFrame arguments
+    and rows out from its result."""
+    if func is None:
+        return functools.partial(traced, name=name)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _tracer is None:
+            return func(*args, **kwargs)
+        with _tracer.span(name or func.__name__) as current:
+            current.rows(rows_in=count_rows(args))
+            result = func(*args, **kwargs)
+            current.rows(rows_out=count_rows(result))
+            return result
+    return wrapper
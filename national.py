@@ -0,0 +1,403 @@
+"""
+Pride in Place Data Explorer - National Build
+Scores every MSOA and LSOA in England, not just the Pride in Place areas.
+
+The lookup, LSOA centroids, LSOA-level HLNM and economic indicators, and the
+MSOA-level census, IMD, HLNM and CNI tables are joined on their area codes in
+a single pass (pandas hash joins on indexed frames), so the cost grows
+linearly with the number of areas instead of once per area as in
+generate_lsoa_embed.sh.
+
+The joined tables are written to the build directory for the query service
+and exports, which would otherwise repeat the joins every time they start:
+
+    data/build/national_msoa.arrow   one row per MSOA, every measure and its
+                                     England percentile
+    data/build/national_lsoa.arrow   one row per LSOA, its MSOA/LA, centroid,
+                                     HLNM and economic fields
+
+and sharded by local authority in the format bundle.py writes for shards/,
+so the dashboard can open any area in England:
+
+    national/index.bin          every MSOA (code, name, LA) and every LA
+    national/la/<LAD22CD>.bin   the areas, lsoa_map, lsoa_hlnm, lsoa_economic
+                                (and similar) tables for one LA
+
+The areas carry the same fields and <column>_percentile values as data.json,
+ranked against every MSOA in England.
+
+Usage:
+    python national.py build [--build-dir data/build] [--out national]
+    python national.py lsoa-map E02001954 E02001947 ...   # LSOA_MAP_DATA script
+"""
+
+import argparse
+import json
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import bundle
+import columnar_store
+import data_gatherer
+import workbooks
+
+LOCAL_DIR = Path(__file__).parent
+BUILD_DIR = LOCAL_DIR / "data" / "build"
+NATIONAL_DIR = LOCAL_DIR / "national"
+NATIONAL_MSOA_FILE = "national_msoa.arrow"
+NATIONAL_LSOA_FILE = "national_lsoa.arrow"
+
+LOOKUP_FILE = LOCAL_DIR / "lsoa_msoa_la_region_lookup_csv.csv"
+LSOA_CENTROIDS_FILE = LOCAL_DIR / "Lower_layer_Super_Output_Areas_December_2021_Boundaries_EW_BSC_V4_3901388190129020682 (1).csv"
+LSOA_HLNM_FILE = LOCAL_DIR / "Hyper-Local-Need-Measure-2025-_csv.csv"
+LSOA_ECONOMIC_FILE = LOCAL_DIR / "Hyper-local Need Index_econ_underlying.csv"
+
+# The LSOA HLNM extract has five title rows and no usable header; these are
+# the positions extract_pip_lsoa_hlnm.ps1 reads, mapped to the compact keys
+# used by LSOA_HLNM_DATA (rank "r" and percentile "p" per domain)
+LSOA_HLNM_SKIP_ROWS = 5
+LSOA_HLNM_COLUMNS = {
+    0: "c",
+    1: "n",
+    9: "t",
+    11: "or",
+    13: "gr",
+    15: "er",
+    17: "cr",
+    19: "opr",
+    21: "hr",
+}
+LSOA_HLNM_PERCENTILES = {"or": "op", "gr": "gp", "er": "ep", "cr": "cp", "opr": "opp", "hr": "hp"}
+
+# The economic indicators extract has the same five title rows; these are the
+# positions of the header extract_lsoa_economic_underlying.ps1 assigns, mapped
+# to the LSOA_ECONOMIC_DATA keys. The three UC rates are summed into uc_total.
+LSOA_ECONOMIC_SKIP_ROWS = 5
+LSOA_ECONOMIC_COLUMNS = {
+    0: "c",
+    5: "uc_search",
+    7: "uc_plan",
+    9: "uc_prep",
+    13: "jsa",
+    22: "jobs_density",
+    23: "gva",
+    25: "gva_change",
+    27: "highgrowth",
+    28: "income",
+    30: "higher_mgr",
+    32: "no_quals",
+    34: "level3plus",
+    35: "broadband",
+    36: "digital",
+    37: "jobs_access",
+}
+LSOA_ECONOMIC_FIELDS = [
+    "uc_search", "uc_total", "jsa", "jobs_density", "gva", "gva_change", "highgrowth",
+    "income", "higher_mgr", "no_quals", "level3plus", "broadband", "digital", "jobs_access",
+]
+
+MISSION_COUNTS = {
+    "Mission Critical": "lsoa_critical",
+    "Mission Priority": "lsoa_priority",
+    "Mission Support": "lsoa_support",
+}
+
+# MSOA measures scored against every MSOA in England; the HLNM and CNI
+# percentiles arrive precomputed in need_msoa.arrow, and the IMD score
+# percentiles are the ones the dashboard's deprivation cards read
+PERCENTILE_COLUMNS = [
+    'bad_health_pct', 'no_qualifications_pct', 'level4_plus_pct',
+    'unemployed_count', 'inactive_count', 'employed_count',
+    'deprived_pct', 'owned_pct', 'social_rented_pct',
+] + bundle.IMD_SCORE_COLUMNS
+
+
+# ---------------------------------------------------------------------------
+# Loading
+# ---------------------------------------------------------------------------
+
+def load_lookup(path=LOOKUP_FILE):
+    """England rows of the LSOA -> MSOA -> LA -> region lookup, indexed by LSOA."""
+    columns = ['LSOA21CD', 'LSOA21NM', 'MSOA21CD', 'MSOA21NM', 'LAD22CD', 'LAD22NM', 'RGN22CD', 'RGN22NM']
+    df = workbooks.read_table(
+        path, usecols=columns,
+        dtype={c: data_gatherer.LOOKUP_DTYPES[c] for c in columns},
+    )
+    df = df[df['LSOA21CD'].str.startswith('E')]
+    return df.set_index('LSOA21CD')
+
+
+def load_centroids(path=LSOA_CENTROIDS_FILE):
+    """LSOA population-weighted centroids, indexed by LSOA."""
+    df = pd.read_csv(path, usecols=['LSOA21CD', 'LAT', 'LONG'], encoding='utf-8-sig')
+    df = df.rename(columns={'LAT': 'lat', 'LONG': 'lng'})
+    return df.set_index('LSOA21CD')
+
+
+def load_lsoa_hlnm(path=LSOA_HLNM_FILE):
+    """LSOA-level HLNM ranks, typology and rank percentiles, indexed by LSOA.
+
+    Percentiles follow extract_pip_lsoa_hlnm.ps1: rank / LSOAs ranked * 100,
+    rounded, with the total taken from the file rather than hardcoded.
+    """
+    df = workbooks.read_table(
+        path, header=None, skiprows=LSOA_HLNM_SKIP_ROWS,
+        usecols=list(LSOA_HLNM_COLUMNS),
+    )
+    df = df.rename(columns=LSOA_HLNM_COLUMNS)
+    df = df[df['c'].astype(str).str.startswith('E01')]
+
+    for rank_col, pct_col in LSOA_HLNM_PERCENTILES.items():
+        ranks = pd.to_numeric(df[rank_col], errors='coerce')
+        df[rank_col] = ranks.astype('Int32')
+        df[pct_col] = (ranks / ranks.notna().sum() * 100).round().astype('Int32')
+
+    df['t'] = df['t'].astype(str).str.strip()
+    return df.set_index('c')
+
+
+def load_lsoa_economic(path=LSOA_ECONOMIC_FILE):
+    """LSOA-level economic indicators, indexed by LSOA.
+
+    Values are cleaned and rounded to 2 dp as extract_lsoa_economic_underlying.ps1
+    does; uc_total is the sum of the searching, planning and preparing rates.
+    """
+    df = workbooks.read_table(
+        path, header=None, skiprows=LSOA_ECONOMIC_SKIP_ROWS,
+        usecols=list(LSOA_ECONOMIC_COLUMNS), dtype=str,
+    )
+    df = df.rename(columns=LSOA_ECONOMIC_COLUMNS)
+    df = df[df['c'].str.startswith('E01', na=False)].set_index('c')
+
+    values = df.apply(lambda col: pd.to_numeric(col.str.replace(r'[£,"\s]', '', regex=True), errors='coerce'))
+    values['uc_total'] = values[['uc_search', 'uc_plan', 'uc_prep']].sum(axis=1, min_count=1)
+    return values[LSOA_ECONOMIC_FIELDS].round(2)
+
+
+def load_msoa_tables(build_dir=BUILD_DIR):
+    """The MSOA-level tables written by the pipeline, indexed by MSOA."""
+    tables = []
+    for name in ("census_msoa.arrow", "imd_msoa.arrow", "need_msoa.arrow"):
+        df = columnar_store.read_table(Path(build_dir) / name)
+        df = df.astype({'msoa_code': str}).set_index('msoa_code')
+        # Drop merge leftovers such as total_x / total_y
+        tables.append(df.loc[:, ~df.columns.str.endswith(('_x', '_y'))])
+    return tables
+
+
+# ---------------------------------------------------------------------------
+# Joining
+# ---------------------------------------------------------------------------
+
+def build_lsoa_table(lookup, centroids, lsoa_hlnm, lsoa_economic=None):
+    """One row per England LSOA with its MSOA/LA, centroid, HLNM and economic fields."""
+    lsoas = lookup[['LSOA21NM', 'MSOA21CD', 'LAD22CD']].join(centroids, how='left')
+    lsoas = lsoas.join(lsoa_hlnm, how='left')
+    if lsoa_economic is not None:
+        lsoas = lsoas.join(lsoa_economic, how='left')
+    lsoas['n'] = lsoas['n'].fillna(lsoas['LSOA21NM'])
+    return lsoas
+
+
+def build_msoa_table(lookup, lsoas, msoa_tables):
+    """One row per England MSOA with every measure and its national percentile."""
+    geography = (
+        lookup.drop_duplicates('MSOA21CD')
+        .set_index('MSOA21CD')[['MSOA21NM', 'LAD22CD', 'LAD22NM', 'RGN22CD', 'RGN22NM']]
+    )
+
+    counts = pd.crosstab(lsoas['MSOA21CD'], lsoas['t']).reindex(columns=list(MISSION_COUNTS), fill_value=0)
+    counts = counts.rename(columns=MISSION_COUNTS).astype(np.int32)
+    counts['lsoa_total'] = lsoas.groupby('MSOA21CD', observed=True).size().astype(np.int32)
+
+    areas = data_gatherer.assemble(geography.index, [geography, *msoa_tables, counts])
+    areas.index.name = 'msoa_code'
+    areas = areas.reset_index().rename(columns={
+        'MSOA21NM': 'neighbourhood_name',
+        'LAD22NM': 'local_authority',
+        'LAD22CD': 'la_code',
+        'RGN22CD': 'region_code',
+        'RGN22NM': 'region',
+    })
+
+    columns = [c for c in PERCENTILE_COLUMNS if c in areas.columns]
+    data_gatherer.calculate_all_percentiles(areas, areas[columns])
+    for col in columns:
+        areas[f"{col}_percentile"] = areas[f"{col}_percentile"].round(1)
+    return areas
+
+
+def _optional(loader, path, columns):
+    """Load an optional per-LSOA source, or an empty frame if it is missing."""
+    if Path(path).exists():
+        return loader(path)
+    print(f"  {Path(path).name} not found, continuing without it")
+    return pd.DataFrame(columns=columns).rename_axis('LSOA21CD')
+
+
+def load_tables(lookup, build_dir=BUILD_DIR):
+    """(areas, lsoas) for every England MSOA and LSOA.
+
+    Read from the national stage's tables when they have been built. Otherwise
+    they are joined here, and unlike build_national the LSOA centroids and
+    HLNM extract are optional; without them the LSOA rows carry only the
+    lookup fields (and the economic indicators, when present).
+    """
+    msoa_path, lsoa_path = Path(build_dir) / NATIONAL_MSOA_FILE, Path(build_dir) / NATIONAL_LSOA_FILE
+    if msoa_path.exists() and lsoa_path.exists():
+        return (columnar_store.read_table(msoa_path),
+                columnar_store.read_table(lsoa_path).set_index('LSOA21CD'))
+
+    hlnm_columns = list(LSOA_HLNM_COLUMNS.values())[1:] + list(LSOA_HLNM_PERCENTILES.values())
+    lsoas = build_lsoa_table(
+        lookup,
+        _optional(load_centroids, LSOA_CENTROIDS_FILE, ['lat', 'lng']),
+        _optional(load_lsoa_hlnm, LSOA_HLNM_FILE, hlnm_columns),
+        _optional(load_lsoa_economic, LSOA_ECONOMIC_FILE, LSOA_ECONOMIC_FIELDS),
+    )
+    return build_msoa_table(lookup, lsoas, load_msoa_tables(build_dir)), lsoas
+
+
+# ---------------------------------------------------------------------------
+# Sharding
+# ---------------------------------------------------------------------------
+
+def _records(df):
+    """DataFrame rows as plain dicts with missing (and non-finite) values
+    dropped, as the bundle stores them.
+    """
+    return [
+        {k: v for k, v in row.items() if not pd.isna(v) and not (isinstance(v, float) and math.isinf(v))}
+        for row in df.to_dict(orient='records')
+    ]
+
+
+def lsoa_shard_tables(lsoas):
+    """The lsoa_map, lsoa_hlnm and lsoa_economic tables for a set of LSOA rows."""
+    lsoas = lsoas.reset_index().rename(columns={'LSOA21CD': 'c', 'MSOA21CD': 'msoa'})
+    located = lsoas[lsoas['lat'].notna()]
+    lsoa_map = located[['c', 'LSOA21NM', 'lat', 'lng', 't', 'msoa']].rename(columns={'LSOA21NM': 'n', 't': 'm'})
+    hlnm_columns = ['c', 'n', 't'] + [c for pair in LSOA_HLNM_PERCENTILES.items() for c in pair]
+    hlnm = lsoas.loc[lsoas['or'].notna(), hlnm_columns]
+    tables = {
+        "lsoa_map": (_records(lsoa_map), {"group": "msoa"}),
+        "lsoa_hlnm": (_records(hlnm), {"key": "c"}),
+    }
+    economic_columns = [c for c in LSOA_ECONOMIC_FIELDS if c in lsoas.columns]
+    if economic_columns:
+        economic = lsoas.loc[lsoas[economic_columns].notna().any(axis=1), ['c'] + economic_columns]
+        tables["lsoa_economic"] = (_records(economic), {"key": "c"})
+    return tables
+
+
+def write_shards(areas, lsoas, out_dir=NATIONAL_DIR, metadata=None, similar_path=bundle.SIMILAR_FILE,
+                 lookup_path=LOOKUP_FILE):
+    """Write one bundle per LA plus the national index with bundle.py's
+    shard writer, so shard_reader.js opens them like shards/; returns the
+    index payload.
+    """
+    tables = {"areas": (_records(areas), {"key": "msoa_code"})}
+    tables.update(lsoa_shard_tables(lsoas))
+    similar = bundle.load_similar_areas(areas['msoa_code'], similar_path, lookup_path)
+    if similar:
+        tables["similar"] = (similar, {"group": "msoa"})
+
+    area_las = {
+        row.msoa_code: {"la_code": row.la_code, "local_authority": row.local_authority,
+                        "region_code": row.region_code, "region": row.region}
+        for row in areas.itertuples(index=False)
+    }
+    return bundle.write_la_shards(out_dir, tables, metadata or {}, area_las)
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+
+def build_national(build_dir=BUILD_DIR, out_dir=NATIONAL_DIR, lookup_path=LOOKUP_FILE,
+                   centroids_path=LSOA_CENTROIDS_FILE, lsoa_hlnm_path=LSOA_HLNM_FILE,
+                   lsoa_economic_path=LSOA_ECONOMIC_FILE):
+    """Join every source for all England MSOAs/LSOAs, write the two tables
+    and the LA shards. The economic indicators are optional.
+    """
+    start = time.perf_counter()
+    print("\n1. Loading lookup, centroids, LSOA HLNM and economic indicators...")
+    lookup = load_lookup(lookup_path)
+    lsoas = build_lsoa_table(
+        lookup, load_centroids(centroids_path), load_lsoa_hlnm(lsoa_hlnm_path),
+        _optional(load_lsoa_economic, lsoa_economic_path, LSOA_ECONOMIC_FIELDS),
+    )
+    print(f"  {len(lsoas):,} LSOAs")
+
+    print("\n2. Joining MSOA measures...")
+    areas = build_msoa_table(lookup, lsoas, load_msoa_tables(build_dir))
+    print(f"  {len(areas):,} MSOAs")
+
+    print("\n3. Writing national tables...")
+    build_dir = Path(build_dir)
+    columnar_store.write_table(areas, build_dir / NATIONAL_MSOA_FILE)
+    columnar_store.write_table(lsoas.reset_index(), build_dir / NATIONAL_LSOA_FILE)
+    print(f"  Wrote {NATIONAL_MSOA_FILE} and {NATIONAL_LSOA_FILE} to {build_dir}")
+
+    print("\n4. Writing LA shards...")
+    metadata = {
+        "generated": pd.Timestamp.now().isoformat(timespec='seconds'),
+        "total_areas": len(areas),
+        "total_lsoas": len(lsoas),
+    }
+    write_shards(areas, lsoas, out_dir, metadata, lookup_path=lookup_path)
+    print(f"  Done in {time.perf_counter() - start:.1f}s")
+    return areas, lsoas
+
+
+def lsoa_map_script(msoa_codes, lookup_path=LOOKUP_FILE, centroids_path=LSOA_CENTROIDS_FILE,
+                    lsoa_hlnm_path=LSOA_HLNM_FILE):
+    """LSOA_MAP_DATA for the given MSOAs, as written by generate_lsoa_embed.sh."""
+    lookup = load_lookup(lookup_path)
+    lookup = lookup[lookup['MSOA21CD'].isin(msoa_codes)]
+    lsoas = build_lsoa_table(lookup, load_centroids(centroids_path), load_lsoa_hlnm(lsoa_hlnm_path))
+    lsoas = lsoas[lsoas['lat'].notna()]
+    groups = dict(tuple(lsoas.groupby('MSOA21CD', observed=True, sort=False)))
+
+    lines = ["const LSOA_MAP_DATA = {"]
+    for msoa in msoa_codes:
+        lines.append(f'"{msoa}":[')
+        for code, row in groups.get(msoa, lsoas.iloc[:0]).iterrows():
+            mission = row['t'] if isinstance(row['t'], str) else ''
+            lines.append(
+                f'{{c:{json.dumps(code)},n:{json.dumps(row["LSOA21NM"])},'
+                f'lat:{row["lat"]},lng:{row["lng"]},m:{json.dumps(mission)}}},'
+            )
+        lines.append("],")
+    lines.append("};")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="National build for the PiP Data Explorer")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="score every England MSOA/LSOA, write the national tables and LA shards")
+    build.add_argument('--build-dir', default=str(BUILD_DIR), help="pipeline intermediate tables")
+    build.add_argument('--out', default=str(NATIONAL_DIR), help="LA shard directory (default: national)")
+
+    lsoa_map = commands.add_parser('lsoa-map', help="print LSOA_MAP_DATA for some MSOAs")
+    lsoa_map.add_argument('msoa_codes', nargs='+')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        print("=" * 60)
+        print("Pride in Place Data Explorer - National Build")
+        print("=" * 60)
+        build_national(args.build_dir, args.out)
+    elif args.command == 'lsoa-map':
+        print(lsoa_map_script(args.msoa_codes), end='')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+"""
+Pride in Place Data Explorer - Build Pipeline
+Incremental, dependency-aware runner for the data build.
+
+Each stage declares the files it reads, including the modules that build
+it, and the files it writes. A stage is skipped when its outputs exist and
+the content hash of its inputs and stage function matches the last
+successful run; stages whose inputs are another stage's outputs run
+after it, and independent stages run in parallel worker processes. A change
+to one source therefore rebuilds only the artifacts that depend on it.
+
+Usage:
+    python pipeline.py                 # build everything that is stale
+    python pipeline.py dataset         # build one stage and what it needs
+    python pipeline.py --force census  # rebuild a stage even if fresh
+    python pipeline.py --list          # show stages and their status
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import runpy
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import columnar_store
+
+LOCAL_DIR = Path(__file__).parent
+DATA_DIR = LOCAL_DIR / "data"
+BUILD_DIR = DATA_DIR / "build"
+STATE_FILE = BUILD_DIR / "pipeline_state.json"
+
+
+class Stage:
+    """One build step: a function plus the files it reads and writes."""
+
+    def __init__(self, name, func, inputs=(), outputs=(), version=1):
+        self.name = name
+        self.func = func
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self.version = version
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def load_state():
+    """Load the pipeline state, or an empty one if missing or unreadable."""
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    state.setdefault("files", {})
+    state.setdefault("stages", {})
+    return state
+
+
+def save_state(state):
+    """Write the pipeline state atomically."""
+    BUILD_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = STATE_FILE.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def input_hash(stage, state):
+    """Content hash of a stage's inputs and version (None if an input is missing)."""
+    digest = hashlib.sha256(f"{stage.name}:{stage.version}".encode())
+    # The stage function is part of the build; its modules are listed as inputs
+    digest.update(inspect.getsource(stage.func).encode())
+    for path in stage.inputs:
+        if not path.exists():
+            return None
+        digest.update(str(path.relative_to(LOCAL_DIR)).encode())
+        digest.update(columnar_store.file_digest(path, state).encode())
+    return digest.hexdigest()
+
+
+def resolve_dependencies(stages):
+    """Map each stage name to the names of the stages producing its inputs."""
+    producers = {}
+    for stage in stages:
+        for path in stage.outputs:
+            producers[path.resolve()] = stage.name
+
+    return {
+        stage.name: {
+            producers[path.resolve()] for path in stage.inputs
+            if path.resolve() in producers and producers[path.resolve()] != stage.name
+        }
+        for stage in stages
+    }
+
+
+def select_stages(stages, targets):
+    """The requested stages plus everything upstream of them, in declared order."""
+    if not targets:
+        return list(stages)
+
+    by_name = {stage.name: stage for stage in stages}
+    unknown = [t for t in targets if t not in by_name]
+    if unknown:
+        raise SystemExit(f"Unknown stage(s): {', '.join(unknown)}. Use --list to see them.")
+
+    deps = resolve_dependencies(stages)
+    wanted = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in wanted:
+            wanted.add(name)
+            pending.extend(deps[name])
+
+    return [stage for stage in stages if stage.name in wanted]
+
+
+def _run_stage(name):
+    """Worker entry point: run one stage by name and time it."""
+    os.chdir(LOCAL_DIR)
+    stage = {s.name: s for s in STAGES}[name]
+    for path in stage.outputs:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    stage.func()
+    return time.perf_counter() - start
+
+
+def run(stages, force=(), jobs=None):
+    """Run stages in dependency order, skipping fresh ones.
+
+    force is a collection of stage names to rerun regardless of their hash.
+    Returns a dict of stage name -> 'built', 'fresh', 'failed' or 'blocked'.
+    """
+    state = load_state()
+    deps = resolve_dependencies(stages)
+    names = {stage.name for stage in stages}
+    deps = {name: deps[name] & names for name in deps if name in names}
+    by_name = {stage.name: stage for stage in stages}
+
+    status = {}
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        while len(status) < len(stages):
+            progressed = False
+            for stage in stages:
+                if stage.name in status or stage.name in running.values():
+                    continue
+                upstream = [status.get(d) for d in deps[stage.name]]
+                if any(s in ('failed', 'blocked') for s in upstream):
+                    status[stage.name] = 'blocked'
+                    progressed = True
+                    print(f"  [blocked] {stage.name}: an upstream stage failed")
+                    continue
+                if not all(s in ('built', 'fresh') for s in upstream):
+                    continue
+
+                progressed = True
+                key = input_hash(stage, state)
+                if key is None:
+                    missing = [str(p.relative_to(LOCAL_DIR)) for p in stage.inputs if not p.exists()]
+                    status[stage.name] = 'failed'
+                    print(f"  [missing] {stage.name}: {', '.join(missing)}")
+                    continue
+
+                previous = state["stages"].get(stage.name, {})
+                outputs_present = all(p.exists() for p in stage.outputs)
+                if previous.get("key") == key and outputs_present and stage.name not in force:
+                    status[stage.name] = 'fresh'
+                    print(f"  [fresh]   {stage.name}")
+                    continue
+
+                print(f"  [run]     {stage.name}")
+                state["stages"].setdefault(stage.name, {})["pending_key"] = key
+                running[pool.submit(_run_stage, stage.name)] = stage.name
+
+            if not running:
+                if not progressed:
+                    # Only reachable with a dependency cycle
+                    for stage in stages:
+                        status.setdefault(stage.name, 'blocked')
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                entry = state["stages"][name]
+                key = entry.pop("pending_key")
+                try:
+                    elapsed = future.result()
+                except Exception as exc:
+                    status[name] = 'failed'
+                    print(f"  [failed]  {name}: {exc!r}")
+                    continue
+
+                missing = [p for p in by_name[name].outputs if not p.exists()]
+                if missing:
+                    status[name] = 'failed'
+                    print(f"  [failed]  {name}: did not write {', '.join(p.name for p in missing)}")
+                    continue
+
+                entry.update({
+                    "key": key,
+                    "seconds": round(elapsed, 3),
+                    "finished": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                })
+                status[name] = 'built'
+                print(f"  [built]   {name} ({elapsed:.2f}s)")
+                save_state(state)
+
+    save_state(state)
+    return status
+
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+def build_path(name):
+    """Path of an intermediate artifact in the build directory."""
+    return BUILD_DIR / name
+
+
+def stage_sources():
+    """Fetch every remote source into the download cache."""
+    import data_gatherer
+    data_gatherer.ensure_data_dir()
+    data_gatherer.prefetch_sources()
+
+
+def stage_lookup():
+    """LSOA -> MSOA -> LA -> region lookup."""
+    import data_gatherer
+    df = data_gatherer.load_lsoa_msoa_lookup()
+    columnar_store.write_table(df, build_path("lookup.arrow"))
+
+
+def stage_census():
+    """Census 2021 measures for every MSOA in England."""
+    import data_gatherer
+    lookup = columnar_store.read_table(build_path("lookup.arrow"))
+    all_msoa_codes = lookup['MSOA21CD'].unique().tolist()
+    census = data_gatherer.build_census_measures(data_gatherer.load_census_data(), all_msoa_codes)
+    columnar_store.write_table(census, build_path("census_msoa.arrow"))
+
+
+def stage_imd():
+    """IMD 2025 scores aggregated to MSOA."""
+    import data_gatherer
+    lookup = columnar_store.read_table(build_path("lookup.arrow"))
+    imd_df, lsoa_col = data_gatherer.load_imd_data(lookup)
+    imd_msoa = data_gatherer.aggregate_imd_to_msoa(imd_df, lsoa_col, lookup)
+    columnar_store.write_table(imd_msoa, build_path("imd_msoa.arrow"))
+
+
+def stage_need():
+    """HLNM scores and CNI ranks per MSOA, joined with their percentiles."""
+    import data_gatherer
+    columnar_store.write_table(data_gatherer.load_need_data(), build_path("need_msoa.arrow"))
+
+
+def stage_dataset():
+    """Join everything for the PiP neighbourhoods and write data.json."""
+    import data_gatherer
+    pip_df = data_gatherer.load_pip_msoas()
+    tables = [
+        columnar_store.read_table(build_path(name))
+        for name in ("census_msoa.arrow", "imd_msoa.arrow", "need_msoa.arrow")
+    ]
+    census_msoa, imd_msoa, need_msoa = tables
+    final_df = data_gatherer.build_final_dataset(pip_df, census_msoa, imd_msoa, [need_msoa])
+    final_df = data_gatherer.add_england_percentiles(final_df, census_msoa, imd_msoa)
+    data_gatherer.export_to_json(final_df, data_gatherer.OUTPUT_FILE)
+
+
+def stage_lsoa_map():
+    """Per-MSOA LSOA centroids and classifications (extract_lsoa_data.py)."""
+    runpy.run_path(str(LOCAL_DIR / "extract_lsoa_data.py"), run_name="__main__")
+
+
+def stage_boundaries():
+    """PiP LSOA boundary subset (extract_pip_boundaries.py)."""
+    runpy.run_path(str(LOCAL_DIR / "extract_pip_boundaries.py"), run_name="__main__")
+
+
+def stage_boundary_tiles():
+    """Simplified per-MSOA and per-LA boundary tiles for the dashboard map."""
+    import boundaries
+    boundaries.build_tiles(boundaries.LSOA_BOUNDARIES_FILE)
+
+
+def stage_spatial():
+    """LSOA polygons for point-in-area lookups (spatial_index.py)."""
+    import spatial_index
+    spatial_index.build_spatial_index()
+
+
+def stage_aggregates():
+    """Population-weighted LA, region and England benchmarks (aggregates.py)."""
+    import aggregates
+    aggregates.build_aggregates()
+
+
+def stage_shards():
+    """The per-LA data bundles the dashboard loads (bundle.py)."""
+    import bundle
+    bundle.write_shards()
+
+
+def stage_national():
+    """Every England MSOA/LSOA: two joined tables and per-LA shards (national.py)."""
+    import national
+    national.build_national()
+
+
+def stage_similar():
+    """Each MSOA's and LSOA's most similar areas (similarity.py)."""
+    import similarity
+    similarity.build_similar()
+
+
+def stage_search():
+    """Name and code search index over every England area (search_index.py)."""
+    import search_index
+    search_index.build_search_index()
+
+
+def stage_publish():
+    """Content-hashed, precompressed copy of the site in dist/ (publish.py)."""
+    import publish
+    publish.publish()
+
+
+def _source(key):
+    import data_gatherer
+    return DATA_DIR / data_gatherer.CACHE_FILES[key]
+
+
+def _code(*modules):
+    """The source files of the given modules, as stage inputs."""
+    return [LOCAL_DIR / f"{name}.py" for name in modules]
+
+
+def _stages():
+    import data_gatherer
+    import national
+    import publish
+
+    census_zips = [_source(key) for key, _ in data_gatherer.CENSUS_TABLES.values()]
+    lookup_csv = LOCAL_DIR / "lsoa_msoa_la_region_lookup_csv.csv"
+    lsoa_boundaries = LOCAL_DIR / "Lower_layer_Super_Output_Areas_December_2021_Boundaries_EW_BSC_V4_-4299016806856585929.geojson"
+    lsoa_centroids = LOCAL_DIR / "Lower_layer_Super_Output_Areas_December_2021_Boundaries_EW_BSC_V4_3901388190129020682 (1).csv"
+    hlnm_lsoa = LOCAL_DIR / "Hyper-Local-Need-Measure-2025-_csv.csv"
+    economic_lsoa = LOCAL_DIR / "Hyper-local Need Index_econ_underlying.csv"
+    # Code every stage reading the raw sources runs through
+    data_code = _code("data_gatherer", "columnar_store", "workbooks")
+
+    return [
+        Stage("sources", stage_sources,
+              outputs=[DATA_DIR / name for name in data_gatherer.CACHE_FILES.values()]),
+        Stage("lookup", stage_lookup,
+              inputs=[_source("lsoa_msoa_lookup")] + data_code,
+              outputs=[build_path("lookup.arrow")]),
+        Stage("census", stage_census,
+              inputs=census_zips + [build_path("lookup.arrow")] + data_code,
+              outputs=[build_path("census_msoa.arrow")]),
+        Stage("imd", stage_imd,
+              inputs=[_source("imd_2025"), build_path("lookup.arrow")] + data_code,
+              outputs=[build_path("imd_msoa.arrow")]),
+        Stage("need", stage_need,
+              inputs=[data_gatherer.HLNM_FILE] + list(data_gatherer.CNI_FILES.values()) + data_code,
+              outputs=[build_path("need_msoa.arrow")]),
+        Stage("dataset", stage_dataset,
+              inputs=[_source("pip_msoas")] + [
+                  build_path(name) for name in
+                  ("census_msoa.arrow", "imd_msoa.arrow", "need_msoa.arrow")
+              ] + data_code,
+              outputs=[data_gatherer.OUTPUT_FILE]),
+        Stage("lsoa_map", stage_lsoa_map,
+              inputs=[lookup_csv, hlnm_lsoa, lsoa_centroids, LOCAL_DIR / "extract_lsoa_data.py"],
+              outputs=[LOCAL_DIR / "lsoa_embedded_data.js"]),
+        Stage("boundaries", stage_boundaries,
+              inputs=[LOCAL_DIR / "lsoa_embedded_data_temp.js", lsoa_boundaries,
+                      LOCAL_DIR / "extract_pip_boundaries.py", LOCAL_DIR / "boundaries.py"],
+              outputs=[LOCAL_DIR / "pip_lsoa_boundaries.geojson"]),
+        Stage("boundary_tiles", stage_boundary_tiles,
+              inputs=[lsoa_boundaries, lookup_csv, LOCAL_DIR / "boundaries.py"],
+              outputs=[LOCAL_DIR / "boundaries" / "index.json"]),
+        Stage("spatial", stage_spatial,
+              inputs=[lsoa_boundaries, lookup_csv] + _code("boundaries", "spatial_index", "national", "columnar_store"),
+              outputs=[LOCAL_DIR / "spatial_index.arrow"]),
+        Stage("national", stage_national,
+              # The economic indicators and similar.bin are optional; tracked when present
+              inputs=[lookup_csv, lsoa_centroids, hlnm_lsoa] + [
+                  build_path(name) for name in
+                  ("census_msoa.arrow", "imd_msoa.arrow", "need_msoa.arrow")
+              ] + [path for path in (economic_lsoa, LOCAL_DIR / "similar.bin") if path.exists()]
+                + _code("national", "bundle") + data_code,
+              outputs=[build_path(national.NATIONAL_MSOA_FILE), build_path(national.NATIONAL_LSOA_FILE),
+                       national.NATIONAL_DIR / "index.bin"]),
+        Stage("aggregates", stage_aggregates,
+              inputs=[_source("imd_2025")] + [
+                  build_path(name) for name in ("lookup.arrow", "census_msoa.arrow", "need_msoa.arrow")
+              ] + _code("aggregates", "bundle") + data_code,
+              outputs=[LOCAL_DIR / "aggregates.bin", build_path("aggregates_msoa.arrow")]),
+        Stage("similar", stage_similar,
+              # The LSOA HLNM ranks are optional features; tracked when present
+              inputs=[lookup_csv, _source("imd_2025")] + [
+                  build_path(name) for name in
+                  ("census_msoa.arrow", "imd_msoa.arrow", "need_msoa.arrow")
+              ] + ([hlnm_lsoa] if hlnm_lsoa.exists() else [])
+                + _code("similarity", "national", "bundle") + data_code,
+              outputs=[LOCAL_DIR / "similar.bin"]),
+        Stage("search", stage_search,
+              inputs=[lookup_csv, data_gatherer.HLNM_FILE, data_gatherer.OUTPUT_FILE]
+                     + list(data_gatherer.CNI_FILES.values())
+                     + _code("search_index", "national", "bundle") + data_code,
+              outputs=[LOCAL_DIR / "search_index.bin"]),
+        Stage("shards", stage_shards,
+              inputs=[data_gatherer.OUTPUT_FILE, LOCAL_DIR / "lsoa_embedded_data_temp.js",
+                      LOCAL_DIR / "lsoa_hlnm_data.js", LOCAL_DIR / "lsoa_economic_underlying.js",
+                      lookup_csv, LOCAL_DIR / "similar.bin"] + _code("bundle", "workbooks"),
+              outputs=[LOCAL_DIR / "shards" / "index.bin"]),
+        Stage("publish", stage_publish,
+              # Each optional artifact is published, and tracked, when present
+              inputs=[LOCAL_DIR / name for name in ("publish.py", *publish.PAGES, *publish.SCRIPTS)] + [
+                  path for path in (LOCAL_DIR / "aggregates.bin", LOCAL_DIR / "search_index.bin",
+                                    LOCAL_DIR / "boundaries" / "index.json", national.NATIONAL_DIR / "index.bin")
+                  if path.exists()
+              ] + [data_gatherer.OUTPUT_FILE, LOCAL_DIR / "shards" / "index.bin"],
+              outputs=[LOCAL_DIR / "dist" / "manifest.json"]),
+    ]
+
+
+STAGES = _stages()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental data build for the PiP Data Explorer")
+    parser.add_argument('stages', nargs='*', help="stages to build (default: all)")
+    parser.add_argument('--force', action='store_true', help="rebuild the named stages even if fresh")
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--list', action='store_true', help="list stages and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        state = load_state()
+        deps = resolve_dependencies(STAGES)
+        for stage in STAGES:
+            key = input_hash(stage, state)
+            fresh = (key is not None and state["stages"].get(stage.name, {}).get("key") == key
+                     and all(p.exists() for p in stage.outputs))
+            label = 'fresh' if fresh else ('missing inputs' if key is None else 'stale')
+            after = f" (after {', '.join(sorted(deps[stage.name]))})" if deps[stage.name] else ""
+            print(f"  {stage.name:<12} {label}{after}")
+        return
+
+    print("=" * 60)
+    print("Pride in Place Data Explorer - Build Pipeline")
+    print("=" * 60)
+
+    stages = select_stages(STAGES, args.stages)
+    force = set(args.stages or [s.name for s in stages]) if args.force else set()
+    start = time.perf_counter()
+    status = run(stages, force=force, jobs=args.jobs)
+
+    counts = {s: list(status.values()).count(s) for s in ('built', 'fresh', 'failed', 'blocked')}
+    print("\n" + "=" * 60)
+    print(f"Built {counts['built']}, fresh {counts['fresh']}, "
+          f"failed {counts['failed']}, blocked {counts['blocked']} "
+          f"in {time.perf_counter() - start:.1f}s")
+    print("=" * 60)
+
+    if counts['failed'] or counts['blocked']:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
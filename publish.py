@@ -0,0 +1,308 @@
+"""
+Pride in Place Data Explorer - Static Publishing
+Builds the deployable site in dist/ and serves it locally.
+
+Every file the dashboard loads is copied under a content-hashed name
+(shard_reader.js -> shard_reader.3f09a1c2b4.js), with JSON artifacts
+minified first and gzip and brotli variants written beside anything that
+compresses. index.html and manifest.json keep their names: the page loads
+manifest.json (asset_manifest.js) and resolves every other file through it,
+so a hashed file can be cached for good and a new build costs one small
+revalidated request. Script tags and the worker's importScripts are
+rewritten to the hashed names at build time. The manifest's precache list
+is what service_worker.js keeps for offline use.
+
+The bundled server sends the .br or .gz variant the browser accepts, marks
+hashed files immutable and answers If-None-Match with 304, so a repeat visit
+downloads nothing that has not changed. Brotli needs the optional brotli
+package; without it only gzip variants are written.
+
+Usage:
+    python publish.py                   # build dist/
+    python publish.py build --out site  # build somewhere else
+    python publish.py serve --port 8000 # serve dist/ at http://localhost:8000
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from email.utils import parsedate_to_datetime
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+LOCAL_DIR = Path(__file__).parent
+DIST_DIR = LOCAL_DIR / "dist"
+MANIFEST_NAME = "manifest.json"
+
+# Loaded from <script> tags, in dependency order: each is hashed after the
+# scripts it references, so their hashed names can be written into it
+SCRIPTS = ["asset_manifest.js", "bundle_reader.js", "search_reader.js", "shard_reader.js", "area_worker.js"]
+# Everything else the page fetches; patterns that match nothing are skipped
+ASSETS = [
+    "ICON-Logo-Final_optimised.png",
+    "aggregates.bin",
+    "search_index.bin",
+    "shards/**/*.bin",
+    "national/**/*.bin",
+    "boundaries/**/*.json",
+]
+# Kept under their own names: they decide which build the browser loads
+PAGES = ["index.html", "service_worker.js"]
+# What service_worker.js keeps for offline use as soon as a build is seen:
+# the app shell and data bundle (national/index.bin when national.py's shards
+# are published, which the page opens instead of shards/). LA shards, boundary
+# tiles and the search index (fetched on first use of the search box) are
+# cached as they are used
+PRECACHE = ["index.html", *SCRIPTS, "ICON-Logo-Final_optimised.png",
+            "national/index.bin", "shards/index.bin", "aggregates.bin"]
+
+HASH_LENGTH = 10
+HASHED_NAME = re.compile(rf"\.[0-9a-f]{{{HASH_LENGTH}}}\.[a-z0-9]+$")
+COMPRESSIBLE = {".html", ".js", ".json", ".bin", ".css", ".svg"}
+# Below this a compressed variant saves less than its headers cost
+MIN_COMPRESS_BYTES = 256
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# Accept-Encoding coding -> variant suffix, preferred first
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+
+# ---------------------------------------------------------------------------
+# Build
+# ---------------------------------------------------------------------------
+
+def minify(path, body):
+    """JSON re-serialised without whitespace; anything else as it is."""
+    if path.suffix != ".json":
+        return body
+    data = json.loads(body.decode("utf-8-sig"))
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def hashed_name(logical, body):
+    """'shards/index.bin' -> 'shards/index.<content hash>.bin'."""
+    path = Path(logical)
+    digest = hashlib.sha256(body).hexdigest()[:HASH_LENGTH]
+    return path.with_name(f"{path.stem}.{digest}{path.suffix}").as_posix()
+
+
+def rewrite_references(text, files):
+    """Quoted './name' references to already-hashed files, pointed at their hashed names."""
+    if not files:
+        return text
+    names = "|".join(re.escape(name) for name in sorted(files, key=len, reverse=True))
+    pattern = re.compile(rf"""(["'])\./({names})\1""")
+    return pattern.sub(lambda m: f"{m.group(1)}./{files[m.group(2)]}{m.group(1)}", text)
+
+
+def compressed_variants(path, body):
+    """{suffix: bytes} for the .gz and .br variants worth serving."""
+    if path.suffix not in COMPRESSIBLE or len(body) < MIN_COMPRESS_BYTES:
+        return {}
+    variants = {".gz": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(body, quality=11)
+    return {suffix: data for suffix, data in variants.items() if len(data) < len(body)}
+
+
+def write_file(out_dir, name, body, sizes):
+    """Writes name and its compressed variants; records their sizes."""
+    path = out_dir / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(body)
+    sizes[name] = {"bytes": len(body)}
+    for suffix, data in compressed_variants(path, body).items():
+        path.with_name(path.name + suffix).write_bytes(data)
+        sizes[name][suffix.lstrip(".")] = len(data)
+
+
+def _sources(root):
+    """Logical names of the files to publish, scripts first in dependency order."""
+    names = [name for name in SCRIPTS if (root / name).exists()]
+    for pattern in ASSETS:
+        names += sorted(p.relative_to(root).as_posix() for p in root.glob(pattern) if p.is_file())
+    return names
+
+
+def publish(out_dir=DIST_DIR, root=LOCAL_DIR):
+    """Builds the site in out_dir, replacing what was there. Returns the manifest."""
+    root, out_dir = Path(root), Path(out_dir)
+    staging = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    files, sizes = {}, {}
+    for name in _sources(root):
+        path = root / name
+        body = minify(path, path.read_bytes())
+        if name in SCRIPTS:
+            body = rewrite_references(body.decode("utf-8"), files).encode("utf-8")
+        files[name] = hashed_name(name, body)
+        write_file(staging, files[name], body, sizes)
+
+    for name in PAGES:
+        html = rewrite_references((root / name).read_text(encoding="utf-8"), files)
+        write_file(staging, name, html.encode("utf-8"), sizes)
+
+    build = hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()[:HASH_LENGTH]
+    manifest = {
+        "build": build,
+        "generated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "files": files,
+        "precache": [files.get(name, name) for name in PRECACHE if name in files or name in PAGES],
+    }
+    (staging / MANIFEST_NAME).write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(staging, out_dir)
+
+    raw = sum(s["bytes"] for s in sizes.values())
+    gz = sum(s.get("gz", s["bytes"]) for s in sizes.values())
+    print(f"Published {len(sizes)} files to {out_dir} (build {build})")
+    print(f"  {raw / 1e6:.2f} MB raw, {gz / 1e6:.2f} MB gzip", end="")
+    if brotli is not None:
+        br = sum(s.get("br", s["bytes"]) for s in sizes.values())
+        print(f", {br / 1e6:.2f} MB brotli")
+    else:
+        print("\n  brotli not installed (pip install brotli); wrote gzip variants only")
+    return manifest
+
+
+# ---------------------------------------------------------------------------
+# Local server
+# ---------------------------------------------------------------------------
+
+def accepted_encodings(header):
+    """Codings an Accept-Encoding header allows (q > 0)."""
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+class StaticHandler(SimpleHTTPRequestHandler):
+    """Serves a published site: precompressed variants, immutable hashed files."""
+
+    extensions_map = {
+        **SimpleHTTPRequestHandler.extensions_map,
+        ".js": "text/javascript",
+        ".json": "application/json",
+        ".bin": "application/octet-stream",
+    }
+
+    def send_head(self):
+        path = Path(self.translate_path(self.path))
+        if path.is_dir() and self.path.split("?")[0].endswith("/"):
+            path = path / "index.html"
+        if not path.is_file():
+            return super().send_head()
+
+        body_path, encoding = path, None
+        accepted = accepted_encodings(self.headers.get("Accept-Encoding"))
+        for coding, suffix in ENCODINGS.items():
+            variant = path.with_name(path.name + suffix)
+            if coding in accepted and variant.is_file():
+                body_path, encoding = variant, coding
+                break
+
+        stat = body_path.stat()
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}{"-" + encoding if encoding else ""}"'
+        cache = IMMUTABLE if HASHED_NAME.search(path.name) else REVALIDATE
+
+        if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self._send_cache_headers(etag, cache)
+            self.end_headers()
+            return None
+        if "If-None-Match" not in self.headers and self._not_modified_since(stat):
+            self.send_response(304)
+            self._send_cache_headers(etag, cache)
+            self.end_headers()
+            return None
+
+        f = open(body_path, "rb")
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(str(path)))
+        self.send_header("Content-Length", str(stat.st_size))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Last-Modified", self.date_time_string(stat.st_mtime))
+        self._send_cache_headers(etag, cache)
+        self.end_headers()
+        return f
+
+    def _send_cache_headers(self, etag, cache):
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", cache)
+        self.send_header("Vary", "Accept-Encoding")
+
+    def _not_modified_since(self, stat):
+        since = self.headers.get("If-Modified-Since")
+        if not since:
+            return False
+        try:
+            return int(stat.st_mtime) <= parsedate_to_datetime(since).timestamp()
+        except (TypeError, ValueError, OverflowError):
+            return False
+
+
+def serve(directory=DIST_DIR, host="localhost", port=8000):
+    """Serves a published site until interrupted."""
+    directory = Path(directory)
+    if not (directory / MANIFEST_NAME).exists():
+        raise SystemExit(f"{directory} has not been published; run python publish.py first")
+
+    def handler(*args, **kwargs):
+        return StaticHandler(*args, directory=str(directory), **kwargs)
+
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Serving {directory} at http://{host}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish the PiP Data Explorer as a static site")
+    commands = parser.add_subparsers(dest='command')
+
+    build = commands.add_parser('build', help="write the hashed, precompressed site")
+    build.add_argument('--out', default=str(DIST_DIR))
+
+    server = commands.add_parser('serve', help="serve a published site locally")
+    server.add_argument('--dir', default=str(DIST_DIR))
+    server.add_argument('--host', default='localhost')
+    server.add_argument('--port', type=int, default=8000)
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.dir, args.host, args.port)
+    else:
+        publish(getattr(args, 'out', DIST_DIR))
+
+
+if __name__ == "__main__":
+    main()
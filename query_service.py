@@ -0,0 +1,578 @@
+"""
+Pride in Place Data Explorer - Query Service
+A small read-only HTTP API over the processed data.
+
+The national tables (every England LSOA and MSOA, see national.py) are
+loaded once at startup and indexed by LSOA, MSOA, LA and region code, so a
+consumer can ask for the one area or slice it needs instead of downloading
+data.json and filtering it client-side.
+
+Endpoints (GET unless noted, JSON):
+
+    /areas/<code>                     one LSOA, MSOA, LA or region
+    /areas/<code>/children            the areas one level down
+    /areas/<code>/similar?limit=10    the MSOAs or LSOAs most like an MSOA or
+                                      LSOA (similarity.py)
+    /indicators                       MSOA indicator names
+    /indicators/<name>?within=<code>  MSOA values of one indicator, optionally
+                                      limited to an LA or region
+    /rank/<name>?within=<code>&order=desc&limit=20
+                                      MSOAs ranked by an indicator
+    /search?q=<text>&limit=8&level=msoa
+                                      areas by name or code (search_index.py)
+    /locate?lat=<lat>&lng=<lng>       the LSOA, MSOA and LA a point is in
+    POST /locate                      the same for {"points": [[lat, lng], ...]},
+                                      up to MAX_POINTS (and MAX_BODY_BYTES)
+                                      in one call
+    /near?lat=&lng=&km=1&level=msoa&limit=20
+                                      areas with a centroid within km, nearest
+                                      first (spatial_index.py)
+    /within?bbox=<west,south,east,north>&level=msoa
+                                      areas with a centroid inside the box
+    /export?codes=<code,...>&level=msoa&format=csv
+                                      the MSOAs or LSOAs in any of the codes
+                                      (all of England if none) as csv, xlsx
+                                      or geojson, streamed (export.py)
+
+Every response carries a strong ETag (If-None-Match gets a 304) and is held
+in an LRU cache keyed by path and query, so repeated requests are a dict
+lookup plus a socket write. POST /locate answers and exports are not
+cached; exports go out with chunked transfer encoding as they are encoded. Only the standard library and pandas are used.
+
+Usage:
+    python query_service.py [--host 127.0.0.1] [--port 8001] [--workers N]
+"""
+
+import argparse
+import functools
+import hashlib
+import json
+import math
+import os
+import signal
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlencode, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import bundle
+import export
+import national
+import search_index
+import similarity
+import spatial_index
+
+LOCAL_DIR = Path(__file__).parent
+AGGREGATES_FILE = LOCAL_DIR / "aggregates.bin"
+
+DEFAULT_PORT = 8001
+CACHE_SIZE = 4096
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 1000
+# Points geocoded by one POST /locate
+MAX_POINTS = 100_000
+# Largest POST body read; MAX_POINTS points at full float precision fit
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+# Level of an area code, by prefix
+LEVEL_PREFIXES = {
+    "E01": "lsoa",
+    "E02": "msoa",
+    "E12": "region",
+}
+
+
+class QueryError(Exception):
+    """A request the service cannot answer; carries the HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ---------------------------------------------------------------------------
+# Data and indexes
+# ---------------------------------------------------------------------------
+
+def _clean(value):
+    """JSON-safe scalar: numpy types unwrapped, NaN/inf as None."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if value is pd.NA:
+        return None
+    return value
+
+
+def _record(row):
+    return {k: _clean(v) for k, v in row.items() if _clean(v) is not None}
+
+
+class AreaIndex:
+    """The national tables indexed by code, with per-indicator sort orders."""
+
+    def __init__(self, areas, lsoas, aggregates=None, search=None, similar=None, spatial=None):
+        self.areas = areas.reset_index(drop=True)
+        self.lsoas = lsoas
+        self.aggregates = aggregates or {}
+        self.search_index = search
+        self.similar_index = similar
+        self.spatial_index = spatial
+
+        self.indicators = [
+            c for c in self.areas.select_dtypes(include=[np.number]).columns
+        ]
+        self.columns = {c: self.areas[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in self.indicators}
+        self.msoa_codes = self.areas['msoa_code'].to_numpy(dtype=object)
+        self.msoa_rows = {code: i for i, code in enumerate(self.msoa_codes)}
+        self.msoa_names = self.areas['neighbourhood_name'].to_numpy(dtype=object)
+        self._orders = {}
+
+        # Area records are built once so a lookup is a dict access, not a pandas row
+        self.msoa_records = [
+            dict(_record(row), level="msoa", parent=str(row['la_code']))
+            for row in self.areas.to_dict(orient='records')
+        ]
+        self.lsoa_records = {}
+        for code, row in zip(lsoas.index, lsoas.to_dict(orient='records')):
+            fields = {k: v for k, v in row.items() if k not in ('LSOA21NM', 'MSOA21CD', 'LAD22CD')}
+            self.lsoa_records[str(code)] = dict(
+                _record(fields), code=str(code), level="lsoa", name=str(row['LSOA21NM']),
+                parent=str(row['MSOA21CD']), la_code=str(row['LAD22CD']),
+            )
+
+        # Parent -> children, and code -> summary for the LA and region levels
+        self.children = {}
+        self.places = {}
+        for region_code, region in self.areas.groupby('region_code', observed=True):
+            self.places[str(region_code)] = {
+                "code": str(region_code), "level": "region", "name": str(region['region'].iloc[0]),
+            }
+            self.children[str(region_code)] = sorted(region['la_code'].astype(str).unique())
+        for la_code, la in self.areas.groupby('la_code', observed=True):
+            self.places[str(la_code)] = {
+                "code": str(la_code), "level": "la", "name": str(la['local_authority'].iloc[0]),
+                "parent": str(la['region_code'].iloc[0]),
+            }
+            self.children[str(la_code)] = la['msoa_code'].tolist()
+        for msoa_code, lsoa_codes in lsoas.groupby('MSOA21CD', observed=True).groups.items():
+            self.children[str(msoa_code)] = sorted(map(str, lsoa_codes))
+
+        # Row positions of the MSOAs inside each LA and region
+        self.members = {}
+        for column in ('la_code', 'region_code'):
+            for code, rows in self.areas.groupby(column, observed=True).indices.items():
+                self.members[str(code)] = rows
+
+    def level(self, code):
+        if code in self.places:
+            return self.places[code]["level"]
+        return LEVEL_PREFIXES.get(code[:3])
+
+    def area(self, code):
+        level = self.level(code)
+        if level == "msoa" and code in self.msoa_rows:
+            return self.msoa_records[self.msoa_rows[code]]
+        if level == "lsoa" and code in self.lsoa_records:
+            return self.lsoa_records[code]
+        if code in self.places:
+            result = dict(self.places[code], children=len(self.children.get(code, [])))
+            benchmarks = self.aggregates.get(result["level"], {}).get(code)
+            if benchmarks:
+                result["benchmarks"] = benchmarks
+            return result
+        raise QueryError(HTTPStatus.NOT_FOUND, f"Unknown area code: {code}")
+
+    def area_children(self, code):
+        self.area(code)
+        return {"code": code, "children": self.children.get(code, [])}
+
+    def similar_areas(self, code, limit=similarity.DEFAULT_K):
+        if self.similar_index is None:
+            raise QueryError(HTTPStatus.NOT_FOUND, "No similar areas index (run python similarity.py)")
+        area = self.area(code)
+        if area["level"] not in similarity.LEVELS:
+            raise QueryError(HTTPStatus.BAD_REQUEST, "Similar areas are only listed for MSOAs and LSOAs")
+        similar = []
+        for neighbour, distance in self.similar_index.similar(code, limit):
+            if area["level"] == "msoa" and neighbour in self.msoa_rows:
+                name = _clean(self.msoa_names[self.msoa_rows[neighbour]])
+            else:
+                name = self.lsoa_records.get(neighbour, {}).get("name")
+            similar.append({"code": neighbour, "name": name, "distance": distance})
+        return {"code": code, "similar": similar}
+
+    def _spatial(self, polygons=False):
+        if self.spatial_index is None or (polygons and self.spatial_index.polygons is None):
+            raise QueryError(HTTPStatus.NOT_FOUND, "No LSOA boundaries (run python spatial_index.py build)")
+        return self.spatial_index
+
+    def _spatial_level(self, level):
+        if level not in spatial_index.LEVELS:
+            raise QueryError(HTTPStatus.BAD_REQUEST, f"level must be one of {', '.join(spatial_index.LEVELS)}")
+        if level not in self._spatial().centroids:
+            raise QueryError(HTTPStatus.NOT_FOUND, f"No {level} centroids loaded")
+        return level
+
+    def locate(self, lat, lng):
+        """{lat, lng, lsoa, msoa, la} per point; None codes outside England."""
+        lat, lng = np.atleast_1d(lat), np.atleast_1d(lng)
+        found = self._spatial(polygons=True).locate(lat, lng)
+        return [
+            dict(lat=_clean(y), lng=_clean(x), **(area or {"lsoa": None, "msoa": None, "la": None}))
+            for y, x, area in zip(lat, lng, found)
+        ]
+
+    def near(self, lat, lng, km, level="msoa", limit=DEFAULT_LIMIT):
+        level = self._spatial_level(level)
+        areas = self.spatial_index.near(lat, lng, km, level, limit)
+        return {
+            "lat": lat, "lng": lng, "km": km, "level": level,
+            "areas": [{"code": code, "km": round(distance, 3)} for code, distance in areas],
+        }
+
+    def within(self, bbox, level="msoa"):
+        level = self._spatial_level(level)
+        west, south, east, north = bbox
+        return {"bbox": bbox, "level": level, "areas": self.spatial_index.within(south, west, north, east, level)}
+
+    def _rows_within(self, within):
+        if not within:
+            return np.arange(len(self.areas))
+        if within not in self.members:
+            raise QueryError(HTTPStatus.BAD_REQUEST, f"within must be an LA or region code, not {within}")
+        return self.members[within]
+
+    def _column(self, name):
+        if name not in self.columns:
+            raise QueryError(HTTPStatus.NOT_FOUND, f"Unknown indicator: {name}")
+        return self.columns[name]
+
+    def indicator(self, name, within=None):
+        values = self._column(name)
+        rows = self._rows_within(within)
+        return {
+            "indicator": name,
+            "within": within,
+            "values": {self.msoa_codes[i]: _clean(values[i]) for i in rows if not np.isnan(values[i])},
+        }
+
+    def rank(self, name, within=None, order="desc", limit=DEFAULT_LIMIT):
+        values = self._column(name)
+        if order not in ("asc", "desc"):
+            raise QueryError(HTTPStatus.BAD_REQUEST, "order must be asc or desc")
+
+        # One argsort per indicator, reused by every ranked request
+        if name not in self._orders:
+            ranked = np.argsort(values, kind='stable')
+            self._orders[name] = ranked[~np.isnan(values[ranked])]
+        ranked = self._orders[name]
+        if order == "desc":
+            ranked = ranked[::-1]
+        if within:
+            ranked = ranked[np.isin(ranked, self._rows_within(within), assume_unique=True)]
+
+        return {
+            "indicator": name,
+            "within": within,
+            "order": order,
+            "total": int(len(ranked)),
+            "areas": [
+                {
+                    "rank": position + 1,
+                    "msoa_code": self.msoa_codes[i],
+                    "name": _clean(self.msoa_names[i]),
+                    "value": _clean(values[i]),
+                }
+                for position, i in enumerate(ranked[:limit])
+            ],
+        }
+
+
+    def search(self, query, limit=search_index.DEFAULT_LIMIT, level=None):
+        if self.search_index is None:
+            raise QueryError(HTTPStatus.NOT_FOUND, "No search index (run python search_index.py)")
+        levels = level.split(',') if level else None
+        if levels and not set(levels) <= set(search_index.LEVELS):
+            raise QueryError(HTTPStatus.BAD_REQUEST, f"level must be one of {', '.join(search_index.LEVELS)}")
+        return {"query": query, "areas": self.search_index.search(query, limit, levels)}
+
+
+def load_aggregates(path=AGGREGATES_FILE):
+    """aggregates.bin as {level: {code: {column: value}}}, or {} if missing."""
+    if not Path(path).exists():
+        return {}
+    tables = bundle.decode_bundle(Path(path).read_bytes())
+    return {level: {row["code"]: row for row in rows} for level, rows in tables.items()}
+
+
+def load_index(build_dir=national.BUILD_DIR):
+    """Load and join the national tables once and index them."""
+    start = time.perf_counter()
+    lookup = national.load_lookup()
+    areas, lsoas = national.load_tables(lookup, build_dir)
+    search = search_index.SearchIndex.load() if search_index.SEARCH_INDEX_FILE.exists() else None
+    similar = similarity.SimilarAreas.load() if similarity.SIMILAR_FILE.exists() else None
+    spatial = spatial_index.SpatialIndex.load(lookup=lookup)
+    index = AreaIndex(areas, lsoas, load_aggregates(), search, similar, spatial)
+    print(f"  Indexed {len(areas):,} MSOAs and {len(lsoas):,} LSOAs in {time.perf_counter() - start:.1f}s")
+    return index
+
+
+# ---------------------------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------------------------
+
+class QueryService:
+    """Routes a request path to the index and caches encoded responses."""
+
+    def __init__(self, index, cache_size=CACHE_SIZE):
+        self.index = index
+        self.respond = functools.lru_cache(maxsize=cache_size)(self._respond)
+
+    @staticmethod
+    def _limit(query, default):
+        try:
+            return max(0, min(int(query.get('limit', default)), MAX_LIMIT))
+        except ValueError:
+            raise QueryError(HTTPStatus.BAD_REQUEST, "limit must be an integer")
+
+    @staticmethod
+    def _numbers(query, *names):
+        try:
+            values = [float(query[name]) for name in names]
+        except KeyError as exc:
+            raise QueryError(HTTPStatus.BAD_REQUEST, f"{exc.args[0]} is required")
+        except ValueError:
+            raise QueryError(HTTPStatus.BAD_REQUEST, f"{', '.join(names)} must be numbers")
+        if not all(math.isfinite(v) for v in values):
+            raise QueryError(HTTPStatus.BAD_REQUEST, f"{', '.join(names)} must be finite")
+        return values
+
+    def _bbox(self, query):
+        parts = query.get('bbox', '').split(',')
+        if len(parts) != 4:
+            raise QueryError(HTTPStatus.BAD_REQUEST, "bbox must be west,south,east,north")
+        return self._numbers(dict(zip('wsen', parts)), *'wsen')
+
+    def _route(self, path, query):
+        parts = [unquote(p) for p in path.strip('/').split('/') if p]
+        within = query.get('within')
+
+        if parts == ['indicators']:
+            return {"indicators": self.index.indicators}
+        if len(parts) == 2 and parts[0] == 'indicators':
+            return self.index.indicator(parts[1], within)
+        if len(parts) == 2 and parts[0] == 'rank':
+            limit = self._limit(query, DEFAULT_LIMIT)
+            return self.index.rank(parts[1], within, query.get('order', 'desc'), limit)
+        if parts == ['search']:
+            limit = self._limit(query, search_index.DEFAULT_LIMIT)
+            return self.index.search(query.get('q', ''), limit, query.get('level'))
+        if len(parts) == 2 and parts[0] == 'areas':
+            return self.index.area(parts[1])
+        if len(parts) == 3 and parts[0] == 'areas' and parts[2] == 'children':
+            return self.index.area_children(parts[1])
+        if len(parts) == 3 and parts[0] == 'areas' and parts[2] == 'similar':
+            return self.index.similar_areas(parts[1], self._limit(query, similarity.DEFAULT_K))
+        if parts == ['locate']:
+            return self.index.locate(*self._numbers(query, 'lat', 'lng'))[0]
+        if parts == ['near']:
+            lat, lng, km = self._numbers(dict({'km': 1}, **query), 'lat', 'lng', 'km')
+            limit = self._limit(query, DEFAULT_LIMIT)
+            return self.index.near(lat, lng, km, query.get('level', 'msoa'), limit)
+        if parts == ['within']:
+            return self.index.within(self._bbox(query), query.get('level', 'msoa'))
+        raise QueryError(HTTPStatus.NOT_FOUND, f"No such endpoint: {path}")
+
+    def _respond(self, path, query_string):
+        """(status, body bytes, etag) for a path and canonical query string."""
+        query = {k: v[-1] for k, v in parse_qs(query_string).items()}
+        try:
+            status, payload = HTTPStatus.OK, self._route(path, query)
+        except QueryError as exc:
+            status, payload = exc.status, {"error": str(exc)}
+        body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        return status, body, etag
+
+    def export(self, query_string):
+        """(status, headers, chunks) for /export; chunks is a generator of bytes."""
+        query = {k: v[-1] for k, v in parse_qs(query_string).items()}
+        fmt, level = query.get('format', 'csv'), query.get('level', 'msoa')
+        codes = [c for c in query.get('codes', '').split(',') if c]
+        try:
+            if fmt not in export.FORMATS:
+                raise ValueError(f"format must be one of {', '.join(export.FORMATS)}")
+            rows = export.select(self.index.areas, self.index.lsoas, codes, level)
+        except ValueError as exc:
+            body = json.dumps({"error": str(exc)}, separators=(',', ':')).encode('utf-8')
+            return HTTPStatus.BAD_REQUEST, {'Content-Type': 'application/json; charset=utf-8'}, iter([body])
+
+        spatial = self.index.spatial_index
+        polygons = spatial.polygons if spatial is not None else None
+        headers = {
+            'Content-Type': export.FORMATS[fmt],
+            'Content-Disposition': f'attachment; filename="pip_{level}.{fmt}"',
+        }
+        return HTTPStatus.OK, headers, export.stream(rows, fmt, level, polygons)
+
+    def _locate_batch(self, body):
+        try:
+            points = json.loads(body)["points"]
+            lat = np.array([p[0] for p in points], dtype=np.float64)
+            lng = np.array([p[1] for p in points], dtype=np.float64)
+        except (ValueError, KeyError, TypeError, IndexError):
+            raise QueryError(HTTPStatus.BAD_REQUEST, 'Body must be {"points": [[lat, lng], ...]}')
+        if len(points) > MAX_POINTS:
+            raise QueryError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"At most {MAX_POINTS:,} points per request")
+        return {"areas": self.index.locate(lat, lng)}
+
+    def respond_post(self, path, body):
+        """(status, body bytes) for a POST; only /locate takes one."""
+        try:
+            if path.strip('/') != 'locate':
+                raise QueryError(HTTPStatus.NOT_FOUND, f"No such endpoint: POST {path}")
+            status, payload = HTTPStatus.OK, self._locate_batch(body)
+        except QueryError as exc:
+            status, payload = exc.status, {"error": str(exc)}
+        return status, json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        server_version = "PiPQuery/1.0"
+        # Headers and body are separate writes; without this a keep-alive
+        # client waits ~40ms for the delayed ACK on every response
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path.rstrip('/') == '/export':
+                self._stream(*service.export(url.query))
+                return
+            # Canonical query string so ?a=1&b=2 and ?b=2&a=1 share a cache
+            # entry; parsed first, so the last of a repeated parameter wins
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            status, body, etag = service.respond(url.path, urlencode(sorted(query.items())))
+
+            cached = [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]
+            if status == HTTPStatus.OK and etag in cached:
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'public, max-age=300')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self, status, headers, chunks):
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            for data in chunks:
+                if data:
+                    self.wfile.write(b'%X\r\n%s\r\n' % (len(data), data))
+            self.wfile.write(b'0\r\n\r\n')
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                length = -1
+            if 0 <= length <= MAX_BODY_BYTES:
+                status, body = service.respond_post(urlsplit(self.path).path, self.rfile.read(length))
+            else:
+                # Refused unread, so the connection cannot be reused
+                self.close_connection = True
+                if length < 0:
+                    status, message = HTTPStatus.BAD_REQUEST, "Content-Length must be a byte count"
+                else:
+                    status, message = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"At most {MAX_BODY_BYTES:,} bytes per request"
+                body = json.dumps({"error": message}).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Access-Control-Allow-Origin', '*')
+            if self.close_connection:
+                self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def make_server(index, host='127.0.0.1', port=DEFAULT_PORT, cache_size=CACHE_SIZE):
+    """A threaded HTTP server (one thread per connection) over index."""
+    return Server((host, port), make_handler(QueryService(index, cache_size)))
+
+
+def serve(server, workers=1):
+    """Serve forever, forking extra worker processes on the same socket.
+
+    The index is built before the fork, so workers share it copy-on-write
+    and each adds a core's worth of request handling (POSIX only).
+    """
+    children = []
+    if workers > 1 and hasattr(os, 'fork'):
+        for _ in range(workers - 1):
+            pid = os.fork()
+            if pid == 0:
+                children = None
+                break
+            children.append(pid)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for pid in children or []:
+            os.kill(pid, signal.SIGTERM)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query service for the PiP Data Explorer")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--build-dir', default=str(national.BUILD_DIR), help="pipeline intermediate tables")
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help="responses kept in the LRU")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="processes serving the same socket (default: CPU count)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Pride in Place Data Explorer - Query Service")
+    print("=" * 60)
+    index = load_index(args.build_dir)
+    server = make_server(index, args.host, args.port, args.cache_size)
+    print(f"  Serving on http://{args.host}:{args.port}/ ({args.workers} worker(s))", flush=True)
+    serve(server, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Pride in Place Data Explorer - Search Index
+Prebuilt name and code search over every LSOA, MSOA, LA and region in England.
+
+The search box used to lowercase and substring-scan every area's name, LA
+and code on each keystroke. That is fine for 40 areas but not for the ~41k
+areas in England, so this module builds the index once:
+
+    entries   one row per area: code, display name, level (index into
+              LEVELS), parent (entry number of its LA, or region for an LA)
+              and, for an LSOA, the entry number of the MSOA the dashboard opens
+    tokens    every distinct word in the areas' names (ONS names, the
+              OCSI "Area Name" labels and the dashboard's own names), sorted,
+              with the run of postings for each
+    postings  entry number << 2 | flags, where FIRST marks a name's first
+              word and CONTEXT a word that only appears in the area's LA
+    words     each entry's own run of words (word number << 2 | flags), so
+              the rarer query words can pick the candidates and the rest are
+              checked per candidate (entries "ws" and "wn" give the run)
+    codes     entry numbers sorted by code, for code prefix lookups
+
+Entries are stored in rank order (regions, LAs, MSOAs, LSOAs, then by name),
+so ties in match quality fall back to the entry number. A query word matches
+a token exactly, as a prefix or (from two letters on) as a substring. The tokens are also kept as
+one newline-joined string, so finding every token containing a word is a
+single string scan over ~10k short words rather than ~41k names. An area
+matches when every query word matches one of its tokens. Its score is the
+sum of each word's best match. search_reader.js answers dashboard keystrokes
+the same way; SearchIndex below is the Python equivalent used by
+query_service.py.
+
+Usage:
+    python search_index.py [--out search_index.bin]
+    python search_index.py --query "kingston 01"
+"""
+
+import argparse
+import bisect
+import json
+import re
+import time
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import bundle
+import data_gatherer
+import national
+import workbooks
+
+LOCAL_DIR = Path(__file__).parent
+SEARCH_INDEX_FILE = LOCAL_DIR / "search_index.bin"
+
+# Static rank of each level: ties in match quality list regions first
+LEVELS = ["region", "la", "msoa", "lsoa"]
+
+# Posting flags (low bits of each posting)
+FIRST = 1
+CONTEXT = 2
+FLAG_BITS = 2
+
+# Match quality of a query word against a token; each step is worth two
+# points so a CONTEXT match (-1) or a FIRST match of the first word (+1)
+# only reorders areas within a quality band
+EXACT, PREFIX, SUBSTRING = 3, 2, 1
+
+# A lone word like "e02" or "e0200123" is looked up as a code prefix
+CODE_PATTERN = re.compile(r"^[a-z]\d+$")
+
+DEFAULT_LIMIT = 8
+
+
+def normalise(text):
+    """Lowercase ASCII form of a name, with accents folded."""
+    text = unicodedata.normalize('NFKD', str(text))
+    return text.encode('ascii', 'ignore').decode('ascii').lower()
+
+
+def words(text):
+    return re.findall(r"[a-z0-9]+", normalise(text))
+
+
+# ---------------------------------------------------------------------------
+# Building
+# ---------------------------------------------------------------------------
+
+def load_area_names(paths):
+    """MSOA code -> "Area Name" from the OCSI extracts (HLNM, CNI) that exist."""
+    names = {}
+    for path in paths:
+        if not Path(path).exists():
+            continue
+        df = workbooks.read_table(path, usecols=['Area Code', 'Area Name'])
+        for code, name in zip(df['Area Code'], df['Area Name']):
+            if isinstance(code, str) and isinstance(name, str):
+                names.setdefault(code, name)
+    return names
+
+
+def load_dashboard_names(areas_file=bundle.AREAS_FILE):
+    """MSOA code -> neighbourhood name used by the dashboard, if data.json exists."""
+    if not Path(areas_file).exists():
+        return {}
+    data = json.loads(Path(areas_file).read_text(encoding='utf-8-sig'))
+    return {
+        area['msoa_code']: area['neighbourhood_name']
+        for area in data.get('areas', [])
+        if area.get('neighbourhood_name')
+    }
+
+
+def build_entries(lookup, area_names=None, dashboard_names=None):
+    """One row per area in rank order, with every name it can be found by.
+
+    The display name prefers the dashboard's name, then the OCSI label, then
+    the ONS name; the others are kept as aliases.
+    """
+    area_names = area_names or {}
+    dashboard_names = dashboard_names or {}
+    lookup = lookup.reset_index().astype(str)
+
+    regions = lookup.drop_duplicates('RGN22CD')
+    las = lookup.drop_duplicates('LAD22CD')
+    msoas = lookup.drop_duplicates('MSOA21CD')
+    frames = [
+        pd.DataFrame({'code': regions['RGN22CD'], 'ons': regions['RGN22NM'], 'level': 'region',
+                      'parent': None, 'context': 'England', 'msoa': None}),
+        pd.DataFrame({'code': las['LAD22CD'], 'ons': las['LAD22NM'], 'level': 'la',
+                      'parent': las['RGN22CD'], 'context': las['RGN22NM'], 'msoa': None}),
+        pd.DataFrame({'code': msoas['MSOA21CD'], 'ons': msoas['MSOA21NM'], 'level': 'msoa',
+                      'parent': msoas['LAD22CD'], 'context': msoas['LAD22NM'], 'msoa': None}),
+        pd.DataFrame({'code': lookup['LSOA21CD'], 'ons': lookup['LSOA21NM'], 'level': 'lsoa',
+                      'parent': lookup['LAD22CD'], 'context': lookup['LAD22NM'], 'msoa': lookup['MSOA21CD']}),
+    ]
+    entries = pd.concat(frames, ignore_index=True)
+
+    names = []
+    for code, ons in zip(entries['code'], entries['ons']):
+        candidates = [dashboard_names.get(code), area_names.get(code), ons]
+        names.append(list(dict.fromkeys(n for n in candidates if n)))
+    entries['names'] = names
+    entries['name'] = [n[0] for n in names]
+
+    entries['rank'] = entries['level'].map(LEVELS.index)
+    entries = entries.sort_values(['rank', 'name', 'code'], kind='stable').reset_index(drop=True)
+    return entries.drop(columns=['rank', 'ons'])
+
+
+def entry_tokens(names, context):
+    """{token: flags} for one area's names and context."""
+    flags = {}
+    for token in words(context):
+        flags[token] = CONTEXT
+    for name in names:
+        for position, token in enumerate(words(name)):
+            # A word in the name outranks the same word from the context
+            flag = FIRST if position == 0 else 0
+            flags[token] = flag if flags.get(token, CONTEXT) == CONTEXT else flags[token] | flag
+    return flags
+
+
+def build_postings(entries):
+    """Sorted tokens, and the postings and per-entry word runs built on them.
+
+    Returns (tokens, starts, counts, postings, forward), where forward is a
+    list per entry of token number << FLAG_BITS | flags.
+    """
+    per_entry = [entry_tokens(names, context) for names, context in zip(entries['names'], entries['context'])]
+    tokens = sorted({token for flags in per_entry for token in flags})
+    number = {token: i for i, token in enumerate(tokens)}
+
+    postings = [[] for _ in tokens]
+    forward = []
+    for entry, flags in enumerate(per_entry):
+        run = sorted(number[token] << FLAG_BITS | flag for token, flag in flags.items())
+        for packed in run:
+            postings[packed >> FLAG_BITS].append(entry << FLAG_BITS | packed & ((1 << FLAG_BITS) - 1))
+        forward.append(run)
+
+    counts = np.array([len(p) for p in postings], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    flat = np.array([p for run in postings for p in run], dtype=np.int64)
+    return tokens, starts, counts, flat, forward
+
+
+def encode_search_index(entries, metadata=None):
+    """The search index tables as data bundle bytes."""
+    tokens, starts, counts, postings, forward = build_postings(entries)
+    codes = np.argsort(entries['code'].str.lower().to_numpy(), kind='stable')
+
+    # Levels and parents are small integers rather than repeated strings
+    number = {code: i for i, code in enumerate(entries['code'])}
+    entry_rows = []
+    word_start = 0
+    rows = entries[['code', 'name', 'level', 'parent', 'msoa']].itertuples(index=False)
+    for (code, name, level, parent, msoa), run in zip(rows, forward):
+        row = {"code": code, "name": name, "level": LEVELS.index(level), "ws": word_start, "wn": len(run)}
+        word_start += len(run)
+        if isinstance(parent, str):
+            row["parent"] = number[parent]
+        if isinstance(msoa, str):
+            row["msoa"] = number[msoa]
+        entry_rows.append(row)
+    tables = {
+        "entries": (entry_rows, {"key": "code"}),
+        "tokens": ([{"t": t, "start": int(s), "n": int(n)} for t, s, n in zip(tokens, starts, counts)], {}),
+        "postings": ([{"p": int(p)} for p in postings], {}),
+        "words": ([{"w": w} for run in forward for w in run], {}),
+        "codes": ([{"e": int(e)} for e in codes], {}),
+    }
+    return bundle.encode_bundle(tables, dict(metadata or {}, flag_bits=FLAG_BITS, levels=LEVELS))
+
+
+def build_search_index(out_path=SEARCH_INDEX_FILE, lookup_path=national.LOOKUP_FILE,
+                       areas_file=bundle.AREAS_FILE):
+    """Build the national search index and write search_index.bin."""
+    start = time.perf_counter()
+    lookup = national.load_lookup(lookup_path)
+    area_names = load_area_names([data_gatherer.HLNM_FILE] + list(data_gatherer.CNI_FILES.values()))
+    entries = build_entries(lookup, area_names, load_dashboard_names(areas_file))
+
+    payload = encode_search_index(entries, {"generated": pd.Timestamp.now().isoformat(timespec='seconds')})
+    Path(out_path).write_bytes(payload)
+    index = SearchIndex(payload)
+    print(f"  Indexed {len(entries):,} areas ({len(index.tokens):,} words, "
+          f"{len(index.postings):,} postings): {len(payload):,} bytes in {time.perf_counter() - start:.1f}s")
+    return index
+
+
+# ---------------------------------------------------------------------------
+# Querying
+# ---------------------------------------------------------------------------
+
+class SearchIndex:
+    """Ranked lookups over a search_index.bin payload."""
+
+    def __init__(self, payload):
+        tables = bundle.decode_bundle(payload)
+        rows = tables["entries"]
+        self.entries = []
+        for row in rows:
+            entry = {"code": row["code"], "name": row["name"], "level": LEVELS[row["level"]]}
+            entry["context"] = rows[row["parent"]]["name"] if "parent" in row else "England"
+            entry["msoa"] = rows[row["msoa"]]["code"] if "msoa" in row else None
+            if entry["level"] == "msoa":
+                entry["msoa"] = entry["code"]
+            self.entries.append(entry)
+        self.levels = np.array([row["level"] for row in rows], dtype=np.int64)
+        self.tokens = [row["t"] for row in tables["tokens"]]
+        self.starts = np.array([row["start"] for row in tables["tokens"]], dtype=np.int64)
+        self.counts = np.array([row["n"] for row in tables["tokens"]], dtype=np.int64)
+        self.postings = np.array([row["p"] for row in tables["postings"]], dtype=np.int64)
+        self.codes = [self.entries[row["e"]]["code"].lower() for row in tables["codes"]]
+        self.code_entries = [row["e"] for row in tables["codes"]]
+
+        # "\n" + tokens joined by "\n": token i starts at offsets[i]
+        self.lengths = np.array([len(t) for t in self.tokens], dtype=np.int64)
+        self.offsets = np.concatenate([[1], 1 + np.cumsum(self.lengths + 1)[:-1]])
+        self.joined = "\n" + "\n".join(self.tokens) + "\n"
+
+    @classmethod
+    def load(cls, path=SEARCH_INDEX_FILE):
+        return cls(Path(path).read_bytes())
+
+    def match_tokens(self, word):
+        """(token ids, quality) of every token containing word.
+
+        A single letter only matches the start of a token; as a substring it
+        would match most of them.
+        """
+        needle = word if len(word) > 1 else "\n" + word
+        skip = len(needle) - len(word)
+        positions = np.array([m.start() + skip for m in re.finditer(re.escape(needle), self.joined)],
+                             dtype=np.int64)
+        if len(positions) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        token_ids = np.searchsorted(self.offsets, positions, side='right') - 1
+        at_start = positions == self.offsets[token_ids]
+        whole = at_start & (self.lengths[token_ids] == len(word))
+        quality = np.where(whole, EXACT, np.where(at_start, PREFIX, SUBSTRING))
+        # A token can contain the word more than once; keep its best match
+        order = np.lexsort((-quality, token_ids))
+        token_ids, quality = token_ids[order], quality[order]
+        first = np.r_[True, token_ids[1:] != token_ids[:-1]]
+        return token_ids[first], quality[first]
+
+    def search_codes(self, word, limit, levels=None):
+        position = bisect.bisect_left(self.codes, word)
+        results = []
+        while position < len(self.codes) and self.codes[position].startswith(word) and len(results) < limit:
+            entry = self.entries[self.code_entries[position]]
+            if levels is None or entry["level"] in levels:
+                results.append(entry)
+            position += 1
+        return results
+
+    def search(self, query, limit=DEFAULT_LIMIT, levels=None):
+        """The best limit areas for query, as entry dicts, best first."""
+        terms = words(query)
+        if not terms:
+            return []
+        if len(terms) == 1 and CODE_PATTERN.match(terms[0]):
+            return self.search_codes(terms[0], limit, levels)
+
+        n = len(self.entries)
+        score = np.zeros(n, dtype=np.int64)
+        alive = None
+        for j, term in enumerate(terms):
+            token_ids, quality = self.match_tokens(term)
+            if len(token_ids) == 0:
+                return []
+            counts = self.counts[token_ids]
+            # Posting positions of every matched token, with its quality
+            spans = np.repeat(self.starts[token_ids] - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+            postings = self.postings[spans + np.arange(counts.sum())]
+            flags = postings & ((1 << FLAG_BITS) - 1)
+            points = np.repeat(quality, counts) * 2 - ((flags & CONTEXT) > 0)
+            if j == 0:
+                points = points + ((flags & FIRST) > 0)
+            best = np.zeros(n, dtype=np.int64)
+            np.maximum.at(best, postings >> FLAG_BITS, points)
+            alive = best > 0 if alive is None else alive & (best > 0)
+            score += best
+
+        candidates = np.flatnonzero(alive)
+        if levels is not None:
+            candidates = candidates[np.isin(self.levels[candidates], [LEVELS.index(lv) for lv in levels])]
+        order = np.lexsort((candidates, -score[candidates]))[:limit]
+        return [self.entries[e] for e in candidates[order]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search index for the PiP Data Explorer")
+    parser.add_argument('--out', default=str(SEARCH_INDEX_FILE))
+    parser.add_argument('--query', help="search the existing index instead of building it")
+    args = parser.parse_args()
+
+    if args.query:
+        index = SearchIndex.load(args.out)
+        start = time.perf_counter()
+        results = index.search(args.query)
+        elapsed = (time.perf_counter() - start) * 1000
+        for entry in results:
+            print(f"  {entry['name']:<50} {entry['level']:<7} {entry.get('context', '')} {entry['code']}")
+        print(f"  ({len(results)} results in {elapsed:.2f} ms)")
+        return
+
+    print("=" * 60)
+    print("Pride in Place Data Explorer - Search Index")
+    print("=" * 60)
+    build_search_index(args.out)
+
+
+if __name__ == "__main__":
+    main()
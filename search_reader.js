@@ -0,0 +1,217 @@
+// Pride in Place Data Explorer - search index reader
+// Answers search-box queries from search_index.bin (written by
+// search_index.py, which documents the layout and the ranking). The
+// postings stay typed views onto the fetched buffer; the only up-front work
+// is decoding the ~8k distinct words into one string that indexOf can scan.
+
+(function (root) {
+    const readBundle = root.PipBundle
+        ? root.PipBundle.readBundle
+        : require('./bundle_reader.js').readBundle;
+
+    const FIRST = 1;
+    const CONTEXT = 2;
+    const EXACT = 3, PREFIX = 2, SUBSTRING = 1;
+    const CODE_PATTERN = /^[a-z]\d+$/;
+
+    function normalise(text) {
+        return String(text).normalize('NFKD').replace(/[\u0300-\u036f]/g, '').toLowerCase();
+    }
+
+    function words(text) {
+        return normalise(text).match(/[a-z0-9]+/g) || [];
+    }
+
+    // Two points per quality step; a CONTEXT word costs one, and the first
+    // query word matching the start of a name earns one
+    function points(quality, flags, firstWord) {
+        return quality * 2 - (flags & CONTEXT ? 1 : 0) + (firstWord && (flags & FIRST) ? 1 : 0);
+    }
+
+    class SearchIndex {
+        constructor(bundle) {
+            const { entries, tokens, postings, words: entryWords, codes } = bundle.tables;
+            this.table = entries;
+            this.levels = bundle.metadata.levels;
+            this.flagBits = bundle.metadata.flag_bits;
+            this.starts = tokens.columns.start.values;
+            this.counts = tokens.columns.n.values;
+            this.postings = postings.columns.p.values;
+            this.words = entryWords.columns.w.values;
+            this.wordStarts = entries.columns.ws.values;
+            this.wordCounts = entries.columns.wn.values;
+            this.codes = codes.columns.e.values;
+            this.entries = new Array(entries.rows);
+
+            // "\n" + words joined by "\n"; word i starts at offsets[i]
+            const words = tokens.column('t');
+            this.lengths = new Uint16Array(words.length);
+            this.offsets = new Uint32Array(words.length);
+            let position = 1;
+            for (let i = 0; i < words.length; i++) {
+                this.offsets[i] = position;
+                this.lengths[i] = words[i].length;
+                position += words[i].length + 1;
+            }
+            this.joined = '\n' + words.join('\n') + '\n';
+
+            // Scratch space reused by every query
+            this.best = new Uint8Array(entries.rows);
+        }
+
+        // {code, name, level, context, msoa} for an entry number, decoded once
+        entry(e) {
+            let entry = this.entries[e];
+            if (!entry) {
+                const t = this.table;
+                const parent = t.value(e, 'parent');
+                const msoa = t.value(e, 'msoa');
+                entry = {
+                    code: t.value(e, 'code'),
+                    name: t.value(e, 'name'),
+                    level: this.levels[t.value(e, 'level')],
+                    context: parent === null ? 'England' : t.value(parent, 'name'),
+                    msoa: msoa === null ? null : t.value(msoa, 'code')
+                };
+                if (entry.level === 'msoa') entry.msoa = entry.code;
+                this.entries[e] = entry;
+            }
+            return entry;
+        }
+
+        // Word number containing a position of the joined string
+        tokenAt(position) {
+            let low = 0, high = this.offsets.length - 1;
+            while (low < high) {
+                const mid = (low + high + 1) >> 1;
+                if (this.offsets[mid] <= position) low = mid;
+                else high = mid - 1;
+            }
+            return low;
+        }
+
+        // Map of word number -> match quality for every word containing term;
+        // a single letter only matches the start of a word
+        matchTokens(term) {
+            const found = new Map();
+            const needle = term.length > 1 ? term : '\n' + term;
+            const skip = needle.length - term.length;
+            let position = this.joined.indexOf(needle);
+            while (position !== -1) {
+                const token = this.tokenAt(position + skip);
+                const quality = position + skip > this.offsets[token]
+                    ? SUBSTRING
+                    : (this.lengths[token] === term.length ? EXACT : PREFIX);
+                if (!(found.get(token) >= quality)) found.set(token, quality);
+                position = this.joined.indexOf(needle, position + 1);
+            }
+            return found;
+        }
+
+        searchCodes(term, limit, accept) {
+            const results = [];
+            let low = 0, high = this.codes.length;
+            while (low < high) {
+                const mid = (low + high) >> 1;
+                if (this.entry(this.codes[mid]).code.toLowerCase() < term) low = mid + 1;
+                else high = mid;
+            }
+            for (let i = low; i < this.codes.length && results.length < limit; i++) {
+                const entry = this.entry(this.codes[i]);
+                if (!entry.code.toLowerCase().startsWith(term)) break;
+                if (!accept || accept(entry)) results.push(entry);
+            }
+            return results;
+        }
+
+        // Points for the best of an entry's own words matching a query word
+        // (found: word number -> quality, from matchTokens)
+        wordPoints(e, found, firstWord) {
+            const end = this.wordStarts[e] + this.wordCounts[e];
+            let best = 0;
+            for (let i = this.wordStarts[e]; i < end; i++) {
+                const w = this.words[i];
+                const quality = found.get(w >> this.flagBits);
+                if (quality) best = Math.max(best, points(quality, w, firstWord));
+            }
+            return best;
+        }
+
+        // The best limit entries for query, best first. accept(entry) can
+        // reject entries (e.g. areas the page cannot show); it is only called
+        // for entries that would otherwise make the list.
+        search(query, limit = 8, accept = null) {
+            const terms = words(query);
+            if (!terms.length) return [];
+            if (terms.length === 1 && CODE_PATTERN.test(terms[0])) {
+                return this.searchCodes(terms[0], limit, accept);
+            }
+
+            // The query word with the fewest postings picks the candidates
+            const matches = terms.map(term => this.matchTokens(term));
+            let driver = 0, fewest = Infinity;
+            matches.forEach((found, j) => {
+                let n = 0;
+                for (const token of found.keys()) n += this.counts[token];
+                if (n < fewest) {
+                    fewest = n;
+                    driver = j;
+                }
+            });
+            if (fewest === 0) return [];
+
+            const { best, postings, flagBits } = this;
+            const candidates = [];
+            for (const [token, quality] of matches[driver]) {
+                const end = this.starts[token] + this.counts[token];
+                for (let i = this.starts[token]; i < end; i++) {
+                    const p = postings[i];
+                    const e = p >> flagBits;
+                    if (best[e] === 0) candidates.push(e);
+                    best[e] = Math.max(best[e], points(quality, p, driver === 0));
+                }
+            }
+
+            // Every other word must match one of the candidate's own words;
+            // keep the top entries by score, then entry number (rank order)
+            const top = [];
+            for (const e of candidates) {
+                let s = best[e];
+                best[e] = 0;
+                for (let j = 0; j < terms.length && s > 0; j++) {
+                    if (j !== driver) {
+                        const w = this.wordPoints(e, matches[j], j === 0);
+                        s = w ? s + w : 0;
+                    }
+                }
+                if (s === 0) continue;
+                if (top.length === limit) {
+                    const last = top[limit - 1];
+                    if (s < last.s || (s === last.s && e > last.e)) continue;
+                }
+                if (accept && !accept(this.entry(e))) continue;
+                let i = top.length;
+                while (i > 0 && (top[i - 1].s < s || (top[i - 1].s === s && top[i - 1].e > e))) i--;
+                top.splice(i, 0, { e, s });
+                if (top.length > limit) top.pop();
+            }
+            return top.map(({ e }) => this.entry(e));
+        }
+    }
+
+    // The content-hashed name when publish.py's manifest is loaded (asset_manifest.js)
+    const assetUrl = url => (root.PipAssets ? root.PipAssets.assetUrl(url) : url);
+
+    async function loadSearchIndex(url) {
+        const response = await fetch(assetUrl(url));
+        if (!response.ok) throw new Error(`Failed to load ${url}: ${response.status}`);
+        return new SearchIndex(readBundle(await response.arrayBuffer()));
+    }
+
+    const api = { SearchIndex, loadSearchIndex, words };
+    if (typeof module !== 'undefined' && module.exports) {
+        module.exports = api;
+    } else {
+        root.PipSearch = api;
+    }
+})(typeof self !== 'undefined' ? self : this);
@@ -0,0 +1,226 @@
+// Pride in Place Data Explorer - offline cache
+// Service Worker for the site publish.py writes to dist/. It keeps the app
+// shell and data bundle of the current build (the manifest's precache list),
+// plus the LA shards, boundary tiles, search index and CARTO basemap tiles
+// already used in bounded LRU caches, so an area seen before renders
+// straight from the cache, on a poor connection or none.
+//
+// Every published file but index.html, manifest.json and this script has a
+// content-hashed name, so a cached copy is never stale and is served without
+// asking the network. New builds arrive through manifest.json, which the
+// page loads on every visit: it is fetched from the network first, and when
+// it names a build not cached yet that build's shell is precached, becomes
+// current, and is what the next visit loads. index.html registers this
+// worker only when a manifest was found, so the repository served as it is
+// (unhashed names) is never cached.
+
+const SCOPE = self.registration.scope;
+const MANIFEST_URL = new URL('manifest.json', SCOPE).href;
+const INDEX_URL = new URL('index.html', SCOPE).href;
+// The current build's manifest, which names the shell cache to serve from
+const META_CACHE = 'pip-meta';
+const SHELL_PREFIX = 'pip-shell-';
+const VENDOR_CACHE = 'pip-vendor';
+// index.html loads Leaflet from unpkg; without it nothing renders offline
+const VENDOR_URLS = [
+    'https://unpkg.com/leaflet@1.9.4/dist/leaflet.css',
+    'https://unpkg.com/leaflet@1.9.4/dist/leaflet.js'
+];
+// Above this the cached manifest is used and the network one, if it comes,
+// is picked up for the next visit
+const NETWORK_TIMEOUT_MS = 3000;
+
+// Runtime caches, checked in order; maxEntries bounds each one (an LA shard
+// is about 10 KB in shards/ and tens of KB in national/, a boundary tile a
+// few KB, a basemap tile 10-30 KB, the search index about 3 MB, so only the
+// current build's is worth keeping)
+const RUNTIME = [
+    { name: 'pip-search', maxEntries: 1, match: url => url.href.startsWith(`${SCOPE}search_index.`) },
+    {
+        name: 'pip-shards', maxEntries: 60,
+        match: url => url.href.startsWith(`${SCOPE}shards/la/`) || url.href.startsWith(`${SCOPE}national/la/`)
+    },
+    { name: 'pip-boundaries', maxEntries: 400, match: url => url.href.startsWith(`${SCOPE}boundaries/`) },
+    { name: 'pip-tiles', maxEntries: 800, match: url => url.hostname.endsWith('.basemaps.cartocdn.com') }
+];
+
+// ----------------------------------------------------------------------
+// Size-bounded LRU over one Cache
+// ----------------------------------------------------------------------
+
+class LruCache {
+    constructor({ name, maxEntries }) {
+        this.name = name;
+        this.maxEntries = maxEntries;
+        // url -> true, least recently used first; the Cache's own key order
+        // is the same (put moves an entry to the end), so it survives restarts
+        this.order = null;
+    }
+
+    async open() {
+        const cache = await caches.open(this.name);
+        if (!this.order) {
+            this.order = new Map((await cache.keys()).map(request => [request.url, true]));
+        }
+        return cache;
+    }
+
+    async get(request) {
+        const cache = await this.open();
+        const response = await cache.match(request, { ignoreVary: true });
+        if (!response) return null;
+        this.order.delete(request.url);
+        this.order.set(request.url, true);
+        return { response, touched: cache.put(request, response.clone()) };
+    }
+
+    async put(request, response) {
+        const cache = await this.open();
+        await cache.put(request, response);
+        this.order.delete(request.url);
+        this.order.set(request.url, true);
+        const excess = [...this.order.keys()].slice(0, Math.max(0, this.order.size - this.maxEntries));
+        for (const url of excess) {
+            this.order.delete(url);
+            await cache.delete(url);
+        }
+    }
+}
+
+const lruCaches = new Map(RUNTIME.map(spec => [spec.name, new LruCache(spec)]));
+
+// Cached copies are never revalidated: every URL here is content-hashed or
+// (basemap tiles) changes rarely enough that the copy is good enough
+async function lruFirst(event, lru) {
+    const hit = await lru.get(event.request);
+    if (hit) {
+        event.waitUntil(hit.touched);
+        return hit.response;
+    }
+    const response = await fetch(event.request);
+    // Opaque (cross-origin no-cors) responses hide their status; keep them
+    if (response.ok || response.type === 'opaque') {
+        event.waitUntil(lru.put(event.request, response.clone()));
+    }
+    return response;
+}
+
+// ----------------------------------------------------------------------
+// Builds
+// ----------------------------------------------------------------------
+
+async function currentManifest() {
+    const response = await (await caches.open(META_CACHE)).match(MANIFEST_URL);
+    return response ? response.json() : null;
+}
+
+let installing = null;
+
+// Precaches the build a manifest response names and makes it current
+function installBuild(response) {
+    const previous = installing || Promise.resolve();
+    installing = previous.then(async () => {
+        const manifest = await response.clone().json();
+        const current = await currentManifest();
+        if (current && current.build === manifest.build) return;
+
+        const shellName = SHELL_PREFIX + manifest.build;
+        const shell = await caches.open(shellName);
+        // A hashed file already cached is the same file; only the rest are
+        // downloaded. addAll stores nothing unless every one arrived, and
+        // the old build stays current until then
+        const hashed = new Set(Object.values(manifest.files));
+        const missing = [];
+        for (const name of manifest.precache || []) {
+            const url = new URL(name, SCOPE).href;
+            const cached = hashed.has(name) && await caches.match(url, { ignoreVary: true });
+            if (cached) await shell.put(url, cached);
+            else missing.push(url);
+        }
+        await shell.addAll(missing);
+        await (await caches.open(META_CACHE)).put(MANIFEST_URL, response);
+
+        for (const name of await caches.keys()) {
+            if (name.startsWith(SHELL_PREFIX) && name !== shellName) await caches.delete(name);
+        }
+    }).catch(e => {
+        console.warn('Could not cache build:', e);
+    });
+    return installing;
+}
+
+async function cacheVendor() {
+    const cache = await caches.open(VENDOR_CACHE);
+    await Promise.all(VENDOR_URLS.map(async url => {
+        if (await cache.match(url)) return;
+        const request = new Request(url, { mode: 'no-cors' });
+        await cache.put(request, await fetch(request));
+    }));
+}
+
+// Network first, so a new build is seen as soon as it is published; the
+// cached manifest when the network is down or slow
+async function manifestFirst(event) {
+    let install = null;
+    const network = fetch(event.request).then(response => {
+        if (response.ok) install = installBuild(response.clone());
+        return response;
+    });
+    event.waitUntil(network.then(() => install, () => null));
+
+    let timer;
+    const timeout = new Promise(resolve => { timer = setTimeout(resolve, NETWORK_TIMEOUT_MS, null); });
+    const response = await Promise.race([network.catch(() => null), timeout]);
+    clearTimeout(timer);
+    if (response) return response;
+    return (await (await caches.open(META_CACHE)).match(MANIFEST_URL)) || network;
+}
+
+// The current build's index.html, or the network's before one is cached
+async function shellPage(event) {
+    const manifest = await currentManifest();
+    if (manifest) {
+        const shell = await caches.open(SHELL_PREFIX + manifest.build);
+        const cached = await shell.match(INDEX_URL, { ignoreVary: true });
+        if (cached) return cached;
+    }
+    return fetch(event.request);
+}
+
+async function cacheFirst(event) {
+    return (await caches.match(event.request, { ignoreVary: true })) || fetch(event.request);
+}
+
+// ----------------------------------------------------------------------
+// Events
+// ----------------------------------------------------------------------
+
+self.addEventListener('install', event => {
+    event.waitUntil((async () => {
+        const response = await fetch(MANIFEST_URL, { cache: 'no-cache' });
+        if (response.ok) await installBuild(response);
+        await cacheVendor().catch(e => console.warn('Could not cache Leaflet:', e));
+        await self.skipWaiting();
+    })());
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(self.clients.claim());
+});
+
+self.addEventListener('fetch', event => {
+    const { request } = event;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+
+    const runtime = RUNTIME.find(spec => spec.match(url));
+    if (runtime) {
+        event.respondWith(lruFirst(event, lruCaches.get(runtime.name)));
+    } else if (url.href === MANIFEST_URL) {
+        event.respondWith(manifestFirst(event));
+    } else if (request.mode === 'navigate' || url.href === INDEX_URL) {
+        event.respondWith(shellPage(event));
+    } else if (url.href.startsWith(SCOPE) || VENDOR_URLS.includes(url.href)) {
+        event.respondWith(cacheFirst(event));
+    }
+});
@@ -0,0 +1,156 @@
+// Pride in Place Data Explorer - shard reader
+// Loads the dashboard data one local authority at a time from a shard
+// directory: national/ (national.py, every MSOA in England) or shards/
+// (bundle.py, the Pride in Place areas).
+// index.bin maps every MSOA to its LA and is all the first paint needs;
+// la/<LA code>.bin holds one LA's areas and LSOA tables and is fetched when
+// an area in that LA is opened, bringing its neighbours in the same LA with
+// it. The most recently used shards stay decoded in a bounded LRU.
+
+(function (root) {
+    const loadBundle = root.PipBundle
+        ? root.PipBundle.loadBundle
+        : require('./bundle_reader.js').loadBundle;
+
+    const EMPTY = Object.freeze({});
+
+    class ShardStore {
+        // index: the decoded index.bin; capacity: LA shards kept in memory;
+        // load(url) returns a decoded bundle (loadBundle by default)
+        constructor(base, index, { capacity = 8, load = loadBundle } = {}) {
+            this.base = base;
+            this.index = index;
+            this.msoas = index.tables.msoas;
+            this.las = index.tables.las;
+            this.capacity = capacity;
+            this.load = load;
+            // LA code -> promise of a shard, least recently used first
+            this.cache = new Map();
+            // Prefetched shards not opened yet, oldest first. Kept apart from
+            // the LRU so a prefetch never evicts a shard in use; one moves
+            // into the LRU when it is opened
+            this.pending = new Map();
+            this.names = null;
+        }
+
+        has(msoa) {
+            return this.msoas.find(msoa) !== undefined;
+        }
+
+        laCode(msoa) {
+            const row = this.msoas.find(msoa);
+            return row === undefined ? null : this.msoas.value(row, 'la_code');
+        }
+
+        // {msoa_code, neighbourhood_name, local_authority} for every MSOA in
+        // the index, for searching before the search index has loaded
+        areaNames() {
+            if (!this.names) {
+                const laNames = new Map(this.las.column('la_code').map(
+                    (code, i) => [code, this.las.value(i, 'local_authority')]));
+                const codes = this.msoas.column('msoa_code');
+                const names = this.msoas.column('neighbourhood_name');
+                const las = this.msoas.column('la_code');
+                this.names = codes.map((code, i) => ({
+                    msoa_code: code,
+                    neighbourhood_name: names[i],
+                    local_authority: laNames.get(las[i])
+                }));
+            }
+            return this.names;
+        }
+
+        // Promise of {laCode, areas, lsoaMap, lsoaHlnm, lsoaEconomic, similar}
+        // for an LA; the LSOA lookups are the same views the dashboard
+        // globals held, and similar lists each area's most similar MSOAs
+        shard(laCode) {
+            let shard = this.cache.get(laCode) || this.pending.get(laCode);
+            if (shard) {
+                this.cache.delete(laCode);
+                this.pending.delete(laCode);
+            } else {
+                shard = this.fetchShard(laCode);
+            }
+            this.cache.set(laCode, shard);
+            while (this.cache.size > this.capacity) {
+                this.cache.delete(this.cache.keys().next().value);
+            }
+            return shard;
+        }
+
+        fetchShard(laCode) {
+            const shard = this.load(`${this.base}la/${laCode}.bin`).then(bundle => {
+                const { areas, lsoa_map, lsoa_hlnm, lsoa_economic, similar } = bundle.tables;
+                return {
+                    laCode,
+                    metadata: bundle.metadata,
+                    buffer: bundle.buffer,
+                    areas,
+                    lsoaMap: lsoa_map ? lsoa_map.grouped() : EMPTY,
+                    lsoaHlnm: lsoa_hlnm ? lsoa_hlnm.keyed() : EMPTY,
+                    lsoaEconomic: lsoa_economic ? lsoa_economic.keyed() : EMPTY,
+                    // only when similar.bin was built (similarity.py)
+                    similar: similar ? similar.grouped() : EMPTY
+                };
+            });
+            // A failed fetch is dropped so the next request retries it
+            shard.catch(() => {
+                if (this.cache.get(laCode) === shard) this.cache.delete(laCode);
+                if (this.pending.get(laCode) === shard) this.pending.delete(laCode);
+            });
+            return shard;
+        }
+
+        // Promise of {area, shard} for an MSOA, or null if it is not indexed
+        async area(msoa) {
+            const laCode = this.laCode(msoa);
+            if (laCode === null) return null;
+            const shard = await this.shard(laCode);
+            const row = shard.areas.find(msoa);
+            return row === undefined ? null : { area: shard.areas.record(row), shard };
+        }
+
+        // Start fetching the shard for an MSOA the user is likely to open
+        // next, without touching the LRU of shards already held
+        prefetch(msoa) {
+            const laCode = this.laCode(msoa);
+            if (laCode === null || this.cache.has(laCode) || this.pending.has(laCode)) return;
+            const shard = this.fetchShard(laCode);
+            shard.catch(e => console.warn(`Prefetch of ${laCode} failed:`, e));
+            this.hold(laCode, shard);
+        }
+
+        hold(laCode, shard) {
+            this.pending.set(laCode, shard);
+            while (this.pending.size > this.capacity) {
+                this.pending.delete(this.pending.keys().next().value);
+            }
+        }
+
+        // Promise of the undecoded bytes of index.bin or an LA shard under
+        // base, for the area worker's store, so a shard is fetched once per
+        // page. One not held yet is fetched into pending, like a prefetch
+        async bytes(url) {
+            if (url === `${this.base}index.bin`) return this.index.buffer;
+            const laCode = url.slice(`${this.base}la/`.length, -'.bin'.length);
+            let shard = this.cache.get(laCode) || this.pending.get(laCode);
+            if (!shard) {
+                shard = this.fetchShard(laCode);
+                this.hold(laCode, shard);
+            }
+            return (await shard).buffer;
+        }
+    }
+
+    async function openShards(base, options = {}) {
+        const load = options.load || loadBundle;
+        return new ShardStore(base, await load(`${base}index.bin`), options);
+    }
+
+    const api = { ShardStore, openShards };
+    if (typeof module !== 'undefined' && module.exports) {
+        module.exports = api;
+    } else {
+        root.PipShards = api;
+    }
+})(typeof self !== 'undefined' ? self : this);
@@ -0,0 +1,224 @@
+"""
+Pride in Place Data Explorer - Similar Areas
+Precomputed "areas like this one" for every MSOA and LSOA in England.
+
+Each area is described by its indicators, standardised across England (each
+column centred on its mean and scaled to unit standard deviation, so ranks in
+the thousands and rates below one weigh the same):
+
+    MSOA  HLNM domain scores, CNI ranks, IMD scores and census rates
+          (MSOA_FEATURES, from the pipeline's MSOA tables)
+    LSOA  IMD domain scores (imd_2025.csv) and HLNM overall and domain
+          ranks (LSOA_FEATURES, from the LSOA HLNM extract)
+
+A missing value is set to the mean, so it neither helps nor hurts a match;
+areas with fewer than half their features are left out. Similarity is the
+Euclidean distance between feature vectors. The k nearest areas of every
+area are found once here, a block of rows at a time against the whole matrix
+(|a - b|^2 = |a|^2 + |b|^2 - 2ab, one matrix product per block), and written
+to similar.bin, a data bundle with one table per level:
+
+    msoa, lsoa   one row per (area, neighbour): code, n (the neighbour's
+                 code) and d (distance), grouped by code, nearest first
+
+so the query service and the dashboard look neighbours up rather than scan
+every area per request.
+
+Usage:
+    python similarity.py [--out similar.bin] [--k 10]
+    python similarity.py --query E02001954
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import bundle
+import data_gatherer
+import national
+
+SIMILAR_FILE = bundle.SIMILAR_FILE
+
+DEFAULT_K = 10
+# Rows compared against every area at once; 512 x ~34k LSOAs is ~140 MB of
+# float64 distances
+BLOCK_ROWS = 512
+# Distances are stored to this many decimals
+DECIMALS = 3
+
+MSOA_FEATURES = [
+    'hlnm_growth', 'hlnm_energy', 'hlnm_crime', 'hlnm_opportunity', 'hlnm_health',
+    'community_needs_rank', 'civic_assets_rank', 'connectedness_rank', 'active_engaged_rank',
+    *bundle.IMD_SCORE_COLUMNS,
+    'bad_health_pct', 'no_qualifications_pct', 'level4_plus_pct',
+    'deprived_pct', 'owned_pct', 'social_rented_pct',
+]
+LSOA_FEATURES = [*bundle.IMD_SCORE_COLUMNS, *national.LSOA_HLNM_PERCENTILES]
+
+LEVELS = ["msoa", "lsoa"]
+
+
+# ---------------------------------------------------------------------------
+# Features
+# ---------------------------------------------------------------------------
+
+def load_msoa_features(lookup, build_dir=national.BUILD_DIR):
+    """MSOA_FEATURES for every England MSOA, indexed by MSOA code."""
+    msoas = lookup.drop_duplicates('MSOA21CD').set_index('MSOA21CD')[[]]
+    msoas = msoas.join(national.load_msoa_tables(build_dir), how='left')
+    return msoas[[c for c in MSOA_FEATURES if c in msoas.columns]]
+
+
+def load_lsoa_features(lookup, lsoa_hlnm_path=national.LSOA_HLNM_FILE):
+    """LSOA_FEATURES for every England LSOA, indexed by LSOA code."""
+    imd, lsoa_col = data_gatherer.load_imd_data(lookup)
+    lsoas = lookup[[]].join(imd.set_index(lsoa_col), how='left')
+    if Path(lsoa_hlnm_path).exists():
+        lsoas = lsoas.join(national.load_lsoa_hlnm(lsoa_hlnm_path), how='left')
+    else:
+        print(f"  {Path(lsoa_hlnm_path).name} not found, continuing without LSOA HLNM ranks")
+    return lsoas[[c for c in LSOA_FEATURES if c in lsoas.columns]]
+
+
+def standardise(features):
+    """(codes, columns, matrix) for the areas with at least half their features.
+
+    Each column becomes z-scores over England; missing values become 0.
+    Columns with no values at all are dropped.
+    """
+    values = features.to_numpy(dtype=np.float64, na_value=np.nan)
+    present = np.isfinite(values)
+    keep_columns = present.any(axis=0)
+    values, present = values[:, keep_columns], present[:, keep_columns]
+    values[~present] = np.nan
+
+    mean = np.nanmean(values, axis=0)
+    std = np.nanstd(values, axis=0)
+    std[std == 0] = 1.0
+    matrix = (np.where(present, values, mean) - mean) / std
+
+    keep_rows = present.sum(axis=1) * 2 >= values.shape[1]
+    codes = features.index.to_numpy(dtype=object)[keep_rows]
+    return codes, list(features.columns[keep_columns]), matrix[keep_rows]
+
+
+# ---------------------------------------------------------------------------
+# Neighbours
+# ---------------------------------------------------------------------------
+
+def nearest_neighbours(matrix, k=DEFAULT_K, block_rows=BLOCK_ROWS):
+    """(neighbours, distances): each row's k nearest other rows, nearest first.
+
+    Both arrays are rows x k; exact, not approximate.
+    """
+    n = len(matrix)
+    k = min(k, n - 1)
+    neighbours = np.empty((n, k), dtype=np.int32)
+    distances = np.empty((n, k), dtype=np.float64)
+    if k <= 0:
+        return neighbours, distances
+
+    norms = np.einsum('ij,ij->i', matrix, matrix)
+    for start in range(0, n, block_rows):
+        stop = min(start + block_rows, n)
+        # |b|^2 - 2ab in place; |a|^2 is the same along a row, so it is only
+        # added back for the k picked
+        partial = matrix[start:stop] @ matrix.T
+        partial *= -2.0
+        partial += norms
+        # An area is not its own neighbour
+        partial[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        nearest = np.argpartition(partial, k - 1, axis=1)[:, :k]
+        squared = np.take_along_axis(partial, nearest, axis=1) + norms[start:stop, None]
+        order = np.lexsort((nearest, squared), axis=1)
+        neighbours[start:stop] = np.take_along_axis(nearest, order, axis=1)
+        distances[start:stop] = np.sqrt(np.maximum(np.take_along_axis(squared, order, axis=1), 0.0))
+    return neighbours, distances
+
+
+def neighbour_rows(codes, neighbours, distances):
+    """similar.bin rows for one level: {code, n, d} per neighbour."""
+    return [
+        {"code": codes[i], "n": codes[j], "d": round(float(d), DECIMALS)}
+        for i in range(len(codes))
+        for j, d in zip(neighbours[i], distances[i])
+    ]
+
+
+def build_similar(out_path=SIMILAR_FILE, k=DEFAULT_K, build_dir=national.BUILD_DIR,
+                  lookup_path=national.LOOKUP_FILE, lsoa_hlnm_path=national.LSOA_HLNM_FILE):
+    """Find every MSOA's and LSOA's k most similar areas and write similar.bin."""
+    start = time.perf_counter()
+    lookup = national.load_lookup(lookup_path)
+    features = {
+        "msoa": load_msoa_features(lookup, build_dir),
+        "lsoa": load_lsoa_features(lookup, lsoa_hlnm_path),
+    }
+
+    tables, metadata = {}, {"generated": pd.Timestamp.now().isoformat(timespec='seconds'), "k": k}
+    for level in LEVELS:
+        level_start = time.perf_counter()
+        codes, columns, matrix = standardise(features[level])
+        neighbours, distances = nearest_neighbours(matrix, k)
+        tables[level] = (neighbour_rows(codes, neighbours, distances), {"group": "code"})
+        metadata[f"{level}_features"] = columns
+        print(f"  {level.upper()}: {len(codes):,} areas x {matrix.shape[1]} features, "
+              f"{neighbours.shape[1]} neighbours each in {time.perf_counter() - level_start:.1f}s")
+
+    payload = bundle.encode_bundle(tables, metadata)
+    Path(out_path).write_bytes(payload)
+    print(f"  Wrote {Path(out_path).name}: {len(payload):,} bytes in {time.perf_counter() - start:.1f}s")
+    return tables
+
+
+# ---------------------------------------------------------------------------
+# Querying
+# ---------------------------------------------------------------------------
+
+class SimilarAreas:
+    """Neighbour lookups over a similar.bin payload."""
+
+    def __init__(self, payload):
+        tables = bundle.decode_bundle(payload)
+        self.neighbours = {}
+        for level in LEVELS:
+            for row in tables.get(level, []):
+                self.neighbours.setdefault(row["code"], []).append((row["n"], row["d"]))
+
+    @classmethod
+    def load(cls, path=SIMILAR_FILE):
+        return cls(Path(path).read_bytes())
+
+    def __contains__(self, code):
+        return code in self.neighbours
+
+    def similar(self, code, limit=DEFAULT_K):
+        """[(code, distance)] of the areas most like code, nearest first."""
+        return self.neighbours.get(code, [])[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Similar areas index for the PiP Data Explorer")
+    parser.add_argument('--out', default=str(SIMILAR_FILE))
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help="neighbours kept per area")
+    parser.add_argument('--build-dir', default=str(national.BUILD_DIR), help="pipeline intermediate tables")
+    parser.add_argument('--query', help="list an area's neighbours from the existing index")
+    args = parser.parse_args()
+
+    if args.query:
+        index = SimilarAreas.load(args.out)
+        for code, distance in index.similar(args.query, args.k):
+            print(f"  {code}  {distance:.3f}")
+        return
+
+    print("=" * 60)
+    print("Pride in Place Data Explorer - Similar Areas")
+    print("=" * 60)
+    build_similar(args.out, args.k, args.build_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""
+Pride in Place Data Explorer - Spatial Index
+Point-in-area, bounding-box and radius queries over LSOA boundaries and
+LSOA/MSOA centroids.
+
+Two kinds of geometry are indexed, both in integer BASE_QUANTUM units
+(millionths of a degree, as boundaries.py stores them):
+
+    polygons   every England LSOA boundary (the national BSC GeoJSON),
+               written once by `build` to spatial_index.arrow: one row per
+               LSOA with its MSOA and LA, rings per polygon, ring lengths and
+               x/y vertices as Arrow lists, so loading is a memory map, not a
+               GeoJSON parse
+    centroids  LSOA population-weighted centroids (the LSOA centroid CSV)
+               and MSOA centroids (LAT/LONG in the MSOA boundaries CSV),
+               read at load time
+
+Each is bucketed by bounding box into a uniform grid of GRID_CELL degree
+cells (GridIndex), so a query only looks at the few items whose cells it
+touches. locate() answers "which LSOA is this point in" for a whole batch of
+points at once: every (point, candidate LSOA) pair from the grid is tested
+with even-odd ray casting over the LSOA's rings in one vectorised pass, a
+chunk of edges at a time. within() and near() list the areas whose centroid
+lies in a box or within a radius (great-circle distance) of a point.
+
+Usage:
+    python spatial_index.py build [SOURCE.geojson] [--out spatial_index.arrow]
+    python spatial_index.py locate POINTS.csv OUT.csv [--lat LAT] [--lng LONG]
+    python spatial_index.py near 53.48 -2.24 [--km 1] [--level msoa]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import boundaries
+import columnar_store
+import national
+
+LOCAL_DIR = Path(__file__).parent
+SPATIAL_INDEX_FILE = LOCAL_DIR / "spatial_index.arrow"
+MSOA_CENTROIDS_FILE = LOCAL_DIR / "Middle_layer_Super_Output_Areas_December_2021_Boundaries_EW_BGC_V3_-8386444323138516297.csv"
+
+QUANTUM = boundaries.BASE_QUANTUM
+# Grid cell size in degrees; about 2 km, a few urban LSOAs per cell
+GRID_CELL = 0.02
+# (point, edge) tests held in memory at once by locate
+CHUNK_EDGES = 4_000_000
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+LEVELS = ["lsoa", "msoa"]
+
+
+def to_units(lat, lng):
+    """(x, y) int64 arrays in QUANTUM units for latitudes and longitudes."""
+    x = np.rint(np.asarray(lng, dtype=np.float64) / QUANTUM).astype(np.int64)
+    y = np.rint(np.asarray(lat, dtype=np.float64) / QUANTUM).astype(np.int64)
+    return x, y
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Great-circle distance in km from one point to arrays of points."""
+    lat, lng, lats, lngs = map(np.radians, (lat, lng, lats, lngs))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+# ---------------------------------------------------------------------------
+# Grid
+# ---------------------------------------------------------------------------
+
+class GridIndex:
+    """Items bucketed by bounding box into a uniform grid.
+
+    Bounding boxes are int64 arrays in QUANTUM units; an item is listed in
+    every cell its box overlaps. Cells are stored CSR-style: the items of
+    cell c are items[offsets[c]:offsets[c + 1]].
+    """
+
+    def __init__(self, x0, y0, x1, y1, cell=GRID_CELL):
+        self.x0, self.y0, self.x1, self.y1 = (np.asarray(a, dtype=np.int64) for a in (x0, y0, x1, y1))
+        self.cell = max(int(round(cell / QUANTUM)), 1)
+        n = len(self.x0)
+        self.origin = (int(self.x0.min()), int(self.y0.min())) if n else (0, 0)
+
+        cx0, cy0 = self._cells(self.x0, self.y0)
+        cx1, cy1 = self._cells(self.x1, self.y1)
+        self.columns = int(cx1.max()) + 1 if n else 0
+        self.rows = int(cy1.max()) + 1 if n else 0
+
+        # One entry per (item, overlapped cell)
+        widths = cx1 - cx0 + 1
+        counts = widths * (cy1 - cy0 + 1)
+        item = np.repeat(np.arange(n), counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        width = np.repeat(widths, counts)
+        cell_ids = (np.repeat(cy0, counts) + within // width) * self.columns + np.repeat(cx0, counts) + within % width
+
+        order = np.argsort(cell_ids, kind='stable')
+        self.items = item[order]
+        self.offsets = np.zeros(self.columns * self.rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cell_ids, minlength=self.columns * self.rows), out=self.offsets[1:])
+
+    def __len__(self):
+        return len(self.x0)
+
+    def _cells(self, x, y):
+        return (x - self.origin[0]) // self.cell, (y - self.origin[1]) // self.cell
+
+    def candidates(self, x, y):
+        """(points, items): every pair whose item box contains the point."""
+        x, y = np.asarray(x, dtype=np.int64), np.asarray(y, dtype=np.int64)
+        cx, cy = self._cells(x, y)
+        inside = (cx >= 0) & (cx < self.columns) & (cy >= 0) & (cy < self.rows)
+        cell_ids = np.where(inside, cy * self.columns + cx, 0)
+        starts = self.offsets[cell_ids]
+        counts = np.where(inside, self.offsets[cell_ids + 1] - starts, 0)
+
+        points = np.repeat(np.arange(len(x)), counts)
+        items = self.items[np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+        px, py = x[points], y[points]
+        hit = (self.x0[items] <= px) & (px <= self.x1[items]) & (self.y0[items] <= py) & (py <= self.y1[items])
+        return points[hit], items[hit]
+
+    def box(self, x0, y0, x1, y1):
+        """Sorted indices of the items whose box overlaps (x0, y0)-(x1, y1)."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+        (cx0, cy0), (cx1, cy1) = self._cells(x0, y0), self._cells(x1, y1)
+        cx0, cx1 = max(cx0, 0), min(cx1, self.columns - 1)
+        cy0, cy1 = max(cy0, 0), min(cy1, self.rows - 1)
+        if cx0 > cx1 or cy0 > cy1:
+            return np.empty(0, dtype=np.int64)
+
+        found = [
+            self.items[self.offsets[row * self.columns + cx0]:self.offsets[row * self.columns + cx1 + 1]]
+            for row in range(cy0, cy1 + 1)
+        ]
+        items = np.unique(np.concatenate(found))
+        keep = (self.x0[items] <= x1) & (self.x1[items] >= x0) & (self.y0[items] <= y1) & (self.y1[items] >= y0)
+        return items[keep]
+
+
+# ---------------------------------------------------------------------------
+# Building
+# ---------------------------------------------------------------------------
+
+def polygon_table(features, rings, parents):
+    """spatial_index.arrow rows: code, msoa, la, rings per polygon, ring lengths and x/y vertices."""
+    rows = []
+    for code, _, polygons in features:
+        members = [rings[i] for polygon in polygons for i in polygon]
+        coords = np.concatenate(members)
+        msoa, la = parents.get(code, (None, None))
+        rows.append({
+            "code": code,
+            "msoa": msoa,
+            "la": la,
+            "parts": np.array([len(polygon) for polygon in polygons], dtype=np.int32),
+            "rings": np.array([len(r) for r in members], dtype=np.int32),
+            "x": coords[:, 0].astype(np.int32),
+            "y": coords[:, 1].astype(np.int32),
+        })
+    return pd.DataFrame(rows, columns=["code", "msoa", "la", "parts", "rings", "x", "y"])
+
+
+def build_spatial_index(source=boundaries.LSOA_BOUNDARIES_FILE, out_path=SPATIAL_INDEX_FILE,
+                        lookup_path=boundaries.LOOKUP_FILE):
+    """Read the England LSOA polygons out of source and write spatial_index.arrow."""
+    start = time.perf_counter()
+    parents = boundaries.load_lookup(lookup_path)
+    print(f"Loading boundaries from {Path(source).name}...")
+    features, rings = boundaries.load_geometry(source, wanted=set(parents))
+    table = polygon_table(features, rings, parents)
+    columnar_store.write_table(table, out_path)
+    size_mb = Path(out_path).stat().st_size / (1024 * 1024)
+    print(f"  Wrote {Path(out_path).name}: {len(table):,} LSOAs, {sum(len(r) for r in rings):,} vertices, "
+          f"{size_mb:.1f}MB in {time.perf_counter() - start:.1f}s")
+    return table
+
+
+# ---------------------------------------------------------------------------
+# Querying
+# ---------------------------------------------------------------------------
+
+def _list_column(table, name):
+    """(values, offsets) of an Arrow list column, without copying rows out."""
+    column = table.column(name).combine_chunks()
+    offsets = column.offsets.to_numpy().astype(np.int64)
+    values = column.values.to_numpy()[offsets[0]:offsets[-1]].astype(np.int64)
+    return values, offsets - offsets[0]
+
+
+class Polygons:
+    """LSOA boundaries as flat vertex arrays plus a grid over their boxes."""
+
+    def __init__(self, table):
+        self.codes = np.asarray(table.column("code").to_pylist(), dtype=object)
+        self.msoas = np.asarray(table.column("msoa").to_pylist(), dtype=object)
+        self.las = np.asarray(table.column("la").to_pylist(), dtype=object)
+        self.rows = {code: i for i, code in enumerate(self.codes)}
+        self.x, offsets = _list_column(table, "x")
+        self.y, _ = _list_column(table, "y")
+        self.ring_lengths, self.ring_offsets = _list_column(table, "rings")
+        self.parts, self.part_offsets = _list_column(table, "parts")
+        ring_lengths = self.ring_lengths
+
+        # Edge i runs from vertex i to vertex following[i], wrapping at the
+        # end of each ring; a feature's edges are its vertices' range
+        ring_starts = np.cumsum(ring_lengths) - ring_lengths
+        self.following = np.arange(1, len(self.x) + 1)
+        self.following[ring_starts + ring_lengths - 1] = ring_starts
+        self.starts, self.counts = offsets[:-1], np.diff(offsets)
+
+        if len(self.codes):
+            boxes = [np.minimum.reduceat(self.x, self.starts), np.minimum.reduceat(self.y, self.starts),
+                     np.maximum.reduceat(self.x, self.starts), np.maximum.reduceat(self.y, self.starts)]
+        else:
+            boxes = [np.empty(0, dtype=np.int64)] * 4
+        self.grid = GridIndex(*boxes)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def polygons(self, i):
+        """Polygon i as GeoJSON MultiPolygon coordinates in degrees."""
+        start, stop = self.starts[i], self.starts[i] + self.counts[i]
+        coords = np.round(np.c_[self.x[start:stop], self.y[start:stop]] * QUANTUM, 6).tolist()
+        lengths = self.ring_lengths[self.ring_offsets[i]:self.ring_offsets[i + 1]]
+        ends = np.cumsum(lengths).tolist()
+        # GeoJSON rings repeat their first vertex at the end
+        rings = [coords[end - length:end] + [coords[end - length]] for end, length in zip(ends, lengths.tolist())]
+        polygons, first = [], 0
+        for count in self.parts[self.part_offsets[i]:self.part_offsets[i + 1]].tolist():
+            polygons.append(rings[first:first + count])
+            first += count
+        return polygons
+
+    def _inside(self, px, py, features):
+        """Boolean per (point, feature) pair: even-odd test over every ring."""
+        counts = self.counts[features]
+        pair = np.repeat(np.arange(len(features)), counts)
+        edge = np.repeat(self.starts[features] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        x0, y0 = self.x[edge], self.y[edge]
+        x1, y1 = self.x[self.following[edge]], self.y[self.following[edge]]
+        py_pair = py[pair]
+
+        # Edges straddling the point's latitude, then whether each crosses
+        # the ray running east from the point
+        straddle = np.flatnonzero((y0 > py_pair) != (y1 > py_pair))
+        x0, y0, x1, y1 = x0[straddle], y0[straddle], x1[straddle], y1[straddle]
+        pair = pair[straddle]
+        crossing_x = x0 + (py[pair] - y0) * (x1 - x0) / (y1 - y0)
+        crossings = np.bincount(pair[crossing_x > px[pair]], minlength=len(features))
+        return crossings % 2 == 1
+
+    def locate(self, x, y, chunk_edges=CHUNK_EDGES):
+        """Index of the polygon containing each point, or -1."""
+        result = np.full(len(x), -1, dtype=np.int64)
+        if not len(self):
+            return result
+        points, features = self.grid.candidates(x, y)
+        edges = np.cumsum(self.counts[features])
+        start = 0
+        while start < len(points):
+            stop = max(int(np.searchsorted(edges, edges[start] - self.counts[features[start]] + chunk_edges)),
+                       start + 1)
+            chunk_points, chunk_features = points[start:stop], features[start:stop]
+            inside = self._inside(x[chunk_points], y[chunk_points], chunk_features)
+            # Pairs run in point order, so a point on a shared edge gets the
+            # first LSOA that claims it
+            hits, first = np.unique(chunk_points[inside], return_index=True)
+            unset = result[hits] < 0
+            result[hits[unset]] = chunk_features[inside][first][unset]
+            start = stop
+        return result
+
+
+class Centroids:
+    """One level's area centroids with a grid over them."""
+
+    def __init__(self, codes, lat, lng):
+        self.codes = np.asarray(codes, dtype=object)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        x, y = to_units(self.lat, self.lng)
+        self.grid = GridIndex(x, y, x, y)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def box(self, south, west, north, east):
+        x0, y0 = to_units(south, west)
+        x1, y1 = to_units(north, east)
+        return self.grid.box(int(x0), int(y0), int(x1), int(y1))
+
+    def near(self, lat, lng, km):
+        """(indices, distances) within km of the point, nearest first."""
+        dlat = km / KM_PER_DEGREE
+        dlng = dlat / max(np.cos(np.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+        candidates = self.box(lat - dlat, lng - dlng, lat + dlat, lng + dlng)
+        distances = haversine_km(lat, lng, self.lat[candidates], self.lng[candidates])
+        keep = distances <= km
+        candidates, distances = candidates[keep], distances[keep]
+        order = np.lexsort((self.codes[candidates].astype(str), distances))
+        return candidates[order], distances[order]
+
+
+def load_centroids(lookup=None, lsoa_path=national.LSOA_CENTROIDS_FILE, msoa_path=MSOA_CENTROIDS_FILE):
+    """{level: Centroids} for the England LSOAs and MSOAs whose CSV exists."""
+    if lookup is None:
+        lookup = national.load_lookup()
+    centroids = {}
+    if Path(lsoa_path).exists():
+        lsoas = lookup[[]].join(national.load_centroids(lsoa_path), how='inner').dropna()
+        centroids["lsoa"] = Centroids(lsoas.index, lsoas['lat'], lsoas['lng'])
+    if Path(msoa_path).exists():
+        msoas = pd.read_csv(msoa_path, usecols=['MSOA21CD', 'LAT', 'LONG'], encoding='utf-8-sig')
+        msoas = msoas[msoas['MSOA21CD'].isin(set(lookup['MSOA21CD']))].dropna()
+        centroids["msoa"] = Centroids(msoas['MSOA21CD'], msoas['LAT'], msoas['LONG'])
+    return centroids
+
+
+class SpatialIndex:
+    """Point-in-LSOA lookups over the polygons, box and radius over centroids."""
+
+    def __init__(self, polygons=None, centroids=None):
+        self.polygons = polygons
+        self.centroids = centroids or {}
+
+    @classmethod
+    def load(cls, path=SPATIAL_INDEX_FILE, lookup=None):
+        polygons = Polygons(columnar_store.read_arrow(path)) if Path(path).exists() else None
+        return cls(polygons, load_centroids(lookup))
+
+    def locate(self, lat, lng):
+        """[{lsoa, msoa, la} or None] for each point, in order."""
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lng = np.atleast_1d(np.asarray(lng, dtype=np.float64))
+        if self.polygons is None:
+            raise ValueError("No LSOA boundaries (run python spatial_index.py build)")
+        found = np.full(len(lat), -1, dtype=np.int64)
+        valid = np.isfinite(lat) & np.isfinite(lng)
+        found[valid] = self.polygons.locate(*to_units(lat[valid], lng[valid]))
+        return [
+            None if i < 0 else
+            {"lsoa": self.polygons.codes[i], "msoa": self.polygons.msoas[i], "la": self.polygons.las[i]}
+            for i in found
+        ]
+
+    def _level(self, level):
+        if level not in self.centroids:
+            raise ValueError(f"No {level} centroids loaded")
+        return self.centroids[level]
+
+    def within(self, south, west, north, east, level="msoa"):
+        """Codes of the areas whose centroid lies inside the box, sorted."""
+        centroids = self._level(level)
+        return sorted(centroids.codes[centroids.box(south, west, north, east)])
+
+    def near(self, lat, lng, km, level="msoa", limit=None):
+        """[(code, distance in km)] of the areas within km, nearest first."""
+        centroids = self._level(level)
+        indices, distances = centroids.near(lat, lng, km)
+        return [(centroids.codes[i], float(d)) for i, d in zip(indices[:limit], distances[:limit])]
+
+
+def locate_csv(source, destination, lat_column='LAT', lng_column='LONG', path=SPATIAL_INDEX_FILE):
+    """Add LSOA21CD, MSOA21CD and LAD22CD columns to a CSV of points."""
+    points = pd.read_csv(source, encoding='utf-8-sig')
+    index = SpatialIndex(Polygons(columnar_store.read_arrow(path)))
+    start = time.perf_counter()
+    found = index.locate(points[lat_column].to_numpy(dtype=np.float64, na_value=np.nan),
+                         points[lng_column].to_numpy(dtype=np.float64, na_value=np.nan))
+    elapsed = time.perf_counter() - start
+    for column, key in (('LSOA21CD', 'lsoa'), ('MSOA21CD', 'msoa'), ('LAD22CD', 'la')):
+        points[column] = [area[key] if area else None for area in found]
+    points.to_csv(destination, index=False)
+    matched = sum(area is not None for area in found)
+    print(f"  Located {matched:,} of {len(points):,} points in {elapsed * 1000:.0f}ms -> {destination}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spatial index for the PiP Data Explorer")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="index the England LSOA boundaries")
+    build.add_argument('source', nargs='?', default=str(boundaries.LSOA_BOUNDARIES_FILE))
+    build.add_argument('--out', default=str(SPATIAL_INDEX_FILE))
+    build.add_argument('--lookup', default=str(boundaries.LOOKUP_FILE))
+
+    locate = commands.add_parser('locate', help="add the LSOA, MSOA and LA of each point to a CSV")
+    locate.add_argument('source')
+    locate.add_argument('destination')
+    locate.add_argument('--lat', default='LAT', help="latitude column")
+    locate.add_argument('--lng', default='LONG', help="longitude column")
+    locate.add_argument('--index', default=str(SPATIAL_INDEX_FILE))
+
+    near = commands.add_parser('near', help="areas whose centroid is within a radius of a point")
+    near.add_argument('lat', type=float)
+    near.add_argument('lng', type=float)
+    near.add_argument('--km', type=float, default=1.0)
+    near.add_argument('--level', choices=LEVELS, default='msoa')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_spatial_index(args.source, args.out, args.lookup)
+    elif args.command == 'locate':
+        locate_csv(args.source, args.destination, args.lat, args.lng, args.index)
+    elif args.command == 'near':
+        index = SpatialIndex(centroids=load_centroids())
+        for code, distance in index.near(args.lat, args.lng, args.km, args.level):
+            print(f"  {code}  {distance:.2f} km")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Boundary tile simplification: junction signatures and shared edges that
+stay identical for both neighbours.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import boundaries  # noqa: E402
+
+
+def features_of(rings):
+    """One feature per ring."""
+    return [(f"E01{i:06d}", f"LSOA {i}", [[i]]) for i in range(len(rings))]
+
+
+def test_signatures_tell_every_owner_set_apart():
+    # Vertex (0, 0) is on features 1, 5 and 6 and (100, 0) on 2, 3 and 7:
+    # the same count, sum and sum of squares of owners
+    shared = {1: (0, 0), 5: (0, 0), 6: (0, 0), 2: (100, 0), 3: (100, 0), 7: (100, 0)}
+    rings = []
+    for i in range(8):
+        x, y = shared.get(i, (1000 * i, 1000))
+        rings.append(np.array([[x, y], [5000 + i, 5000], [5000 + i, 6000]], dtype=np.int64))
+
+    signatures = boundaries.vertex_signatures(features_of(rings), rings)
+
+    assert signatures[1][0] == signatures[5][0] == signatures[6][0]
+    assert signatures[2][0] == signatures[3][0] == signatures[7][0]
+    assert signatures[1][0] != signatures[2][0]
+    # Vertices on one feature each are told apart too
+    assert len({int(s[1]) for s in signatures}) == 8
+
+
+def test_collapsed_ring_keeps_edges_shared_with_its_neighbours():
+    # A thin sliver between two squares, meeting both at (1000, 0) and
+    # (1000, 300). The bump on its left edge is within tolerance but off the
+    # output grid, so the simplified sliver snaps to two points and the
+    # unsimplified one does not
+    bottom, top = [1000, 0], [1000, 300]
+    left = [[995, 20], [940, 150], [995, 280]]
+    right = [[1005, 280], [1005, 20]]
+    rings = [
+        np.array([[0, 0], bottom, *left, top, [0, 300]], dtype=np.int64),
+        np.array([bottom, *left, top, *right], dtype=np.int64),
+        np.array([bottom, [2000, 0], [2000, 300], top, *right], dtype=np.int64),
+    ]
+    level = {"level": 0, "tolerance": 200 * boundaries.BASE_QUANTUM,
+             "quantum": 100 * boundaries.BASE_QUANTUM}
+
+    west, sliver, east = (ring.tolist() for ring in boundaries.simplify_rings(features_of(rings), rings, level))
+
+    assert len(sliver) >= 3
+    # The bump is kept on both sides of the edge it is on
+    assert [9, 2] in sliver and [9, 2] in west
+    assert [[x, y] for x, y in west if x >= 9] == [[10, 0], [9, 2], [10, 3]]
+    assert sorted([x, y] for x, y in east if x <= 10) == [[10, 0], [10, 3]]
@@ -0,0 +1,48 @@
+"""
+Census measures from a table with integer, float and missing counts, against
+the per-column DataFrame.sum(axis=1) they replaced.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import data_gatherer  # noqa: E402
+
+
+def health_table(**bad_columns):
+    return pd.DataFrame({
+        'geography code': ['E02000001', 'E02000002', 'E02000003'],
+        'General health: Total': [100, 200, 400],
+        **bad_columns,
+    })
+
+
+def bad_health(table):
+    codes = data_gatherer.code_index(table['geography code'])
+    return data_gatherer.census_measures('health', table, codes)
+
+
+def test_integer_counts_stay_integers():
+    table = health_table(**{'Bad health': [1, 2, 3], 'Very bad health': [4, 5, 6]})
+
+    found = bad_health(table)
+
+    assert found['bad_health_count'].dtype == np.int64
+    assert found['bad_health_count'].tolist() == [5, 7, 9]
+
+
+def test_missing_and_float_counts_are_summed_like_before():
+    table = health_table(**{'Bad health': [1.5, np.nan, np.nan], 'Very bad health': [4, 5, np.nan]})
+
+    found = bad_health(table)
+
+    expected = table[['Bad health', 'Very bad health']].sum(axis=1)
+    assert found['bad_health_count'].tolist() == expected.tolist() == [5.5, 5.0, 0.0]
@@ -0,0 +1,59 @@
+"""
+Columnar store manifest shared by parallel build processes.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+
+import contextlib
+import io
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import columnar_store  # noqa: E402
+
+TABLES = 24
+
+
+def build_one(store_dir, i):
+    source = Path(store_dir) / f"source{i}.csv"
+    source.write_text(f"value\n{i}\n")
+    with contextlib.redirect_stdout(io.StringIO()):
+        columnar_store.cached_table(f"table{i}", [source], lambda: pd.DataFrame({'value': [i]}),
+                                    store_dir=store_dir)
+
+
+def test_parallel_writers_keep_every_entry(tmp_path):
+    with ProcessPoolExecutor(6) as pool:
+        list(pool.map(build_one, [tmp_path] * TABLES, range(TABLES)))
+
+    manifest = columnar_store.load_manifest(tmp_path)
+    assert sorted(manifest["tables"]) == sorted(f"table{i}" for i in range(TABLES))
+    assert len(manifest["files"]) == TABLES
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_numeric_columns_are_read_without_copying(tmp_path):
+    path = tmp_path / "table.arrow"
+    columnar_store.write_table(pd.DataFrame({'n': [1.0, 2.0], 's': ['a', 'b']}), path)
+
+    df = columnar_store.read_table(path)
+
+    # A view of the mapped file is read-only and owns no data
+    values = df['n'].to_numpy()
+    assert not values.flags.writeable and not values.flags.owndata
+    assert df['s'].tolist() == ['a', 'b']
+
+
+def test_tables_get_the_default_file_mode(tmp_path):
+    path = tmp_path / "table.arrow"
+    columnar_store.write_table(pd.DataFrame({'n': [1.0]}), path)
+    columnar_store.save_manifest(columnar_store.load_manifest(tmp_path), tmp_path)
+
+    for written in (path, tmp_path / columnar_store.MANIFEST_NAME):
+        assert written.stat().st_mode & 0o777 == columnar_store.FILE_MODE
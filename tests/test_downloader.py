@@ -0,0 +1,234 @@
+"""
+Download cache against a local HTTP server: resume, If-Range, a changed
+ETag, a misaligned range, checksum failure and adopting pre-manifest files.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+
+import json
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+import requests
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import downloader  # noqa: E402
+
+BODY = bytes(range(256)) * 400
+
+
+class Source:
+    """What the server holds, and what it was asked for."""
+
+    def __init__(self, body=BODY, etag='"v1"'):
+        self.body = body
+        self.etag = etag
+        # One-shot faults: stop after this many bytes; answer a Range from byte 0
+        self.truncate_at = None
+        self.misalign = False
+        self.requests = []
+
+    def change(self, body, etag):
+        self.body, self.etag = body, etag
+
+
+class Handler(BaseHTTPRequestHandler):
+    source = None
+
+    def log_message(self, *args):
+        pass
+
+    def _headers(self, status, length, extra=()):
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        self.send_header('ETag', self.source.etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        for name, value in extra:
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.source.requests.append(('HEAD', dict(self.headers)))
+        self._headers(200, len(self.source.body))
+
+    def do_GET(self):
+        source = self.source
+        source.requests.append(('GET', dict(self.headers)))
+        body = source.body
+
+        if self.headers.get('If-None-Match') == source.etag:
+            self._headers(304, 0)
+            return
+
+        wanted = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if wanted and (if_range is None or if_range == source.etag):
+            start = int(wanted.removeprefix('bytes=').split('-')[0])
+            if source.misalign:
+                source.misalign = False
+                start = 0
+            self._headers(206, len(body) - start,
+                          [('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')])
+            self.wfile.write(body[start:])
+            return
+
+        self._headers(200, len(body))
+        if source.truncate_at is not None:
+            self.wfile.write(body[:source.truncate_at])
+            source.truncate_at = None
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # Chunks smaller than the file, so an interrupted transfer keeps some
+    monkeypatch.setattr(downloader, 'CHUNK_SIZE', 4096)
+    source = Source()
+    handler = type('SourceHandler', (Handler,), {'source': source})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    source.url = f'http://127.0.0.1:{httpd.server_address[1]}/table.csv'
+    yield source
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def gets(source):
+    return [headers for method, headers in source.requests if method == 'GET']
+
+
+def manifest(directory):
+    return json.loads((directory / downloader.MANIFEST_NAME).read_text())
+
+
+def interrupted(server, path, at=10_000):
+    """Start a download that the server cuts off after `at` bytes."""
+    server.truncate_at = at
+    with pytest.raises((IOError, requests.RequestException)):
+        downloader.download(server.url, path)
+    part = path.with_name(path.name + '.part')
+    assert part.exists() and 0 < part.stat().st_size < len(server.body)
+    return part
+
+
+def test_download_records_manifest(server, tmp_path):
+    path = downloader.download(server.url, tmp_path / 'table.csv')
+
+    assert path.read_bytes() == BODY
+    entry = manifest(tmp_path)['table.csv']
+    assert entry['size'] == len(BODY)
+    assert entry['etag'] == '"v1"'
+    assert entry['sha256'] == downloader.sha256_file(path)
+
+
+def test_cached_copy_needs_no_request(server, tmp_path):
+    downloader.download(server.url, tmp_path / 'table.csv')
+    server.requests.clear()
+
+    downloader.download(server.url, tmp_path / 'table.csv')
+
+    assert server.requests == []
+
+
+def test_resume_sends_range_and_if_range(server, tmp_path):
+    path = tmp_path / 'table.csv'
+    part = interrupted(server, path)
+    offset = part.stat().st_size
+
+    downloader.download(server.url, path)
+
+    resumed = gets(server)[-1]
+    assert resumed['Range'] == f'bytes={offset}-'
+    assert resumed['If-Range'] == '"v1"'
+    assert path.read_bytes() == BODY
+    assert not part.exists()
+
+
+def test_changed_etag_restarts_from_scratch(server, tmp_path):
+    path = tmp_path / 'table.csv'
+    interrupted(server, path)
+    changed = bytes(reversed(BODY))
+    server.change(changed, '"v2"')
+
+    downloader.download(server.url, path)
+
+    # If-Range no longer matches, so the server sends the whole new file
+    assert gets(server)[-1]['If-Range'] == '"v1"'
+    assert path.read_bytes() == changed
+    assert manifest(tmp_path)['table.csv']['etag'] == '"v2"'
+
+
+def test_misaligned_range_is_not_appended(server, tmp_path):
+    path = tmp_path / 'table.csv'
+    interrupted(server, path)
+    server.misalign = True
+
+    downloader.download(server.url, path)
+
+    assert 'Range' not in gets(server)[-1]
+    assert path.read_bytes() == BODY
+
+
+def test_checksum_failure_refetches(server, tmp_path):
+    path = downloader.download(server.url, tmp_path / 'table.csv')
+    # Same size, different bytes: only the checksum can tell
+    corrupt = bytearray(BODY)
+    corrupt[1000] ^= 0xFF
+    path.write_bytes(bytes(corrupt))
+    server.requests.clear()
+
+    downloader.download(server.url, path, verify=True)
+
+    assert len(gets(server)) == 1
+    assert path.read_bytes() == BODY
+
+
+def test_force_revalidates_with_etag(server, tmp_path):
+    path = downloader.download(server.url, tmp_path / 'table.csv')
+    server.requests.clear()
+
+    downloader.download(server.url, path, force=True)
+
+    assert gets(server)[0]['If-None-Match'] == '"v1"'
+    assert path.read_bytes() == BODY
+
+
+def test_complete_pre_manifest_file_is_adopted(server, tmp_path):
+    path = tmp_path / 'table.csv'
+    path.write_bytes(BODY)
+
+    downloader.download(server.url, path)
+
+    assert [method for method, _ in server.requests] == ['HEAD']
+    assert manifest(tmp_path)['table.csv']['etag'] == '"v1"'
+
+
+def test_truncated_pre_manifest_file_is_refetched(server, tmp_path):
+    path = tmp_path / 'table.csv'
+    path.write_bytes(BODY[:5000])
+
+    downloader.download(server.url, path)
+
+    assert len(gets(server)) == 1
+    assert path.read_bytes() == BODY
+
+
+def record_one(cache_dir, i):
+    downloader._update_manifest(cache_dir, f"table{i}.csv", {"size": i})
+
+
+def test_parallel_processes_keep_every_entry(tmp_path):
+    with ProcessPoolExecutor(6) as pool:
+        list(pool.map(record_one, [tmp_path] * 24, range(24)))
+
+    assert sorted(manifest(tmp_path)) == sorted(f"table{i}.csv" for i in range(24))
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,112 @@
+"""
+National LA shards: the economic indicators extract, and shards that carry
+the tables and <column>_percentile fields the dashboard cards read.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+
+import contextlib
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import bundle  # noqa: E402
+import national  # noqa: E402
+
+IMD = 'Index of Multiple Deprivation (IMD) Score'
+
+
+def economic_csv(path, rows):
+    """The extract's layout: five title rows, then 38 unnamed columns."""
+    lines = ["Hyper-local Need Index"] + [""] * 4
+    for code, values in rows:
+        cells = [""] * 38
+        cells[0] = code
+        for position, value in values.items():
+            cells[position] = value
+        lines.append(",".join(cells))
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def synthetic():
+    """(areas, lsoas) for four MSOAs of one LSOA each, in two LAs."""
+    msoas = [f"E02{i:06d}" for i in range(4)]
+    lookup = pd.DataFrame({
+        'LSOA21NM': [f"LSOA {i}" for i in range(4)],
+        'MSOA21CD': msoas,
+        'MSOA21NM': [f"Area {i}" for i in range(4)],
+        'LAD22CD': ['E08000001', 'E08000001', 'E08000002', 'E08000002'],
+        'LAD22NM': ['First', 'First', 'Second', 'Second'],
+        'RGN22CD': ['E12000001'] * 4,
+        'RGN22NM': ['North East'] * 4,
+    }, index=pd.Index([f"E01{i:06d}" for i in range(4)], name='LSOA21CD'))
+    centroids = pd.DataFrame({'lat': [53.0, 53.1, 53.2, 53.3], 'lng': [-1.5] * 4}, index=lookup.index)
+    hlnm = pd.DataFrame({
+        'n': [f"LSOA {i}" for i in range(4)],
+        't': ['Mission Critical', np.nan, 'Mission Support', np.nan],
+        **{column: pd.array([None] * 4, dtype='Int32')
+           for pair in national.LSOA_HLNM_PERCENTILES.items() for column in pair},
+    }, index=lookup.index)
+    hlnm['or'] = pd.array([1, None, 3, None], dtype='Int32')
+    hlnm['op'] = pd.array([50, None, 100, None], dtype='Int32')
+    economic = pd.DataFrame({
+        'jobs_density': [1.25, np.nan, 3.5, np.nan],
+        'income': [21000.0, np.nan, 25000.0, np.nan],
+    }, index=lookup.index)
+    imd = pd.DataFrame({
+        IMD: [10.0, 40.0, 20.0, 30.0],
+        'owned_pct': [50.0, np.inf, 30.0, np.nan],
+    }, index=pd.Index(msoas, name='msoa_code'))
+
+    lsoas = national.build_lsoa_table(lookup, centroids, hlnm, economic)
+    with contextlib.redirect_stdout(io.StringIO()):
+        areas = national.build_msoa_table(lookup, lsoas, [imd])
+    return areas, lsoas
+
+
+def test_economic_indicators_follow_the_extract_script(tmp_path):
+    path = tmp_path / "econ.csv"
+    economic_csv(path, [
+        ("E01000001", {5: "1.005", 7: "2", 9: "", 22: "3.124", 28: '"£21,500"', 37: "660417.18"}),
+        ("W01000001", {5: "9"}),
+    ])
+
+    found = national.load_lsoa_economic(path)
+
+    assert list(found.index) == ["E01000001"]
+    row = found.loc["E01000001"]
+    assert row['uc_search'] == 1.0 and row['uc_total'] == 3.0
+    assert row['jobs_density'] == 3.12 and row['income'] == 21500 and row['jobs_access'] == 660417.18
+    assert np.isnan(row['jsa'])
+
+
+def test_shards_carry_what_the_cards_read(tmp_path):
+    areas, lsoas = synthetic()
+    # Ranked among every MSOA, not looked up
+    assert areas[f"{IMD}_percentile"].tolist() == [0.0, 75.0, 25.0, 50.0]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        national.write_shards(areas, lsoas, tmp_path, {"total_areas": len(areas)},
+                              similar_path=tmp_path / "similar.bin")
+
+    index = bundle.decode_bundle((tmp_path / "index.bin").read_bytes())
+    assert [row['la_code'] for row in index["msoas"]] == list(areas['la_code'])
+    assert [row['la_code'] for row in index["las"]] == ['E08000001', 'E08000002']
+
+    shard = bundle.decode_bundle((tmp_path / "la" / "E08000001.bin").read_bytes())
+    assert [a['msoa_code'] for a in shard["areas"]] == ['E02000000', 'E02000001']
+    assert shard["areas"][1][f"{IMD}_percentile"] == 75.0
+    # Infinite and missing values are left out, as the bundle stores them
+    assert 'owned_pct' not in shard["areas"][1]
+    assert [row['c'] for row in shard["lsoa_map"]] == ['E01000000', 'E01000001']
+    assert shard["lsoa_hlnm"] == [
+        {'c': 'E01000000', 'n': 'LSOA 0', 't': 'Mission Critical', 'or': 1, 'op': 50}
+    ]
+    assert shard["lsoa_economic"] == [{'c': 'E01000000', 'jobs_density': 1.25, 'income': 21000}]
+    assert "similar" not in shard
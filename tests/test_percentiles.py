@@ -0,0 +1,122 @@
+"""
+England percentile ranking: the sorted lookup against the per-area scan it
+replaced, value for value, on ties, NaNs, values on and outside England's
+range, an all-missing England column and the lower-is-worse inversion.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+
+import contextlib
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import data_gatherer  # noqa: E402
+
+ENGLAND_MSOAS = 2000
+COLUMNS = data_gatherer.HIGHER_IS_WORSE + data_gatherer.LOWER_IS_WORSE + ['social_rented_pct']
+
+
+def scan_percentiles(df, all_england_df):
+    """calculate_all_percentiles as it was before the sorted lookup."""
+    numeric_cols = df.select_dtypes(include=[np.number]).columns
+
+    for col in numeric_cols:
+        if col in ['msoa_code']:
+            continue
+
+        if col in all_england_df.columns:
+            all_values = all_england_df[col].dropna()
+
+            percentile_col = f"{col}_percentile"
+            df[percentile_col] = df[col].apply(
+                lambda x: (all_values < x).sum() / len(all_values) * 100 if pd.notna(x) else np.nan
+            )
+
+            if col in data_gatherer.LOWER_IS_WORSE:
+                df[percentile_col] = 100 - df[percentile_col]
+
+    return df
+
+
+def synthetic(rng, rows, prefix='E02'):
+    """A frame of COLUMNS rounded to 1 dp (so values tie) with 5% NaN."""
+    df = pd.DataFrame({'msoa_code': [f"{prefix}{i:06d}" for i in range(rows)]})
+    for col in COLUMNS:
+        values = np.round(rng.gamma(2.0, 8.0, rows), 1)
+        values[rng.random(rows) < 0.05] = np.nan
+        df[col] = values
+    return df
+
+
+def percentiles(df, england):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return data_gatherer.calculate_all_percentiles(df, england)
+
+
+@pytest.fixture
+def england():
+    england = synthetic(np.random.default_rng(0), ENGLAND_MSOAS)
+    # Missing for every England MSOA: the old loop divides by zero
+    england['social_rented_pct'] = np.nan
+    return england
+
+
+@pytest.mark.parametrize('size', [40, 400])
+def test_matches_the_per_area_scan_exactly(england, size):
+    areas = synthetic(np.random.default_rng(size), size)
+    column = COLUMNS[0]
+    # Outside England's range, exactly on its extremes, and tied with it
+    areas.loc[0, column] = -1.0
+    areas.loc[1, column] = 1e6
+    areas.loc[2, column] = england[column].min()
+    areas.loc[3, column] = england[column].max()
+    areas.loc[4, column] = england[column].dropna().iloc[0]
+
+    with np.errstate(invalid='ignore'):
+        expected = scan_percentiles(areas.copy(), england)
+    found = percentiles(areas.copy(), england)
+
+    pd.testing.assert_frame_equal(found, expected, check_exact=True)
+
+
+def test_edge_values(england):
+    higher, lower = data_gatherer.HIGHER_IS_WORSE[0], data_gatherer.LOWER_IS_WORSE[0]
+    areas = pd.DataFrame({
+        'msoa_code': ['A', 'B', 'C', 'D'],
+        higher: [-1.0, 1e6, england[higher].min(), np.nan],
+        lower: [-1.0, 1e6, england[lower].min(), np.nan],
+        'social_rented_pct': [1.0, 2.0, 3.0, 4.0],
+    })
+
+    found = percentiles(areas, england)
+
+    # Below every value 0, above every value 100, NaN stays NaN
+    assert found[f"{higher}_percentile"].tolist()[:3] == [0.0, 100.0, 0.0]
+    assert np.isnan(found[f"{higher}_percentile"].iloc[3])
+    # Lower is worse: the same places, inverted
+    assert found[f"{lower}_percentile"].tolist()[:3] == [100.0, 0.0, 100.0]
+    assert np.isnan(found[f"{lower}_percentile"].iloc[3])
+    # No England values to rank against
+    assert found['social_rented_pct_percentile'].isna().all()
+
+
+def test_missing_sources_are_skipped(england):
+    areas = synthetic(np.random.default_rng(1), 10)
+    census = england[['msoa_code'] + data_gatherer.HIGHER_IS_WORSE]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        unchanged = data_gatherer.add_england_percentiles(areas.copy(), None, None)
+        found = data_gatherer.add_england_percentiles(areas.copy(), census, None)
+
+    pd.testing.assert_frame_equal(unchanged, areas)
+    assert [c for c in found.columns if c.endswith('_percentile')] == [
+        f"{col}_percentile" for col in data_gatherer.HIGHER_IS_WORSE
+    ]
@@ -0,0 +1,129 @@
+"""
+Query service over a small synthetic index: ETag revalidation, the LRU
+response cache and the limits on POST /locate.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+
+import http.client
+import json
+import sys
+import threading
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import query_service  # noqa: E402
+
+MSOAS = 6
+
+
+def synthetic_index():
+    codes = [f"E02{i:06d}" for i in range(MSOAS)]
+    areas = pd.DataFrame({
+        'msoa_code': codes,
+        'neighbourhood_name': [f"Area {i}" for i in range(MSOAS)],
+        'la_code': ['E08000001'] * 3 + ['E08000002'] * 3,
+        'local_authority': ['First'] * 3 + ['Second'] * 3,
+        'region_code': ['E12000001'] * MSOAS,
+        'region': ['North East'] * MSOAS,
+        'score': [float(i) for i in range(MSOAS)],
+    })
+    lsoas = pd.DataFrame({
+        'LSOA21NM': [f"LSOA {i}" for i in range(MSOAS)],
+        'MSOA21CD': codes,
+        'LAD22CD': areas['la_code'],
+    }, index=pd.Index([f"E01{i:06d}" for i in range(MSOAS)], name='LSOA21CD'))
+    return query_service.AreaIndex(areas, lsoas)
+
+
+@pytest.fixture
+def server():
+    service = query_service.QueryService(synthetic_index(), cache_size=2)
+    server = query_service.Server(('127.0.0.1', 0), query_service.make_handler(service))
+    server.service = service
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+def test_if_none_match_gets_304(server):
+    status, headers, body = request(server, 'GET', '/areas/E02000001')
+    assert status == 200 and json.loads(body)['msoa_code'] == 'E02000001'
+
+    status, again, body = request(server, 'GET', '/areas/E02000001',
+                                  headers={'If-None-Match': f'"other", {headers["ETag"]}'})
+
+    assert status == 304 and body == b''
+    assert again['ETag'] == headers['ETag']
+
+
+def test_changed_etag_gets_the_body(server):
+    status, _, body = request(server, 'GET', '/areas/E02000001', headers={'If-None-Match': '"stale"'})
+
+    assert status == 200 and json.loads(body)['msoa_code'] == 'E02000001'
+
+
+def test_least_recently_used_response_is_evicted(server):
+    respond = server.service.respond
+    for path in ('/areas/E02000001', '/areas/E02000002', '/areas/E02000001', '/areas/E02000003'):
+        request(server, 'GET', path)
+    assert respond.cache_info().currsize == 2
+
+    # E02000002 was used least recently, so it alone was dropped
+    hits = respond.cache_info().hits
+    request(server, 'GET', '/areas/E02000001')
+    request(server, 'GET', '/areas/E02000003')
+    assert respond.cache_info().hits == hits + 2
+    request(server, 'GET', '/areas/E02000002')
+    assert respond.cache_info().hits == hits + 2
+
+
+def test_reordered_query_shares_a_cache_entry(server):
+    respond = server.service.respond
+    request(server, 'GET', '/rank/score?order=asc&limit=2')
+    hits = respond.cache_info().hits
+
+    status, _, body = request(server, 'GET', '/rank/score?limit=2&order=asc')
+
+    assert status == 200 and [a['msoa_code'] for a in json.loads(body)['areas']] == ['E02000000', 'E02000001']
+    assert respond.cache_info().hits == hits + 1
+
+
+def test_too_many_points_gets_413(server):
+    points = json.dumps({"points": [[0, 0]] * (query_service.MAX_POINTS + 1)})
+
+    status, _, body = request(server, 'POST', '/locate', body=points)
+
+    assert status == 413 and 'points' in json.loads(body)['error']
+
+
+def test_oversized_body_is_refused_unread(server):
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+    try:
+        # Only the headers are sent: the answer cannot wait for the body
+        connection.putrequest('POST', '/locate')
+        connection.putheader('Content-Length', str(10 * 1024 ** 3))
+        connection.endheaders()
+        response = connection.getresponse()
+
+        assert response.status == 413
+        assert response.getheader('Connection') == 'close'
+    finally:
+        connection.close()
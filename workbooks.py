@@ -0,0 +1,304 @@
+"""
+Pride in Place Data Explorer - Workbook Reader
+Reads the OCSI and ONS workbooks (HLNM_MSOA.xlsx, the Community Needs Index
+ranks, lsoa_msoa_la_region_lookup.xlsx) or their _csv twins into typed
+DataFrames, replacing the Excel-COM PowerShell extractors.
+
+An .xlsx file is a zip of XML parts. Rather than walking cells one at a time
+(as Excel COM and openpyxl do), the sheet XML is decompressed once and the
+wanted columns are pulled out with a single regular expression over the
+whole document; shared strings are resolved with one array lookup per
+column. Only plain cell values are read: styles, dates and merged cells are
+ignored, and formulas yield their cached results.
+
+Usage:
+    python workbooks.py describe HLNM_MSOA.xlsx
+    python workbooks.py convert HLNM_MSOA.xlsx --sheet master
+"""
+
+import argparse
+import html
+import posixpath
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+# One cell: column letters, row number, attributes, then the cached value or
+# inline string (a formula, if any, sits between them and is skipped)
+CELL_PATTERN = (
+    r'<c r="({column})(\d+)"([^>]*?)(?:/>|>(?:<f[^>]*/>|<f[^>]*>[^<]*</f>)?'
+    r'(?:<v>([^<]*)</v>|<is>(.*?)</is>)?</c>)'
+)
+ANY_COLUMN = "[A-Z]+"
+SHARED_STRING = re.compile(r"<si>(.*?)</si>", re.S)
+SIMPLE_STRING = re.compile(r"<si><t>([^<]*)</t></si>")
+TEXT_RUN = re.compile(r"<t[^>]*>([^<]*)</t>")
+PHONETIC_RUN = re.compile(r"<rPh\b.*?</rPh>", re.S)
+CELL_TYPE = re.compile(r'\bt="(\w+)"')
+
+
+def column_letters(position):
+    """Spreadsheet column letters for a zero-based position (0 -> A)."""
+    letters = ""
+    position += 1
+    while position:
+        position, remainder = divmod(position - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def column_position(letters):
+    """Zero-based position of spreadsheet column letters (A -> 0)."""
+    position = 0
+    for letter in letters:
+        position = position * 26 + ord(letter) - 64
+    return position - 1
+
+
+def _text(fragment):
+    """Plain text of a shared or inline string (one or more <t> runs)."""
+    if fragment.startswith("<t>") and fragment.endswith("</t>") and fragment.count("<") == 2:
+        text = fragment[3:-4]
+    else:
+        text = "".join(TEXT_RUN.findall(PHONETIC_RUN.sub("", fragment)))
+    return html.unescape(text) if "&" in text else text
+
+
+class Workbook:
+    """An open .xlsx file: sheet names, shared strings and sheet XML."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.zip = zipfile.ZipFile(self.path)
+        self.sheets = self._sheet_parts()
+        self._shared = None
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _sheet_parts(self):
+        """Sheet name -> zip member, in workbook order."""
+        targets = {}
+        rels = ET.fromstring(self.zip.read("xl/_rels/workbook.xml.rels"))
+        for rel in rels.iter(f"{{{PACKAGE_REL_NS}}}Relationship"):
+            target = rel.get("Target")
+            if target.startswith("/"):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join("xl", target))
+            targets[rel.get("Id")] = target
+
+        workbook = ET.fromstring(self.zip.read("xl/workbook.xml"))
+        return {
+            sheet.get("name"): targets[sheet.get(f"{{{REL_NS}}}id")]
+            for sheet in workbook.iter(f"{{{MAIN_NS}}}sheet")
+        }
+
+    @property
+    def shared_strings(self):
+        """Shared string table as an object array, read on first use."""
+        if self._shared is None:
+            try:
+                xml = self.zip.read("xl/sharedStrings.xml").decode("utf-8")
+            except KeyError:
+                xml = ""
+            strings = SIMPLE_STRING.findall(xml)
+            if len(strings) != xml.count("<si>"):
+                # Rich text or attributes somewhere: take the slow path
+                strings = [_text(s) for s in SHARED_STRING.findall(xml)]
+            elif "&" in xml:
+                strings = [html.unescape(s) if "&" in s else s for s in strings]
+            self._shared = np.array(strings, dtype=object)
+        return self._shared
+
+    def sheet_xml(self, sheet=None):
+        """XML of a sheet by name, or of the first sheet."""
+        if sheet is None:
+            sheet = next(iter(self.sheets))
+        if sheet not in self.sheets:
+            raise KeyError(f"{self.path.name} has no sheet {sheet!r} (sheets: {', '.join(self.sheets)})")
+        return self.zip.read(self.sheets[sheet]).decode("utf-8")
+
+    def cells(self, xml, columns=ANY_COLUMN):
+        """Cells of the given columns (a regex alternation, default all) as
+        (columns, rows, attributes, values, inline strings) arrays in sheet
+        order, rows one-based. Cells holding no value are left out.
+        """
+        found = re.findall(CELL_PATTERN.format(column=columns), xml, re.S)
+        cells = np.array(found, dtype=object).reshape(-1, 5)
+        cells = cells[(cells[:, 3] != "") | (cells[:, 4] != "")]
+        return (cells[:, 0], cells[:, 1].astype(np.int64), cells[:, 2], cells[:, 3], cells[:, 4])
+
+    def column_values(self, attributes, values, inline):
+        """Typed values for cells (see cells()): strings, numbers or booleans."""
+        joined = "".join(attributes)
+        if 't="' not in joined:
+            return pd.to_numeric(pd.Series(values, dtype=object).replace("", np.nan)).to_numpy()
+        if joined.count('t="s"') == len(attributes):
+            return self.shared_strings[values.astype(np.int64)]
+
+        result = np.empty(len(values), dtype=object)
+        for i, (attrs, value, text) in enumerate(zip(attributes, values, inline)):
+            kind = CELL_TYPE.search(attrs)
+            kind = kind.group(1) if kind else "n"
+            if kind == "s":
+                result[i] = self.shared_strings[int(value)]
+            elif kind == "inlineStr":
+                result[i] = _text(text)
+            elif kind == "str":
+                result[i] = html.unescape(value) if "&" in value else value
+            elif kind == "b":
+                result[i] = value == "1"
+            elif kind == "e" or value == "":
+                result[i] = np.nan
+            else:
+                number = float(value)
+                result[i] = int(number) if number.is_integer() else number
+        return result
+
+
+def _header_row(workbook, xml, row):
+    """Column letters -> header text for a one-based sheet row."""
+    start = xml.find(f'<row r="{row}"')
+    if start == -1:
+        return {}
+    columns, _, attrs, values, inline = workbook.cells(xml[start:xml.find("</row>", start)] + "</row>")
+    return dict(zip(columns, map(str, workbook.column_values(attrs, values, inline))))
+
+
+def read_xlsx(path, sheet=None, usecols=None, header=0, skiprows=0, dtype=None):
+    """Read one sheet of an .xlsx file like pd.read_csv would read its CSV.
+
+    usecols takes header names or zero-based positions and columns come back
+    in sheet order; header is the row (after skiprows) holding column names,
+    or None to number columns by position. Numeric columns are float64, or
+    int64 when every value is a whole number; dtype is then applied.
+    """
+    with Workbook(path) as workbook:
+        xml = workbook.sheet_xml(sheet)
+        first = skiprows + 1 + (0 if header is None else header + 1)
+        names = {} if header is None else _header_row(workbook, xml, skiprows + header + 1)
+
+        if usecols is None:
+            pattern = ANY_COLUMN
+        else:
+            by_name = {name: col for col, name in names.items()}
+            missing = [c for c in usecols if c not in by_name and not isinstance(c, int)]
+            if missing:
+                raise ValueError(f"{Path(path).name}: columns not found: {missing}")
+            pattern = "|".join(by_name[c] if c in by_name else column_letters(c) for c in usecols)
+
+        cols, rows, attrs, values, inline = workbook.cells(xml, pattern)
+        keep = rows >= first
+        cols, rows, attrs, values, inline = (a[keep] for a in (cols, rows, attrs, values, inline))
+        rows -= first
+        length = int(rows.max()) + 1 if len(rows) else 0
+
+        # One stable sort groups the cells by column, each still in row order
+        codes, found = pd.factorize(cols)
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes, minlength=len(found))
+        columns = {}
+        for col, count, end in zip(found, counts, np.cumsum(counts)):
+            picked = order[end - count:end]
+            columns[col] = (rows[picked], workbook.column_values(attrs[picked], values[picked], inline[picked]))
+        if usecols is None:
+            # Headed columns with no values still appear, as in a CSV
+            for col in names.keys() - columns.keys():
+                columns[col] = (rows[:0], np.array([], dtype=object))
+
+    data = {}
+    for col, (rows, typed) in sorted(columns.items(), key=lambda item: column_position(item[0])):
+        name = names.get(col, column_position(col))
+        if len(rows) == length:
+            data[name] = typed
+        else:
+            # Blank cells are absent from the XML
+            full = np.full(length, np.nan, dtype=object)
+            full[rows] = typed
+            data[name] = pd.Series(full).infer_objects().to_numpy()
+
+    df = pd.DataFrame(data, index=pd.RangeIndex(length))
+    for name in df.columns:
+        # Whole numbers stored as floats come back as integers, as in a CSV
+        values = df[name].to_numpy()
+        if values.dtype == np.float64 and len(values) and not np.isnan(values).any() \
+                and (values == np.round(values)).all():
+            df[name] = values.astype(np.int64)
+    if dtype is not None:
+        df = df.astype(dtype)
+    return df
+
+
+def read_table(path, sheet=None, usecols=None, header=0, skiprows=0, dtype=None):
+    """Read a workbook sheet or a CSV export with the same arguments."""
+    if Path(path).suffix.lower() == ".xlsx":
+        return read_xlsx(path, sheet=sheet, usecols=usecols, header=header, skiprows=skiprows, dtype=dtype)
+    return pd.read_csv(
+        path, usecols=usecols, header=header, skiprows=skiprows, dtype=dtype,
+        encoding="utf-8-sig",
+    )
+
+
+def csv_twin(path):
+    """The <name>_csv.csv export saved alongside a workbook."""
+    path = Path(path)
+    return path.with_name(f"{path.stem}_csv.csv")
+
+
+def describe(path):
+    """Print each sheet's size, header and first data row."""
+    with Workbook(path) as workbook:
+        for sheet in workbook.sheets:
+            df = read_xlsx(path, sheet=sheet)
+            print(f"=== {sheet} ===")
+            print(f"Rows: {len(df)}, Columns: {len(df.columns)}")
+            print(f"Columns: {', '.join(map(str, df.columns))}")
+            if len(df):
+                print(f"Sample (row 2): {' | '.join(map(str, df.iloc[0].tolist()))}")
+            print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read OCSI/ONS workbooks without Excel")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    describe_parser = commands.add_parser("describe", help="list sheets, headers and a sample row")
+    describe_parser.add_argument("path")
+
+    convert_parser = commands.add_parser("convert", help="write a sheet as a CSV twin")
+    convert_parser.add_argument("path")
+    convert_parser.add_argument("--sheet", help="sheet name (default: first sheet)")
+    convert_parser.add_argument("--out", help="output CSV (default: <name>_csv.csv)")
+
+    args = parser.parse_args(argv)
+    if args.command == "describe":
+        describe(args.path)
+        return
+
+    start = time.perf_counter()
+    df = read_xlsx(args.path, sheet=args.sheet)
+    out = Path(args.out) if args.out else csv_twin(args.path)
+    df.to_csv(out, index=False, encoding="utf-8-sig")
+    print(f"Wrote {len(df)} rows x {len(df.columns)} columns to {out} "
+          f"in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())